@@ -691,6 +691,7 @@ from .dxrecord import DXRecord, new_dxrecord
 from .dxproject import DXContainer, DXProject
 from .dxjob import DXJob, new_dxjob
 from .dxanalysis import DXAnalysis
+from .dxexecution_functions import describe_executions, wait_for_executions
 from .dxapplet import DXExecutable, DXApplet
 from .dxapp import DXApp
 from .dxglobalworkflow import DXGlobalWorkflow
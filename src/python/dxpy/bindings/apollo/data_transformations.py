@@ -1,3 +1,5 @@
+from array import array
+
 
 def transform_to_expression_matrix(list_of_dicts):
     """
@@ -10,8 +12,8 @@ def transform_to_expression_matrix(list_of_dicts):
     Additional key:value pairs are possible, but are not included in the transformed output
 
     How it works:
-    First, create a dictionary where each key is a sample id, and the values are the feature_id:expression pairs
-    Then, convert it to a list of dictionaries (the format that output handling is expecting)
+    The results are pivoted with ExpressionMatrix (see below), and each of its rows is
+    converted to a dictionary (the format that output handling is expecting)
     Each item in the list is a dictionary containing one "sample_id":sample_id pair, and
     multiple feature_id:expression pairs
 
@@ -25,33 +27,104 @@ def transform_to_expression_matrix(list_of_dicts):
         <feature_id_n>:<expression_n>
     }
     """
-    transformed_dict = {}
-    # create a dict of the form
-    # {
-    #   <sample_id>:{
-    #       "sample_id":<sample_id>,
-    #       <feature_id_1>:<expression_1>,
-    #       <feature_id_2>:<expression_2>,
-    #        etc.
-    #   }
-    # 
-    # }
-    colnames = set()
-    for entry in list_of_dicts:
-        # Keep track of all seen feature_ids, they will become the columns of our final table
-        colnames.add(entry["feature_id"])
-        if entry["sample_id"] not in transformed_dict:
-            transformed_dict[entry["sample_id"]] = {"sample_id":entry["sample_id"],entry["feature_id"]:entry["expression"]}
-        else:
-            transformed_dict[entry["sample_id"]][entry["feature_id"]] = entry["expression"]
-    colnames = sorted(list(colnames))
-    colnames.insert(0,"sample_id")
-
-    # We want the output to be a list of dictionaries, rather than a single dicitonary keyed on sample_id
-    dict_list = list(transformed_dict.values())
-    for dict_row in dict_list:
-        for colname in colnames:
-            if colname not in dict_row:
-                dict_row[colname] = None
-
-    return (dict_list,colnames)
\ No newline at end of file
+    matrix = ExpressionMatrix(list_of_dicts)
+    colnames = matrix.colnames
+    dict_list = [dict(zip(colnames, row)) for row in matrix.iter_rows()]
+    return (dict_list, colnames)
+
+
+class ExpressionMatrix(object):
+    """
+    Samples by features matrix of expression values, pivoted from vizserver results
+    of the form {"feature_id": <feature_id>, "sample_id": <sample_id>, "expression": <expression>}
+    (additional key:value pairs are ignored).
+
+    Sample IDs and feature columns are coded as integers and the values are kept in
+    three parallel arrays (sample code, column, value), one item per result, so the
+    memory used is proportional to the number of results rather than to the number
+    of samples times the number of features. Rows are produced one at a time, for
+    the samples in the order in which they first appear in the results, with the
+    features sorted by ID; when a sample has several values for a feature, the last
+    one is used, and missing values are None.
+
+    Example usage:
+
+    matrix = ExpressionMatrix(results)
+    writer.writerow(matrix.colnames)
+    writer.writerows(matrix.iter_rows())
+    """
+
+    def __init__(self, results):
+        sample_codes = {}
+        feature_codes = {}
+        self._samples = array("l")
+        features = array("l")
+        self._values = []
+        for entry in results:
+            self._samples.append(sample_codes.setdefault(entry["sample_id"], len(sample_codes)))
+            features.append(feature_codes.setdefault(entry["feature_id"], len(feature_codes)))
+            self._values.append(entry["expression"])
+
+        self.sample_ids = list(sample_codes)
+        self.feature_ids = sorted(feature_codes)
+        # Column (in sorted order) of each feature code, then of each result
+        columns = array("l", [0]) * len(self.feature_ids)
+        for column, feature_id in enumerate(self.feature_ids):
+            columns[feature_codes[feature_id]] = column
+        self._columns = array("l", [columns[feature] for feature in features])
+
+    @property
+    def colnames(self):
+        return ["sample_id"] + self.feature_ids
+
+    def _iter_sample_entries(self):
+        # Yields the indices of the results of each sample in turn, grouped with a counting sort
+        offsets = array("l", [0]) * (len(self.sample_ids) + 1)
+        for sample in self._samples:
+            offsets[sample + 1] += 1
+        for sample in range(len(self.sample_ids)):
+            offsets[sample + 1] += offsets[sample]
+        positions = array("l", offsets[:-1])
+        order = array("l", [0]) * len(self._samples)
+        for i, sample in enumerate(self._samples):
+            order[positions[sample]] = i
+            positions[sample] += 1
+        for sample in range(len(self.sample_ids)):
+            yield sample, order[offsets[sample]:offsets[sample + 1]]
+
+    def iter_rows(self):
+        """
+        Yields one list per sample: the sample ID followed by the values of the features.
+        """
+        columns, values, sample_ids = self._columns, self._values, self.sample_ids
+        num_features = len(self.feature_ids)
+        for sample, entries in self._iter_sample_entries():
+            row = [sample_ids[sample]] + [None] * num_features
+            for i in entries:
+                row[columns[i] + 1] = values[i]
+            yield row
+
+    def iter_entries(self):
+        """
+        Yields the (sample index, feature index, value) of each value that is not None,
+        sorted by sample and feature (indices refer to sample_ids and feature_ids).
+        """
+        columns, values = self._columns, self._values
+        for sample, entries in self._iter_sample_entries():
+            sample_values = {}
+            for i in entries:
+                sample_values[columns[i]] = values[i]
+            for column in sorted(sample_values):
+                if sample_values[column] is not None:
+                    yield sample, column, sample_values[column]
+
+    def write_matrix_market(self, fd):
+        """
+        Writes the matrix to fd in Matrix Market coordinate format, with 1-based
+        indices referring to sample_ids (rows) and feature_ids (columns).
+        """
+        num_entries = sum(1 for _ in self.iter_entries())
+        fd.write("%%MatrixMarket matrix coordinate real general\n")
+        fd.write("{} {} {}\n".format(len(self.sample_ids), len(self.feature_ids), num_entries))
+        for sample, column, value in self.iter_entries():
+            fd.write("{} {} {}\n".format(sample + 1, column + 1, value))
@@ -1,8 +1,6 @@
-import sys
-import gzip
 from dxpy import DXHTTPRequest
-from dxpy.bindings import DXRecord, DXFile
-import json
+from dxpy.bindings import DXRecord
+from dxpy.utils.descriptor_cache import get_dataset_descriptor
 
 
 class Dataset(DXRecord):
@@ -11,6 +9,8 @@ class Dataset(DXRecord):
         self.dataset_id = dataset_id
         self._detail_describe = detail_describe_dict
         self._visualize_info = None
+        self._descriptor_file_dict = None
+        self._assays_info_dict = None
 
         if detail_describe_dict:
             if "details" not in detail_describe_dict:
@@ -39,22 +39,11 @@ class Dataset(DXRecord):
 
     @property
     def descriptor_file_dict(self):
-        is_python2 = sys.version_info.major == 2
-        content = DXFile(
-            self.descriptor_file, mode="rb", project=self.project_id
-        ).read()
-
-        if is_python2:
-            import StringIO
-
-            x = StringIO.StringIO(content)
-            file_obj = gzip.GzipFile(fileobj=x)
-            content = file_obj.read()
-
-        else:
-            content = gzip.decompress(content)
-
-        return json.loads(content)
+        if self._descriptor_file_dict is None:
+            self._descriptor_file_dict = get_dataset_descriptor(
+                self.descriptor_file, project=self.project_id
+            )
+        return self._descriptor_file_dict
 
     @property
     def visualize_info(self):
@@ -88,6 +77,11 @@ class Dataset(DXRecord):
 
     @property
     def assays_info_dict(self):
+        if self._assays_info_dict is None:
+            self._assays_info_dict = self._load_assays_info_dict()
+        return self._assays_info_dict
+
+    def _load_assays_info_dict(self):
         assays = self.descriptor_file_dict["assays"]
         assays_info_dict = {}
 
@@ -1,5 +1,73 @@
 from __future__ import print_function
 
+import collections
+
+# A schema compiled into tables (see compile_schema)
+CompiledSchema = collections.namedtuple(
+    "CompiledSchema",
+    ["types", "keys", "key_conflicting_keys", "conflicting_keys", "dependent_conditional_keys"],
+)
+# A key of a schema: its properties as (name, type, required) tuples, and for lists
+# the (type, properties) of their items
+CompiledKey = collections.namedtuple(
+    "CompiledKey", ["name", "properties", "items", "conflicting_keys"]
+)
+
+# Compiled schemas by schema ID, with the schema itself so that the ID is not reused
+_compiled_schemas = {}
+
+
+def _compile_properties(properties):
+    return tuple(
+        (key, value.get("type"), value.get("required"))
+        for key, value in properties.items()
+    )
+
+
+def _compile_items(item_schema):
+    return (
+        item_schema.get("type"),
+        _compile_properties(item_schema.get("properties", {})),
+    )
+
+
+def compile_schema(schema):
+    """
+    Returns the schema of a JSONValidator compiled into tables, which are
+    built once per schema and shared by all the validators using it. Schemas
+    are assumed not to be modified once they are used.
+    """
+    if not isinstance(schema, dict):
+        return CompiledSchema({}, (), {}, (), ())
+    cached = _compiled_schemas.get(id(schema))
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
+    types, keys, key_conflicting_keys = {}, [], {}
+    for key, value in schema.items():
+        if key in ("conflicting_keys", "dependent_conditional_keys"):
+            continue
+        types[key] = value.get("type")
+        conflicting_keys = tuple(value.get("conflicting_keys") or ())
+        key_conflicting_keys[key] = conflicting_keys
+        keys.append(
+            CompiledKey(
+                key,
+                _compile_properties(value.get("properties", {})),
+                _compile_items(value.get("items", {})) if value.get("type") == list else None,
+                conflicting_keys,
+            )
+        )
+    compiled = CompiledSchema(
+        types,
+        tuple(keys),
+        key_conflicting_keys,
+        tuple(schema.get("conflicting_keys", ())),
+        tuple(schema.get("dependent_conditional_keys", {}).items()),
+    )
+    _compiled_schemas[id(schema)] = (schema, compiled)
+    return compiled
+
 
 class JSONValidator(object):
     """
@@ -55,6 +123,10 @@ class JSONValidator(object):
     In the example above, dependent_conditional_keys is defined as {"list_key_example": ["key1", "key2"]}, which means whenever list_key_example is present, either "key1"
     or "key2" has to be also present.
 
+    The schema is compiled once into tables of keys, types and properties (see compile_schema), which are shared by
+    all the validators using the same schema, so that large inputs (e.g. long lists of locations) are validated in
+    one pass without interpreting the schema again for each item.
+
     Currently the maximum level of nestedness supported for validation is as deep as shown in the example above via the "list_key_example" key.
 
     This is an example of a valid JSON that satisfies all the conditions defined in the schema above:
@@ -79,6 +151,7 @@ class JSONValidator(object):
 
         if not isinstance(schema, dict) or not schema:
             error_handler("Schema must be a non-empty dict.")
+        self.compiled_schema = compile_schema(schema)
 
     def validate(self, input_json):
         if not isinstance(input_json, dict) or not input_json:
@@ -88,48 +161,54 @@ class JSONValidator(object):
 
         self.validate_types(input_json)
 
-        for key, value in self.schema.items():
-            if key in input_json:
-                self.validate_properties(value.get("properties", {}), input_json[key])
+        for key in self.compiled_schema.keys:
+            if key.name in input_json:
+                self._check_properties(key.properties, input_json[key.name])
 
-                if value.get("type") == list:
-                    self.validate_list_items(
-                        value.get("items", {}), input_json[key], key
-                    )
+                if key.items is not None:
+                    self._check_list_items(key.items, input_json[key.name], key.name)
 
                 # Check for incompatible/conflicting subkeys defined at the key-level
-                if value.get("conflicting_keys"):
-                    self.check_incompatible_subkeys(input_json, key)
-                    self.check_incompatible_subkeys(input_json[key], key)
+                if key.conflicting_keys:
+                    self.check_incompatible_subkeys(input_json, key.name)
+                    self.check_incompatible_subkeys(input_json[key.name], key.name)
 
 
         self.check_incompatible_keys(input_json)
         self.check_dependent_key_combinations(input_json)
 
     def validate_types(self, input_dict):
+        types = self.compiled_schema.types
         for key, value in input_dict.items():
-            if not isinstance(value, self.schema.get(key, {}).get("type")):
+            if not isinstance(value, types.get(key)):
                 self.error_handler(
                     "Key '{}' has an invalid type. Expected {} but got {}".format(
-                        key, self.schema.get(key, {}).get("type"), type(value)
+                        key, types.get(key), type(value)
                     )
                 )
 
     def validate_properties(self, properties, input_dict):
-        for key, value in properties.items():
-            if key not in input_dict and value.get("required"):
-                self.error_handler(
-                    "Required key '{}' was not found in the input JSON.".format(key)
-                )
-            if key in input_dict and not isinstance(input_dict[key], value.get("type")):
+        self._check_properties(_compile_properties(properties), input_dict)
+
+    def _check_properties(self, properties, input_dict):
+        for key, key_type, required in properties:
+            if key not in input_dict:
+                if required:
+                    self.error_handler(
+                        "Required key '{}' was not found in the input JSON.".format(key)
+                    )
+            elif not isinstance(input_dict[key], key_type):
                 self.error_handler(
                     "Key '{}' has an invalid type. Expected {} but got {}".format(
-                        key, value.get("type"), type(input_dict[key])
+                        key, key_type, type(input_dict[key])
                     )
                 )
 
     def validate_list_items(self, item_schema, input_list, key_name):
-        item_type = item_schema.get("type")
+        self._check_list_items(_compile_items(item_schema), input_list, key_name)
+
+    def _check_list_items(self, items, input_list, key_name):
+        item_type, properties = items
         if item_type:
             for item in input_list:
                 if not isinstance(item, item_type):
@@ -138,7 +217,7 @@ class JSONValidator(object):
                             key_name, item_type, type(item)
                         )
                     )
-                self.validate_properties(item_schema.get("properties", {}), item)
+                self._check_properties(properties, item)
         else:
             if not isinstance(input_list, list):
                 self.error_handler(
@@ -153,7 +232,7 @@ class JSONValidator(object):
                     )
 
     def check_incompatible_subkeys(self, input_json, current_key):
-        for keys in self.schema.get(current_key, {}).get("conflicting_keys", []):
+        for keys in self.compiled_schema.key_conflicting_keys.get(current_key, ()):
             if all(k in input_json for k in keys):
                 self.error_handler(
                     "For {}, exactly one of {} must be provided in the supplied JSON object.".format(
@@ -162,7 +241,7 @@ class JSONValidator(object):
                 )
 
     def check_incompatible_keys(self, input_json):
-        for keys in self.schema.get("conflicting_keys", []):
+        for keys in self.compiled_schema.conflicting_keys:
             if all(key in input_json for key in keys):
                 self.error_handler(
                     "Exactly one of {} must be provided in the supplied JSON object.".format(
@@ -173,8 +252,7 @@ class JSONValidator(object):
     def check_dependent_key_combinations(
         self, input_json, enforce_one_associated_key=False
     ):
-        mandatory_combinations = self.schema.get("dependent_conditional_keys", {})
-        for main_key, associated_keys in mandatory_combinations.items():
+        for main_key, associated_keys in self.compiled_schema.dependent_conditional_keys:
             if main_key in input_json:
                 present_associated_keys = [
                     key for key in associated_keys if key in input_json
@@ -193,10 +271,8 @@ class JSONValidator(object):
                     )
 
     def error_on_invalid_keys(self, input_json):
-        invalid_keys = []
-        for key in input_json:
-            if key not in self.schema:
-                invalid_keys.append(key)
+        types = self.compiled_schema.types
+        invalid_keys = [key for key in input_json if key not in types]
 
         if invalid_keys:
             self.error_handler(
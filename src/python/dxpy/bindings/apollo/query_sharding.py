@@ -0,0 +1,295 @@
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import copy
+import heapq
+import itertools
+import json
+
+from dxpy.utils import get_futures_threadpool, wait_for_all_futures
+from dxpy.bindings.apollo.vizclient import stream_results
+
+# Errors after which a query is split into smaller ones
+SHARDABLE_ERRORS = ("QueryTimeOut", "DataTooLarge")
+# Number of sub-queries a query is split into
+SHARD_FANOUT = 4
+# Maximum number of times a query is split
+MAX_SHARD_DEPTH = 5
+# Maximum number of sub-queries running at the same time
+MAX_SHARD_WORKERS = 4
+# Genomic ranges narrower than this (in bp) are not split into windows
+MIN_WINDOW_WIDTH = 1000
+
+
+class VizserverError(Exception):
+    """
+    Raised when vizserver returns an error instead of results; the error
+    object of the response is in the "error" attribute.
+    """
+
+    def __init__(self, error):
+        super(VizserverError, self).__init__(str(error))
+        self.error = error
+
+
+def _split_list(values, num_shards):
+    size = -(-len(values) // num_shards)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _get_bounds(location):
+    start = int(location["starting_position"])
+    return start, int(location.get("ending_position", start))
+
+
+def _split_range(location, num_shards, min_width):
+    start, end = _get_bounds(location)
+    if end - start + 1 < 2 * min_width:
+        return None
+    width = max(-(-(end - start + 1) // num_shards), min_width)
+    convert = type(location["starting_position"])
+    windows = []
+    for window_start in range(start, end + 1, width):
+        window = dict(location)
+        window["starting_position"] = convert(window_start)
+        window["ending_position"] = convert(min(window_start + width - 1, end))
+        windows.append(window)
+    return windows
+
+
+def _get_overlaps(parts):
+    """
+    parts: the lists of ranges a list of ranges sorted by chromosome and
+        start was split into
+
+    Returns, for each part, a range such that the results the part has in
+    common with the parts before it are its results overlapping that range
+    (or None if it has none in common with them). Such results overlap a
+    range of the part, which starts at or after the part's first range
+    (start S), and a range of the parts before it on the same chromosome,
+    which end at or before the last end E of those ranges: they overlap
+    [E, E] if E < S (e.g. the last position of the previous window) and
+    [S, E] otherwise.
+    """
+    overlaps = []
+    for i, part in enumerate(parts):
+        start, _ = _get_bounds(part[0])
+        ends = [_get_bounds(location)[1] for earlier_part in parts[:i] for location in earlier_part
+                if location.get("chromosome") == part[0].get("chromosome")]
+        if not ends:
+            overlaps.append(None)
+            continue
+        convert = type(part[0]["starting_position"])
+        overlap = dict(part[0])
+        overlap["starting_position"] = convert(min(start, max(ends)))
+        overlap["ending_position"] = convert(max(ends))
+        overlaps.append(overlap)
+    return overlaps
+
+
+def _get_path(filters, path):
+    for key in path:
+        if not isinstance(filters, dict) or key not in filters:
+            return None
+        filters = filters[key]
+    return filters
+
+
+def _replace_path(filters, path, value):
+    filters = copy.copy(filters)
+    parent = filters
+    for key in path[:-1]:
+        parent[key] = copy.copy(parent[key])
+        parent = parent[key]
+    parent[path[-1]] = value
+    return filters
+
+
+def _split_filters(filters, shard_keys, num_shards, min_window_width):
+    # Returns the path of the list that is split, its parts, and the
+    # overlaps of the parts (see _get_overlaps)
+    location_paths = [path for path in shard_keys if path[-1] == "location"]
+    for path in location_paths:
+        locations = _get_path(filters, path)
+        if not locations:
+            continue
+        if len(locations) > 1:
+            locations = sorted(locations, key=lambda location: (str(location.get("chromosome")),
+                                                                _get_bounds(location)))
+            parts = _split_list(locations, num_shards)
+            return path, parts, _get_overlaps(parts)
+        windows = _split_range(locations[0], num_shards, min_window_width)
+        if windows is not None:
+            parts = [[window] for window in windows]
+            return path, parts, _get_overlaps(parts)
+
+    lists = [(len(_get_path(filters, path)), path) for path in shard_keys
+             if path not in location_paths and isinstance(_get_path(filters, path), list)]
+    lists = [(length, path) for length, path in lists if length > 1]
+    if not lists:
+        return None
+    _, path = max(lists, key=lambda item: item[0])
+    parts = _split_list(_get_path(filters, path), num_shards)
+    return path, parts, [None] * len(parts)
+
+
+def split_filters(filters, shard_keys, num_shards=SHARD_FANOUT, min_window_width=MIN_WINDOW_WIDTH):
+    """
+    Splits filters into narrower filters whose results together are the
+    results of the original filters.
+
+    filters: the filters given by the user, e.g. {"location": [...], "sample_id": [...]}
+    shard_keys: paths (tuples of keys) of the lists of filters that can be split,
+        e.g. [("location",), ("annotation", "feature_id")]; the items of each list
+        must be combined with "or", and the lists with the other filters with "and".
+        Except for "location" lists, no result may match two items of a list
+
+    A "location" list with several ranges is sorted and split into groups of
+    ranges, and a single range into windows of (nearly) equal width; otherwise
+    the longest of the other lists is split. Returns None if none of the lists
+    can be split.
+    """
+    split = _split_filters(filters, shard_keys, num_shards, min_window_width)
+    if split is None:
+        return None
+    path, parts, _ = split
+    return [_replace_path(filters, path, part) for part in parts]
+
+
+def _sort_value(value):
+    # Values of different types are not comparable; nulls are sorted last
+    if value is None:
+        return (2, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value)
+    return (1, str(value))
+
+
+def merge_results(shard_results, order_by=None):
+    """
+    Merges the results of the sub-queries of a query.
+
+    shard_results: iterables over the results of the sub-queries, in the order of the sub-queries
+    order_by: the "order_by" of the payload; if given (and all ascending), the
+        results of each sub-query are assumed to be sorted accordingly and are
+        merged in that order, otherwise they are concatenated
+    """
+    if order_by and all(list(order.values())[0] == "asc" for order in order_by):
+        columns = [list(order.keys())[0] for order in order_by]
+
+        def get_key(result):
+            return tuple(_sort_value(result.get(column)) for column in columns)
+
+        return heapq.merge(*shard_results, key=get_key)
+    return itertools.chain.from_iterable(shard_results)
+
+
+def _skip_results(results, skipped):
+    # Results are compared as JSON
+    for result in results:
+        if json.dumps(result, sort_keys=True) not in skipped:
+            yield result
+
+
+def run_query(resource_url, payload):
+    """
+    Sends the query and returns the stream of its results (see
+    vizclient.stream_results). Raises VizserverError if vizserver returns
+    an error.
+    """
+    stream = stream_results(resource_url, payload)
+    if "error" in stream.members:
+        raise VizserverError(stream.members["error"])
+    return stream
+
+
+def run_sharded_query(resource_url, filters, build_payload, shard_keys, payload=None,
+                      max_workers=MAX_SHARD_WORKERS, max_depth=MAX_SHARD_DEPTH):
+    """
+    Runs the query for the given filters, and if vizserver cannot answer it
+    in one go (QueryTimeOut or DataTooLarge), splits the filters (see
+    split_filters) into sub-queries, which are run concurrently, and split
+    again if they fail the same way. The results of the sub-queries are
+    merged (see merge_results).
+
+    resource_url: URL of the vizserver "raw" route of the record
+    filters: the filters given by the user
+    build_payload: function returning the payload of the query for some filters
+    shard_keys: paths of the lists of filters that can be split (see split_filters)
+    payload: the payload for filters, if already built
+
+    Returns an iterable over the results, which are decoded as they are
+    received. Raises VizserverError with the last error if the query cannot
+    be split any further.
+    """
+    if payload is None:
+        payload = build_payload(filters)
+    try:
+        return run_query(resource_url, payload)
+    except VizserverError as e:
+        if e.error.get("type") not in SHARDABLE_ERRORS:
+            raise
+        error = e
+
+    def run_shard(shard_filters):
+        try:
+            return run_query(resource_url, build_payload(shard_filters))
+        except VizserverError as e:
+            if e.error.get("type") not in SHARDABLE_ERRORS:
+                raise
+            return e
+
+    def get_overlapping_results(overlap_filters):
+        return set(json.dumps(result, sort_keys=True)
+                   for result in run_query(resource_url, build_payload(overlap_filters)))
+
+    # Each round runs the sub-queries that have not been answered yet, which
+    # are identified by their position in the tree of splits so that their
+    # results can be put back in order. Sub-queries of a location list may
+    # have results in common with the sub-queries before them (e.g. features
+    # overlapping two windows); these are found with a query on the overlap
+    # of the sub-queries (see _get_overlaps), and skipped. Sub-queries inherit
+    # the overlaps of the sub-query they were split from.
+    pending, results = [((), filters, [])], {}
+    pool = get_futures_threadpool(max_workers=max_workers)
+    try:
+        for _ in range(max_depth):
+            shards = []
+            for position, shard_filters, overlaps in pending:
+                split = _split_filters(shard_filters, shard_keys, SHARD_FANOUT, MIN_WINDOW_WIDTH)
+                if split is None:
+                    raise error
+                path, parts, part_overlaps = split
+                for i, (part, overlap) in enumerate(zip(parts, part_overlaps)):
+                    shard_overlaps = overlaps
+                    if overlap is not None:
+                        shard_overlaps = overlaps + [pool.submit(get_overlapping_results,
+                                                                 _replace_path(shard_filters, path, [overlap]))]
+                    shards.append((position + (i,), _replace_path(shard_filters, path, part), shard_overlaps))
+            futures = [pool.submit(run_shard, shard_filters) for _, shard_filters, _ in shards]
+            wait_for_all_futures(futures)
+            pending = []
+            for (position, shard_filters, overlaps), future in zip(shards, futures):
+                if isinstance(future.result(), VizserverError):
+                    error = future.result()
+                    pending.append((position, shard_filters, overlaps))
+                else:
+                    results[position] = (future.result(), overlaps)
+            if not pending:
+                break
+        if pending:
+            raise error
+
+        # The results of the sub-queries are read as they are merged
+        shard_results = []
+        for position in sorted(results):
+            stream, overlaps = results[position]
+            skipped = set().union(*[overlap.result() for overlap in overlaps])
+            shard_results.append(_skip_results(stream, skipped) if skipped else stream)
+    except Exception:
+        for stream, _ in results.values():
+            stream.close()
+        raise
+    finally:
+        pool.shutdown(wait=False)
+
+    return merge_results(shard_results, payload.get("order_by"))
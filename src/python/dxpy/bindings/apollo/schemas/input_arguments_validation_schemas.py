@@ -16,6 +16,7 @@ EXTRACT_ASSAY_EXPRESSION_INPUT_ARGS_SCHEMA = {
         "expression_matrix",
         "json_help",
         "filter_json",
+        "output_format",
     ],
     "1_path_or_json_help-at_least_one_required": {
         "properties": {
@@ -121,4 +122,13 @@ EXTRACT_ASSAY_EXPRESSION_INPUT_ARGS_SCHEMA = {
             "message": '"--expression-matrix"/"-em" cannot be passed with the flag, "--sql".'
         },
     },
+    "10_output_format_sql-mutually_exclusive": {
+        "properties": {
+            "items": ["output_format", "sql"],
+        },
+        "condition": "mutually_exclusive_group",
+        "error_message": {
+            "message": '"--output-format" cannot be passed with the flag, "--sql".'
+        },
+    },
 }
@@ -1,5 +1,61 @@
 from __future__ import print_function
 import dxpy
+from dxpy.utils.json_stream import JSONArrayStream
+from dxpy.utils.result_cache import get_result_cache
+
+# Size of the chunks in which streamed responses are read
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def get_error_message(error):
+    if error["type"] == "InvalidInput":
+        return (
+            "Insufficient permissions due to the project policy.\n"
+            + error["message"]
+        )
+    elif error["type"] == "QueryTimeOut":
+        return "Please consider using --sql option to generate the SQL query and execute query via a private compute cluster."
+    elif error["type"] == "DataTooLarge":
+        return "Please consider using --sql option to generate the SQL query and execute query via a private compute cluster."
+    else:
+        return error
+
+
+def stream_results(resource_url, payload):
+    """
+    Sends the query and returns a JSONArrayStream over the "results" of the
+    response, which are decoded as the response body is received. The
+    members of the response that precede the results (e.g. "error") are
+    already read.
+
+    If the result cache is enabled (see dxpy.utils.result_cache), the
+    response is read from it if the same query was made recently, and is
+    otherwise cached once it has been read to the end.
+    """
+    cache = get_result_cache()
+    cache_key = cache.get_key(resource_url, payload) if cache is not None else None
+    chunks = cache.get(cache_key) if cache_key is not None else None
+    on_close = None
+    if chunks is None:
+        response = dxpy.DXHTTPRequest(
+            resource=resource_url,
+            data=payload,
+            prepend_srv=False,
+            want_full_response=True,
+            preload_content=False,
+        )
+        chunks = response.stream(STREAM_CHUNK_SIZE, decode_content=True)
+        on_close = response.release_conn
+        if cache_key is not None:
+            chunks = cache.tee(cache_key, chunks)
+    stream = JSONArrayStream(chunks, key="results", on_close=on_close)
+    stream.start()
+    if cache_key is not None and "error" in stream.members:
+        # Errors (e.g. timeouts) are not cached
+        chunks.close()
+        cache.remove(cache_key)
+    return stream
+
 
 class VizClient(object):
     def __init__(self, url, project_id, error_handler=print):
@@ -13,26 +69,51 @@ class VizClient(object):
                 resource=resource_url, data=payload, prepend_srv=False
             )
             if "error" in response:
-                if response["error"]["type"] == "InvalidInput":
-                    err_message = (
-                        "Insufficient permissions due to the project policy.\n"
-                        + response["error"]["message"]
-                    )
-                elif response["error"]["type"] == "QueryTimeOut":
-                    err_message = "Please consider using --sql option to generate the SQL query and execute query via a private compute cluster."
-                elif response["error"]["type"] == "DataTooLarge":
-                    err_message = "Please consider using --sql option to generate the SQL query and execute query via a private compute cluster."
-                else:
-                    err_message = response["error"]
-                self.error_handler(str(err_message))
+                self.error_handler(str(get_error_message(response["error"])))
             return response
         except Exception as details:
             self.error_handler(str(details))
 
+    def _get_response_stream(self, payload, resource_url):
+        try:
+            stream = stream_results(resource_url, payload)
+            if "error" in stream.members:
+                self.error_handler(str(get_error_message(stream.members["error"])))
+            return stream
+        except Exception as details:
+            self.error_handler(str(details))
+
     def get_data(self, payload, record_id):
         resource_url = "{}/data/3.0/{}/raw".format(self.url, record_id)
         return self._get_response(payload, resource_url)
 
+    def get_data_stream(self, payload, record_id):
+        """
+        Like get_data, but returns an iterable over the results that decodes
+        them as they are received instead of loading the whole response.
+        """
+        resource_url = "{}/data/3.0/{}/raw".format(self.url, record_id)
+        return self._get_response_stream(payload, resource_url)
+
+    def get_data_sharded(self, filters, build_payload, shard_keys, record_id, payload=None):
+        """
+        Like get_data_stream, but if vizserver cannot answer the query in one go
+        (QueryTimeOut or DataTooLarge), the query is split into smaller ones along
+        the lists of filters in shard_keys (see query_sharding.run_sharded_query).
+
+        build_payload is called with (parts of) filters and returns the payload of the query.
+        """
+        # query_sharding uses stream_results from this module
+        from dxpy.bindings.apollo.query_sharding import run_sharded_query, VizserverError
+
+        resource_url = "{}/data/3.0/{}/raw".format(self.url, record_id)
+        try:
+            return run_sharded_query(resource_url, filters, build_payload, shard_keys, payload=payload)
+        except VizserverError as e:
+            self.error_handler(str(get_error_message(e.error)))
+        except Exception as details:
+            self.error_handler(str(details))
+
     def get_raw_sql(self, payload, record_id):
         resource_url = "{}/viz-query/3.0/{}/raw-query".format(self.url, record_id)
         return self._get_response(payload, resource_url)
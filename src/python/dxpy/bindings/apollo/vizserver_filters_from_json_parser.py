@@ -1,5 +1,36 @@
 from __future__ import print_function
 
+# Per-item filters of "properties" defined as lists of dicts, by properties ID, with the
+# properties themselves so that the ID is not reused (see compile_list_properties)
+_compiled_list_properties = {}
+
+
+def compile_list_properties(properties):
+    """
+    Returns the filters to build for each item of a list in the input JSON, given
+    the "properties" (a list of dicts) of its filtering conditions, as
+    (key, table_column, condition, filtering_condition) tuples: "key" is set for
+    generic one-key filters, and "filtering_condition" for the special conditions
+    of JSONFiltersValidator.condition_function_mapping.
+
+    The filters are built once per schema and shared by all the parsers using it,
+    so that the schema is not interpreted again for every item of the list.
+    """
+    cached = _compiled_list_properties.get(id(properties))
+    if cached is not None and cached[0] is properties:
+        return cached[1]
+
+    item_filters = []
+    for item in properties:
+        if item.get("key"):
+            item_filters.append((item["key"], item["table_column"], item["condition"], None))
+        if item.get("keys") and len(item.get("keys")) == 2:
+            if item.get("condition") not in JSONFiltersValidator.SUPPORTED_VIZSERVER_CONDITIONS:
+                item_filters.append((None, None, item.get("condition"), item))
+    item_filters = tuple(item_filters)
+    _compiled_list_properties[id(properties)] = (properties, item_filters)
+    return item_filters
+
 
 class JSONFiltersValidator(object):
     """
@@ -29,6 +60,35 @@ class JSONFiltersValidator(object):
 
     """
 
+    SUPPORTED_VIZSERVER_CONDITIONS = frozenset([
+        "contains",
+        "exists",
+        "not-exists",
+        "any",
+        "not-any",
+        "all",
+        "not-empty",
+        "in",
+        "not-in",
+        "is",
+        "is-not",
+        "greater-than",
+        "less-than",
+        "greater-than-eq",
+        "less-than-eq",
+        "between",
+        "between-ex",
+        "between-left-inc",
+        "between-right-inc",
+        "not-between",
+        "not-between-ex",
+        "not-between-left-inc",
+        "not-between-right-inc",
+        "compare-before",
+        "compare-after",
+        "compare-within",
+    ])
+
     def __init__(self, input_json, schema, error_handler=print):
         self.input_json = input_json
         self.schema = schema
@@ -36,34 +96,6 @@ class JSONFiltersValidator(object):
         self.condition_function_mapping = {
             "genobin_partial_overlap": self.build_partial_overlap_genobin_filters,
         }
-        self.SUPPORTED_VIZSERVER_CONDITIONS = [
-            "contains",
-            "exists",
-            "not-exists",
-            "any",
-            "not-any",
-            "all",
-            "not-empty",
-            "in",
-            "not-in",
-            "is",
-            "is-not",
-            "greater-than",
-            "less-than",
-            "greater-than-eq",
-            "less-than-eq",
-            "between",
-            "between-ex",
-            "between-left-inc",
-            "between-right-inc",
-            "not-between",
-            "not-between-ex",
-            "not-between-left-inc",
-            "not-between-right-inc",
-            "compare-before",
-            "compare-after",
-            "compare-within",
-        ]
 
     def parse(self):
         self.is_valid_json(self.schema)
@@ -195,12 +227,19 @@ class JSONFiltersValidator(object):
         ### so we need to build the filters for each element in the list as well
         ### and then append them to the compound list of dicts
 
+        ## properties['key'] -> simple case
+        ## properties['keys'] -> reserved for complex, special cases
+        ## specifically for those cases where SUPPORTED_VIZSERVER_CONDITIONS is not sufficient
+        ## Both are looked up once per schema (see compile_list_properties)
+        item_filters = compile_list_properties(current_properties)
+        filters_combination_operator = current_filters.get("filters_combination_operator")
+
         # Build filters for each item in the list (input_json[filter_values])
         for current_list_item in filter_values:
             # Consider keeping track of input_json keys and properties evaluated and used so far
 
             current_compound_filter = {
-                "logic": current_filters.get("filters_combination_operator"),
+                "logic": filters_combination_operator,
                 "compound": [
                     # {},
                     # {},
@@ -208,35 +247,19 @@ class JSONFiltersValidator(object):
                 ],
             }
 
-            ## properties['key'] -> simple case
-            ## properties['keys'] -> reserved for complex, special cases
-            ## specifically for those cases where SUPPORTED_VIZSERVER_CONDITIONS is not sufficient
-
-            for item in current_properties:
-                if item.get("key"):
+            for key, table_column, condition, filtering_condition in item_filters:
+                if filtering_condition is None:
                     # Consider a separate check for list type
                     # Currently not necessary
                     temp_filter = self.build_one_key_generic_filter(
-                        item["table_column"],
-                        item["condition"],
-                        current_list_item[item.get("key")],
+                        table_column, condition, current_list_item[key]
                     )
-
-                    current_compound_filter["compound"].append(temp_filter)
-
-                if item.get("keys"):
-                    if len(item.get("keys")) == 2:
-                        if (
-                            item.get("condition")
-                            not in self.SUPPORTED_VIZSERVER_CONDITIONS
-                        ):
-                            special_filtering_function = (
-                                self.condition_function_mapping[item.get("condition")]
-                            )
-                            temp_filter = special_filtering_function(
-                                item, current_list_item
-                            )
-                            current_compound_filter["compound"].append(temp_filter)
+                else:
+                    special_filtering_function = self.condition_function_mapping[condition]
+                    temp_filter = special_filtering_function(
+                        filtering_condition, current_list_item
+                    )
+                current_compound_filter["compound"].append(temp_filter)
 
             # Consider checking if current_compound_filter contains any new elements before appending
             full_filter_for_all_items["compound"].append(current_compound_filter)
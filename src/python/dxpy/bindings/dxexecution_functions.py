@@ -0,0 +1,145 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Helper Functions
+****************
+
+The following helper functions are useful shortcuts for interacting with
+many jobs and analyses at once.
+
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import time
+
+import dxpy
+from ..compat import basestring
+from ..exceptions import DXError, DXJobFailureError
+
+# Maximum number of executions described in a single /system/describeExecutions call
+DESCRIBE_EXECUTIONS_BATCH_SIZE = 1000
+
+_FAILED_STATES = ("failed", "partially_failed", "terminated")
+_DESCRIBE_FIELDS = {"state": True, "failureReason": True, "failureMessage": True, "failureFrom": True}
+
+
+def _format_failure(execution_id, desc):
+    if desc["state"] == "terminated":
+        return "{} was terminated.".format(execution_id)
+    err_msg = "{} has failed because of {}: {}".format(execution_id, desc.get("failureReason"),
+                                                       desc.get("failureMessage"))
+    if desc.get("failureFrom") is not None and desc["failureFrom"]["id"] != execution_id:
+        err_msg += " (failure from {id})".format(id=desc["failureFrom"]["id"])
+    return err_msg
+
+
+def describe_executions(execution_ids, fields=None, **kwargs):
+    '''
+    :param execution_ids: Job and analysis IDs
+    :type execution_ids: list of strings
+    :param fields: Describe fields to return; if not given, the default describe output is returned
+    :type fields: dict
+    :returns: The describe output of each execution, in the same order as *execution_ids*
+    :rtype: list of dicts
+    :raises: :exc:`~dxpy.exceptions.DXError` if an execution could not be described
+
+    Describes the executions with /system/describeExecutions, in batches
+    of up to 1000 executions per call.
+    '''
+    describe = {"fields": fields} if fields else {}
+    descriptions = []
+    for i in range(0, len(execution_ids), DESCRIBE_EXECUTIONS_BATCH_SIZE):
+        batch = execution_ids[i:i + DESCRIBE_EXECUTIONS_BATCH_SIZE]
+        response = dxpy.api.system_describe_executions(
+            {"executions": [{"id": execution_id, "describe": describe} for execution_id in batch]}, **kwargs)
+        for execution_id, result in zip(batch, response["results"]):
+            if "describe" not in result:
+                raise DXError("Could not describe {}: {}".format(execution_id, result.get("error", result)))
+            descriptions.append(result["describe"])
+    return descriptions
+
+
+def wait_for_executions(executions, fail_fast=False, timeout=3600*24*7, min_interval=2, max_interval=60,
+                        on_update=None, **kwargs):
+    '''
+    :param executions: Job and analysis IDs or handlers
+    :type executions: list of strings, :class:`~dxpy.bindings.dxjob.DXJob` or :class:`~dxpy.bindings.dxanalysis.DXAnalysis`
+    :param fail_fast: If True, raise as soon as any execution fails or is terminated; otherwise wait for all executions to reach a terminal state first
+    :type fail_fast: boolean
+    :param timeout: Maximum amount of time to wait, in seconds, until all executions are done
+    :type timeout: integer
+    :param min_interval: Initial (and minimum) number of seconds between polls
+    :type min_interval: float
+    :param max_interval: Maximum number of seconds between polls
+    :type max_interval: float
+    :param on_update: Function called after each poll with the number of executions that are not yet done and the total number of executions
+    :type on_update: function
+    :returns: Mapping from execution ID to its last observed state
+    :rtype: dict
+    :raises: :exc:`~dxpy.exceptions.DXJobFailureError` if any execution fails or is terminated;
+        :exc:`~dxpy.exceptions.DXError` if the timeout is reached
+
+    Waits until all the executions have finished running. The states of
+    all pending executions are fetched together with
+    /system/describeExecutions. The interval between polls starts at
+    *min_interval* and grows by half each time no execution changed
+    state, up to *max_interval*; it is reset whenever a state change is
+    observed.
+
+    Example::
+
+        dxpy.wait_for_executions([job1, job2, "analysis-xxxx"], fail_fast=True)
+
+    '''
+    execution_ids = [execution if isinstance(execution, basestring) else execution.get_id()
+                     for execution in executions]
+    states = {}
+    failures = []
+    pending = list(dict.fromkeys(execution_ids))
+    interval = min_interval
+    start = time.time()
+    while True:
+        changed = False
+        still_pending = []
+        for execution_id, desc in zip(pending, describe_executions(pending, fields=_DESCRIBE_FIELDS, **kwargs)):
+            if states.get(execution_id) != desc["state"]:
+                changed = True
+            states[execution_id] = desc["state"]
+            if desc["state"] in _FAILED_STATES:
+                failures.append(_format_failure(execution_id, desc))
+                if fail_fast:
+                    raise DXJobFailureError(failures[0])
+            elif desc["state"] != "done":
+                still_pending.append(execution_id)
+        pending = still_pending
+        if on_update is not None:
+            on_update(len(pending), len(states))
+        if not pending:
+            break
+        if time.time() - start >= timeout:
+            raise DXError("Reached timeout while waiting for {} execution(s) to finish".format(len(pending)))
+
+        interval = min_interval if changed else min(interval * 1.5, max_interval)
+        time.sleep(interval)
+
+    if failures:
+        if len(failures) == 1:
+            raise DXJobFailureError(failures[0])
+        raise DXJobFailureError("{} executions did not finish successfully:\n".format(len(failures)) +
+                                "\n".join(failures))
+    return states
@@ -70,6 +70,24 @@ def resolve_data_objects(objects, project=None, folder=None, batchsize=1000):
     return results
 
 
+def _find_pages(api_method, query, first_page_size, **kwargs):
+    ''' Calls a /system/find* API method handler with *query*, following the
+    "next" pointer of each response, and yields the raw responses.
+    '''
+    if "limit" not in query:
+        query["limit"] = first_page_size
+
+    while True:
+        resp = api_method(query, **kwargs)
+        yield resp
+
+        # set up next query
+        if resp["next"] is not None:
+            query["starting"] = resp["next"]
+            query["limit"] = min(query["limit"]*2, 1000)
+        else:
+            return
+
 def _find(api_method, query, limit, return_handler, first_page_size, **kwargs):
     ''' Takes an API method handler (dxpy.api.find*) and calls it with *query*,
     and then wraps a generator around its output. Used by the methods below.
@@ -78,12 +96,7 @@ def _find(api_method, query, limit, return_handler, first_page_size, **kwargs):
     '''
     num_results = 0
 
-    if "limit" not in query:
-        query["limit"] = first_page_size
-
-    while True:
-        resp = api_method(query, **kwargs)
-
+    for resp in _find_pages(api_method, query, first_page_size, **kwargs):
         by_parent = resp.get('byParent')
         descriptions = resp.get('describe')
         def format_result(result):
@@ -100,12 +113,26 @@ def _find(api_method, query, limit, return_handler, first_page_size, **kwargs):
             num_results += 1
             yield format_result(i)
 
-        # set up next query
-        if resp["next"] is not None:
-            query["starting"] = resp["next"]
-            query["limit"] = min(query["limit"]*2, 1000)
-        else:
-            return
+def _find_into(result_set, api_method, query, limit, first_page_size, **kwargs):
+    ''' Like _find, but appends the results of each page into *result_set*
+    as soon as the page is received, and returns *result_set*. The
+    "byParent" and "describe" fields of the responses, which _find yields
+    with each result, are passed to its "add_tree" method, so
+    *result_set* must have both an "extend" and an "add_tree" method
+    (e.g. a CompactResultSet).
+    '''
+    num_results = 0
+    for resp in _find_pages(api_method, query, first_page_size, **kwargs):
+        if resp.get('byParent') is not None:
+            result_set.add_tree(resp['byParent'], resp.get('describe'))
+        results = resp["results"]
+        if limit is not None and num_results + len(results) > limit:
+            results = results[:limit - num_results]
+        result_set.extend(results)
+        num_results += len(results)
+        if limit is not None and num_results >= limit:
+            break
+    return result_set
 
 def find_data_objects(classname=None, state=None, visibility=None,
                       name=None, name_mode='exact', properties=None,
@@ -115,7 +142,7 @@ def find_data_objects(classname=None, state=None, visibility=None,
                       created_after=None, created_before=None,
                       describe=False, limit=None, level=None, region=None,
                       archival_state=None, return_handler=False, first_page_size=100,
-                      **kwargs):
+                      result_set=None, **kwargs):
     """
     :param classname:
         Class with which to restrict the search, i.e. one of "record",
@@ -171,6 +198,8 @@ def find_data_objects(classname=None, state=None, visibility=None,
     :type first_page_size: int
     :param return_handler: If True, yields results as dxpy object handlers (otherwise, yields each result as a dict with keys "id" and "project")
     :type return_handler: boolean
+    :param result_set: If given, a container into which the results are appended page by page (see :class:`~dxpy.utils.compact_results.CompactResultSet`); it is returned instead of a generator once all pages have been fetched
+    :type result_set: :class:`~dxpy.utils.compact_results.CompactResultSet`
     :rtype: generator
 
     Returns a generator that yields all data objects matching the query,
@@ -267,6 +296,10 @@ def find_data_objects(classname=None, state=None, visibility=None,
     if limit is not None:
         query["limit"] = limit
 
+    if result_set is not None:
+        if return_handler:
+            raise DXError('find_data_objects: Arguments "result_set" and "return_handler" cannot both be provided')
+        return _find_into(result_set, dxpy.api.system_find_data_objects, query, limit, first_page_size, **kwargs)
     return _find(dxpy.api.system_find_data_objects, query, limit, return_handler, first_page_size, **kwargs)
 
 
@@ -276,7 +309,7 @@ def find_executions(classname=None, launched_by=None, executable=None, project=N
                     created_after=None, created_before=None, describe=False,
                     name=None, name_mode="exact", tags=None, properties=None, limit=None,
                     first_page_size=100, return_handler=False, include_subjobs=True,
-                    include_restarted=None, **kwargs):
+                    include_restarted=None, result_set=None, **kwargs):
     '''
     :param classname:
         Class with which to restrict the search, i.e. one of "job",
@@ -332,6 +365,8 @@ def find_executions(classname=None, launched_by=None, executable=None, project=N
     :type include_subjobs: boolean
     :param include_restarted: If True, API response will include restarted jobs and job trees rooted in restarted jobs
     :type include_restarted: boolean
+    :param result_set: If given, a container into which the results are appended page by page (see :class:`~dxpy.utils.compact_results.CompactResultSet`); it is returned instead of a generator once all pages have been fetched
+    :type result_set: :class:`~dxpy.utils.compact_results.CompactResultSet`
     :rtype: generator
 
     Returns a generator that yields all executions (jobs or analyses) that match the query. It transparently handles
@@ -423,6 +458,10 @@ def find_executions(classname=None, launched_by=None, executable=None, project=N
     if limit is not None:
         query["limit"] = limit
 
+    if result_set is not None:
+        if return_handler:
+            raise DXError('find_executions: Arguments "result_set" and "return_handler" cannot both be provided')
+        return _find_into(result_set, dxpy.api.system_find_executions, query, limit, first_page_size, **kwargs)
     return _find(dxpy.api.system_find_executions, query, limit, return_handler, first_page_size, **kwargs)
 
 def find_jobs(*args, **kwargs):
@@ -23,7 +23,12 @@ command-line client.
 
 from __future__ import print_function, unicode_literals, division, absolute_import
 
+import sys
+
 import dxpy
+from ..utils.bulk_operations import resolve_paths, run_in_chunks
+from ..utils.completion_cache import invalidates_completion_cache
+from ..utils.resolution_cache import invalidates_resolution_cache
 from ..utils.resolver import (resolve_existing_path, resolve_path, is_hashid, get_last_pos_of_char)
 from ..exceptions import (err_exit, DXCLIError, ResourceNotFound)
 from . import try_call
@@ -106,6 +111,8 @@ def cp_to_noexistent_destination(args, dest_path, dx_dest, dest_proj):
             err_exit()
 
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def cp(args):
     dest_proj, dest_path, _none = try_call(resolve_path, args.destination, expected='folder')
     if dest_path is None:
@@ -123,10 +130,8 @@ def cp(args):
         raise DXCLIError('No sources provided to copy to another project')
     src_objects = []
     src_folders = []
-    for source in args.sources:
-        src_proj, src_folderpath, src_results = try_call(resolve_existing_path,
-                                                         source,
-                                                         allow_mult=True, all_mult=args.all)
+    resolutions = try_call(resolve_paths, args.sources, all_mult=args.all, raise_errors=True)
+    for source, (src_proj, src_folderpath, src_ids) in zip(args.sources, resolutions):
         if src_proj == dest_proj:
             if is_hashid(source):
                 # This is the only case in which the source project is
@@ -142,19 +147,27 @@ def cp(args):
             raise DXCLIError(fill('Error: A source project must be specified or a current ' +
                                   'project set in order to clone objects between projects'))
 
-        if src_results is None:
+        if src_ids is None:
             src_folders.append(src_folderpath)
         else:
-            src_objects += [result['id'] for result in src_results]
-    try:
-        exists = dxpy.DXHTTPRequest('/' + src_proj + '/clone',
-                                    {"objects": src_objects,
-                                     "folders": src_folders,
-                                     "project": dest_proj,
-                                     "destination": dest_path,
-                                     "targetFileRelocation": args.target_file_relocation})['exists']
-        if len(exists) > 0:
-            print(fill('The following objects already existed in the destination container ' +
-                       'and were left alone:') + '\n ' + '\n '.join(exists))
-    except:
-        err_exit()
+            src_objects += src_ids
+
+    def clone(chunk):
+        return dxpy.DXHTTPRequest('/' + src_proj + '/clone',
+                                  {"objects": [item["id"] for item in chunk if "id" in item],
+                                   "folders": [item["folder"] for item in chunk if "folder" in item],
+                                   "project": dest_proj,
+                                   "destination": dest_path,
+                                   "targetFileRelocation": args.target_file_relocation})['exists']
+
+    results, failures = run_in_chunks(clone, [{"folder": folder} for folder in src_folders] +
+                                      [{"id": object_id} for object_id in src_objects])
+    exists = [object_id for result in results if result is not None for object_id in result]
+    if len(exists) > 0:
+        print(fill('The following objects already existed in the destination container ' +
+                   'and were left alone:') + '\n ' + '\n '.join(exists))
+    if failures:
+        for chunk, details in failures:
+            print(fill('Error while copying ' + ', '.join(item.get("id", item.get("folder")) for item in chunk) +
+                       ': ' + str(details)), file=sys.stderr)
+        err_exit('', 3)
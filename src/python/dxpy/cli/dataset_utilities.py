@@ -28,6 +28,8 @@ import csv
 import dxpy
 import codecs
 import subprocess
+import itertools
+import heapq
 from functools import reduce
 from ..utils.printing import fill
 from ..bindings import DXRecord
@@ -35,6 +37,7 @@ from ..bindings.dxdataobject_functions import is_dxlink, describe
 from ..bindings.dxfile import DXFile
 from ..utils.resolver import resolve_existing_path, is_hashid, ResolutionError, resolve_path, check_folder_exists
 from ..utils.file_handle import as_handle
+from ..utils.descriptor_cache import get_dataset_descriptor
 from ..utils.describe import print_desc
 from ..exceptions import (
     err_exit,
@@ -55,9 +58,9 @@ from ..dx_extract_utils.germline_utils import (
     get_germline_loci_payload,
     update_genotype_only_ref,
     get_genotype_types,
-    infer_genotype_type,
+    iter_inferred_genotypes,
     get_types_to_filter_out_when_infering,
-    filter_results
+    iter_filtered_results
 )
 from ..dx_extract_utils.input_validation import inference_validation
 from ..dx_extract_utils.input_validation_somatic import validate_somatic_filter
@@ -75,15 +78,26 @@ from ..bindings.apollo.schemas.assay_filtering_conditions import EXTRACT_ASSAY_E
 
 from ..bindings.apollo.vizserver_filters_from_json_parser import JSONFiltersValidator
 from ..bindings.apollo.vizserver_payload_builder import VizPayloadBuilder
-from ..bindings.apollo.vizclient import VizClient
-
-from ..bindings.apollo.data_transformations import transform_to_expression_matrix
-from .output_handling import write_expression_output, pretty_print_json
+from ..bindings.apollo.vizclient import VizClient, stream_results
+from ..bindings.apollo.query_sharding import run_sharded_query, VizserverError
+
+from ..bindings.apollo.data_transformations import ExpressionMatrix
+from .output_handling import (
+    write_expression_output,
+    write_typed_output,
+    remove_partial_output,
+    check_output_format,
+    pretty_print_json,
+    OUTPUT_FORMAT_SUFFIXES,
+    TYPED_OUTPUT_FORMATS,
+)
 
 from .help_messages import EXTRACT_ASSAY_EXPRESSION_JSON_HELP, EXTRACT_ASSAY_EXPRESSION_ADDITIONAL_FIELDS_HELP
 
 database_unique_name_regex = re.compile("^database_\w{24}__\w+$")
 database_id_regex = re.compile("^database-\\w{24}$")
+# Marks the end of a list of nodes when traversing coding hierarchies
+_END_OF_NODES = object()
 
 
 def resolve_validate_record_path(path):
@@ -167,6 +181,18 @@ def raw_cohort_query_api_call(resp, payload):
     return viz_query_api_call(resp, payload, 'raw-cohort-query')
 
 
+def raw_api_error_message(error, sql_message=True):
+    if error["type"] == "InvalidInput":
+        err_message = "Insufficient permissions due to the project policy.\n" + error["message"]
+    elif sql_message and error["type"] == "QueryTimeOut":
+        err_message = "Please consider using `--sql` option to generate the SQL query and query via a private compute cluster.\n" + error["message"]
+    elif error["type"] == "DxApiError":
+        err_message = error["message"]
+    else:
+        err_message = error
+    return str(err_message)
+
+
 def raw_api_call(resp, payload, sql_message=True):
     resource_val = resp["url"] + "/data/3.0/" + resp["dataset"] + "/raw"
     try:
@@ -174,20 +200,68 @@ def raw_api_call(resp, payload, sql_message=True):
             resource=resource_val, data=payload, prepend_srv=False
         )
         if "error" in resp_raw.keys():
-            if resp_raw["error"]["type"] == "InvalidInput":
-                err_message = "Insufficient permissions due to the project policy.\n" + resp_raw["error"]["message"]
-            elif sql_message and resp_raw["error"]["type"] == "QueryTimeOut":
-                err_message = "Please consider using `--sql` option to generate the SQL query and query via a private compute cluster.\n" + resp_raw["error"]["message"]        
-            elif resp_raw["error"]["type"] == "DxApiError":
-                err_message = resp_raw["error"]["message"]
-            else:
-                err_message = resp_raw["error"]
-            err_exit(str(err_message))
+            err_exit(raw_api_error_message(resp_raw["error"], sql_message))
     except Exception as details:
         err_exit(str(details))
     return resp_raw
 
 
+def raw_api_call_stream(resp, payload, sql_message=True):
+    """
+    Like raw_api_call, but returns an iterable over the results of the query,
+    which are decoded as the response is received, so that they can be written
+    out without holding the whole response in memory.
+    """
+    resource_val = resp["url"] + "/data/3.0/" + resp["dataset"] + "/raw"
+    try:
+        stream = stream_results(resource_val, payload)
+        if "error" in stream.members:
+            err_exit(raw_api_error_message(stream.members["error"], sql_message))
+    except Exception as details:
+        err_exit(str(details))
+    return stream
+
+
+# Lists of filters along which extract_assay queries are split when they are too large for vizserver.
+# Lists of values of array columns (the "any" condition) are not split, as a row matching several
+# values would be returned by several sub-queries.
+GERMLINE_SHARD_KEYS = {
+    "allele": [("location",)],
+    "annotation": [("allele_id",), ("gene_name",), ("gene_id",), ("feature_id",), ("hgvs_c",), ("hgvs_p",)],
+    "genotype": [("location",), ("allele_id",), ("sample_id",)],
+}
+SOMATIC_SHARD_KEYS = [
+    ("location",),
+    ("allele", "allele_id"),
+    ("sample", "sample_id"),
+    ("sample", "assay_sample_id"),
+]
+EXPRESSION_SHARD_KEYS = [
+    ("location",),
+    ("annotation", "feature_id"),
+    ("annotation", "feature_name"),
+    ("sample_id",),
+]
+
+
+def raw_api_call_sharded(resp, filter_dict, build_payload, shard_keys, payload=None, sql_message=True):
+    """
+    Like raw_api_call_stream, but if vizserver cannot answer the query in one go
+    (QueryTimeOut or DataTooLarge), the query is split into smaller ones along the
+    lists of filters in shard_keys, which are run concurrently and whose results
+    are merged (see query_sharding.run_sharded_query).
+
+    build_payload is called with (parts of) filter_dict and returns the payload of the query.
+    """
+    resource_val = resp["url"] + "/data/3.0/" + resp["dataset"] + "/raw"
+    try:
+        return run_sharded_query(resource_val, filter_dict, build_payload, shard_keys, payload=payload)
+    except VizserverError as e:
+        err_exit(raw_api_error_message(e.error, sql_message))
+    except Exception as details:
+        err_exit(str(details))
+
+
 def extract_dataset(args):
     """
     Retrieves the data or generates SQL to retrieve the data from a dataset or cohort for a set of entity.fields. Additionally, the dataset's dictionary can be extracted independently or in conjunction with data.
@@ -211,6 +285,10 @@ def extract_dataset(args):
             "dx extract_dataset: error: only one of the arguments, --fields or --fields-file, may be supplied at a given time"
         )
 
+    if args.output_format and (args.sql or (args.fields is None and args.fields_file is None)):
+        err_exit("--output-format can only be used with --fields or --fields-file, and not with --sql")
+    check_output_format(args.output_format)
+
     listing_restricted = {
         "dump_dataset_dictionary": False,
         "sql": False,
@@ -218,6 +296,7 @@ def extract_dataset(args):
         "fields_file": None,
         "output": None,
         "delim": ",",
+        "output_format": None,
     }
 
     def check_options(args, restricted):
@@ -320,6 +399,8 @@ def extract_dataset(args):
     if args.fields or args.fields_file:
         if args.sql:
             file_name_suffix = ".data.sql"
+        elif args.output_format:
+            file_name_suffix = OUTPUT_FORMAT_SUFFIXES[args.output_format]
         else:
             file_name_suffix = out_extension
 
@@ -410,13 +491,14 @@ def extract_dataset(args):
                 with open(out_file_field, "w") as f:
                     print(sql_results, file=f)
         else:
-            resp_raw = raw_api_call(resp, payload)
             csv_from_json(
                 out_file_name=out_file_field,
                 print_to_stdout=print_to_stdout,
                 sep=delimiter,
-                raw_results=resp_raw["results"],
+                raw_results=raw_api_call_stream(resp, payload),
                 column_names=fields_list,
+                output_format=args.output_format,
+                column_types=DXDatasetDictionary.get_field_types(rec_descriptor.model, fields_list),
             )
 
     elif args.sql:
@@ -524,13 +606,11 @@ def retrieve_meta_info(resp, project_id, assay_id, assay_name, print_to_stdout,
             "id": assay_id,
         },
     }
-    resp_raw = raw_api_call(resp, payload, sql_message=False)
-
     csv_from_json(
         out_file_name=out_file_name,
         print_to_stdout=print_to_stdout,
         sep="\t",
-        raw_results=resp_raw["results"],
+        raw_results=raw_api_call_stream(resp, payload, sql_message=False),
         column_names=columns,
     )
 
@@ -541,6 +621,8 @@ def assign_output_method(args, record_name, friendly_assay_type):
         file_name_suffix = ".data.sql"
     elif friendly_assay_type == 'somatic' and args.retrieve_meta_info:
         file_name_suffix = ".vcf_meta_info.txt"
+    elif args.output_format:
+        file_name_suffix = OUTPUT_FORMAT_SUFFIXES[args.output_format]
     else:
         file_name_suffix = ".tsv"
     file_already_exist = []
@@ -669,7 +751,7 @@ def retrieve_samples(resp: dict, assay_name: str, assay_id: str) -> list:
         "fields": [{"sample_id": "sample$sample_id"}],
         "raw_filters": {"assay_filters": {"name": assay_name, "id": assay_id}},
     }
-    return [_["sample_id"] for _ in raw_api_call(resp, sample_payload)["results"]]
+    return [_["sample_id"] for _ in raw_api_call_stream(resp, sample_payload)]
 
 
 def extract_assay_germline(args):
@@ -708,6 +790,11 @@ def extract_assay_germline(args):
                 "The flags, --infer-ref and --infer-nocall, can only be used with --retrieve-genotype."
             )
 
+    #### Validate that --output-format is only passed when data is retrieved ####
+    if args.output_format and (args.sql or args.list_assays or args.json_help):
+        err_exit("--output-format cannot be used with --sql, --list-assays or --json-help.")
+    check_output_format(args.output_format)
+
     #### Check if the retrieve options are passed correctly, print help if needed ####
     if args.retrieve_allele:
         if args.json_help:
@@ -821,14 +908,25 @@ def extract_assay_germline(args):
     elif args.retrieve_annotation:
         filter_type = "annotation"
 
+    def germline_payload_builder(**kwargs):
+        def build_payload(shard_filter_dict):
+            shard_payload, _ = final_payload(full_input_dict=shard_filter_dict, **kwargs)
+            add_germline_base_sql(resp, shard_payload)
+            return shard_payload
+        return build_payload
+
+    payload_kwargs = dict(
+        name=selected_assay_name,
+        id=selected_assay_id,
+        project_context=project,
+        genome_reference=selected_ref_genome,
+    )
+
     if filter_type and filter_given:
         payload, fields_list = final_payload(
             full_input_dict=filter_dict,
-            name=selected_assay_name,
-            id=selected_assay_id,
-            project_context=project,
-            genome_reference=selected_ref_genome,
             filter_type=filter_type,
+            **payload_kwargs
         )
 
         add_germline_base_sql(resp, payload)
@@ -842,8 +940,14 @@ def extract_assay_germline(args):
                 with open(out_file, "w") as sql_file:
                     print(sql_results, file=sql_file)
         else:
-            resp_raw = raw_api_call(resp, payload)
-            ordered_results = sorted(resp_raw["results"], key=sort_germline_variant)
+            results = raw_api_call_sharded(
+                resp,
+                filter_dict,
+                germline_payload_builder(filter_type=filter_type, **payload_kwargs),
+                GERMLINE_SHARD_KEYS[filter_type],
+                payload=payload,
+            )
+            ordered_results = sorted(results, key=sort_germline_variant)
 
             csv_from_json(
                 out_file_name=out_file,
@@ -852,6 +956,7 @@ def extract_assay_germline(args):
                 raw_results=ordered_results,
                 column_names=fields_list,
                 quote_char=str("|"),
+                output_format=args.output_format,
             )
 
     if args.retrieve_genotype and filter_given:
@@ -879,19 +984,14 @@ def extract_assay_germline(args):
                                                           exclude_refdata, exclude_halfref, exclude_nocall)
             
         # get the payload for the genotype/allele table query for alternate genotype types
-        genotype_payload, fields_list = final_payload(
-            full_input_dict=filter_dict,
-            name=selected_assay_name,
-            id=selected_assay_id,
-            project_context=project,
-            genome_reference=selected_ref_genome,
-            filter_type="genotype",
-            order=not genotype_only_types,
-        )
+        genotype_kwargs = dict(filter_type="genotype", order=not genotype_only_types, **payload_kwargs)
+        genotype_payload, fields_list = final_payload(full_input_dict=filter_dict, **genotype_kwargs)
 
         add_germline_base_sql(resp, genotype_payload)
 
         genotype_only_payloads = []
+        # filters and keyword arguments of final_payload for each genotype only payload, to split them if needed
+        genotype_only_queries = []
         if genotype_only_types:
             # get the payloads for the genotype table only query
             # assay_filter does not support "or" so there is a separate query for each partition
@@ -904,22 +1004,23 @@ def extract_assay_germline(args):
                 elif genotype_only_type == "no-call":
                     genotype_only_filter_dict["nocall_yn"] = True
 
-                genotype_only_payload, _ = final_payload(
-                    full_input_dict=genotype_only_filter_dict,
-                    name=selected_assay_name,
-                    id=selected_assay_id,
-                    project_context=project,
-                    genome_reference=selected_ref_genome,
+                genotype_only_kwargs = dict(
                     filter_type="genotype_only",
                     exclude_refdata=genotype_only_type != "ref",
                     exclude_halfref=genotype_only_type != "half",
                     exclude_nocall=genotype_only_type != "no-call",
                     order=i == len(genotype_only_types) - 1,
+                    **payload_kwargs
+                )
+                genotype_only_payload, _ = final_payload(
+                    full_input_dict=genotype_only_filter_dict,
+                    **genotype_only_kwargs
                 )
 
                 add_germline_base_sql(resp, genotype_only_payload)
 
                 genotype_only_payloads.append(genotype_only_payload)
+                genotype_only_queries.append((genotype_only_filter_dict, genotype_only_kwargs))
 
         # get the list of requested genotype types for the genotype/allele table query
         genotype_types = get_genotype_types(filter_dict)
@@ -958,14 +1059,27 @@ def extract_assay_germline(args):
             # get the list of dictionary results for the genotype/allele table query
             ordered_results = []
             if genotype_types:
-                genotype_resp_raw = raw_api_call(resp, genotype_payload)
-                ordered_results.extend(genotype_resp_raw["results"])
+                ordered_results.extend(raw_api_call_sharded(
+                    resp,
+                    filter_dict,
+                    germline_payload_builder(**genotype_kwargs),
+                    GERMLINE_SHARD_KEYS["genotype"],
+                    payload=genotype_payload,
+                ))
 
             # get the list of dictionary results for each genotype table only query
-            for genotype_only_payload in genotype_only_payloads:
-                genotype_only_resp_raw = raw_api_call(resp, genotype_only_payload)
+            for genotype_only_payload, (genotype_only_filter_dict, genotype_only_kwargs) in zip(
+                genotype_only_payloads, genotype_only_queries
+            ):
+                genotype_only_results = raw_api_call_sharded(
+                    resp,
+                    genotype_only_filter_dict,
+                    germline_payload_builder(**genotype_only_kwargs),
+                    GERMLINE_SHARD_KEYS["genotype"],
+                    payload=genotype_only_payload,
+                )
                 # add missing keys that are in the allele table part of the genotype/allele table query
-                ordered_results.extend(harmonize_germline_results(genotype_only_resp_raw["results"], fields_list))
+                ordered_results.extend(harmonize_germline_results(genotype_only_results, fields_list))
 
             if genotype_only_types:
                 # get the ref value from the allele table using locus ids
@@ -983,14 +1097,19 @@ def extract_assay_germline(args):
                 if selected_samples:
                     samples = list(selected_samples.intersection(samples))
                 loci_payload = get_germline_loci_payload(filter_dict["location"], genotype_payload)
-                loci = [locus for locus in raw_api_call(resp, loci_payload)["results"]]
+                loci = list(raw_api_call_stream(resp, loci_payload))
                 type_to_infer = "ref" if args.infer_ref else "no-call"
-                ordered_results = infer_genotype_type(samples, loci, ordered_results, type_to_infer)
+                ordered_results.sort(key=sort_germline_variant)
+                # The inferred genotypes (one per missing locus and sample) are generated in order
+                # and merged with the query results as they are written out
+                if type_to_infer not in types_to_filter_out:
+                    inferred_results = iter_inferred_genotypes(samples, loci, ordered_results, type_to_infer, sort=True)
+                    ordered_results = heapq.merge(ordered_results, inferred_results, key=sort_germline_variant)
                 # Filter out not requested genotypes
                 if len(types_to_filter_out) > 0:
-                    ordered_results = filter_results(ordered_results, "genotype_type", types_to_filter_out)
-
-            ordered_results.sort(key=sort_germline_variant)
+                    ordered_results = iter_filtered_results(ordered_results, "genotype_type", types_to_filter_out)
+            else:
+                ordered_results.sort(key=sort_germline_variant)
 
             csv_from_json(
                 out_file_name=out_file,
@@ -999,6 +1118,7 @@ def extract_assay_germline(args):
                 raw_results=ordered_results,
                 column_names=fields_list,
                 quote_char=str("|"),
+                output_format=args.output_format,
             )
 
 
@@ -1051,7 +1171,19 @@ def csv_from_json(
     column_names=[],
     quote_char=str('"'),
     quoting=csv.QUOTE_MINIMAL,
+    output_format=None,
+    column_types=None,
 ):
+    if output_format in TYPED_OUTPUT_FORMATS:
+        write_typed_output(
+            raw_results,
+            column_names,
+            output_format,
+            output_file_name=None if print_to_stdout else out_file_name,
+            column_types=column_types,
+        )
+        return
+
     if print_to_stdout:
         fields_output = sys.stdout
     else:
@@ -1069,12 +1201,19 @@ def csv_from_json(
         strict=False,
         fieldnames=column_names,
     )
-    csv_writer.writeheader()
-    for entry in raw_results:
-        csv_writer.writerow(entry)
-
-    if not print_to_stdout:
-        fields_output.close()
+    complete = False
+    try:
+        csv_writer.writeheader()
+        # raw_results may be a stream of results that are decoded as they are received
+        for entry in raw_results:
+            csv_writer.writerow(entry)
+        complete = True
+    finally:
+        if not print_to_stdout:
+            fields_output.close()
+            # A truncated or malformed stream must not leave a partial file behind
+            if not complete:
+                remove_partial_output(out_file_name)
 
 
 def extract_assay_somatic(args):
@@ -1095,6 +1234,12 @@ def extract_assay_somatic(args):
             '--list-assays cannot be presented with other options.'
         )
 
+    if args.output_format and any([args.sql, args.list_assays, args.json_help, args.additional_fields_help, args.retrieve_meta_info]):
+        err_exit(
+            "--output-format cannot be used with --sql, --list-assays, --json-help, --additional-fields-help or --retrieve-meta-info."
+        )
+    check_output_format(args.output_format)
+
     if args.json_help:
         if any([args.assay_name, args.output, args.include_normal_sample, args.additional_fields, args.sql]):
             err_exit(
@@ -1199,30 +1344,24 @@ def extract_assay_somatic(args):
     if args.retrieve_variant:
         filter_dict = json_validation_function("variant", args)
        
-        if args.additional_fields:
-            payload, fields_list = somatic_final_payload(
-                full_input_dict=filter_dict,
-                name=selected_assay_name,
-                id=selected_assay_id,
-                project_context=project,
-                genome_reference=selected_ref_genome,
-                additional_fields=additional_fields_input,
-                include_normal=args.include_normal_sample,
-            )
-        else:
-            payload, fields_list = somatic_final_payload(
-                full_input_dict=filter_dict,
+        def build_payload(shard_filter_dict):
+            shard_payload, shard_fields_list = somatic_final_payload(
+                full_input_dict=shard_filter_dict,
                 name=selected_assay_name,
                 id=selected_assay_id,
                 project_context=project,
                 genome_reference=selected_ref_genome,
+                additional_fields=additional_fields_input if args.additional_fields else None,
                 include_normal=args.include_normal_sample,
             )
 
-        if "CohortBrowser" in resp["recordTypes"]:
-            if resp.get("baseSql"):
-                payload["base_sql"] = resp.get("baseSql")
-            payload["filters"] = resp["filters"]
+            if "CohortBrowser" in resp["recordTypes"]:
+                if resp.get("baseSql"):
+                    shard_payload["base_sql"] = resp.get("baseSql")
+                shard_payload["filters"] = resp["filters"]
+            return shard_payload, shard_fields_list
+
+        payload, fields_list = build_payload(filter_dict)
 
         #### Run api call to get sql or extract data ####
 
@@ -1234,16 +1373,21 @@ def extract_assay_somatic(args):
                 with open(out_file, "w") as sql_file:
                     print(sql_results, file=sql_file)
         else:
-            resp_raw = raw_api_call(resp, payload)
-
             csv_from_json(
                 out_file_name=out_file,
                 print_to_stdout=print_to_stdout,
                 sep="\t",
-                raw_results=resp_raw["results"],
+                raw_results=raw_api_call_sharded(
+                    resp,
+                    filter_dict,
+                    lambda shard_filter_dict: build_payload(shard_filter_dict)[0],
+                    SOMATIC_SHARD_KEYS,
+                    payload=payload,
+                ),
                 column_names=fields_list,
                 quote_char=str("\t"),
                 quoting=csv.QUOTE_NONE,
+                output_format=args.output_format,
             )
 
 def extract_assay_expression(args):
@@ -1262,6 +1406,10 @@ def extract_assay_expression(args):
     )
     input_validator.validate_input_combination()
 
+    if args.output_format == "mtx" and not args.expression_matrix:
+        err_exit('"--output-format mtx" can only be used with "--expression-matrix".')
+    check_output_format(args.output_format)
+
     if args.json_help:
         print(EXTRACT_ASSAY_EXPRESSION_JSON_HELP)
         sys.exit(0)
@@ -1481,13 +1629,6 @@ def extract_assay_expression(args):
                 window_width=250000000,
                 check_each_separately=False,
             )
-    input_json_parser = JSONFiltersValidator(
-        input_json=user_filters_json,
-        schema=filter_schema,
-        error_handler=err_exit,
-    )
-    vizserver_raw_filters = input_json_parser.parse()
-
     _db_columns_list = filter_schema[
         "output_fields_mapping"
     ].get("default")
@@ -1522,27 +1663,36 @@ def extract_assay_expression(args):
         ]
         _db_columns_list.extend(user_additional_cols)
 
-    viz = VizPayloadBuilder(
-        project_context=project,
-        output_fields_mapping=_db_columns_list,
-        filters={"filters": COHORT_FILTERS} if IS_COHORT else None,
-        order_by=filter_schema["order_by"],
-        limit=None,
-        base_sql=BASE_SQL,
-        is_cohort=IS_COHORT,
-        error_handler=err_exit,
-    )
-
-
     DATASET_DESCRIPTOR = dataset.descriptor_file_dict
     ASSAY_NAME = (
         args.assay_name if args.assay_name else dataset.assay_names_list("molecular_expression")[0]
     )
 
-    viz.assemble_assay_raw_filters(
-        assay_name=ASSAY_NAME, assay_id=ASSAY_ID, filters=vizserver_raw_filters
-    )
-    vizserver_payload = viz.build()
+    def build_payload(filters_json):
+        input_json_parser = JSONFiltersValidator(
+            input_json=filters_json,
+            schema=filter_schema,
+            error_handler=err_exit,
+        )
+        vizserver_raw_filters = input_json_parser.parse()
+
+        viz = VizPayloadBuilder(
+            project_context=project,
+            output_fields_mapping=_db_columns_list,
+            filters={"filters": COHORT_FILTERS} if IS_COHORT else None,
+            order_by=filter_schema["order_by"],
+            limit=None,
+            base_sql=BASE_SQL,
+            is_cohort=IS_COHORT,
+            error_handler=err_exit,
+        )
+
+        viz.assemble_assay_raw_filters(
+            assay_name=ASSAY_NAME, assay_id=ASSAY_ID, filters=vizserver_raw_filters
+        )
+        return viz.build()
+
+    vizserver_payload = build_payload(user_filters_json)
 
     # Get the record ID and vizserver URL from the Dataset object
     record_id = dataset.detail_describe["id"]
@@ -1550,28 +1700,28 @@ def extract_assay_expression(args):
 
     # Create VizClient object and get data from vizserver using generated payload
     client = VizClient(url, project, err_exit)
+    colnames = None
     if args.sql:
-        vizserver_response = client.get_raw_sql(vizserver_payload, record_id)
+        # Output is on the "sql" key rather than the "results" key when sql is requested
+        output_data = client.get_raw_sql(vizserver_payload, record_id)["sql"]
     else:
-        vizserver_response = client.get_data(vizserver_payload, record_id)
-
-    colnames = None
-
-    # Output is on the "sql" key rather than the "results" key when sql is requested
-    output_data = (
-        vizserver_response["sql"] if args.sql else vizserver_response["results"]
-    )
-
-    # Output data (from vizserver_response["results"]) will be an empty list if no data is returned for the given filters
-    if args.expression_matrix and output_data:
-        transformed_response, colnames = transform_to_expression_matrix(
-            vizserver_response["results"]
-        )
-        output_data = transformed_response
-
-    if not output_data:
-        # write_expression_output expects a list of dicts
-        output_data = [{}]
+        # The results are decoded as they are received, and written out as they are decoded
+        # unless they have to be transformed to an expression matrix. Queries that are too
+        # large for vizserver are split along the location and list filters.
+        results = iter(client.get_data_sharded(
+            user_filters_json, build_payload, EXPRESSION_SHARD_KEYS, record_id, payload=vizserver_payload
+        ))
+        first_result = next(results, None)
+        if args.expression_matrix and (first_result is not None or args.output_format):
+            # The matrix is pivoted in compact arrays and written one sample at a time
+            output_data = ExpressionMatrix(
+                itertools.chain([first_result], results) if first_result is not None else []
+            )
+        elif first_result is None:
+            # No data is returned for the given filters; write_expression_output expects a list of dicts
+            output_data = [{}]
+        else:
+            output_data = itertools.chain([first_result], results)
 
     write_expression_output(
         args.output,
@@ -1581,6 +1731,8 @@ def extract_assay_expression(args):
         save_uncommon_delim_to_txt=True,
         output_file_name=dataset.detail_describe["name"],
         colnames=colnames,
+        output_format=args.output_format,
+        column_types={"expression": "float"},
     )
 
 
@@ -1860,15 +2012,19 @@ class DXDatasetDescriptor:
     def __init__(self, dxfile, **kwargs):
         python3_5_x = sys.version_info.major == 3 and sys.version_info.minor == 5
 
-        with as_handle(dxfile, is_gzip=True, **kwargs) as f:
-            if python3_5_x:
-                jsonstr = f.read()
-                if type(jsonstr) != str:
-                    jsonstr = jsonstr.decode("utf-8")
+        if isinstance(dxfile, DXFile):
+            # Descriptor files are immutable, so they are cached by file ID
+            obj = get_dataset_descriptor(dxfile.get_id(), project=dxfile.get_proj_id())
+        else:
+            with as_handle(dxfile, is_gzip=True, **kwargs) as f:
+                if python3_5_x:
+                    jsonstr = f.read()
+                    if type(jsonstr) != str:
+                        jsonstr = jsonstr.decode("utf-8")
 
-                obj = json.loads(jsonstr, object_pairs_hook=collections.OrderedDict)
-            else:
-                obj = json.load(f, object_pairs_hook=collections.OrderedDict)
+                    obj = json.loads(jsonstr, object_pairs_hook=collections.OrderedDict)
+                else:
+                    obj = json.load(f, object_pairs_hook=collections.OrderedDict)
 
         for key in obj:
             setattr(self, key, obj[key])
@@ -1882,22 +2038,60 @@ class DXDatasetDictionary:
     """
     A class to represent data, coding and entity dictionaries based on the descriptor.
     All 3 dictionaries will have the same internal representation as dictionaries of string to pandas dataframe.
+    The dictionaries are built in a single pass over the descriptor as columns (lists of values) per entity or
+    coding; the dataframes are only created when the attributes are first accessed, and write() turns each
+    dictionary into a single dataframe directly from the columns.
     Attributes
         data - dictionary of entity name to pandas dataframe representing entity with fields, relationships, etc.
         entity - dictionary of entity name to pandas dataframe representing entity title, etc.
         coding - dictionary of coding name to pandas dataframe representing codes, their hierarchy (if applicable) and their meanings
     """
 
+    DATA_REQUIRED_COLUMNS = ["entity", "name", "type", "primary_key_type"]
+    CODING_REQUIRED_COLUMNS = ["coding_name", "code", "meaning"]
+    ENTITY_REQUIRED_COLUMNS = ["entity", "entity_title"]
+    # Data dictionary types of the field types of the descriptor
+    DATASET_DATATYPES = {
+        "integer": "integer",
+        "double": "float",
+        "date": "date",
+        "datetime": "datetime",
+        "string": "string",
+    }
+
     def __init__(self, descriptor):
-        self.data_dictionary = self.load_data_dictionary(descriptor)
-        self.coding_dictionary = self.load_coding_dictionary(descriptor)
-        self.entity_dictionary = self.load_entity_dictionary(descriptor)
+        self.data_columns = self.load_data_dictionary(descriptor)
+        self.coding_columns = self.load_coding_dictionary(descriptor)
+        self.entity_columns = self.load_entity_dictionary(descriptor)
+        self._dataframes = {}
+
+    def _get_dataframes(self, name, blocks):
+        if name not in self._dataframes:
+            self._dataframes[name] = collections.OrderedDict(
+                (block_name, pd.DataFrame(columns)) for block_name, columns in blocks.items()
+            )
+        return self._dataframes[name]
+
+    @property
+    def data_dictionary(self):
+        return self._get_dataframes("data", self.data_columns)
+
+    @property
+    def coding_dictionary(self):
+        return self._get_dataframes("coding", self.coding_columns)
+
+    @property
+    def entity_dictionary(self):
+        return self._get_dataframes("entity", self.entity_columns)
 
     def load_data_dictionary(self, descriptor):
         """
-        Processes data dictionary from descriptor
+        Processes data dictionary from descriptor.
+        Returns an ordered dictionary of entity name to the columns of the entity.
         """
         eblocks = collections.OrderedDict()
+        # Row of each field name, per entity, to apply the edges
+        field_rows = {}
         join_path_to_entity_field = collections.OrderedDict()
         for entity_name in descriptor.model["entities"]:
             eblocks[entity_name] = self.create_entity_dframe(
@@ -1907,6 +2101,11 @@ class DXDatasetDictionary:
                 ),
                 global_primary_key=(descriptor.model["global_primary_key"]),
             )
+            rows = {}
+            for row, name in enumerate(eblocks[entity_name]["name"]):
+                # None marks field names that are not unique
+                rows[name] = None if name in rows else row
+            field_rows[entity_name] = rows
 
             join_path_to_entity_field.update(
                 self.get_join_path_to_entity_field_map(
@@ -1928,29 +2127,23 @@ class DXDatasetDictionary:
 
         for edge in edges:
             source_eblock = eblocks.get(edge["source_entity"])
-            if not source_eblock.empty:
-                eb_row_idx = source_eblock["name"] == edge["source_field"]
-                if eb_row_idx.sum() != 1:
+            if source_eblock["name"]:
+                row = field_rows[edge["source_entity"]].get(edge["source_field"])
+                if row is None:
                     raise ValueError("Invalid edge: " + str(edge))
 
-                ref = source_eblock["referenced_entity_field"].values
-                rel = source_eblock["relationship"].values
-                ref[eb_row_idx] = "{}:{}".format(
+                source_eblock["referenced_entity_field"][row] = "{}:{}".format(
                     edge["destination_entity"], edge["destination_field"]
                 )
-                rel[eb_row_idx] = edge["relationship"]
-
-                source_eblock = source_eblock.assign(
-                    relationship=rel, referenced_entity_field=ref
-                )
+                source_eblock["relationship"][row] = edge["relationship"]
 
         return eblocks
 
     def create_entity_dframe(self, entity, is_primary_entity, global_primary_key):
         """
-        Returns DataDictionary pandas DataFrame for an entity.
+        Returns the DataDictionary columns for an entity, as a dictionary of column name to list of values.
         """
-        required_columns = ["entity", "name", "type", "primary_key_type"]
+        required_columns = self.DATA_REQUIRED_COLUMNS
 
         extra_cols = [
             "coding_name",
@@ -1966,25 +2159,19 @@ class DXDatasetDictionary:
             "title",
             "units",
         ]
-        dataset_datatype_dict = {
-            "integer": "integer",
-            "double": "float",
-            "date": "date",
-            "datetime": "datetime",
-            "string": "string",
-        }
+        dataset_datatype_dict = self.DATASET_DATATYPES
         dcols = {col: [] for col in required_columns + extra_cols}
         dcols["entity"] = [entity["name"]] * len(entity["fields"])
         dcols["referenced_entity_field"] = [""] * len(entity["fields"])
         dcols["relationship"] = [""] * len(entity["fields"])
+        primary_key_type = "global" if is_primary_entity else "local"
 
-        for field in entity["fields"]:
+        for field_dict in entity["fields"].values():
             # Field-level parameters
-            field_dict = entity["fields"][field]
             dcols["name"].append(field_dict["name"])
             dcols["type"].append(dataset_datatype_dict[field_dict["type"]])
             dcols["primary_key_type"].append(
-                ("global" if is_primary_entity else "local")
+                primary_key_type
                 if (
                     entity["primary_key"]
                     and field_dict["name"] == entity["primary_key"]
@@ -1999,7 +2186,7 @@ class DXDatasetDictionary:
             dcols["description"].append(field_dict["description"])
             dcols["folder_path"].append(
                 " > ".join(field_dict["folder_path"])
-                if ("folder_path" in field_dict.keys() and field_dict["folder_path"])
+                if field_dict.get("folder_path")
                 else ""
             )
             dcols["is_multi_select"].append(
@@ -2017,12 +2204,23 @@ class DXDatasetDictionary:
             dcols["title"].append(field_dict["title"])
             dcols["units"].append(field_dict["units"])
 
-        try:
-            dframe = pd.DataFrame(dcols)
-        except ValueError as exc:
-            raise exc
+        return dcols
 
-        return dframe
+    @classmethod
+    def get_field_types(cls, model, fields_list):
+        """
+        Returns the data dictionary type of each of the fields ("<entity>.<field>") of fields_list,
+        as "list<type>" for multi-select fields.
+        """
+        field_types = {}
+        for entry in fields_list:
+            entity_name, field_name = entry.split(".")[:2]
+            field_dict = model["entities"][entity_name]["fields"][field_name]
+            field_type = cls.DATASET_DATATYPES.get(field_dict["type"], "string")
+            if field_dict.get("is_multi_select"):
+                field_type = "list<{}>".format(field_type)
+            field_types[entry] = field_type
+        return field_types
 
     def get_join_path_to_entity_field_map(self, entity):
         """
@@ -2082,7 +2280,8 @@ class DXDatasetDictionary:
 
     def load_coding_dictionary(self, descriptor):
         """
-        Processes coding dictionary from descriptor
+        Processes coding dictionary from descriptor.
+        Returns an ordered dictionary of coding name to the columns of the coding.
         """
         cblocks = collections.OrderedDict()
         for entity in descriptor.model["entities"]:
@@ -2098,112 +2297,81 @@ class DXDatasetDictionary:
 
     def create_coding_name_dframe(self, model, entity, field, coding_name_value):
         """
-        Returns CodingDictionary pandas DataFrame for a coding_name.
+        Returns the CodingDictionary columns for a coding_name, as a dictionary of column name to list of values.
         """
+        coding = model["codings"][coding_name_value]
+        codes_to_meanings = coding["codes_to_meanings"]
+        codes_to_concepts = coding["codes_to_concepts"] or {}
         dcols = {}
         if model["entities"][entity]["fields"][field]["is_hierarchical"]:
-            displ_ord = 0
-
-            def unpack_hierarchy(nodes, parent_code, displ_ord):
-                """Serialize the node hierarchy by depth-first traversal.
-
-                Yields: tuples of (code, parent_code)
-                """
-                for node in nodes:
-                    if isinstance(node, dict):
-                        next_parent_code, child_nodes = next(iter(node.items()))
-                        # internal: unpack recursively
-                        displ_ord += 1
-                        yield next_parent_code, parent_code, displ_ord
-                        for deep_node, deep_parent, displ_ord in unpack_hierarchy(
-                            child_nodes, next_parent_code, displ_ord
-                        ):
-                            yield (deep_node, deep_parent, displ_ord)
-                    else:
-                        # terminal: serialize
-                        displ_ord += 1
-                        yield (node, parent_code, displ_ord)
-
-            all_codes, parents, displ_ord = zip(
-                *unpack_hierarchy(
-                    model["codings"][coding_name_value]["display"], "", displ_ord
-                )
-            )
+            # Serialize the node hierarchy by depth-first traversal; the display
+            # order of a code is its position in the traversal
+            all_codes, parents = [], []
+            stack = [(iter(coding["display"]), "")]
+            while stack:
+                nodes, parent_code = stack[-1]
+                node = next(nodes, _END_OF_NODES)
+                if node is _END_OF_NODES:
+                    stack.pop()
+                elif isinstance(node, dict):
+                    # internal: unpack its children next
+                    code, child_nodes = next(iter(node.items()))
+                    all_codes.append(code)
+                    parents.append(parent_code)
+                    stack.append((iter(child_nodes), code))
+                else:
+                    # terminal: serialize
+                    all_codes.append(node)
+                    parents.append(parent_code)
+
             dcols.update(
                 {
                     "code": all_codes,
                     "parent_code": parents,
-                    "meaning": [
-                        model["codings"][coding_name_value]["codes_to_meanings"][c]
-                        for c in all_codes
-                    ],
-                    "concept": [
-                        model["codings"][coding_name_value]["codes_to_concepts"][c]
-                        if (
-                            model["codings"][coding_name_value]["codes_to_concepts"]
-                            and c
-                            in model["codings"][coding_name_value][
-                                "codes_to_concepts"
-                            ].keys()
-                        )
-                        else None
-                        for c in all_codes
-                    ],
-                    "display_order": displ_ord,
+                    "meaning": [codes_to_meanings[c] for c in all_codes],
+                    "concept": [codes_to_concepts.get(c) for c in all_codes],
+                    "display_order": list(range(1, len(all_codes) + 1)),
                 }
             )
 
         else:
             # No hierarchy; just unpack the codes dictionary
-            codes, meanings = zip(
-                *model["codings"][coding_name_value]["codes_to_meanings"].items()
-            )
-            if model["codings"][coding_name_value]["codes_to_concepts"]:
-                codes, concepts = zip(
-                    *model["codings"][coding_name_value]["codes_to_concepts"].items()
-                )
-            else:
-                concepts = [None] * len(codes)
-            display_order = [
-                int(model["codings"][coding_name_value]["display"].index(c) + 1)
-                for c in codes
-            ]
+            display_positions = {}
+            for position, c in enumerate(coding["display"], 1):
+                display_positions.setdefault(c, position)
+            codes = list(codes_to_meanings)
+            try:
+                display_order = [display_positions[c] for c in codes]
+            except KeyError as exc:
+                raise ValueError("{} is not in the display of coding {}".format(exc, coding_name_value))
             dcols.update(
                 {
                     "code": codes,
-                    "meaning": meanings,
-                    "concept": concepts,
+                    "meaning": list(codes_to_meanings.values()),
+                    "concept": [codes_to_concepts.get(c) for c in codes],
                     "display_order": display_order,
                 }
             )
 
         dcols["coding_name"] = [coding_name_value] * len(dcols["code"])
 
-        try:
-            dframe = pd.DataFrame(dcols)
-        except ValueError as exc:
-            raise exc
-
-        return dframe
+        return dcols
 
     def load_entity_dictionary(self, descriptor):
         """
-        Processes entity dictionary from descriptor
+        Processes entity dictionary from descriptor.
+        Returns an ordered dictionary of entity name to the columns of the entity (one row each).
         """
         entity_dictionary = collections.OrderedDict()
         for entity_name in descriptor.model["entities"]:
             entity = descriptor.model["entities"][entity_name]
-            entity_dictionary[entity_name] = pd.DataFrame.from_dict(
-                [
-                    {
-                        "entity": entity_name,
-                        "entity_title": entity.get("entity_title"),
-                        "entity_label_singular": entity.get("entity_label_singular"),
-                        "entity_label_plural": entity.get("entity_label_plural"),
-                        "entity_description": entity.get("entity_description"),
-                    }
-                ]
-            )
+            entity_dictionary[entity_name] = {
+                "entity": [entity_name],
+                "entity_title": [entity.get("entity_title")],
+                "entity_label_singular": [entity.get("entity_label_singular")],
+                "entity_label_plural": [entity.get("entity_label_plural")],
+                "entity_description": [entity.get("entity_description")],
+            }
         return entity_dictionary
 
     def write(
@@ -2219,33 +2387,36 @@ class DXDatasetDictionary:
             na_rep="",
         )
 
-        def sort_dataframe_columns(dframe, required_columns):
-            """Sort dataframe columns alphabetically but with `required_columns` first."""
-            extra_cols = dframe.columns.difference(required_columns)
-            sorted_cols = list(required_columns) + extra_cols.sort_values().tolist()
-            return dframe.loc[:, sorted_cols]
-
-        def as_dataframe(ord_dict_of_df, required_columns):
-            """Join all blocks into a pandas DataFrame."""
-            df = pd.concat([b for b in ord_dict_of_df.values()], sort=False)
-            return sort_dataframe_columns(df, required_columns)
-
-        if self.data_dictionary:
+        def as_dataframe(blocks, required_columns):
+            """
+            Join the columns of all blocks into a single pandas DataFrame, with the columns sorted
+            alphabetically but with `required_columns` first. Columns missing from a block are left blank.
+            """
+            column_names = collections.OrderedDict()
+            for columns in blocks.values():
+                column_names.update((name, True) for name in columns)
+            extra_cols = sorted(name for name in column_names if name not in required_columns)
+            joined = collections.OrderedDict((name, []) for name in list(required_columns) + extra_cols)
+            for columns in blocks.values():
+                nrows = len(next(iter(columns.values()))) if columns else 0
+                for name, values in joined.items():
+                    values.extend(columns.get(name, [None] * nrows))
+            return pd.DataFrame(joined)
+
+        if self.data_columns:
             data_dframe = as_dataframe(
-                self.data_dictionary,
-                required_columns=["entity", "name", "type", "primary_key_type"],
+                self.data_columns, required_columns=self.DATA_REQUIRED_COLUMNS
             )
             data_dframe.to_csv(output_file_data, **csv_opts)
 
-        if self.coding_dictionary:
+        if self.coding_columns:
             coding_dframe = as_dataframe(
-                self.coding_dictionary,
-                required_columns=["coding_name", "code", "meaning"],
+                self.coding_columns, required_columns=self.CODING_REQUIRED_COLUMNS
             )
             coding_dframe.to_csv(output_file_coding, **csv_opts)
 
-        if self.entity_dictionary:
+        if self.entity_columns:
             entity_dframe = as_dataframe(
-                self.entity_dictionary, required_columns=["entity", "entity_title"]
+                self.entity_columns, required_columns=self.ENTITY_REQUIRED_COLUMNS
             )
             entity_dframe.to_csv(output_file_entity, **csv_opts)
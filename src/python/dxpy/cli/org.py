@@ -24,7 +24,7 @@ import dxpy
 from . import try_call, prompt_for_yn, INTERACTIVE_CLI
 from .parsers import process_find_by_property_args, process_phi_param
 from ..exceptions import (DXCLIError, err_exit)
-from dxpy.utils.printing import (fill, DELIMITER, format_find_results)
+from dxpy.utils.printing import (fill, DELIMITER, format_find_results, JSONResultWriter)
 import json
 
 
@@ -197,7 +197,7 @@ def find_orgs(args):
     res_iter = dxpy.find_orgs(_get_find_orgs_args(args)["query"])
 
     if args.json:
-        print(json.dumps(list(res_iter)))
+        JSONResultWriter(args.json_stream, indent=None).write_all(res_iter)
     elif args.brief:
         for res in res_iter:
             print(res["id"])
@@ -3,7 +3,35 @@ import sys
 import csv
 import os
 import json
+import itertools
+import tempfile
 from ..exceptions import err_exit
+from ..bindings.apollo.data_transformations import ExpressionMatrix
+
+# File suffixes of the output formats other than delimited text
+OUTPUT_FORMAT_SUFFIXES = {
+    "mtx": ".mtx",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "jsonl": ".jsonl",
+}
+# Output formats written by write_typed_output
+TYPED_OUTPUT_FORMATS = ["parquet", "arrow", "jsonl"]
+# Number of rows converted and written at a time (i.e. per Parquet row group or Arrow record batch)
+ROW_GROUP_SIZE = 65536
+
+
+def remove_partial_output(output_file_name):
+    """
+    Removes an output file whose writing did not complete (e.g. because the stream of results it
+    was written from was truncated or malformed), so that it is not mistaken for a complete one
+    """
+    if output_file_name is None:
+        return
+    try:
+        os.remove(output_file_name)
+    except OSError:
+        pass
 
 
 def write_expression_output(
@@ -15,6 +43,8 @@ def write_expression_output(
     output_file_name=None,
     error_handler=err_exit,
     colnames=None,
+    output_format=None,
+    column_types=None,
 ):
     """
     arg_output: str
@@ -36,6 +66,9 @@ def write_expression_output(
     if arg_sql is True, this is expected to be a string representing the SQL query
     if arg_sql is False, this is expected to be a list of dicts representing the output of a SQL query
     if output_listdict_or_string is a list of dicts, all dicts must have the same keys which will be used as column names
+    if arg_sql is False, it can also be an iterator over dicts (e.g. results streamed from vizserver); the rows are then
+    written as they are produced, and checked for the same keys as they are written
+    if arg_sql is False, it can also be an ExpressionMatrix (see data_transformations), which is written row by row
 
     save_uncommon_delim_to_txt: bool
     Set this to False if you want to error out when any delimiter other than "," or "\t" is specified
@@ -45,6 +78,16 @@ def write_expression_output(
     Do not append a suffix to this string
     output_file_name is mandatory when arg_output is not specified
 
+    output_format: str
+    "mtx" to write an ExpressionMatrix in Matrix Market coordinate format (file suffix .mtx), with its
+    sample IDs and feature IDs, one per line, in <file name>.samples.tsv and <file name>.features.tsv
+    "parquet", "arrow" or "jsonl" to write the data with typed columns (see write_typed_output)
+    This can be args.output_format from argparse
+
+    column_types: dict
+    Types of (some of) the columns, used with the "parquet" and "arrow" output formats (see write_typed_output)
+    The values of an ExpressionMatrix are always written as floats
+
     By default delimiter is set "," and file suffix is csv (when writing to file)
 
     None values are written as empty strings by default (csv.DictWriter behavior)
@@ -60,6 +103,14 @@ def write_expression_output(
         SUFFIX = ".sql"
         if not isinstance(output_listdict_or_string, str):
             error_handler("Expected SQL query to be a string")
+    elif output_format == "mtx":
+        SUFFIX = OUTPUT_FORMAT_SUFFIXES[output_format]
+        if not isinstance(output_listdict_or_string, ExpressionMatrix):
+            error_handler("Matrix Market output is only supported for expression matrices")
+        if arg_output == "-":
+            error_handler("Matrix Market output cannot be written to STDOUT")
+    elif output_format in TYPED_OUTPUT_FORMATS:
+        SUFFIX = OUTPUT_FORMAT_SUFFIXES[output_format]
     elif arg_delim:
         if arg_delim == ",":
             SUFFIX = ".csv"
@@ -92,7 +143,12 @@ def write_expression_output(
             WRITE_METHOD = "FILE"
             output_file_name = os.path.join(OUTPUT_DIR, output_file_name + SUFFIX)
 
-    if WRITE_METHOD == "FILE":
+    output_file_names = [output_file_name]
+    if output_format == "mtx":
+        output_file_stem = os.path.splitext(output_file_name)[0]
+        output_file_names += [output_file_stem + ".samples.tsv", output_file_stem + ".features.tsv"]
+
+    for output_file_name in output_file_names if WRITE_METHOD == "FILE" else []:
         # error out if file already exists or output_file_name is a directory
         if os.path.exists(output_file_name):
             if os.path.isfile(output_file_name):
@@ -108,6 +164,8 @@ def write_expression_output(
                     )
                 )
 
+    output_file_name = output_file_names[0]
+
     if arg_sql:
         if WRITE_METHOD == "STDOUT":
             print(output_listdict_or_string)
@@ -117,16 +175,88 @@ def write_expression_output(
         else:
             error_handler("Unexpected error occurred while writing SQL query output")
 
+    elif output_format == "mtx":
+        matrix = output_listdict_or_string
+        with open(output_file_name, "w") as f:
+            matrix.write_matrix_market(f)
+        for ids_file_name, ids in zip(output_file_names[1:], (matrix.sample_ids, matrix.feature_ids)):
+            with open(ids_file_name, "w") as f:
+                for id in ids:
+                    f.write("{}\n".format(id))
+
+    elif isinstance(output_listdict_or_string, ExpressionMatrix) and output_format in TYPED_OUTPUT_FORMATS:
+        matrix = output_listdict_or_string
+        matrix_column_types = dict.fromkeys(matrix.feature_ids, "float")
+        matrix_column_types["sample_id"] = "string"
+        write_typed_output(
+            (dict(zip(matrix.colnames, row)) for row in matrix.iter_rows()),
+            matrix.colnames,
+            output_format,
+            output_file_name=output_file_name if WRITE_METHOD == "FILE" else None,
+            column_types=matrix_column_types,
+            error_handler=error_handler,
+        )
+
+    elif isinstance(output_listdict_or_string, ExpressionMatrix):
+        # Rows are written as lists, without building a dict per sample
+        matrix = output_listdict_or_string
+        writer_params = {
+            "delimiter": str(arg_delim) if arg_delim else ",",
+            "lineterminator": OS_SPECIFIC_LINE_SEPARATOR,
+            "quoting": csv.QUOTE_MINIMAL,
+            "quotechar": '"',
+        }
+        if WRITE_METHOD == "FILE":
+            f = open(output_file_name, "w", newline="")
+        else:
+            f = sys.stdout
+        try:
+            w = csv.writer(f, **writer_params)
+            w.writerow(matrix.colnames)
+            w.writerows(matrix.iter_rows())
+        finally:
+            if WRITE_METHOD == "FILE":
+                f.close()
+
     else:
+        if isinstance(output_listdict_or_string, list):
+            rows = output_listdict_or_string
+            first_row = rows[0]
+        else:
+            # An iterator over rows that are decoded as they are received:
+            # they are checked as they are written
+            rows = iter(output_listdict_or_string)
+            first_row = next(rows, {})
+            rows = itertools.chain([first_row], rows)
+
         if colnames:
             COLUMN_NAMES = colnames
         else:
-            COLUMN_NAMES = output_listdict_or_string[0].keys()
-
-        if not all(
-            set(i.keys()) == set(COLUMN_NAMES) for i in output_listdict_or_string
-        ):
-            error_handler("All rows must have the same column names")
+            COLUMN_NAMES = first_row.keys()
+        column_set = set(COLUMN_NAMES)
+
+        def checked_rows(rows):
+            for row in rows:
+                if set(row.keys()) != column_set:
+                    error_handler("All rows must have the same column names")
+                yield row
+
+        if isinstance(rows, list):
+            if not all(set(i.keys()) == column_set for i in rows):
+                error_handler("All rows must have the same column names")
+        else:
+            rows = checked_rows(rows)
+
+        if output_format in TYPED_OUTPUT_FORMATS:
+            write_typed_output(
+                rows,
+                list(COLUMN_NAMES),
+                output_format,
+                output_file_name=output_file_name if WRITE_METHOD == "FILE" else None,
+                column_types=column_types,
+                error_handler=error_handler,
+            )
+            return
 
         WRITE_MODE = "wb" if IS_PYTHON_2 or IS_OS_WINDOWS else "w"
         NEWLINE = "" if IS_PYTHON_3 else None
@@ -150,20 +280,242 @@ def write_expression_output(
         }
 
         if WRITE_METHOD == "FILE":
-            with open(output_file_name, **write_args) as f:
-                w = csv.DictWriter(f, **dictwriter_params)
-                w.writeheader()
-                w.writerows(output_listdict_or_string)
+            complete = False
+            try:
+                with open(output_file_name, **write_args) as f:
+                    w = csv.DictWriter(f, **dictwriter_params)
+                    w.writeheader()
+                    w.writerows(rows)
+                complete = True
+            finally:
+                if not complete:
+                    remove_partial_output(output_file_name)
 
         elif WRITE_METHOD == "STDOUT":
             w = csv.DictWriter(sys.stdout, **dictwriter_params)
             w.writeheader()
-            w.writerows(output_listdict_or_string)
+            w.writerows(rows)
 
         else:
             error_handler("Unexpected error occurred while writing output")
 
 
+def _import_pyarrow(output_format, error_handler):
+    try:
+        import pyarrow
+
+        if output_format == "parquet":
+            import pyarrow.parquet
+        else:
+            import pyarrow.ipc
+    except ImportError:
+        pyarrow = None
+    if pyarrow is None:
+        # Reported outside of the except clause so that no traceback is printed
+        error_handler(
+            '"--output-format {}" requires pyarrow, which is not currently installed. '
+            "Please install pyarrow, for example with 'python3 -m pip install pyarrow'.".format(output_format)
+        )
+    return pyarrow
+
+
+def check_output_format(output_format, error_handler=err_exit):
+    """
+    Reports an error if the packages needed by output_format are not installed, so that it
+    can be done before the data is retrieved
+    """
+    if output_format in ("parquet", "arrow"):
+        _import_pyarrow(output_format, error_handler)
+
+
+def _get_arrow_type(pa, column_type):
+    if column_type.startswith("list<") and column_type.endswith(">"):
+        return pa.list_(_get_arrow_type(pa, column_type[5:-1]))
+    arrow_types = {
+        "string": pa.string(),
+        "integer": pa.int64(),
+        "float": pa.float64(),
+        "boolean": pa.bool_(),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("us"),
+    }
+    return arrow_types.get(column_type, pa.string())
+
+
+def _infer_arrow_type(pa, values):
+    try:
+        return pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+
+
+def _widen_arrow_type(pa, arrow_type, other_type):
+    # The narrowest type the values of both types can be converted to:
+    # integers and floats are widened to floats, other mixes to strings
+    if arrow_type is None or pa.types.is_null(arrow_type):
+        return other_type
+    if pa.types.is_null(other_type) or other_type == arrow_type:
+        return arrow_type
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (arrow_type, other_type)):
+        return pa.float64()
+    return pa.string()
+
+
+def _to_arrow_array(pa, values, arrow_type=None):
+    # Values are converted to the type they are inferred as, and then cast
+    # (safely, i.e. without loss) to arrow_type; values of mixed types (e.g.
+    # numbers and strings) are converted to strings first
+    if arrow_type is not None and pa.types.is_list(arrow_type):
+        values = [value if value is None or isinstance(value, list) else [value] for value in values]
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        array = pa.array([value if value is None else str(value) for value in values], type=pa.string())
+    if arrow_type is None:
+        return array if not pa.types.is_null(array.type) else array.cast(pa.string())
+    if array.type == arrow_type:
+        return array
+    try:
+        return array.cast(arrow_type)
+    except pa.ArrowInvalid:
+        if not (pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type)):
+            raise
+        # Dates with a time, and times with a UTC offset (which are converted to UTC)
+        return _to_timestamp_array(pa, array).cast(arrow_type, safe=False)
+
+
+def _to_timestamp_array(pa, array):
+    try:
+        return array.cast(pa.timestamp("us"))
+    except pa.ArrowInvalid:
+        pass
+    try:
+        return array.cast(pa.timestamp("us", tz="UTC")).cast(pa.timestamp("us"))
+    except pa.ArrowInvalid:
+        if len(array) == 1:
+            raise
+    # Times with and without a UTC offset
+    return pa.concat_arrays([_to_timestamp_array(pa, array.slice(i, 1)) for i in range(len(array))])
+
+
+def write_typed_output(
+    rows,
+    column_names,
+    output_format,
+    output_file_name=None,
+    column_types=None,
+    row_group_size=ROW_GROUP_SIZE,
+    error_handler=err_exit,
+):
+    """
+    rows: iterable of dicts
+    The rows to write, e.g. results streamed from vizserver; they are written as they are produced,
+    row_group_size at a time, and missing values are written as nulls
+
+    column_names: list of str
+    The columns to write, in order
+
+    output_format: str
+    One of "parquet" (Parquet file, one row group per row_group_size rows), "arrow" (Arrow IPC file,
+    one record batch per row_group_size rows) or "jsonl" (one JSON object per line)
+    "parquet" and "arrow" require pyarrow
+
+    output_file_name: str
+    The file to write to; when None, the output is written to stdout
+
+    column_types: dict
+    Type of each column, as in the data dictionary of a dataset (see DXDatasetDictionary): one of "string",
+    "integer", "float", "boolean", "date" and "datetime", or "list<type>" for lists of values (e.g. the
+    values of multi-select fields)
+    The types of the other columns are inferred from all their values (integers mixed with floats are
+    written as floats, other mixed values and columns without any values as strings); if there are more
+    than row_group_size rows, the rows are first spooled to a temporary file to do so. All types are
+    ignored by the "jsonl" output format
+    """
+    if output_format == "jsonl":
+        fd = open(output_file_name, "w") if output_file_name is not None else sys.stdout
+        complete = False
+        try:
+            for row in rows:
+                fd.write(json.dumps({name: row.get(name) for name in column_names}) + "\n")
+            complete = True
+        finally:
+            if output_file_name is not None:
+                fd.close()
+                if not complete:
+                    remove_partial_output(output_file_name)
+        return
+
+    pa = _import_pyarrow(output_format, error_handler)
+    arrow_types = {name: _get_arrow_type(pa, column_type) for name, column_type in (column_types or {}).items()}
+    inferred_names = [name for name in column_names if name not in arrow_types]
+    schema = None
+    writer = None
+    spool = None
+    fd = open(output_file_name, "wb") if output_file_name is not None else sys.stdout.buffer
+    complete = False
+    try:
+        rows = iter(rows)
+        first_chunk = list(itertools.islice(rows, row_group_size))
+        if inferred_names and len(first_chunk) == row_group_size:
+            # The first row group is not enough to infer the types of the columns (e.g. a column
+            # may only have nulls or integers in it), and they cannot be changed once it is written
+            spool = tempfile.TemporaryFile("w+")
+            inferred_types = {}
+            chunk = first_chunk
+            while chunk:
+                for name in inferred_names:
+                    inferred_types[name] = _widen_arrow_type(
+                        pa, inferred_types.get(name), _infer_arrow_type(pa, [row.get(name) for row in chunk])
+                    )
+                for row in chunk:
+                    spool.write(json.dumps({name: row.get(name) for name in column_names}) + "\n")
+                chunk = list(itertools.islice(rows, row_group_size))
+            for name, arrow_type in inferred_types.items():
+                arrow_types[name] = arrow_type if not pa.types.is_null(arrow_type) else pa.string()
+            spool.seek(0)
+            rows = (json.loads(line) for line in spool)
+            first_chunk = list(itertools.islice(rows, row_group_size))
+
+        chunk = first_chunk
+        while True:
+            if schema is not None:
+                chunk = list(itertools.islice(rows, row_group_size))
+                if not chunk:
+                    break
+            arrays = []
+            for i, name in enumerate(column_names):
+                if schema is not None:
+                    arrow_type = schema.field(i).type
+                else:
+                    arrow_type = arrow_types.get(name)
+                error = None
+                try:
+                    arrays.append(_to_arrow_array(pa, [row.get(name) for row in chunk], arrow_type))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+                    error = e
+                if error is not None:
+                    error_handler('Could not convert the values of "{}" to {}: {}'.format(name, arrow_type, error))
+            if schema is None:
+                schema = pa.schema([pa.field(name, array.type) for name, array in zip(column_names, arrays)])
+                if output_format == "parquet":
+                    writer = pa.parquet.ParquetWriter(fd, schema)
+                else:
+                    writer = pa.ipc.new_file(fd, schema)
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            if len(chunk) < row_group_size:
+                break
+        complete = True
+    finally:
+        if writer is not None:
+            writer.close()
+        if spool is not None:
+            spool.close()
+        if output_file_name is not None:
+            fd.close()
+            if not complete:
+                remove_partial_output(output_file_name)
+
 
 def pretty_print_json(json_dict: dict) -> str:
     """Pretty-prints the provided JSON object.
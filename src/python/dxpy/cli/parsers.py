@@ -53,9 +53,26 @@ delim_arg.add_argument('--delimiter', '--delim',
                        nargs='?',
                        const="\t")
 
+class JSONStreamAction(argparse.Action):
+    def __init__(self, *args, **kwargs):
+        kwargs['nargs'] = 0
+        super(JSONStreamAction, self).__init__(*args, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        namespace.json = True
+        setattr(namespace, self.dest, self.const)
+
 json_arg = argparse.ArgumentParser(add_help=False)
 json_arg.add_argument('--json', help='Display return value in JSON', action='store_true')
 
+json_stream_args = argparse.ArgumentParser(add_help=False)
+json_stream_args.add_argument('--json-stream', dest='json_stream', help=fill('Like --json, but print the JSON array incrementally as results are received', width_adjustment=-24), action=JSONStreamAction, const='array')
+json_stream_args.add_argument('--json-lines', dest='json_stream', help=fill('Display each result as a single-line JSON object as soon as it is received (JSON Lines)', width_adjustment=-24), action=JSONStreamAction, const='lines')
+
+cached_args = argparse.ArgumentParser(add_help=False)
+cached_args.add_argument('--cached', help=fill('Answer from the local metadata index of the project (built on first use) instead of querying the platform; the age of the index is printed to stderr', width_adjustment=-24), action='store_true')
+cached_args.add_argument('--refresh-cache', help=fill('Incrementally update the local metadata index of the project before answering; implies --cached', width_adjustment=-24), action='store_true')
+
 try_arg = argparse.ArgumentParser(add_help=False)
 try_arg.add_argument('--try', metavar="T", dest="job_try", type=int,
                      help=fill('When modifying a job that was restarted, apply the change to try T of the restarted job. T=0 refers to the first try. Default is the last job try.', width_adjustment=-24))
@@ -105,6 +122,8 @@ find_executions_args.add_argument('--root-execution', '--root', help=fill('Execu
 find_executions_args.add_argument('-n', '--num-results', metavar='N', type=int, help=fill('Max number of results (trees or jobs, as according to the search mode) to return (default 10)', width_adjustment=-24), default=10)
 find_executions_args.add_argument('-o', '--show-outputs', help=fill('Show job outputs in results', width_adjustment=-24), action='store_true')
 find_executions_args.add_argument('--include-restarted', help=fill('if specified, results will include restarted jobs and job trees rooted in restarted jobs', width_adjustment=-24), action='store_true')
+find_executions_args.add_argument('--tree-depth', metavar='N', type=int, help=fill('In tree mode, show at most N levels of executions below the root of each tree', width_adjustment=-24))
+find_executions_args.add_argument('--tree-width', metavar='N', type=int, help=fill('In tree mode, show at most N children of each execution; the number of children not shown is printed instead', width_adjustment=-24))
 
 def add_find_executions_search_gp(parser):
     find_executions_search_gp = parser.add_argument_group('Search mode')
@@ -27,9 +27,11 @@ from .parsers import (process_dataobject_args, process_single_dataobject_output_
                       process_instance_type_arg)
 from ..utils.describe import io_val_to_str
 from ..utils.resolver import (resolve_existing_path, resolve_path, is_analysis_id)
+from ..utils.resolution_cache import invalidates_resolution_cache
 from ..exceptions import (err_exit, DXCLIError, InvalidState)
 from . import (try_call, try_call_err_exit)
 
+@invalidates_resolution_cache
 def new_workflow(args):
     try_call(process_dataobject_args, args)
     try_call(process_single_dataobject_output_args, args)
@@ -25,6 +25,22 @@ with open(
     column_conditions = json.load(infile)
 
 
+# Filter schemas by filter type, loaded once for the lifetime of the process
+_filter_schemas = {}
+
+
+def load_filter_schema(filter_type):
+    """
+    Returns the JSON schema of the given filter type (allele, annotation or genotype),
+    reading the schema file only the first time
+    """
+    if filter_type not in _filter_schemas:
+        schema_file = "retrieve_{}_schema.json".format(filter_type)
+        with open(os.path.join(extract_utils_basepath, schema_file), "r") as infile:
+            _filter_schemas[filter_type] = json.load(infile)
+    return _filter_schemas[filter_type]
+
+
 def retrieve_geno_bins(list_of_genes, project, genome_reference):
     """
     A function for determining appropriate geno bins to attach to a given annotation$gene_name
@@ -290,11 +306,7 @@ def validate_JSON(filter, type):
     Errors out if JSON is invalid, continues otherwise
     """
 
-    schema_file = "retrieve_{}_schema.json".format(type)
-
-    # Open the schema asset.
-    with open(os.path.join(extract_utils_basepath, schema_file), "r") as infile:
-        json_schema = json.load(infile)
+    json_schema = load_filter_schema(type)
 
     # Note: jsonschema disabled in this release
     # The jsonschema validation function will error out if the schema is invalid.  The error message will contain
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import itertools
 import json
 import os
 import re
@@ -262,6 +263,39 @@ def _produce_loci_dict(loci: list[dict], results_entries: list[dict]) -> dict:
     return loci_dict
 
 
+def iter_inferred_genotypes(
+    samples: list, loci: list[dict], result_entries: list[dict], type_to_infer: str, sort: bool = False
+):
+    """
+    Generates the entries inferred by infer_genotype_type one at a time, so that they can be
+    written out as they are produced instead of being collected for all loci and samples.
+    Args:
+        samples, loci, result_entries, type_to_infer: see infer_genotype_type
+        sort: if True, the entries are generated in the order of sort_germline_variant, so that
+            they can be merged with result_entries sorted the same way (see heapq.merge);
+            otherwise they are generated locus by locus, in the order of loci and samples
+    """
+    loci_dict = _produce_loci_dict(loci, result_entries)
+    loci_groups = [[locus] for locus in loci_dict]
+    if sort:
+        samples = sorted(samples)
+        # Loci at the same position have the same sort key, so their entries are interleaved by sample
+        loci_keys = {locus: sort_germline_variant(loci_dict[locus]["entry"])[:4] for locus in loci_dict}
+        loci_groups = [
+            list(group) for _, group in itertools.groupby(sorted(loci_dict, key=loci_keys.get), key=loci_keys.get)
+        ]
+
+    for group in loci_groups:
+        templates = [
+            (loci_dict[locus]["samples"], {"sample_id": None, **loci_dict[locus]["entry"], "genotype_type": type_to_infer})
+            for locus in group
+        ]
+        for sample in samples:
+            for locus_samples, template in templates:
+                if sample not in locus_samples:
+                    yield {**template, "sample_id": sample}
+
+
 def infer_genotype_type(
     samples: list, loci: list[dict], result_entries: list[dict], type_to_infer: str
 ) -> list[dict]:
@@ -290,19 +324,7 @@ def infer_genotype_type(
         type_to_infer: type to infer either  "ref" or "no-call"
     Returns: list of infered entries with added inferred genotype type and other entries retrieved from result for loci of interest.
     """
-    loci_dict = _produce_loci_dict(loci, result_entries)
-    inferred_entries = []
-    for locus in loci_dict:
-        for sample in samples:
-            if sample not in loci_dict[locus]["samples"]:
-                inferred_entries.append(
-                    {
-                        "sample_id": sample,
-                        **loci_dict[locus]["entry"],
-                        "genotype_type": type_to_infer,
-                    }
-                )
-    return result_entries + inferred_entries
+    return result_entries + list(iter_inferred_genotypes(samples, loci, result_entries, type_to_infer))
 
 
 def filter_results(
@@ -326,5 +348,13 @@ def filter_results(
         restricted_values: list of values to filter by
     Returns: list of filtered entries
     """
-    return [entry for entry in results if entry[key] not in restricted_values]
+    return list(iter_filtered_results(results, key, restricted_values))
+
+
+def iter_filtered_results(results, key: str, restricted_values: list):
+    """
+    Like filter_results, but returns a generator, so that results can be filtered as they are written out.
+    """
+    restricted_values = set(restricted_values)
+    return (entry for entry in results if entry[key] not in restricted_values)
 
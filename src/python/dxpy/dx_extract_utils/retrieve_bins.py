@@ -1,51 +1,116 @@
+import bisect
 import json
+import threading
 from ..exceptions import err_exit, ResourceNotFound
+from ..utils.descriptor_cache import get_descriptor_cache
 import os
 import dxpy
-import subprocess
+
+# Directory, in the user configuration directory, of the cached gene-to-bin indexes
+GENO_BINS_CACHE_DIRNAME = "geno_bins"
+
+# Gene-to-bin indexes by file ID, manifests by path, and gene-to-bin map file IDs
+# and project regions, kept for the lifetime of the process
+_indexes = {}
+_manifests = {}
+_map_file_ids = {}
+_project_regions = {}
+_lock = threading.Lock()
+
+
+class GenoBinIndex(object):
+    """
+    Index of a gene-to-bin map file, which maps gene names (or IDs, symbols,
+    features) to their geno bin: {"<gene>": {"chr": ..., "start": ..., "end": ...,
+    "strand": ...}, ...}
+
+    The genes are kept sorted, with their bins in parallel lists, and are looked
+    up by bisection. This is much more compact than the parsed JSON, and loads
+    quickly from the on-disk cache.
+    """
+
+    def __init__(self, gene_map):
+        self.genes = sorted(gene_map)
+        self.chrs = [gene_map[gene]["chr"] for gene in self.genes]
+        self.starts = [gene_map[gene]["start"] for gene in self.genes]
+        self.ends = [gene_map[gene]["end"] for gene in self.genes]
+
+    def __len__(self):
+        return len(self.genes)
+
+    def get(self, gene):
+        """
+        Returns the bin of the gene, as {"chr": ..., "start": ..., "end": ...},
+        or None if the gene is not in the map
+        """
+        i = bisect.bisect_left(self.genes, gene)
+        if i == len(self.genes) or self.genes[i] != gene:
+            return None
+        return {"chr": self.chrs[i], "start": self.starts[i], "end": self.ends[i]}
+
+
+def get_geno_bin_index(file_id):
+    """
+    Returns the index of the gene-to-bin map file with the given ID. Files are
+    immutable, so indexes are kept in memory and in the on-disk cache (see
+    dxpy.utils.descriptor_cache) keyed by file ID, and the file is only
+    downloaded if it is in neither.
+    """
+    with _lock:
+        if file_id not in _indexes:
+            cache = get_descriptor_cache(GENO_BINS_CACHE_DIRNAME)
+            index = cache.get(file_id) if cache is not None else None
+            if index is None:
+                index = GenoBinIndex(json.loads(dxpy.DXFile(file_id, mode="rb").read()))
+                if cache is not None:
+                    cache.put(file_id, index)
+            _indexes[file_id] = index
+        return _indexes[file_id]
+
+
+def _load_manifest(path):
+    if path not in _manifests:
+        with open(path, "r") as geno_bin_manifest:
+            _manifests[path] = json.load(geno_bin_manifest)
+    return _manifests[path]
+
+
+def _get_map_file_id(project, genome_reference, extract_utils_basepath, stage_file, platform_file):
+    if project not in _project_regions:
+        _project_regions[project] = dxpy.describe(project)["region"]
+    region = _project_regions[project]
+
+    key = (extract_utils_basepath, stage_file, platform_file, genome_reference, region)
+    if key not in _map_file_ids:
+        try:
+            r = _load_manifest(os.path.join(extract_utils_basepath, platform_file))
+            dxpy.describe(r[genome_reference][region])
+        except ResourceNotFound:
+            r = _load_manifest(os.path.join(extract_utils_basepath, stage_file))
+        _map_file_ids[key] = r[genome_reference][region]
+    return _map_file_ids[key]
+
 
 def retrieve_bins(list_of_genes, project, genome_reference, extract_utils_basepath,
                   stage_file,platform_file,error_message):
     """
     A function for determining appropriate geno bins to attach to a given filter
     """
-    project_desc = dxpy.describe(project)
-    geno_positions = []
-
-    try:
-        with open(
-            os.path.join(
-                extract_utils_basepath, platform_file
-            ),
-            "r",
-        ) as geno_bin_manifest:
-            r = json.load(geno_bin_manifest)
-        dxpy.describe(r[genome_reference][project_desc["region"]])
-    except ResourceNotFound:
-        with open(
-            os.path.join(
-                extract_utils_basepath, stage_file
-            ),
-            "r",
-        ) as geno_bin_manifest:
-            r = json.load(geno_bin_manifest)
-
-    geno_bins = subprocess.check_output(
-        ["dx", "cat", r[genome_reference][project_desc["region"]]]
+    index = get_geno_bin_index(
+        _get_map_file_id(project, genome_reference, extract_utils_basepath, stage_file, platform_file)
     )
-    geno_bins_json = json.loads(geno_bins)
+    geno_positions = []
     invalid_genes = []
 
     for gene in list_of_genes:
-        bin = geno_bins_json.get(gene)
+        bin = index.get(gene)
         if bin is None:
             invalid_genes.append(gene)
         else:
-            bin.pop("strand")
             geno_positions.append(bin)
 
     if invalid_genes:
         error_message = error_message + ": " + str(invalid_genes)
         err_exit(error_message)
 
-    return geno_positions
\ No newline at end of file
+    return geno_positions
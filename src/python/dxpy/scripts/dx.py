@@ -37,7 +37,7 @@ from ..cli import workflow as workflow_cli
 from ..cli.cp import cp
 from ..cli.dataset_utilities import extract_dataset, extract_assay_germline, extract_assay_somatic, create_cohort, extract_assay_expression
 from ..cli.download import (download_one_file, download_one_database_file, download)
-from ..cli.parsers import (no_color_arg, delim_arg, env_args, stdout_args, all_arg, json_arg, try_arg, parser_dataobject_args,
+from ..cli.parsers import (no_color_arg, delim_arg, env_args, stdout_args, all_arg, json_arg, json_stream_args, try_arg, cached_args, parser_dataobject_args,
                            parser_single_dataobject_output_args, process_properties_args,
                            find_by_properties_and_tags_args, process_find_by_property_args, process_dataobject_args,
                            process_single_dataobject_output_args, find_executions_args, add_find_executions_search_gp,
@@ -49,14 +49,14 @@ from ..cli.org import (get_org_invite_args, add_membership, remove_membership, u
                        find_orgs, org_find_members, org_find_projects, org_find_apps)
 from ..exceptions import (err_exit, DXError, DXCLIError, DXAPIError, network_exceptions, default_expected_exceptions,
                           format_exception)
-from ..utils import warn, group_array_by_field, normalize_timedelta, normalize_time_input, merge
-from ..utils.batch_utils import (batch_run, batch_launch_args)
+from ..utils import warn, group_array_by_field, normalize_timedelta, normalize_time_input, merge, get_futures_threadpool
+from ..utils.batch_utils import (batch_run, batch_run_parallel, batch_launch_args)
 
 from ..app_categories import APP_CATEGORIES
 from ..utils.printing import (CYAN, BLUE, YELLOW, GREEN, RED, WHITE, UNDERLINE, BOLD, ENDC, DNANEXUS_LOGO,
                               DNANEXUS_X, set_colors, set_delimiter, get_delimiter, DELIMITER, fill,
-                              tty_rows, tty_cols, pager, format_find_results, nostderr)
-from ..utils.pretty_print import format_tree, format_table
+                              tty_rows, tty_cols, pager, format_find_results, nostderr, JSONResultWriter)
+from ..utils.pretty_print import format_tree, iter_format_tree, format_table
 from ..utils.resolver import (clean_folder_path, pick, paginate_and_pick, is_hashid, is_data_obj_id, is_container_id, is_job_id,
                               is_analysis_id, get_last_pos_of_char, resolve_container_id_or_name, resolve_path,
                               resolve_existing_path, get_app_from_path, resolve_app, resolve_global_executable, get_exec_handler,
@@ -64,6 +64,10 @@ from ..utils.resolver import (clean_folder_path, pick, paginate_and_pick, is_has
                               object_exists_in_project, is_jbor_str, parse_input_keyval)
 from ..utils.completer import (path_completer, DXPathCompleter, DXAppCompleter, LocalCompleter,
                                ListCompleter, MultiCompleter)
+from ..utils.metadata_index import open_metadata_index, format_staleness
+from ..utils.resolution_cache import invalidates_resolution_cache
+from ..utils.completion_cache import invalidates_completion_cache
+from ..utils.bulk_operations import resolve_paths, run_in_chunks, MAX_CHUNK_ITEMS, DEFAULT_MAX_RETRIES
 from ..utils.describe import (print_data_obj_desc, print_desc, print_ls_desc, get_ls_l_desc, print_ls_l_header,
                               print_ls_l_desc, get_ls_l_desc_fields, get_io_desc, get_find_executions_string)
 from ..system_requirements import SystemRequirementsDict
@@ -759,10 +763,24 @@ def cd(args):
 def cmp_names(x):
     return x['describe']['name'].lower()
 
+def get_metadata_index(project, args):
+    index = try_call(open_metadata_index, project, refresh=args.refresh_cache)
+    warn(fill('Answering from the local metadata index of ' + project + ' (' +
+              format_staleness(index.get_staleness()) + '); use --refresh-cache to update it'))
+    return index
+
 def ls(args):
-    project, folderpath, entity_results = try_call(resolve_existing_path, # TODO: this needs to honor "ls -a" (all) (args.obj/args.folders/args.full)
-                                                   args.path,
-                                                   ask_to_resolve=False)
+    index = None
+    if args.cached or args.refresh_cache:
+        project, folderpath, entity_name = try_call(resolve_path, args.path)
+        if project is None:
+            err_exit('Current project must be set or specified before any data can be listed', 3)
+        index = get_metadata_index(project, args)
+        folderpath, entity_results = try_call(index.resolve_existing_path, folderpath, entity_name)
+    else:
+        project, folderpath, entity_results = try_call(resolve_existing_path, # TODO: this needs to honor "ls -a" (all) (args.obj/args.folders/args.full)
+                                                       args.path,
+                                                       ask_to_resolve=False)
 
     if project is None:
         err_exit('Current project must be set or specified before any data can be listed', 3)
@@ -785,15 +803,19 @@ def ls(args):
                 describe_input = dict(fields=get_ls_l_desc_fields())
             else:
                 describe_input = dict(fields={'id': True, 'class': True, 'name': True})
-            resp = dxproj.list_folder(folder=folderpath,
-                                      describe=describe_input,
-                                      only=only,
-                                      includeHidden=args.all)
+            if index is not None:
+                resp = index.list_folder(folder=folderpath, only=only, include_hidden=args.all)
+            else:
+                resp = dxproj.list_folder(folder=folderpath,
+                                          describe=describe_input,
+                                          only=only,
+                                          includeHidden=args.all)
 
             # Listing the folder was successful
 
             if args.verbose:
-                print(UNDERLINE('Project:') + ' ' + dxproj.describe()['name'] + ' (' + project + ')')
+                project_name = index.project_name if index is not None else dxproj.describe()['name']
+                print(UNDERLINE('Project:') + ' ' + project_name + ' (' + project + ')')
                 print(UNDERLINE('Folder :') + ' ' + folderpath)
 
             if not args.obj:
@@ -837,6 +859,8 @@ def ls(args):
                 else:
                     print_ls_desc(result['describe'], print_id=True if name_counts[result['describe']['name']] > 1 else False)
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def mkdir(args):
     had_error = False
     for path in args.paths:
@@ -858,6 +882,8 @@ def mkdir(args):
     if had_error:
         err_exit('', 3)
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def rmdir(args):
     had_error = False
     for path in args.paths:
@@ -887,6 +913,8 @@ def rmdir(args):
 
 
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def rm(args):
     had_error = False
     projects = {}
@@ -913,21 +941,20 @@ def rm(args):
                 continue
 
 
-    for path in args.paths:
+    for path, resolution in zip(args.paths, resolve_paths(args.paths, all_mult=args.all)):
         # Resolve the path and add it to the list
-        try:
-            project, folderpath, entity_results = resolve_existing_path(path, allow_mult=True, all_mult=args.all)
-        except Exception as details:
-            print(fill('Could not resolve "' + path + '": ' + str(details)))
+        if isinstance(resolution, Exception):
+            print(fill('Could not resolve "' + path + '": ' + str(resolution)))
             had_error = True
             continue
+        project, folderpath, object_ids = resolution
         if project is None:
             had_error = True
             print(fill('Could not resolve "' + path + '" to a project'))
             continue
         if project not in projects:
             projects[project] = {"folders": [], "objects": []}
-        if entity_results is None:
+        if object_ids is None:
             if folderpath is not None:
                 if not args.recursive:
                     print(fill('Did not find "' + path + '" as a data object; if it is a folder, cannot remove it without setting the "-r" flag'))
@@ -940,7 +967,7 @@ def rm(args):
                 had_error = True
                 continue
         else:
-            projects[project]['objects'] += [result['id'] for result in entity_results]
+            projects[project]['objects'] += object_ids
 
     for project in projects:
         for folder in projects[project]['folders']:
@@ -959,19 +986,22 @@ def rm(args):
                 print("Error while removing " + folder + " from " + project)
                 print("  " + str(details))
                 had_error = True
-        try:
+
+        def remove_objects(objects, project=project):
             # set force as true so the underlying API requests are idempotent
-            dxpy.api.project_remove_objects(project,
-                                            {"objects": projects[project]['objects'], "force": True},
-                                            always_retry=True)
-        except Exception as details:
-            print("Error while removing " + json.dumps(projects[project]['objects']) + " from " + project)
+            dxpy.api.project_remove_objects(project, {"objects": objects, "force": True}, always_retry=True)
+
+        _results, failures = run_in_chunks(remove_objects, projects[project]['objects'],
+                                           on_progress=get_bulk_progress_printer("Removed"))
+        for objects, details in failures:
+            print("Error while removing " + json.dumps(objects) + " from " + project)
             print("  " + str(details))
             had_error = True
     if had_error:
         # TODO: 'dx rm' and related commands should separate out user error exceptions and internal code exceptions
         err_exit('', 3)
 
+@invalidates_resolution_cache
 def rmproject(args):
     had_error = False
     for project in args.projects:
@@ -1024,6 +1054,8 @@ def rmproject(args):
         err_exit('', 3)
 
 # ONLY for within the SAME project.  Will exit fatally otherwise.
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def mv(args):
     dest_proj, dest_path, _none = try_call(resolve_path, args.destination, expected='folder')
     try:
@@ -1084,17 +1116,18 @@ def mv(args):
         err_exit('No sources provided to move', 3)
     src_objects = []
     src_folders = []
-    for source in args.sources:
-        src_proj, src_folderpath, src_results = try_call(resolve_existing_path,
-                                                         source,
-                                                         allow_mult=True, all_mult=args.all)
+    for src_proj, src_folderpath, src_ids in try_call(resolve_paths, args.sources, all_mult=args.all,
+                                                      raise_errors=True):
         if src_proj != dest_proj:
             err_exit(fill('Using "mv" for moving something from one project to another is unsupported.  Please use "cp" and "rm" instead.'), 3)
 
-        if src_results is None:
+        if src_ids is None:
             src_folders.append(src_folderpath)
         else:
-            src_objects += [result['id'] for result in src_results]
+            src_objects += src_ids
+
+    # A single request, so that the move stays atomic (a folder and the
+    # objects in it are never moved separately)
     try:
         dxpy.api.project_move(src_proj,
                               {"objects": src_objects,
@@ -1105,6 +1138,59 @@ def mv(args):
         err_exit()
 
 
+def get_tree_item_desc(desc, long_format):
+    if long_format:
+        return get_ls_l_desc(desc)
+    item_desc = desc['name']
+    if desc['class'] in ['applet', 'workflow']:
+        item_desc = BOLD() + GREEN() + item_desc + ENDC()
+    return item_desc
+
+# Maximum number of folders listed in advance by dx tree --stream
+TREE_PREFETCH_FOLDERS = 8
+
+def stream_tree(args, dxproj, folderpath, index=None):
+    """
+    Prints the tree under folderpath while it is traversed. The contents of
+    each folder are only listed when the folder is reached, while the first
+    subfolders of the folders being printed are listed concurrently in
+    advance, so only the listings of the folders on the current path are
+    kept in memory.
+    """
+    if index is not None:
+        # The index is local (and not shared between threads), so there is no
+        # need to list folders in advance
+        pool = None
+        def list_folder(folder):
+            return index.list_folder(folder=folder, include_hidden=args.all)
+    else:
+        pool = get_futures_threadpool(max_workers=TREE_PREFETCH_FOLDERS)
+        describe_input = dict(fields=(get_ls_l_desc_fields() if args.long else {'id': True, 'class': True, 'name': True}))
+        def list_folder(folder):
+            return dxproj.list_folder(folder=folder, describe=describe_input, includeHidden=args.all)
+    listings = {}
+
+    def get_children(folder):
+        listing = listings.pop(folder).result() if folder in listings else list_folder(folder)
+        subfolders = sorted(listing['folders'], key=lambda subfolder: os.path.basename(subfolder).lower())
+        if pool is not None:
+            for subfolder in subfolders[:TREE_PREFETCH_FOLDERS]:
+                listings[subfolder] = pool.submit(list_folder, subfolder)
+        children = [(BOLD() + BLUE() + os.path.basename(subfolder) + ENDC(), functools.partial(get_children, subfolder))
+                    for subfolder in subfolders]
+        for item in sorted(listing['objects'], key=cmp_names):
+            children.append((get_tree_item_desc(item['describe'], args.long), None))
+        return children
+
+    try:
+        for line in iter_format_tree(get_children(folderpath), root=(BOLD() + BLUE() + args.path + ENDC())):
+            print(line)
+    finally:
+        if pool is not None:
+            for listing in listings.values():
+                listing.cancel()
+            pool.shutdown()
+
 def tree(args):
     project, folderpath, _none = try_call(resolve_existing_path, args.path,
                                           expected='folder')
@@ -1112,10 +1198,27 @@ def tree(args):
     if project is None:
         err_exit(fill('Current project must be set or specified before any data can be listed'), 3)
     dxproj = dxpy.get_handler(project)
+    index = get_metadata_index(project, args) if args.cached or args.refresh_cache else None
+
+    if args.stream:
+        try:
+            stream_tree(args, dxproj, folderpath, index)
+        except:
+            err_exit()
+        return
 
     tree = collections.OrderedDict()
     try:
-        folders = [folder for folder in dxproj.describe(input_params={"folders": True})['folders']
+        if index is not None:
+            if not index.folder_exists(folderpath):
+                raise ResolutionError('Folder ' + folderpath + ' was not found in the metadata index of ' + project)
+            all_folders = index.get_folders()
+            objects = index.find(folder=folderpath, recurse=True, visibility=('either' if args.all else 'visible'))
+        else:
+            all_folders = dxproj.describe(input_params={"folders": True})['folders']
+            objects = dxpy.find_data_objects(project=project, folder=folderpath,
+                                             recurse=True, describe=dict(fields=get_ls_l_desc_fields()))
+        folders = [folder for folder in all_folders
                    if folder.startswith((folderpath + '/') if folderpath != '/' else '/')]
         folders = [ folder[len(folderpath):] for folder in folders ]
         for folder in folders:
@@ -1127,30 +1230,25 @@ def tree(args):
                 subtree.setdefault(path_element_desc, collections.OrderedDict())
                 subtree = subtree[path_element_desc]
 
-        for item in sorted(dxpy.find_data_objects(project=project, folder=folderpath,
-                                                  recurse=True, describe=dict(fields=get_ls_l_desc_fields())),
-                           key=cmp_names):
+        for item in sorted(objects, key=cmp_names):
             subtree = tree
             for path_element in item['describe']['folder'][len(folderpath):].split("/"):
                 if path_element == "":
                     continue
                 path_element_desc = BOLD() + BLUE() + path_element + ENDC()
                 subtree = subtree[path_element_desc]
-            if args.long:
-                item_desc = get_ls_l_desc(item['describe'])
-            else:
-                item_desc = item['describe']['name']
-                if item['describe']['class'] in ['applet', 'workflow']:
-                    item_desc = BOLD() + GREEN() + item_desc + ENDC()
-            subtree[item_desc] = None
+            subtree[get_tree_item_desc(item['describe'], args.long)] = None
 
         print(format_tree(tree, root=(BOLD() + BLUE() + args.path + ENDC())))
     except:
         err_exit()
 
+# Maximum number of IDs described in a single /system/describe* call by dx describe
+DESCRIBE_BATCH_SIZE = 1000
+
 def describe(args):
 
-    def describe_global_executable(json_output, args, exec_type):
+    def describe_global_executable(json_output, path, exec_type):
         """
         Describes a global executable, i.e. either app or global workflow
         depending on the provided exec_type. Appends the result to json_output.
@@ -1161,9 +1259,9 @@ def describe(args):
 
         try:
             if exec_type == 'app':
-                desc = dxpy.api.app_describe(args.path)
+                desc = dxpy.api.app_describe(path)
             else:
-                desc = dxpy.api.global_workflow_describe(args.path)
+                desc = dxpy.api.global_workflow_describe(path)
                 desc = dxpy.append_underlying_workflow_describe(desc)
             if args.json:
                 json_output.append(desc)
@@ -1179,7 +1277,7 @@ def describe(args):
 
         return found_match
 
-    def find_global_executable(json_output, args):
+    def find_global_executable(json_output, path):
         """
         Makes a find_apps API call and, if no matches are found, a find_global_workflows call.
         Since these two objects share namespace, either app or a global workflow will be
@@ -1196,47 +1294,50 @@ def describe(args):
                 print_desc(result['describe'], args.verbose)
 
         found_match = False
-        for result in dxpy.find_apps(name=args.path, describe=True):
+        for result in dxpy.find_apps(name=path, describe=True):
             append_to_output_json_and_print(result)
             found_match = True
         if not found_match:
-            for result in dxpy.find_global_workflows(name=args.path, describe=True):
+            for result in dxpy.find_global_workflows(name=path, describe=True):
                 result['describe'] = dxpy.append_underlying_workflow_describe(result['describe'])
                 append_to_output_json_and_print(result)
                 found_match = True
         return found_match
 
-    try:
-        if len(args.path) == 0:
-            raise DXCLIError('Must provide a nonempty string to be described')
-
-        # Attempt to resolve name
-        # First, if it looks like a hash id, do that.
-        json_input = {}
-        extra_fields = []
-        json_input["properties"] = True
-        if args.name and (args.verbose or args.details or args.json):
-            raise DXCLIError('Cannot request --name in addition to one of --verbose, --details, or --json')
-        # Always retrieve details too (just maybe don't render them)
-        json_input["details"] = True
-        if is_data_obj_id(args.path):
-            # Prefer the current project's version if possible
+    def get_workspace_hint():
+        """
+        Returns the current project if it is still accessible (it is then
+        used as a hint when describing data objects by ID), otherwise None.
+        """
+        if 'project' not in workspace_hint:
+            workspace_hint['project'] = None
             if dxpy.WORKSPACE_ID is not None:
                 try:
                     # But only put it in the JSON if you still have access
                     dxpy.api.project_describe(dxpy.WORKSPACE_ID, input_params={"fields": {"id": True}})
-                    json_input['project'] = dxpy.WORKSPACE_ID
+                    workspace_hint['project'] = dxpy.WORKSPACE_ID
                 except dxpy.DXAPIError as e:
                     if not isinstance(e, ResourceNotFound):
                         raise e
+        return workspace_hint['project']
+
+    def get_entity_describe_input(entity_id):
+        """
+        Returns the describe input used for a data object or an execution.
+        """
+        json_input = {}
+        extra_fields = []
+        json_input["properties"] = True
+        # Always retrieve details too (just maybe don't render them)
+        json_input["details"] = True
 
-        if is_job_id(args.path):
+        if is_job_id(entity_id):
             extra_fields.append('spotCostSavings')
             if args.verbose:
                 for field in VERBOSE_ONLY_JOB_FIELDS:
                     extra_fields.append(field)
 
-        if is_analysis_id(args.path):
+        if is_analysis_id(entity_id):
             extra_fields.append('spotCostSavings')
             if args.verbose:
                 for field in VERBOSE_ONLY_ANALYSIS_FIELDS:
@@ -1245,16 +1346,127 @@ def describe(args):
         if len(extra_fields) > 0:
             json_input['defaultFields'] = True
             json_input['fields'] = {field: True for field in extra_fields}
+        return json_input
+
+    def get_project_describe_input():
+        json_input = {}
+        json_input['properties'] = True
+        if args.verbose:
+            json_input["permissions"] = True
+            json_input['appCaches'] = True
+        return json_input
+
+    def output_project(desc):
+        if args.json:
+            json_output.append(desc)
+        elif args.name:
+            print(desc['name'])
+        else:
+            print(get_result_str())
+            print_desc(desc, args.verbose)
+
+    def output_entity_result(result):
+        if is_analysis_id(result['id']) and args.verbose and result['id'] not in default_described_analyses:
+            default_analysis_desc = dxpy.DXAnalysis(result['id']).describe()
+            result['describe'].update(default_analysis_desc)
+        if args.json:
+            # Filter out verbose-only fields for jobs and analyses when not in verbose mode
+            desc_output = result['describe']
+            if not args.verbose:
+                desc_output = filter_verbose_fields(desc_output, result['id'])
+            json_output.append(desc_output)
+        elif args.name:
+            print(result['describe']['name'])
+        else:
+            print(get_result_str())
+            print_desc(result['describe'], args.verbose or args.details)
+
+    def describe_ids_in_bulk(paths):
+        """
+        Describes the data objects, jobs, analyses and projects among paths
+        that are bare IDs with batched /system/describeDataObjects,
+        /system/describeExecutions and /system/describeProjects calls.
+        Returns a dict mapping each ID that was described to its
+        description. IDs that could not be described this way are left
+        out, and are then described individually.
+        """
+        data_object_ids, execution_ids, project_ids = [], [], []
+        for path in collections.OrderedDict.fromkeys(paths):
+            if is_data_obj_id(path):
+                data_object_ids.append(path)
+            elif is_job_id(path) or is_analysis_id(path):
+                execution_ids.append(path)
+            elif path.startswith('project-') and is_container_id(path):
+                project_ids.append(path)
+
+        descriptions = {}
+
+        def describe_in_batches(api_method, key, entity_ids, get_input, into=descriptions):
+            for i in range(0, len(entity_ids), DESCRIBE_BATCH_SIZE):
+                batch = entity_ids[i:i + DESCRIBE_BATCH_SIZE]
+                try:
+                    response = api_method({key: [get_input(entity_id) for entity_id in batch]})
+                except dxpy.DXAPIError:
+                    # Leave the whole batch to the individual describe calls,
+                    # which report the errors for the offending IDs
+                    continue
+                for entity_id, result in zip(batch, response['results']):
+                    if result.get('describe'):
+                        into[entity_id] = result['describe']
+
+        def get_data_object_input(entity_id):
+            object_input = {"id": entity_id, "describe": get_entity_describe_input(entity_id)}
+            if get_workspace_hint() is not None:
+                object_input["project"] = get_workspace_hint()
+            return object_input
+
+        describe_in_batches(dxpy.api.system_describe_data_objects, 'objects', data_object_ids,
+                            get_data_object_input)
+        describe_in_batches(dxpy.api.system_describe_executions, 'executions', execution_ids,
+                            lambda entity_id: {"id": entity_id, "describe": get_entity_describe_input(entity_id)})
+        describe_in_batches(dxpy.api.system_describe_projects, 'projects', project_ids,
+                            lambda entity_id: {"id": entity_id, "describe": get_project_describe_input()})
+        if args.verbose:
+            # The default description of the analyses is merged into their
+            # verbose description, as in output_entity_result
+            default_descriptions = {}
+            describe_in_batches(dxpy.api.system_describe_executions, 'executions',
+                                [entity_id for entity_id in execution_ids
+                                 if is_analysis_id(entity_id) and entity_id in descriptions],
+                                lambda entity_id: {"id": entity_id, "describe": {}}, into=default_descriptions)
+            for entity_id, desc in default_descriptions.items():
+                descriptions[entity_id].update(desc)
+                default_described_analyses.add(entity_id)
+        for entity_id in data_object_ids:
+            if entity_id in descriptions:
+                descriptions[entity_id] = dxpy.append_underlying_workflow_describe(descriptions[entity_id])
+        return descriptions
+
+    def describe_path(path):
+        """
+        Describes the entities matching path, appending the results to
+        json_output or printing them. Returns True if any matches were found
+        """
+        if len(path) == 0:
+            raise DXCLIError('Must provide a nonempty string to be described')
+
+        # Attempt to resolve name
+        # First, if it looks like a hash id, do that.
+        json_input = get_entity_describe_input(path)
+        if is_data_obj_id(path):
+            # Prefer the current project's version if possible
+            if get_workspace_hint() is not None:
+                json_input['project'] = get_workspace_hint()
 
         if args.job_try is not None:
-            if not is_job_id(args.path):
+            if not is_job_id(path):
                 err_exit('Parameter --try T can be used only when describing jobs')
             json_input['try'] = args.job_try
 
         # Otherwise, attempt to look for it as a data object or
         # execution
         try:
-            project, _folderpath, entity_results = resolve_existing_path(args.path,
+            project, _folderpath, entity_results = resolve_existing_path(path,
                                                                          expected='entity',
                                                                          ask_to_resolve=False,
                                                                          describe=json_input)
@@ -1272,43 +1484,23 @@ def describe(args):
 
         found_match = False
 
-        json_output = []
-
-        get_result_str = ResultCounter()
-
         # Could be a project
-        json_input = {}
-        json_input['properties'] = True
-        if args.verbose:
-            json_input["permissions"] = True
-            json_input['appCaches'] = True
+        json_input = get_project_describe_input()
         if entity_results is None:
-            if args.path[-1] == ':' and project is not None:
+            if path[-1] == ':' and project is not None:
                 # It is the project.
                 try:
                     desc = dxpy.api.project_describe(project, json_input)
                     found_match = True
-                    if args.json:
-                        json_output.append(desc)
-                    elif args.name:
-                        print(desc['name'])
-                    else:
-                        print(get_result_str())
-                        print_desc(desc, args.verbose)
+                    output_project(desc)
                 except dxpy.DXAPIError as e:
                     if not isinstance(e, ResourceNotFound):
                         raise e
-            elif is_container_id(args.path):
+            elif is_container_id(path):
                 try:
-                    desc = dxpy.api.project_describe(args.path, json_input)
+                    desc = dxpy.api.project_describe(path, json_input)
                     found_match = True
-                    if args.json:
-                        json_output.append(desc)
-                    elif args.name:
-                        print(desc['name'])
-                    else:
-                        print(get_result_str())
-                        print_desc(desc, args.verbose)
+                    output_project(desc)
                 except dxpy.DXAPIError as e:
                     if not isinstance(e, ResourceNotFound):
                         raise e
@@ -1318,35 +1510,22 @@ def describe(args):
             if len(entity_results) > 0:
                 found_match = True
             for result in entity_results:
-                if is_analysis_id(result['id']) and args.verbose:
-                    default_analysis_desc = dxpy.DXAnalysis(result['id']).describe()
-                    result['describe'].update(default_analysis_desc)
-                if args.json:
-                    # Filter out verbose-only fields for jobs and analyses when not in verbose mode
-                    desc_output = result['describe']
-                    if not args.verbose:
-                        desc_output = filter_verbose_fields(desc_output, result['id'])
-                    json_output.append(desc_output)
-                elif args.name:
-                    print(result['describe']['name'])
-                else:
-                    print(get_result_str())
-                    print_desc(result['describe'], args.verbose or args.details)
+                output_entity_result(result)
 
-        if not is_hashid(args.path) and ':' not in args.path:
+        if not is_hashid(path) and ':' not in path:
 
             # Could be a name of an app or a global workflow
-            if args.path.startswith('app-') or args.path.startswith('globalworkflow-'):
-                found = describe_global_executable(json_output, args, args.path.partition('-')[0])
+            if path.startswith('app-') or path.startswith('globalworkflow-'):
+                found = describe_global_executable(json_output, path, path.partition('-')[0])
             else:
-                found = find_global_executable(json_output, args)
+                found = find_global_executable(json_output, path)
             if found:
                 found_match = True
 
-            if args.path.startswith('user-'):
+            if path.startswith('user-'):
                 # User
                 try:
-                    desc = dxpy.api.user_describe(args.path, {"appsInstalled": True, "subscriptions": True})
+                    desc = dxpy.api.user_describe(path, {"appsInstalled": True, "subscriptions": True})
                     found_match = True
                     if args.json:
                         json_output.append(desc)
@@ -1358,10 +1537,10 @@ def describe(args):
                 except dxpy.DXAPIError as e:
                     if not isinstance(e, ResourceNotFound):
                         raise e
-            elif args.path.startswith('org-') or args.path.startswith('team-'):
+            elif path.startswith('org-') or path.startswith('team-'):
                 # Org or team
                 try:
-                    desc = dxpy.DXHTTPRequest('/' + args.path + '/describe', {})
+                    desc = dxpy.DXHTTPRequest('/' + path + '/describe', {})
                     found_match = True
                     if args.json:
                         json_output.append(desc)
@@ -1374,17 +1553,54 @@ def describe(args):
                     if not isinstance(e, ResourceNotFound):
                         raise e
 
+        return found_match
+
+    json_output = []
+    get_result_str = ResultCounter()
+    workspace_hint = {}
+    default_described_analyses = set()
+
+    try:
+        if args.name and (args.verbose or args.details or args.json):
+            raise DXCLIError('Cannot request --name in addition to one of --verbose, --details, or --json')
+
+        if len(args.path) == 1:
+            path = args.path[0]
+            found_match = describe_path(path)
+            if args.json:
+                if args.multi:
+                    print(json.dumps(json_output, indent=4))
+                elif len(json_output) > 1:
+                    raise DXCLIError('More than one match found for ' + path + '; to get all of them in JSON format, also provide the --multi flag.')
+                elif len(json_output) == 0:
+                    raise DXCLIError('No match found for ' + path)
+                else:
+                    print(json.dumps(json_output[0], indent=4))
+            elif not found_match:
+                raise DXCLIError("No matches found for " + path)
+            return
+
+        if args.job_try is not None:
+            raise DXCLIError('Parameter --try T can be used only when describing a single job')
+
+        # Several paths: describe the ones given by ID in bulk, and print
+        # all the results in the order of the paths
+        descriptions = describe_ids_in_bulk(args.path)
+        not_found = []
+        for path in args.path:
+            if path in descriptions:
+                if is_container_id(path):
+                    output_project(descriptions[path])
+                else:
+                    output_entity_result({"id": path, "describe": descriptions[path]})
+            elif not describe_path(path):
+                not_found.append(path)
+
         if args.json:
-            if args.multi:
-                print(json.dumps(json_output, indent=4))
-            elif len(json_output) > 1:
-                raise DXCLIError('More than one match found for ' + args.path + '; to get all of them in JSON format, also provide the --multi flag.')
-            elif len(json_output) == 0:
-                raise DXCLIError('No match found for ' + args.path)
-            else:
-                print(json.dumps(json_output[0], indent=4))
-        elif not found_match:
-            raise DXCLIError("No matches found for " + args.path)
+            # Always a JSON array, as if --multi was given
+            print(json.dumps(json_output, indent=4))
+        if not_found:
+            raise DXCLIError("No matches found for " + ", ".join(not_found))
     except:
         err_exit()
 
@@ -1451,6 +1667,7 @@ def new_user(args):
         print(fill("Created new user account ({u})".format(u=user_id)))
 
 
+@invalidates_resolution_cache
 def new_project(args):
     if args.name == None:
         if INTERACTIVE_CLI:
@@ -1491,6 +1708,8 @@ def new_project(args):
         err_exit()
 
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def new_record(args):
     try_call(process_dataobject_args, args)
     try_call(process_single_dataobject_output_args, args)
@@ -1652,8 +1871,32 @@ def remove_types(args):
     if had_error:
         err_exit('', 3)
 
+def get_bulk_progress_printer(verb):
+    def on_progress(done, total, failed):
+        # Only report progress for operations that are split into several chunks
+        if sys.stderr.isatty() and total > MAX_CHUNK_ITEMS:
+            sys.stderr.write("\r{} {} of {} items{}".format(verb, done, total,
+                                                           " ({} failed)".format(failed) if failed else "") +
+                             ("\n" if done == total else ""))
+            sys.stderr.flush()
+    return on_progress
+
+def apply_to_objects(entity_results, route, payload):
+    """
+    Calls /<object-id>/<route> with the given payload for each of the
+    objects, concurrently. Prints the errors and returns whether all
+    calls succeeded.
+    """
+    def call(chunk):
+        dxpy.DXHTTPRequest('/' + chunk[0] + '/' + route, payload)
+
+    _results, failures = run_in_chunks(call, [result['id'] for result in entity_results], max_items=1,
+                                       on_progress=get_bulk_progress_printer("Updated"))
+    for _chunk, details in failures:
+        print(format_exception(details), file=sys.stderr)
+    return not failures
+
 def add_tags(args):
-    had_error = False
     # Attempt to resolve name
     project, _folderpath, entity_results = try_call(resolve_to_objects_or_project,
                                                     args.path,
@@ -1665,15 +1908,9 @@ def add_tags(args):
         if args.job_try is not None and any(map(lambda x: not is_job_id(x['id']), entity_results)):
             err_exit('Parameter --try T can be used only with jobs')
 
-        for result in entity_results:
-            if args.job_try is not None:
-                payload['try'] = args.job_try
-            try:
-                dxpy.DXHTTPRequest('/' + result['id'] + '/addTags', payload)
-            except (dxpy.DXAPIError,) + network_exceptions as details:
-                print(format_exception(details), file=sys.stderr)
-                had_error = True
-        if had_error:
+        if args.job_try is not None:
+            payload['try'] = args.job_try
+        if not apply_to_objects(entity_results, 'addTags', payload):
             err_exit('', 3)
     elif not project.startswith('project-'):
         err_exit('Cannot add tags to a non-project data container', 3)
@@ -1688,7 +1925,6 @@ def add_tags(args):
             err_exit()
 
 def remove_tags(args):
-    had_error = False
     # Attempt to resolve name
     project, _folderpath, entity_results = try_call(resolve_to_objects_or_project,
                                                     args.path,
@@ -1700,15 +1936,9 @@ def remove_tags(args):
         if args.job_try is not None and any(map(lambda x: not is_job_id(x['id']), entity_results)):
             err_exit('Parameter --try T can be used only with jobs')
 
-        for result in entity_results:
-            if args.job_try is not None:
-                payload['try'] = args.job_try
-            try:
-                dxpy.DXHTTPRequest('/' + result['id'] + '/removeTags', payload)
-            except (dxpy.DXAPIError,) + network_exceptions as details:
-                print(format_exception(details), file=sys.stderr)
-                had_error = True
-        if had_error:
+        if args.job_try is not None:
+            payload['try'] = args.job_try
+        if not apply_to_objects(entity_results, 'removeTags', payload):
             err_exit('', 3)
     elif not project.startswith('project-'):
         err_exit('Cannot remove tags from a non-project data container', 3)
@@ -1722,6 +1952,8 @@ def remove_tags(args):
         except:
             err_exit()
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def rename(args):
     had_error = False
     # Attempt to resolve name
@@ -1749,7 +1981,6 @@ def rename(args):
             err_exit()
 
 def set_properties(args):
-    had_error = False
     # Attempt to resolve name
     project, _folderpath, entity_results = try_call(resolve_to_objects_or_project,
                                                     args.path,
@@ -1762,15 +1993,9 @@ def set_properties(args):
         if args.job_try is not None and any(map(lambda x: not is_job_id(x['id']), entity_results)):
             err_exit('Parameter --try T can be used only with jobs')
 
-        for result in entity_results:
-            if args.job_try is not None:
-                payload['try'] = args.job_try
-            try:
-                dxpy.DXHTTPRequest('/' + result['id'] + '/setProperties', payload)
-            except (dxpy.DXAPIError,) + network_exceptions as details:
-                print(format_exception(details), file=sys.stderr)
-                had_error = True
-        if had_error:
+        if args.job_try is not None:
+            payload['try'] = args.job_try
+        if not apply_to_objects(entity_results, 'setProperties', payload):
             err_exit('', 3)
     elif not project.startswith('project-'):
         err_exit('Cannot set properties on a non-project data container', 3)
@@ -1783,7 +2008,6 @@ def set_properties(args):
             err_exit()
 
 def unset_properties(args):
-    had_error = False
     # Attempt to resolve name
     project, _folderpath, entity_results = try_call(resolve_to_objects_or_project,
                                                     args.path,
@@ -1797,15 +2021,9 @@ def unset_properties(args):
         if args.job_try is not None and any(map(lambda x: not is_job_id(x['id']), entity_results)):
             err_exit('Parameter --try T can be used only with jobs')
 
-        for result in entity_results:
-            if args.job_try is not None:
-                payload['try'] = args.job_try
-            try:
-                dxpy.DXHTTPRequest('/' + result['id'] + '/setProperties', payload)
-            except (dxpy.DXAPIError,) + network_exceptions as details:
-                print(format_exception(details), file=sys.stderr)
-                had_error = True
-        if had_error:
+        if args.job_try is not None:
+            payload['try'] = args.job_try
+        if not apply_to_objects(entity_results, 'setProperties', payload):
             err_exit('', 3)
     elif not project.startswith('project-'):
         err_exit('Cannot unset properties on a non-project data container', 3)
@@ -2110,6 +2328,8 @@ def head(args):
         except:
             err_exit()
 
+@invalidates_resolution_cache
+@invalidates_completion_cache
 def upload(args, **kwargs):
     if args.output is not None and args.path is not None:
         raise DXParserError('Error: Cannot provide both the -o/--output and --path/--destination arguments')
@@ -2195,8 +2415,14 @@ def upload_one(args):
         except:
             err_exit()
 
+# Maximum number of execution trees fetched concurrently by dx find executions
+FIND_TREES_MAX_WORKERS = 8
+
 def find_executions(args):
     try_call(process_find_by_property_args, args)
+    if (args.tree_depth is not None and args.tree_depth < 0) or (args.tree_width is not None and args.tree_width < 1):
+        err_exit(exception=DXParserError('--tree-depth must be nonnegative and --tree-width must be positive'),
+                 expected_exceptions=(DXParserError,))
     if not (args.origin_jobs or args.all_jobs):
         args.trees = True
     if args.origin_jobs and args.parent is not None and args.parent != 'none':
@@ -2266,7 +2492,7 @@ def find_executions(args):
     if jobs_to_fetch < 1000 and not args.trees:
         query['limit'] = jobs_to_fetch + 1
 
-    json_output = []                        # for args.json
+    json_writer = JSONResultWriter(args.json_stream)     # for args.json
 
     class ExecutionId:
 
@@ -2292,7 +2518,7 @@ def find_executions(args):
     def print_brief(job_id, job_try, has_retries):
         print(job_id + (" try %d" % job_try if has_retries and include_restarted and job_try is not None else ""))
 
-    def build_tree(root, root_try, executions_by_parent, execution_descriptions, execution_retries):
+    def build_tree(root, root_try, executions_by_parent, execution_descriptions, execution_retries, depth=0):
         tree, root_string = {}, ''
         # When try is not explicitly specified, use the most recent try
         execution_id = ExecutionId(root, root_try if root_try is not None else execution_retries[root][0])
@@ -2311,15 +2537,15 @@ def find_executions(args):
                                                         as_try_group_root=True)
                     tree[root_string] = collections.OrderedDict()
                 for rtry in execution_retries[root]:
-                    subtree, _ = build_tree(root, rtry, executions_by_parent, execution_descriptions, execution_retries)
+                    subtree, _ = build_tree(root, rtry, executions_by_parent, execution_descriptions, execution_retries, depth)
                     if tree:
                         tree[root_string].update(subtree)
                 return tree, root_string
             else:
-                return build_tree(root, execution_retries[root][0], executions_by_parent, execution_descriptions, execution_retries)
+                return build_tree(root, execution_retries[root][0], executions_by_parent, execution_descriptions, execution_retries, depth)
 
         if args.json:
-            json_output.append(execution_descriptions[execution_id])
+            json_writer.write(execution_descriptions[execution_id])
         elif args.brief:
             print_brief(root, root_try, root_has_retries)
         else:
@@ -2329,14 +2555,25 @@ def find_executions(args):
                                                      is_cached_result=root_has_reused_output,
                                                      show_try=include_restarted and root_has_retries)
             tree[root_string] = collections.OrderedDict()
-        for child_execution in executions_by_parent.get(execution_id, {}):
+        child_executions = executions_by_parent.get(execution_id, [])
+        num_hidden, hidden_string = 0, ''
+        if args.tree_depth is not None and depth >= args.tree_depth:
+            num_hidden, hidden_string = len(child_executions), '... %d child execution(s) not shown'
+            child_executions = []
+        elif args.tree_width is not None and len(child_executions) > args.tree_width:
+            num_hidden, hidden_string = len(child_executions) - args.tree_width, '... and %d more'
+            child_executions = child_executions[:args.tree_width]
+        for child_execution in child_executions:
             subtree, _subtree_root = build_tree(child_execution,
                                                 execution_retries[child_execution][0] if len(execution_retries[child_execution]) == 1 else None,
                                                 executions_by_parent,
                                                 execution_descriptions,
-                                                execution_retries)
+                                                execution_retries,
+                                                depth + 1)
             if tree:
                 tree[root_string].update(subtree)
+        if tree and num_hidden > 0:
+            tree[root_string][hidden_string % num_hidden] = None
 
         return tree, root_string
 
@@ -2348,6 +2585,9 @@ def find_executions(args):
     try:
         num_processed_results = 0
         roots = collections.OrderedDict()
+        # Creation time of each root, i.e. of the earliest execution found in
+        # its tree (an execution is never older than its root)
+        root_created = {}
         execution_retries = collections.defaultdict(set)
         executions_cache = []
 
@@ -2377,6 +2617,8 @@ def find_executions(args):
                     # Analyses in trees with jobs at their root found in "dx find analyses" are displayed unrooted,
                     # and only the last analysis found is displayed.
                     roots[root] = execution_result['describe']['id']
+                root_created[root] = min(root_created.get(root, execution_result['describe']['created']),
+                                         execution_result['describe']['created'])
 
         if not args.trees:
             # Handle situations where the number of results is between args.num_results and args.num_results + 10
@@ -2392,7 +2634,7 @@ def find_executions(args):
                 show_try = include_restarted and execution_max_try > 0
 
                 if args.json:
-                    json_output.append(execution_result['describe'])
+                    json_writer.write(execution_result['describe'])
                 elif args.brief:
                     print_brief(execution_id, execution_try, show_try)
                 else:
@@ -2403,6 +2645,9 @@ def find_executions(args):
                                                                     show_try=show_try)))
         else:
             executions_by_parent, descriptions = collections.defaultdict(list), {}
+            # IDs of the executions whose tries changed since the last tree
+            # was printed, and roots of the trees of the cached stages found
+            updated_retries, cached_stage_roots = set(), []
             root_field = 'origin_job' if args.classname == 'job' else 'root_execution'
             parent_field = 'masterJob' if args.no_subjobs else 'parentJob'
             query = {'classname': args.classname,
@@ -2435,6 +2680,7 @@ def find_executions(args):
 
                 descriptions[execution_id] = execution_desc
                 execution_retries[execution_id.id].add(execution_id.try_num)
+                updated_retries.add(execution_id.id)
 
                 # If an analysis with cached children, also insert those
                 if execution_desc['class'] == 'analysis':
@@ -2442,32 +2688,62 @@ def find_executions(args):
                         if 'parentAnalysis' in stage_desc['execution'] and stage_desc['execution']['parentAnalysis'] != execution_result['id'] and \
                            (args.classname != 'analysis' or stage_desc['execution']['class'] == 'analysis'):
                             stage_execution_id = stage_desc['execution']['id']
-                            if stage_execution_id not in executions_by_parent[execution_id.id]:
+                            if stage_execution_id not in executions_by_parent[execution_id]:
                                 # this is a cached stage (with a different parent)
-                                executions_by_parent[execution_id.id].append(stage_execution_id)
-                            if stage_execution_id not in descriptions:
-                                descriptions[stage_execution_id] = stage_desc['execution']
+                                executions_by_parent[execution_id].append(stage_execution_id)
+                            stage_execution = ExecutionId(stage_execution_id, stage_desc['execution'].get('try'))
+                            if stage_execution not in descriptions:
+                                descriptions[stage_execution] = stage_desc['execution']
+                                execution_retries[stage_execution_id].add(stage_execution.try_num)
+                                updated_retries.add(stage_execution_id)
+                            cached_stage_roots.append(stage_desc['execution'].get('rootExecution'))
+
+            def find_tree_executions(root):
+                return list(dxpy.find_executions(**dict(query, **{root_field: [root]})))
 
             # Short-circuit the find_execution API call(s) if there are
             # no root executions (and therefore we would have gotten 0
             # results anyway)
             if len(list(roots.keys())) > 0:
-                for execution_result in dxpy.find_executions(**query):
-                    process_execution_result(execution_result)
-
-                # ensure tries are sorted from newest to oldest
-                execution_retries = {k: sorted(v, reverse=True) for k, v in execution_retries.items()}
+                # ensure roots are sorted by their creation time (which is
+                # shared by all tries of a job)
+                sorted_roots = sorted(roots.keys(), key=lambda root: -root_created[root])
+
+                # Fetch the trees concurrently, and print each one as soon as
+                # it and the trees before it have been fetched
+                pool = get_futures_threadpool(max_workers=FIND_TREES_MAX_WORKERS)
+                tree_futures = collections.OrderedDict((root, pool.submit(find_tree_executions, root))
+                                                       for root in sorted_roots)
+                fetched_roots = set()
+                sorted_retries = {}
+
+                def fetch_tree(root):
+                    if root in fetched_roots or root not in tree_futures:
+                        return
+                    fetched_roots.add(root)
+                    for execution_result in tree_futures[root].result():
+                        process_execution_result(execution_result)
 
-                # ensure roots are sorted by their creation time
-                sorted_roots = sorted(
-                    roots.keys(),
-                    key=lambda root: -descriptions[ExecutionId(roots[root], execution_retries[roots[root]][-1])]['created']
-                )
-
-                for root in sorted_roots:
-                    process_tree(roots[root], executions_by_parent, descriptions, execution_retries)
+                try:
+                    for root in sorted_roots:
+                        fetch_tree(root)
+                        # The subtrees of cached stages reused from older
+                        # analyses are printed under this tree too
+                        while cached_stage_roots:
+                            fetch_tree(cached_stage_roots.pop())
+
+                        # ensure tries are sorted from newest to oldest
+                        for execution_id in updated_retries:
+                            sorted_retries[execution_id] = sorted(execution_retries[execution_id], reverse=True)
+                        updated_retries.clear()
+
+                        process_tree(roots[root], executions_by_parent, descriptions, sorted_retries)
+                finally:
+                    for tree_future in tree_futures.values():
+                        tree_future.cancel()
+                    pool.shutdown()
         if args.json:
-            print(json.dumps(json_output, indent=4))
+            json_writer.close()
 
         if more_results and get_delimiter() is None and not (args.brief or args.json):
             print(fill("* More results not shown; use -n to increase number of results or --created-before to show older results", subsequent_indent='  '))
@@ -2509,26 +2785,53 @@ def find_data(args):
         describe_input = True
     else:
         describe_input = dict(fields=get_ls_l_desc_fields())
+    if args.cached or args.refresh_cache:
+        if args.project is None:
+            err_exit(exception=DXParserError('--cached requires a single project; it cannot be combined with --all-projects'),
+                     expected_exceptions=(DXParserError,))
+        if args.link is not None or args.region is not None:
+            err_exit(exception=DXParserError('--link and --region are not supported with --cached'),
+                     expected_exceptions=(DXParserError,))
+        if args.verbose:
+            err_exit(exception=DXParserError('--verbose is not supported with --cached; the local index only stores the listing fields'),
+                     expected_exceptions=(DXParserError,))
     try:
-        results = dxpy.find_data_objects(classname=args.classname,
-                                         state=args.state,
-                                         visibility=args.visibility,
-                                         properties=args.properties,
-                                         name=args.name,
-                                         name_mode=args.name_mode,
-                                         typename=args.type,
-                                         tags=args.tag, link=args.link,
-                                         project=args.project,
-                                         folder=args.folder,
-                                         recurse=(args.recurse if not args.recurse else None),
-                                         modified_after=args.mod_after,
-                                         modified_before=args.mod_before,
-                                         created_after=args.created_after,
-                                         created_before=args.created_before,
-                                         region=args.region,
-                                         describe=describe_input)
+        if args.cached or args.refresh_cache:
+            index = get_metadata_index(args.project, args)
+            results = index.find(classname=args.classname,
+                                 state=args.state,
+                                 visibility=args.visibility,
+                                 properties=args.properties,
+                                 name=args.name,
+                                 name_mode=args.name_mode,
+                                 typename=args.type,
+                                 tags=args.tag,
+                                 folder=args.folder,
+                                 recurse=args.recurse,
+                                 modified_after=args.mod_after,
+                                 modified_before=args.mod_before,
+                                 created_after=args.created_after,
+                                 created_before=args.created_before)
+        else:
+            results = dxpy.find_data_objects(classname=args.classname,
+                                             state=args.state,
+                                             visibility=args.visibility,
+                                             properties=args.properties,
+                                             name=args.name,
+                                             name_mode=args.name_mode,
+                                             typename=args.type,
+                                             tags=args.tag, link=args.link,
+                                             project=args.project,
+                                             folder=args.folder,
+                                             recurse=(args.recurse if not args.recurse else None),
+                                             modified_after=args.mod_after,
+                                             modified_before=args.mod_before,
+                                             created_after=args.created_after,
+                                             created_before=args.created_before,
+                                             region=args.region,
+                                             describe=describe_input)
         if args.json:
-            print(json.dumps(list(results), indent=4))
+            JSONResultWriter(args.json_stream).write_all(results)
             return
         if args.brief:
             for result in results:
@@ -2648,6 +2951,7 @@ def find_global_workflows(args):
     except:
         err_exit()
 
+@invalidates_resolution_cache
 def update_project(args):
     input_params = get_update_project_args(args)
 
@@ -2717,31 +3021,37 @@ def wait(args):
             raise DXCLIError(
                 'Could not open {}. The problem was: {}' % (args.path[0], e))
 
+    execution_ids = [path for path in args.path if is_job_id(path) or is_analysis_id(path)]
+    if len(execution_ids) == 1:
+        print("Waiting for " + execution_ids[0] + " to finish running...")
+    elif len(execution_ids) > 1:
+        print("Waiting for " + str(len(execution_ids)) + " jobs and analyses to finish running...")
+    if execution_ids:
+        try_call(dxpy.wait_for_executions, execution_ids, fail_fast=args.fail_fast)
+        print("Done")
+
     for path in args.path:
         if is_job_id(path) or is_analysis_id(path):
-            dxexecution = dxpy.get_handler(path)
-            print("Waiting for " + path + " to finish running...")
-            try_call(dxexecution.wait_on_done)
-            print("Done")
-        else:
-            # Attempt to resolve name
-            try:
-                project, _folderpath, entity_result = resolve_existing_path(path, expected='entity')
-            except:
-                project, entity_result = None, None
+            continue
+        # Attempt to resolve name
+        try:
+            project, _folderpath, entity_result = resolve_existing_path(path, expected='entity')
+        except:
+            project, entity_result = None, None
 
-            if entity_result is None:
-                print(fill('Could not resolve ' + path + ' to a data object'))
-                had_error = True
-            else:
-                handler = dxpy.get_handler(entity_result['id'], project=entity_result['describe']['project'])
-                print("Waiting for " + path + " to close...")
-                try_call(handler._wait_on_close)
-                print("Done")
+        if entity_result is None:
+            print(fill('Could not resolve ' + path + ' to a data object'))
+            had_error = True
+        else:
+            handler = dxpy.get_handler(entity_result['id'], project=entity_result['describe']['project'])
+            print("Waiting for " + path + " to close...")
+            try_call(handler._wait_on_close)
+            print("Done")
 
     if had_error:
         err_exit('', 3)
 
+@invalidates_resolution_cache
 def build(args):
     sys.argv = ['dx build'] + sys.argv[2:]
 
@@ -3076,6 +3386,7 @@ def remove_developers(args):
         err_exit()
 
 
+@invalidates_completion_cache
 def install(args):
     app_desc = try_call(resolve_app, args.app)
 
@@ -3085,6 +3396,7 @@ def install(args):
     except:
         err_exit()
 
+@invalidates_completion_cache
 def uninstall(args):
     app_desc = get_app_from_path(args.app)
     if app_desc:
@@ -3213,12 +3525,39 @@ def run_batch_all_steps(args, executable, dest_proj, dest_path, input_json, run_
         print(fill("Calling " + executable.get_id() + " with output destination " + dest_proj + ":" + dest_path,
                    subsequent_indent='  ') + '\n')
 
+    if args.launch_jobs is not None:
+        run_batch_parallel(args, executable, b_args, run_kwargs)
+        return
+
     # Run the executable on all the input dictionaries
     dx_execs = batch_run(executable, b_args, run_kwargs, args.batch_folders)
     exec_ids = [dxe.get_id() for dxe in dx_execs]
     print(",".join(exec_ids))
     sys.stdout.flush()
 
+def run_batch_parallel(args, executable, b_args, run_kwargs):
+    manifest = args.batch_manifest or (args.batch_tsv + ".manifest.jsonl")
+    if not args.brief:
+        print(fill("Recording the progress of the launch in " + manifest + "; rerun the same command to resume "
+                   "an interrupted launch") + '\n')
+
+    def on_progress(finished, total):
+        if sys.stderr.isatty():
+            sys.stderr.write("\rLaunched {} of {} rows".format(finished, total) + ("\n" if finished == total else ""))
+            sys.stderr.flush()
+
+    exec_ids, failures = try_call(batch_run_parallel, executable, b_args, run_kwargs,
+                                  set_batch_folders=args.batch_folders, launch_jobs=args.launch_jobs,
+                                  manifest=manifest, on_progress=on_progress)
+    print(",".join(exec_id for exec_id in exec_ids if exec_id is not None))
+    sys.stdout.flush()
+    if failures:
+        for batch_id, error in failures:
+            err_msg = 'Could not launch batch ' + batch_id + ': ' + error
+            print(fill(err_msg), file=sys.stderr)
+        err_exit(fill(str(len(failures)) + ' of ' + str(len(exec_ids)) + ' rows could not be launched; rerun the '
+                      'same command to retry them'), 3)
+
 # Shared code for running an executable ("dx run executable"). At the end of this method,
 # there is a fork between the case of a single executable, and a batch run.
 def run_body(args, executable, dest_proj, dest_path, preset_inputs=None, input_name_prefix=None):
@@ -3632,6 +3971,12 @@ def run(args):
         args.allow_ssh = [client_ip]
     if args.ssh_proxy and not args.ssh:
         err_exit(exception=DXCLIError("Option --ssh-proxy cannot be specified without --ssh"))
+    if (args.launch_jobs is not None or args.batch_manifest is not None) and args.batch_tsv is None:
+        err_exit(exception=DXCLIError("Options --launch-jobs and --batch-manifest can only be used with --batch-tsv"))
+    if args.batch_manifest is not None and args.launch_jobs is None:
+        err_exit(exception=DXCLIError("Option --batch-manifest cannot be specified without --launch-jobs"))
+    if args.launch_jobs is not None and args.launch_jobs < 1:
+        err_exit(exception=DXCLIError("Option --launch-jobs must be a positive integer"))
     if args.ssh_proxy:
         args.allow_ssh.append(args.ssh_proxy.split(':'[0]))
     if args.ssh or args.allow_ssh or args.debug_on:
@@ -3853,7 +4198,8 @@ def watch(args):
         if args.levels and "METRICS" not in args.levels:
             err_exit(exception=DXCLIError("'--metrics' is specified, but METRICS level is not included"))
 
-        iarg = check_args_compatibility(["get_stdout", "get_stderr", "get_streams", ("tail", "no-wait"), "tree", "num_recent_messages"])
+        iarg = check_args_compatibility(["get_stdout", "get_stderr", "get_streams", ("tail", "no-wait"), "tree", "num_recent_messages",
+                                         "grep", "exclude", "fast", "output", "dump_dir"])
         if iarg:
             incompatible_args = ("--metrics top", iarg)
     elif args.metrics == "csv":
@@ -3861,9 +4207,24 @@ def watch(args):
         if iarg:
             incompatible_args = ("--metrics csv", iarg)
 
+    if incompatible_args is None and args.dump_dir is not None:
+        iarg = check_args_compatibility([("job_try", "try"), ("tail", "no-wait"), "num_recent_messages", "output"])
+        if iarg:
+            incompatible_args = ("--dump-dir", iarg)
+
     if incompatible_args:
         err_exit(exception=DXCLIError("Can not specify both '%s' and '%s'" % incompatible_args))
 
+    from dxpy.utils.job_log_client import (DXJobLogStreamClient, LogMessageFilter, BufferedLogWriter, RotatingLogFile,
+                                           dump_execution_logs, metrics_top)
+
+    message_filter = None
+    if args.grep is not None or args.exclude is not None:
+        try:
+            message_filter = LogMessageFilter(pattern=args.grep, exclude_pattern=args.exclude)
+        except re.error as e:
+            err_exit(exception=DXCLIError("Invalid regular expression: %s" % e))
+
     def enrich_msg(log_client, message):
         message['timestamp'] = str(datetime.datetime.fromtimestamp(message.get('timestamp', 0)//1000))
         message['level_color'] = level_colors.get(message.get('level', ''), '')
@@ -3871,7 +4232,12 @@ def watch(args):
         message['job_name'] = log_client.seen_jobs[message['job']]['name'] if message['job'] in log_client.seen_jobs else message['job']
 
     is_try_provided = args.job_try is not None
-    msg_callback, log_client = None, None
+    msg_callback, log_client, writer = None, None, None
+    if args.output is not None:
+        max_bytes = int(args.output_max_size * 1024 * 1024) if args.output_max_size else None
+        writer = BufferedLogWriter(RotatingLogFile(args.output, max_bytes=max_bytes), close_stream=True)
+    elif args.fast:
+        writer = BufferedLogWriter(sys.stdout)
     if args.get_stdout:
         args.levels = ['STDOUT']
         args.format = "{msg}"
@@ -3899,9 +4265,10 @@ def watch(args):
 
         def msg_callback(message):
             enrich_msg(log_client, message)
-            print(format.format(**message))
-
-    from dxpy.utils.job_log_client import DXJobLogStreamClient, metrics_top
+            if writer is not None:
+                writer.write_line(format.format(**message))
+            else:
+                print(format.format(**message))
 
     input_params = {"numRecentMessages": args.num_recent_messages,
                     "recurseJobs": args.tree,
@@ -3936,6 +4303,23 @@ def watch(args):
     else:
         input_params['metricsFormat'] = "text"
 
+    if args.dump_dir is not None:
+        if not args.quiet:
+            print("Saving the logs of the jobs of %s to %s" % (args.jobid, args.dump_dir), file=sys.stderr)
+        dump_params = {key: value for key, value in input_params.items()
+                       if key in ('levels', 'excludeMetrics', 'metricsFormat')}
+        try:
+            paths, failures = dump_execution_logs(args.jobid, args.dump_dir, input_params=dump_params,
+                                                  message_filter=message_filter,
+                                                  msg_output_format=args.format or "{timestamp} {job} {level} {msg}")
+        except Exception:
+            err_exit()
+        if not args.quiet:
+            print("Saved the logs of %d job(s)" % len(paths), file=sys.stderr)
+        if failures:
+            err_exit("\n".join("Could not save the logs of %s: %s" % (job_id, error) for job_id, error in failures.items()), 3)
+        return
+
     # Note: currently, the client is synchronous and blocks until the socket is closed.
     # If this changes, some refactoring may be needed below
     try:
@@ -3943,7 +4327,8 @@ def watch(args):
             metrics_top(args, input_params, enrich_msg)
         else:
             log_client = DXJobLogStreamClient(args.jobid, job_try=args.job_try, input_params=input_params, msg_callback=msg_callback,
-                                              msg_output_format=args.format, print_job_info=args.job_info)
+                                              msg_output_format=args.format, print_job_info=args.job_info,
+                                              message_filter=message_filter, output=writer, async_describe=args.fast)
 
             if not args.quiet:
                 print("Watching job %s%s. Press Ctrl+C to stop watching." % (
@@ -3954,6 +4339,9 @@ def watch(args):
             log_client.connect()
     except Exception as details:
         err_exit(fill(str(details)), 3)
+    finally:
+        if writer is not None:
+            writer.close()
 
 def get_client_ip():
     return dxpy.api.system_whoami({"fields": {"clientIp": True}}).get('clientIp')
@@ -4263,6 +4651,9 @@ def publish(args):
     except:
         err_exit()
 
+# Maximum number of files in a single /project-xxxx/archive or /project-xxxx/unarchive request
+ARCHIVAL_CHUNK_SIZE = 1000
+
 def archive(args):
     def send_archive_request(target_project, request_input, request_func):
         api_errors = [InvalidState, ResourceNotFound, PermissionDenied]
@@ -4278,6 +4669,30 @@ def archive(args):
             err_exit("Failed request: {}. {}".format(request_input, format_exception(e)), code=3)
         return res
 
+    def send_archive_requests(target_project, request_input, request_func, on_progress=None):
+        # Requests for lists of files are split into chunks, which are sent concurrently
+        if "files" not in request_input:
+            return [send_archive_request(target_project, request_input, request_func)]
+
+        def send_chunk(files):
+            return request_func(target_project, dict(request_input, files=files))
+
+        # Only dry runs are retried on top of the retries of the API call
+        # itself: a failed archival or unarchival request may have been
+        # applied to some of its files
+        max_retries = DEFAULT_MAX_RETRIES if request_input.get("dryRun") else 0
+        results, failures = run_in_chunks(send_chunk, request_input["files"], max_items=ARCHIVAL_CHUNK_SIZE,
+                                          max_retries=max_retries, on_progress=on_progress)
+        if failures:
+            for files, e in failures:
+                eprint("Failed request: {}".format(dict(request_input, files=files)))
+                if isinstance(e, (InvalidState, ResourceNotFound, PermissionDenied)):
+                    eprint("     API error: {}. {}".format(e.name, e.msg))
+                else:
+                    eprint("     Unexpected error: {}".format(format_exception(e)))
+            err_exit("{} of {} request(s) failed".format(len(failures), len(results)), code=3)
+        return results
+
     def get_valid_archival_input(args, target_files, target_folder, target_project):
         request_input = {}
         if target_files:
@@ -4371,6 +4786,7 @@ def archive(args):
         if possible_folder:
             target_folder = possible_folder.pop()
         else:
+            names = []
             for fp in possible_files:
                 # find a filename
                 # is file ID
@@ -4378,23 +4794,29 @@ def archive(args):
                     target_files.add(fp)
                 # is folderpath/filename
                 else:
-                    folderpath, filename = clean_folder_path(('' if obj.startswith('/') else '/') + fp)
-                    try:
-                        file_results = list(dxpy.find_data_objects(classname="file", name=filename,project=target_project,folder=folderpath,describe=True,recurse=False))
-                    except:
-                        err_exit("Input '{}' is not found as a file in project '{}'".format(fp, target_project), code=3)
-
-                    if not file_results:
-                        err_exit("Input '{}' is not found as a file in project '{}'".format(fp, target_project), code=3)
-                    # elif file_results
-                    if not args.all:
-                        choice = pick([ "{} ({})".format(result['describe']['name'], result['id']) for result in file_results],allow_mult=True)
-                        if choice == "*" :
-                            target_files.update([file['id'] for file in file_results])
-                        else:
-                            target_files.add(file_results[choice]['id'])
+                    folderpath, filename = clean_folder_path(('' if fp.startswith('/') else '/') + fp)
+                    names.append((fp, folderpath, filename))
+
+            # Resolve the names with batched resolveDataObjects calls, grouped by folder
+            names.sort(key=lambda name: name[1])
+            try:
+                resolutions = dxpy.resolve_data_objects([{"folder": folderpath, "name": filename}
+                                                         for _fp, folderpath, filename in names],
+                                                        project=target_project)
+            except:
+                err_exit("Could not resolve the input files in project '{}'".format(target_project), code=3)
+            for (fp, _folderpath, filename), results in zip(names, resolutions):
+                file_ids = sorted(result['id'] for result in results if result['id'].startswith("file-"))
+                if not file_ids:
+                    err_exit("Input '{}' is not found as a file in project '{}'".format(fp, target_project), code=3)
+                if len(file_ids) == 1 or args.all:
+                    target_files.update(file_ids)
+                else:
+                    choice = pick(["{} ({})".format(filename, file_id) for file_id in file_ids], allow_mult=True)
+                    if choice == "*" :
+                        target_files.update(file_ids)
                     else:
-                        target_files.update([file['id'] for file in file_results])
+                        target_files.add(file_ids[choice])
 
         return target_files, target_folder, target_project
 
@@ -4415,21 +4837,27 @@ def archive(args):
         elif request_mode == "unarchival":
             dryrun_request_input = copy.deepcopy(request_input)
             dryrun_request_input.update(dryRun=True)
-            dryrun_res = send_archive_request(target_project, dryrun_request_input, request_func)
-            print('Will tag {} file(s) for unarchival in {}, totalling {} GB, costing ${}'.format(dryrun_res["files"], target_project, dryrun_res["size"],dryrun_res["cost"]/1000))
+            # The cost estimate is the sum of the estimates of the chunks
+            dryrun_results = send_archive_requests(target_project, dryrun_request_input, request_func)
+            print('Will tag {} file(s) for unarchival in {}, totalling {} GB, costing ${}'.format(
+                sum(res["files"] for res in dryrun_results), target_project,
+                sum(res["size"] for res in dryrun_results), sum(res["cost"] for res in dryrun_results)/1000))
 
         if not prompt_for_yn('Confirm all paths?', default=True):
             parser.exit(0)
 
     # send request and display final results
-    res = send_archive_request(target_project, request_input, request_func)
+    results = send_archive_requests(target_project, request_input, request_func,
+                                    on_progress=None if args.quiet else get_bulk_progress_printer("Sent"))
 
     if not args.quiet:
         print()
         if request_mode == "archival":
-            print('Tagged {} file(s) for archival in {}'.format(res["count"],target_project))
+            print('Tagged {} file(s) for archival in {}'.format(sum(res["count"] for res in results), target_project))
         elif request_mode == "unarchival":
-            print('Tagged {} file(s) for unarchival, totalling {} GB, costing ${}'.format(res["files"], res["size"],res["cost"]/1000))
+            print('Tagged {} file(s) for unarchival, totalling {} GB, costing ${}'.format(
+                sum(res["files"] for res in results), sum(res["size"] for res in results),
+                sum(res["cost"] for res in results)/1000))
         print()
 
 def print_help(args):
@@ -4748,7 +5176,7 @@ register_parser(parser_uninvite, categories='other')
 #####################################
 parser_ls = subparsers.add_parser('ls', help='List folders and/or objects in a folder',
                                   description='List folders and/or objects in a folder',
-                                  parents=[no_color_arg, delim_arg, env_args, stdout_args],
+                                  parents=[no_color_arg, delim_arg, env_args, stdout_args, cached_args],
                                   prog='dx ls')
 parser_ls.add_argument('-a', '--all', help='show hidden files', action='store_true')
 ls_output_args = parser_ls.add_mutually_exclusive_group()
@@ -4767,10 +5195,11 @@ register_parser(parser_ls, categories='fs')
 #####################################
 parser_tree = subparsers.add_parser('tree', help='List folders and objects in a tree',
                                     description='List folders and objects in a tree',
-                                    parents=[no_color_arg, env_args],
+                                    parents=[no_color_arg, env_args, cached_args],
                                     prog='dx tree')
 parser_tree.add_argument('-a', '--all', help='show hidden files', action='store_true')
 parser_tree.add_argument('-l', '--long', help='use a long listing format', action='store_true')
+parser_tree.add_argument('--stream', help=fill('Print the tree while it is traversed, listing one folder at a time (in sorted order) instead of fetching the whole project first', width_adjustment=-24), action='store_true')
 tree_path_action = parser_tree.add_argument('path', help='Folder (possibly in another project) to list the contents of, default is the current directory in the current project.  Syntax: projectID:/folder/path',
                                             nargs='?', default='.')
 tree_path_action.completer = DXPathCompleter(expected='folder')
@@ -4913,7 +5342,7 @@ parser_describe.add_argument('--multi', help=fill('If the flag --json is also pr
 parser_describe.add_argument('--try', metavar="T", dest="job_try", type=int,
                              help=fill('When describing a job that was restarted, describe job try T. T=0 refers to the first try. Default is the last job try.', width_adjustment=-24))
 
-describe_path_action = parser_describe.add_argument('path', help=fill('Object ID or path to an object (possibly in another project) to describe.', width_adjustment=-24))
+describe_path_action = parser_describe.add_argument('path', nargs='+', help=fill('Object IDs or paths to objects (possibly in another project) to describe.  Data objects, jobs, analyses and projects given by ID are described together in bulk; with several paths, --json always outputs a JSON array of the results in the order of the paths', width_adjustment=-24))
 describe_path_action.completer = DXPathCompleter()
 parser_describe.set_defaults(func=describe)
 register_parser(parser_describe, categories=('data', 'metadata'))
@@ -5613,6 +6042,15 @@ parser_run.add_argument('--batch-tsv', dest='batch_tsv', metavar="FILE",
                                   'of the executable input arguments. A job will be launched ' +
                                   'for each table row.',
                                   width_adjustment=-24))
+parser_run.add_argument('--launch-jobs', dest='launch_jobs', metavar='N', type=int,
+                        help=fill('With --batch-tsv, launch the rows with up to N concurrent requests. Each row is ' +
+                                  'launched at most once, and the progress is recorded in a manifest file so that an ' +
+                                  'interrupted launch can be resumed by rerunning the same command.',
+                                  width_adjustment=-24))
+parser_run.add_argument('--batch-manifest', dest='batch_manifest', metavar='FILE',
+                        help=fill('With --launch-jobs, the manifest file in which to record the launched rows ' +
+                                  '(default: the --batch-tsv file name followed by ".manifest.jsonl")',
+                                  width_adjustment=-24))
 ic_format = '\'{"entrypoint": <number of instances>}\''
 parser_run.add_argument('--instance-count',
                                metavar='INSTANCE_COUNT_OR_MAPPING',
@@ -5682,6 +6120,18 @@ parser_watch.add_argument('-q', '--quiet', help='Do not print extra info message
 parser_watch.add_argument('-f', '--format', help='Message format. Available fields: job, try, level, msg, date')
 parser_watch.add_argument('--no-wait', '--no-follow', action='store_false', dest='tail',
                           help='Exit after the first new message is received, instead of waiting for all logs')
+parser_watch.add_argument('--grep', metavar='REGEX',
+                          help=fill('Only show messages matching this regular expression', width_adjustment=-24))
+parser_watch.add_argument('--exclude', metavar='REGEX',
+                          help=fill('Do not show messages matching this regular expression', width_adjustment=-24))
+parser_watch.add_argument('--fast', action='store_true',
+                          help=fill('High-throughput mode for large job trees: write messages in batches and describe new jobs in bulk in the background, so job info may appear after the first messages of a job', width_adjustment=-24))
+parser_watch.add_argument('--output', metavar='FILE',
+                          help=fill('Write messages to FILE instead of stdout, gzip-compressed if FILE ends with .gz', width_adjustment=-24))
+parser_watch.add_argument('--output-max-size', metavar='MB', type=float,
+                          help=fill('With --output, start a new file (FILE.1, FILE.2...) whenever the current one reaches about this size', width_adjustment=-24))
+parser_watch.add_argument('--dump-dir', metavar='DIR',
+                          help=fill('Save the full logs of the job and all its subjobs to DIR/<job ID>.log, one file per job, downloading them concurrently, and exit once all the jobs are done', width_adjustment=-24))
 parser_watch.add_argument('--metrics', help=fill('Select display mode for detailed job metrics if they were collected and are available based on retention policy; see --metrics-help for details', width_adjustment=-24),
                           choices=["interspersed", "none", "top", "csv"], default="interspersed")
 
@@ -6045,6 +6495,7 @@ parser_wait = subparsers.add_parser('wait', help='Wait for data object(s) to clo
 path_action = parser_wait.add_argument('path', help='Path to a data object, job ID, or file with IDs to wait for', nargs='+')
 path_action.completer = DXPathCompleter()
 parser_wait.add_argument('--from-file', help='Read the list of objects to wait for from the file provided in path', action='store_true')
+parser_wait.add_argument('--fail-fast', help=fill('Exit as soon as any of the jobs or analyses fails, instead of waiting for all of them to reach a terminal state', width_adjustment=-24), action='store_true')
 parser_wait.set_defaults(func=wait)
 register_parser(parser_wait, categories=('data', 'metadata', 'exec'))
 
@@ -6135,7 +6586,7 @@ parser_find_jobs = subparsers_find.add_parser(
     help=fill('List jobs in the current project'),
     description=fill('Finds jobs subject to the given search parameters. By default, output is formatted to show the '
                      'last several job trees that you\'ve run in the current project.'),
-    parents=[find_executions_args, stdout_args, json_arg, no_color_arg, delim_arg, env_args,
+    parents=[find_executions_args, stdout_args, json_arg, json_stream_args, no_color_arg, delim_arg, env_args,
              find_by_properties_and_tags_args],
     formatter_class=argparse.RawTextHelpFormatter,
     conflict_handler='resolve',
@@ -6151,7 +6602,7 @@ parser_find_analyses = subparsers_find.add_parser(
     help=fill('List analyses in the current project'),
     description=fill('Finds analyses subject to the given search parameters. By default, output is formatted to show '
                      'the last several job trees that you\'ve run in the current project.'),
-    parents=[find_executions_args, stdout_args, json_arg, no_color_arg, delim_arg, env_args,
+    parents=[find_executions_args, stdout_args, json_arg, json_stream_args, no_color_arg, delim_arg, env_args,
              find_by_properties_and_tags_args],
     formatter_class=argparse.RawTextHelpFormatter,
     conflict_handler='resolve',
@@ -6167,7 +6618,7 @@ parser_find_executions = subparsers_find.add_parser(
     help=fill('List executions (jobs and analyses) in the current project'),
     description=fill('Finds executions (jobs and analyses) subject to the given search parameters. By default, output '
                      'is formatted to show the last several job trees that you\'ve run in the current project.'),
-    parents=[find_executions_args, stdout_args, json_arg, no_color_arg, delim_arg, env_args,
+    parents=[find_executions_args, stdout_args, json_arg, json_stream_args, no_color_arg, delim_arg, env_args,
              find_by_properties_and_tags_args],
     formatter_class=argparse.RawTextHelpFormatter,
     conflict_handler='resolve',
@@ -6184,7 +6635,7 @@ parser_find_data = subparsers_find.add_parser(
     description=fill('Finds data objects subject to the given search parameters. By default, restricts the search to '
                      'the current project if set. To search over all projects (excluding public projects), use '
                      '--all-projects (overrides --path and --norecurse).'),
-    parents=[stdout_args, json_arg, no_color_arg, delim_arg, env_args, find_by_properties_and_tags_args],
+    parents=[stdout_args, json_arg, json_stream_args, no_color_arg, delim_arg, env_args, find_by_properties_and_tags_args, cached_args],
     prog='dx find data'
 )
 parser_find_data.add_argument('--class', dest='classname', choices=['record', 'file', 'applet', 'workflow', 'database'],
@@ -6217,7 +6668,7 @@ parser_find_projects = subparsers_find.add_parser(
     help=fill('List projects'),
     description=fill('Finds projects subject to the given search parameters. Use the --public flag to list all public '
                      'projects.'),
-    parents=[stdout_args, json_arg, delim_arg, env_args, find_by_properties_and_tags_args, contains_phi],
+    parents=[stdout_args, json_arg, json_stream_args, delim_arg, env_args, find_by_properties_and_tags_args, contains_phi],
     prog='dx find projects'
 )
 parser_find_projects.add_argument('--name', help='Name of the project')
@@ -6255,7 +6706,7 @@ parser_find_org_members = subparsers_find_org.add_parser(
     'members',
     help='List members in the specified org',
     description=fill('Finds members in the specified org subject to the given search parameters'),
-    parents=[stdout_args, json_arg, delim_arg, env_args],
+    parents=[stdout_args, json_arg, json_stream_args, delim_arg, env_args],
     prog='dx find org members'
 )
 parser_find_org_members.add_argument('org_id', help='Org ID')
@@ -6269,7 +6720,7 @@ parser_find_org_projects = subparsers_find_org.add_parser(
     description=fill('Finds projects billed to the specified org subject to the given search parameters. You must '
                      'be an ADMIN of the specified org to use this command. It allows you to identify projects billed '
                      'to the org that have not been shared with you explicitly.'),
-    parents=[stdout_args, json_arg, delim_arg, env_args, find_by_properties_and_tags_args, contains_phi],
+    parents=[stdout_args, json_arg, json_stream_args, delim_arg, env_args, find_by_properties_and_tags_args, contains_phi],
     prog='dx find org projects'
 )
 parser_find_org_projects.add_argument('org_id', help='Org ID')
@@ -6290,7 +6741,7 @@ parser_find_org_apps = subparsers_find_org.add_parser(
     description=fill('Finds apps billed to the specified org subject to the given search parameters. You must '
                      'be an ADMIN of the specified org to use this command. It allows you to identify apps billed '
                      'to the org that have not been shared with you explicitly.'),
-    parents=[stdout_args, json_arg, delim_arg, env_args],
+    parents=[stdout_args, json_arg, json_stream_args, delim_arg, env_args],
     prog='dx find org apps'
 )
 parser_find_org_apps.add_argument('org_id', help='Org ID')
@@ -6319,7 +6770,7 @@ parser_find_orgs = subparsers_find.add_parser(
     "orgs",
     help=fill("List orgs"),
     description="Finds orgs subject to the given search parameters.",
-    parents=[stdout_args, env_args, delim_arg, json_arg],
+    parents=[stdout_args, env_args, delim_arg, json_arg, json_stream_args],
     prog="dx find orgs"
 )
 parser_find_orgs.add_argument("--level", choices=["ADMIN", "MEMBER"], required=True, help="Restrict the result set to contain only orgs in which the requesting user has at least the specified membership level")
@@ -6541,6 +6992,7 @@ parser_extract_dataset.add_argument('--fields', type=str, help='A comma-separate
 parser_extract_dataset.add_argument('--fields-file', type=str, help='A file with no header and one entry per line where every entry is the phenotypic entity name and field name, separated by a dot. For example: <entity_name>.<field_name>. If multiple entities are provided, field values will be automatically inner joined. If only the --fields-file argument is provided, data will be retrieved and returned. If both --fields-file and --sql arguments are provided, a SQL statement to retrieve the specified field data will be automatically generated and returned. May not be used in conjunction with the argument --fields.')
 parser_extract_dataset.add_argument('--sql', action="store_true", default=False, help='If provided, a SQL statement (string) will be returned to query the set of entity.fields, instead of returning stored values from the set of entity.fields')
 parser_extract_dataset.add_argument('--delim', '--delimiter', nargs='?', const=',', default=',', help='Always use exactly one of DELIMITER to separate fields to be printed; if no delimiter is provided with this flag, COMMA will be used')
+parser_extract_dataset.add_argument('--output-format', choices=['parquet', 'arrow', 'jsonl'], help='Write the data retrieved with --fields or --fields-file as a Parquet file, an Arrow IPC file or JSON Lines (one JSON object per line) instead of delimited text, with typed columns according to the data dictionary of the dataset. The file suffix will be ".parquet", ".arrow" or ".jsonl" respectively. "parquet" and "arrow" require the pyarrow package. May not be used with --sql.')
 parser_extract_dataset.add_argument('-o', '--output', help='Local filename or directory to be used ("-" indicates stdout output). If not supplied, output will create a file with a default name in the current folder')
 parser_extract_dataset.add_argument( "--list-fields", action="store_true", default=False, help='List the names and titles of all fields available in the dataset specified. When not specified together with "–-entities", it will return all the fields from the main entity. Output will be a two column table, field names and field titles, separated by a tab, where field names will be of the format, "<entity name>.<field name>" and field titles will be of the format, "<field title>".')
 parser_extract_dataset.add_argument( "--list-entities", action="store_true", default=False, help='List the names and titles of all the entities available in the dataset specified. Output will be a two column table, entity names and entity titles, separated by a tab.')
@@ -6639,6 +7091,11 @@ parser_extract_assay_germline.add_argument(
     action="store_true",
     help='If the flag is provided, a SQL statement, returned as a string, will be provided to query the specified data instead of returning data.'
 )
+parser_extract_assay_germline.add_argument(
+    "--output-format",
+    choices=["parquet", "arrow", "jsonl"],
+    help='Write the data as a Parquet file, an Arrow IPC file or JSON Lines (one JSON object per line) instead of tab-delimited text, with typed columns. The file suffix will be ".parquet", ".arrow" or ".jsonl" respectively. "parquet" and "arrow" require the pyarrow package. May not be used with --sql.'
+)
 parser_extract_assay_germline.add_argument(
     "-o", "--output", 
     type=str,
@@ -6721,6 +7178,11 @@ parser_extract_assay_somatic.add_argument(
     action="store_true",
     help='If the flag is provided, a SQL statement, returned as a string, will be provided to query the specified data instead of returning data.'
 )
+parser_extract_assay_somatic.add_argument(
+    "--output-format",
+    choices=["parquet", "arrow", "jsonl"],
+    help='Write the data as a Parquet file, an Arrow IPC file or JSON Lines (one JSON object per line) instead of tab-delimited text, with typed columns. The file suffix will be ".parquet", ".arrow" or ".jsonl" respectively. "parquet" and "arrow" require the pyarrow package. May not be used with --sql or --retrieve-meta-info.'
+)
 parser_extract_assay_somatic.add_argument(
     "-o", "--output", 
     type=str,
@@ -6811,6 +7273,12 @@ parser_extract_assay_expression.add_argument(
     help='If the flag is provided with "--retrieve-expression", the returned data will be a matrix of sample IDs (rows) by feature IDs (columns), where each cell is the respective pairwise value. The flag is not compatible with "--additional-fields". Additionally, the flag is not compatible with an "expression" filter. If the underlying expression value is missing, the value will be empty in returned data. Use of --expression-matrix/-em is not supported when also using the flag, "--sql".',
 )
 
+parser_extract_assay_expression.add_argument(
+    "--output-format",
+    choices=["mtx", "parquet", "arrow", "jsonl"],
+    help='Format of the returned data. "parquet", "arrow" and "jsonl" write a Parquet file, an Arrow IPC file or JSON Lines (one JSON object per line) respectively, with typed columns; "parquet" and "arrow" require the pyarrow package. "mtx" writes the matrix returned with "--expression-matrix" in Matrix Market coordinate format, as a sparse matrix of sample IDs (rows) by feature IDs (columns) where missing values are omitted; the sample IDs and feature IDs are written, one per line, to files with the same name as the output and the suffixes ".samples.tsv" and ".features.tsv". "mtx" requires "--expression-matrix" and an output file. The file suffix will be the name of the format. May not be used with "--sql". If not specified, the data is written as delimited text (see "--delim").',
+)
+
 parser_extract_assay_expression.add_argument(
     "--delim",
     "--delimiter",
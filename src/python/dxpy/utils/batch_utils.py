@@ -25,8 +25,13 @@ from collections import defaultdict
 import csv
 import dxpy
 import json
+import os
+import threading
+import time
 
-from ..exceptions import err_exit
+from . import Nonce, get_futures_threadpool, wait_for_all_futures
+from .bulk_operations import is_retryable_error
+from ..exceptions import err_exit, DXError, DXAPIError
 
 
 # Informational columns in the TSV file, which we want to ignore
@@ -205,6 +210,20 @@ def batch_launch_args(executable, input_json, batch_tsv_file):
     return { "launch_args": launch_args,
              "batch_ids": batch_ids }
 
+def _get_batch_run_args(run_kwargs, exec_name, batch_id, set_batch_folders):
+    run_args = run_kwargs.copy()
+    name = "{}-{}".format(exec_name, batch_id)
+    properties = dict(run_kwargs.get('properties') or {})
+    properties.update({
+        'batch-id': batch_id,
+        'batch-name': name
+    })
+    run_args['name'] = name
+    run_args['properties'] = properties
+    if set_batch_folders:
+        run_args['folder'] = run_kwargs['folder'] + "/" + batch_id
+    return run_args
+
 #
 # executable: applet, app, or workflow
 # launch_args: array of dictionaries, each of which contains all arguments needed to
@@ -214,30 +233,154 @@ def batch_launch_args(executable, input_json, batch_tsv_file):
 #     The folders will be created/used relative to the output folder set with
 #     the --destination arg
 def batch_run(executable, b_args, run_kwargs, set_batch_folders=False):
-    run_args = run_kwargs.copy()
     exec_name = executable.describe()["name"]
     launch_args = b_args["launch_args"]
     batch_ids = b_args["batch_ids"]
     executions = []
     for idx, input_json in enumerate(launch_args):
-        batch_id = batch_ids[idx]
-        name = "{}-{}".format(exec_name, batch_id)
-        properties = {
-            'batch-id': batch_id,
-            'batch-name': name
-        }
-        run_args['name'] = name
-        if run_args.get('properties') is not None:
-            run_args['properties'].update(properties)
-        else:
-            run_args['properties'] = properties
-
-        if set_batch_folders:
-            run_args['folder'] = run_kwargs['folder'] + "/" + batch_id
-
+        run_args = _get_batch_run_args(run_kwargs, exec_name, batch_ids[idx], set_batch_folders)
         try:
             dxexecution = executable.run(input_json, **run_args)
             executions.append(dxexecution)
         except Exception:
             err_exit()
     return executions
+
+
+def _read_manifest(manifest):
+    # Returns {row index: entry}, where later lines for a row override earlier ones
+    entries = {}
+    if manifest is None or not os.path.exists(manifest):
+        return entries
+    with open(manifest) as fd:
+        for line in fd:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line may be truncated if the launcher was killed while writing it
+                continue
+            entries.setdefault(entry["row"], {}).update(entry)
+    return entries
+
+
+def batch_run_parallel(executable, b_args, run_kwargs, set_batch_folders=False, launch_jobs=8, manifest=None,
+                       retry_budget=None, on_progress=None):
+    """
+    :param executable: Applet, app, or workflow to run
+    :param b_args: Output of :func:`batch_launch_args`
+    :type b_args: dict
+    :param run_kwargs: Keyword arguments to the run method of the executable, shared by all rows
+    :type run_kwargs: dict
+    :param set_batch_folders: Whether to place the results of each row in a separate folder named after its batch ID
+    :type set_batch_folders: boolean
+    :param launch_jobs: Maximum number of concurrent /run requests
+    :type launch_jobs: int
+    :param manifest: Path of a JSON lines file in which the progress of the launch is recorded
+    :type manifest: string
+    :param retry_budget: Total number of retries allowed across all rows (default: 10% of the rows, at least 10)
+    :type retry_budget: int
+    :param on_progress: Function called with the number of finished rows and the total number of rows
+    :type on_progress: function
+    :returns: The execution IDs (None for rows that could not be launched) and a list of (batch ID, error message) tuples for the failed rows
+    :rtype: tuple
+
+    Launches one execution per batch row, with up to *launch_jobs* /run
+    requests in flight. Each row is run with its own nonce, so that
+    retrying a request never launches the same row twice. Failed requests
+    that may succeed later (throttling, server errors, connection errors)
+    are retried with exponential backoff until the shared retry budget is
+    used up; while the server is throttling requests, no new ones are
+    sent.
+
+    If *manifest* is given, the nonce of each row is recorded before it is
+    launched and the execution ID once it has been launched. Rerunning with
+    the same manifest skips the rows that were already launched and reuses
+    the nonces of the others, so an interrupted launch can be resumed
+    safely.
+    """
+    exec_name = executable.describe()["name"]
+    launch_args = b_args["launch_args"]
+    batch_ids = b_args["batch_ids"]
+    num_rows = len(launch_args)
+    if retry_budget is None:
+        retry_budget = max(10, num_rows // 10)
+
+    previous = _read_manifest(manifest)
+    for row, entry in previous.items():
+        if row >= num_rows or entry.get("batch_id") != batch_ids[row]:
+            raise DXError("The manifest {} does not match the batch file (row {})".format(manifest, row))
+
+    lock = threading.Lock()
+    state = {"retries_left": retry_budget, "resume_at": 0, "finished": 0}
+    manifest_fd = open(manifest, "a") if manifest is not None else None
+
+    def record(entry):
+        if manifest_fd is not None:
+            with lock:
+                manifest_fd.write(json.dumps(entry) + "\n")
+                manifest_fd.flush()
+
+    def finish():
+        with lock:
+            state["finished"] += 1
+            finished = state["finished"]
+        if on_progress is not None:
+            on_progress(finished, num_rows)
+
+    def launch(row):
+        batch_id = batch_ids[row]
+        nonce = previous.get(row, {}).get("nonce") or str(Nonce())
+        record({"row": row, "batch_id": batch_id, "nonce": nonce})
+        run_args = _get_batch_run_args(run_kwargs, exec_name, batch_id, set_batch_folders)
+        run_args['extra_args'] = dict(run_args.get('extra_args') or {}, nonce=nonce)
+        delay = 1
+        while True:
+            with lock:
+                wait = state["resume_at"] - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                execution_id = executable.run(launch_args[row], **run_args).get_id()
+            except Exception as e:
+                with lock:
+                    can_retry = is_retryable_error(e) and state["retries_left"] > 0
+                    if can_retry:
+                        state["retries_left"] -= 1
+                        if isinstance(e, DXAPIError) and e.code in (429, 503):
+                            # Hold back all workers while the server is throttling
+                            state["resume_at"] = max(state["resume_at"], time.time() + delay)
+                if not can_retry:
+                    message = e.error_message() if isinstance(e, DXAPIError) else "{}: {}".format(
+                        e.__class__.__name__, e)
+                    record({"row": row, "batch_id": batch_id, "nonce": nonce, "error": message})
+                    finish()
+                    return None, message
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            record({"row": row, "batch_id": batch_id, "nonce": nonce, "id": execution_id})
+            finish()
+            return execution_id, None
+
+    execution_ids = [previous.get(row, {}).get("id") for row in range(num_rows)]
+    to_launch = [row for row in range(num_rows) if execution_ids[row] is None]
+    state["finished"] = num_rows - len(to_launch)
+    failures = []
+    try:
+        if to_launch:
+            pool = get_futures_threadpool(max_workers=min(launch_jobs, len(to_launch)))
+            futures = [pool.submit(launch, row) for row in to_launch]
+            wait_for_all_futures(futures)
+            pool.shutdown()
+            for row, future in zip(to_launch, futures):
+                execution_id, error = future.result()
+                execution_ids[row] = execution_id
+                if error is not None:
+                    failures.append((batch_ids[row], error))
+    finally:
+        if manifest_fd is not None:
+            manifest_fd.close()
+    return execution_ids, failures
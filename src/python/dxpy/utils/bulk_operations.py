@@ -0,0 +1,200 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Helpers for applying an operation to a large number of data objects.
+
+:func:`resolve_paths` resolves many paths with batched
+/system/describeDataObjects and /system/resolveDataObjects calls, and :func:`run_in_chunks` splits a list
+of items into size-bounded chunks, applies an operation to the chunks
+concurrently (retrying chunks that failed with transient errors) and
+reports the progress and the failed chunks. They are used by ``dx rm``,
+``dx mv``, ``dx cp``, ``dx tag`` and ``dx set_properties``, among others.
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import json, time
+
+import dxpy
+from . import get_futures_threadpool, wait_for_all_futures
+from .resolver import (resolve_path, resolve_existing_path, is_hashid, is_data_obj_id, is_glob_pattern, is_job_id,
+                       ResolutionError)
+from ..exceptions import DXAPIError, network_exceptions
+
+# Maximum number of items and of JSON-encoded bytes in a single chunk
+MAX_CHUNK_ITEMS = 1000
+MAX_CHUNK_BYTES = 1024 * 1024
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 3
+
+RESOLVE_BATCH_SIZE = 1000
+
+
+def is_retryable_error(error):
+    '''
+    :returns: Whether a request that failed with *error* may succeed if it is retried later (throttling, server and connection errors)
+    :rtype: boolean
+    '''
+    if isinstance(error, DXAPIError):
+        return error.code == 429 or 500 <= error.code < 600
+    return isinstance(error, network_exceptions + (IOError,))
+
+
+def make_chunks(items, max_items=MAX_CHUNK_ITEMS, max_bytes=MAX_CHUNK_BYTES):
+    '''
+    :param items: JSON-serializable items
+    :type items: list
+    :returns: Consecutive sublists of *items*, each with at most *max_items* items and (unless a single item is larger) at most *max_bytes* bytes when JSON-encoded
+    :rtype: list of lists
+    '''
+    chunks, chunk, chunk_bytes = [], [], 0
+    for item in items:
+        item_bytes = len(json.dumps(item)) + 1
+        if chunk and (len(chunk) >= max_items or chunk_bytes + item_bytes > max_bytes):
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_in_chunks(func, items, max_items=MAX_CHUNK_ITEMS, max_bytes=MAX_CHUNK_BYTES, max_workers=DEFAULT_MAX_WORKERS,
+                  max_retries=DEFAULT_MAX_RETRIES, on_progress=None):
+    '''
+    :param func: Function that applies the operation to a chunk (a list of items) and returns a result
+    :type func: function
+    :param items: Items to which to apply the operation
+    :type items: list
+    :param max_workers: Maximum number of chunks processed concurrently
+    :type max_workers: int
+    :param max_retries: Number of times a chunk that failed with a transient error is retried
+    :type max_retries: int
+    :param on_progress: Function called after each chunk with the number of items processed so far (successfully or not), the total number of items, and the number of items in failed chunks
+    :type on_progress: function
+    :returns: The result of *func* for each chunk (None for failed chunks), and a list of (chunk, exception) tuples for the failed chunks
+    :rtype: tuple
+
+    Splits *items* into chunks with :func:`make_chunks` and calls *func*
+    on the chunks concurrently. Only use it for operations that can be
+    safely retried and for which the order of the chunks does not
+    matter.
+    '''
+    chunks = make_chunks(items, max_items=max_items, max_bytes=max_bytes)
+    progress = {"done": 0, "failed": 0}
+
+    def process(chunk):
+        delay = 1
+        for attempt in range(max_retries + 1):
+            try:
+                return func(chunk)
+            except Exception as e:
+                if attempt == max_retries or not is_retryable_error(e):
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    results, failures = [None] * len(chunks), []
+    if not chunks:
+        return results, failures
+    pool = get_futures_threadpool(max_workers=min(max_workers, len(chunks)))
+    futures = [pool.submit(process, chunk) for chunk in chunks]
+    wait_for_all_futures(futures)
+    pool.shutdown()
+    for i, (chunk, future) in enumerate(zip(chunks, futures)):
+        if future.exception() is not None:
+            failures.append((chunk, future.exception()))
+            progress["failed"] += len(chunk)
+        else:
+            results[i] = future.result()
+        progress["done"] += len(chunk)
+        if on_progress is not None:
+            on_progress(progress["done"], len(items), progress["failed"])
+    return results, failures
+
+
+def resolve_paths(paths, all_mult=False, raise_errors=False, batch_size=RESOLVE_BATCH_SIZE):
+    '''
+    :param paths: Paths to data objects or folders
+    :type paths: list of strings
+    :param all_mult: Whether to return all matching objects if a name matches several objects (otherwise the user is asked to pick one, if possible)
+    :type all_mult: boolean
+    :param raise_errors: Whether to raise the exception of the first path that could not be resolved instead of returning it
+    :type raise_errors: boolean
+    :returns: A list with one (project, folderpath, object IDs) tuple per path, in the order of *paths*, where object IDs is None if the path refers to a folder (or a project), or the exception raised if the path could not be resolved
+    :rtype: list
+
+    Resolves many paths with as few API calls as possible: object IDs are
+    checked with batched /system/describeDataObjects calls, names are
+    looked up with batched /system/resolveDataObjects calls, and only
+    paths that may refer to folders, glob patterns, ambiguous names and
+    objects that could not be found this way are resolved one at a time
+    with :func:`~dxpy.utils.resolver.resolve_existing_path` (which reports
+    the errors).
+    '''
+    resolved = [None] * len(paths)
+    to_describe = []  # (index, {"id": ..., "project": ...})
+    to_batch = []  # (index, {"project": ..., "folder": ..., "name": ...})
+    for i, path in enumerate(paths):
+        try:
+            project, folderpath, entity_name = resolve_path(path, expected='entity')
+        except ResolutionError as e:
+            resolved[i] = e
+            continue
+        if entity_name is not None and is_data_obj_id(entity_name) and project is not None and not is_job_id(project):
+            to_describe.append((i, {"id": entity_name, "project": project, "describe": {"fields": {"id": True}}}))
+        elif entity_name is not None and not is_hashid(entity_name) and not is_glob_pattern(entity_name) \
+                and project is not None and not is_job_id(project):
+            to_batch.append((i, {"project": project, "folder": folderpath, "name": entity_name}))
+
+    for start in range(0, len(to_describe), batch_size):
+        batch = to_describe[start:start + batch_size]
+        try:
+            results = dxpy.api.system_describe_data_objects({"objects": [query for _, query in batch]})["results"]
+        except Exception:
+            # Fall back to resolving the paths individually
+            continue
+        for (i, query), result in zip(batch, results):
+            if result.get("describe"):
+                resolved[i] = (query["project"], None, [query["id"]])
+
+    for start in range(0, len(to_batch), batch_size):
+        batch = to_batch[start:start + batch_size]
+        try:
+            results = dxpy.resolve_data_objects([query for _, query in batch])
+        except Exception:
+            # Fall back to resolving the paths individually
+            continue
+        for (i, query), result in zip(batch, results):
+            if len(result) == 1 or (len(result) > 1 and all_mult):
+                resolved[i] = (query["project"], None, [obj["id"] for obj in result])
+
+    for i, path in enumerate(paths):
+        if resolved[i] is None:
+            try:
+                project, folderpath, entity_results = resolve_existing_path(path, allow_mult=True, all_mult=all_mult)
+                if entity_results is None:
+                    resolved[i] = (project, folderpath, None)
+                else:
+                    resolved[i] = (project, None, [result['id'] for result in entity_results])
+            except Exception as e:
+                resolved[i] = e
+        if raise_errors and isinstance(resolved[i], Exception):
+            raise resolved[i]
+    return resolved
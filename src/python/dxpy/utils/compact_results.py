@@ -0,0 +1,307 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Compact, column-oriented container for large /system/find* result sets.
+
+Each result of a find method is normally kept as a nested dict, which
+costs several hundred bytes to a few KB per object. A
+:class:`CompactResultSet` instead stores the requested describe fields
+column-wise: repeated strings (folders, classes, states, project IDs) are
+interned and stored as integer codes, integers are stored in typed arrays,
+and rows are only materialized on access through lightweight
+:class:`CompactRow` views.
+
+Example::
+
+    results = dxpy.find_data_objects(project=project_id, classname="file",
+                                     describe={"fields": {"name": True, "folder": True, "size": True}},
+                                     result_set=CompactResultSet(["name", "folder", "size"]))
+    for row in results:
+        print(row.id, row["folder"], row["size"])
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import csv, json
+from array import array
+
+from ..compat import basestring
+from ..exceptions import DXError
+
+_MISSING_INT = -2 ** 63
+
+# Describe fields of the executions in the tree of a find result that are
+# kept by CompactResultSet.add_tree (the ones needed to print the tree)
+TREE_DESCRIBE_FIELDS = ('id', 'class', 'name', 'executableName', 'function', 'state', 'launchedBy', 'parentJob',
+                        'parentAnalysis', 'created', 'startedRunning', 'stoppedRunning', 'try')
+
+
+class _Column(object):
+    '''
+    Storage for a single field. The representation is chosen from the
+    first non-null value and widened to a plain list if a later value does
+    not fit it.
+    '''
+    __slots__ = ('kind', 'values', 'pool', 'codes', 'length')
+
+    def __init__(self):
+        self.kind = None    # None (only nulls seen so far), "str", "int" or "object"
+        self.values = None
+        self.pool = None
+        self.codes = None
+        self.length = 0
+
+    def _start(self, value):
+        if isinstance(value, basestring):
+            # Code 0 is reserved for null
+            self.kind, self.values, self.pool, self.codes = "str", array('l', [0] * self.length), [None], {}
+        elif isinstance(value, int) and not isinstance(value, bool) and _MISSING_INT < value < 2 ** 63:
+            self.kind, self.values = "int", array('q', [_MISSING_INT] * self.length)
+        else:
+            self.kind, self.values = "object", [None] * self.length
+
+    def _to_object(self):
+        self.values = [self.get(i) for i in range(self.length)]
+        self.kind, self.pool, self.codes = "object", None, None
+
+    def append(self, value):
+        if value is not None:
+            if self.kind is None:
+                self._start(value)
+            elif self.kind == "int" and (isinstance(value, bool) or not isinstance(value, int) or
+                                         not _MISSING_INT < value < 2 ** 63):
+                self._to_object()
+            elif self.kind == "str" and not isinstance(value, basestring):
+                self._to_object()
+        if self.kind == "str":
+            code = self.codes.get(value) if value is not None else 0
+            if code is None:
+                code = self.codes[value] = len(self.pool)
+                self.pool.append(value)
+            self.values.append(code)
+        elif self.kind == "int":
+            self.values.append(_MISSING_INT if value is None else value)
+        elif self.kind == "object":
+            self.values.append(value)
+        self.length += 1
+
+    def get(self, i):
+        if self.kind is None:
+            if not -self.length <= i < self.length:
+                raise IndexError(i)
+            return None
+        value = self.values[i]
+        if self.kind == "str":
+            return self.pool[value]
+        if self.kind == "int" and value == _MISSING_INT:
+            return None
+        return value
+
+
+class CompactRow(object):
+    '''
+    Read-only view of a single row of a :class:`CompactResultSet`. Describe
+    fields are available with ``row[field]``; ``row.id`` and ``row.project``
+    hold the ID and project of the result.
+    '''
+    __slots__ = ('_results', '_index')
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index = index
+
+    @property
+    def id(self):
+        return self._results._ids[self._index]
+
+    @property
+    def project(self):
+        return self._results._projects.get(self._index)
+
+    def __getitem__(self, field):
+        if field not in self._results._columns:
+            raise KeyError(field)
+        return self._results._columns[field].get(self._index)
+
+    def get(self, field, default=None):
+        value = self._results._columns[field].get(self._index) if field in self._results._columns else None
+        return default if value is None else value
+
+    def describe(self):
+        '''
+        :returns: The stored describe fields of the row (fields that were absent are omitted)
+        :rtype: dict
+        '''
+        desc = {}
+        for field, column in self._results._columns.items():
+            value = column.get(self._index)
+            if value is not None:
+                desc[field] = value
+        return desc
+
+    def to_dict(self):
+        '''
+        :returns: The row in the format yielded by the find methods, i.e. {"id": ..., "project": ..., "describe": {...}}
+        :rtype: dict
+        '''
+        result = {"id": self.id}
+        if self.project is not None:
+            result["project"] = self.project
+        if self._results.fields:
+            result["describe"] = self.describe()
+        return result
+
+    def __repr__(self):
+        return "CompactRow({!r})".format(self.to_dict())
+
+
+class CompactResultSet(object):
+    '''
+    :param fields: Names of the describe fields to keep; other fields in the results are dropped
+    :type fields: list of strings
+
+    Column-oriented container of results of the /system/find* methods.
+    Pass an instance as the *result_set* argument of
+    :func:`~dxpy.bindings.search.find_data_objects` or
+    :func:`~dxpy.bindings.search.find_executions` to have the results
+    appended to it page by page, or call :meth:`append` or :meth:`extend`
+    with result dicts directly.
+
+    When the find method returns the execution tree of the results
+    ("byParent" and "describe" in the response), it is merged into
+    :attr:`by_parent` and :attr:`descriptions`; only the fields in
+    :data:`TREE_DESCRIBE_FIELDS` and *fields* of each description are
+    kept.
+    '''
+
+    def __init__(self, fields=()):
+        self.fields = list(fields)
+        self.by_parent = {}
+        self.descriptions = {}
+        self._known_children = {}
+        self._ids = []
+        self._projects = _Column()
+        self._columns = {field: _Column() for field in self.fields}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._ids)
+        if not 0 <= index < len(self._ids):
+            raise IndexError(index)
+        return CompactRow(self, index)
+
+    def __iter__(self):
+        for i in range(len(self._ids)):
+            yield CompactRow(self, i)
+
+    def append(self, result):
+        '''
+        :param result: A result in the format yielded by the find methods
+        :type result: dict
+        '''
+        self._ids.append(result['id'])
+        self._projects.append(result.get('project'))
+        desc = result.get('describe') or {}
+        for field, column in self._columns.items():
+            column.append(desc.get(field))
+
+    def extend(self, results):
+        for result in results:
+            self.append(result)
+
+    def add_tree(self, by_parent, descriptions):
+        '''
+        :param by_parent: Mapping from parent execution ID to the IDs of its children
+        :type by_parent: dict
+        :param descriptions: Mapping from execution ID to its describe output
+        :type descriptions: dict
+        '''
+        for parent, children in by_parent.items():
+            ordered = self.by_parent.setdefault(parent, [])
+            known = self._known_children.setdefault(parent, set())
+            for child in children:
+                if child not in known:
+                    known.add(child)
+                    ordered.append(child)
+        for execution_id, desc in (descriptions or {}).items():
+            self.descriptions[execution_id] = {field: value for field, value in desc.items()
+                                               if field in TREE_DESCRIBE_FIELDS or field in self._columns}
+
+    def column(self, field):
+        '''
+        :param field: "id", "project", or one of the stored describe fields
+        :type field: string
+        :returns: All values of the field, in row order
+        :rtype: list
+        '''
+        if field == 'id':
+            return list(self._ids)
+        column = self._projects if field == 'project' else self._columns[field]
+        return [column.get(i) for i in range(len(self._ids))]
+
+    def to_jsonl(self, fh):
+        '''
+        Writes one JSON object per line to the text file handle *fh*, in
+        the format yielded by the find methods.
+        '''
+        for row in self:
+            fh.write(json.dumps(row.to_dict()))
+            fh.write("\n")
+
+    def to_csv(self, fh, delimiter=","):
+        '''
+        Writes the rows to the text file handle *fh* as delimited text,
+        with a header of "id", "project" and the stored fields. Values
+        that are lists or mappings are JSON-encoded.
+        '''
+        writer = csv.writer(fh, delimiter=str(delimiter), lineterminator="\n")
+        header = ["id", "project"] + self.fields
+        writer.writerow(header)
+        columns = [self._projects] + [self._columns[field] for field in self.fields]
+        for i, obj_id in enumerate(self._ids):
+            row = [obj_id]
+            for column in columns:
+                value = column.get(i)
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value)
+                row.append("" if value is None else value)
+            writer.writerow(row)
+
+    def to_pandas(self):
+        '''
+        :returns: A DataFrame with the columns "id", "project" and the stored fields
+        :rtype: pandas.DataFrame
+        :raises: :exc:`~dxpy.exceptions.DXError` if pandas is not installed
+        '''
+        try:
+            import pandas as pd
+        except ImportError:
+            raise DXError("CompactResultSet.to_pandas requires pandas, which is not currently installed")
+        data = {"id": self._ids, "project": self.column("project")}
+        for field in self.fields:
+            column = self._columns[field]
+            if column.kind == "str":
+                # Build a categorical directly from the interned codes (-1 denotes a missing value)
+                data[field] = pd.Categorical.from_codes([code - 1 for code in column.values],
+                                                        categories=column.pool[1:])
+            else:
+                data[field] = self.column(field)
+        return pd.DataFrame(data, columns=["id", "project"] + self.fields)
+
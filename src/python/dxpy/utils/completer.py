@@ -28,6 +28,8 @@ import dxpy
 from .resolver import (get_first_pos_of_char, get_last_pos_of_char, clean_folder_path, resolve_path,
                        split_unescaped, ResolutionError)
 from .printing import fill
+from .completion_cache import get_folder_listing, get_app_list
+from ..compat import basestring
 
 def startswith(text):
     return (lambda string: string.startswith(text))
@@ -100,8 +102,12 @@ def get_folder_matches(text, delim_pos, dxproj, folderpath):
     and be in escaped form for consumption by the command-line.
     '''
     try:
-        folders = dxproj.list_folder(folder=folderpath, only='folders')['folders']
-        folder_names = [name[name.rfind('/') + 1:] for name in folders]
+        listing = get_folder_listing(dxproj.get_id(), folderpath)
+        if listing is not None:
+            folder_names = list(listing['folders'])
+        else:
+            folders = dxproj.list_folder(folder=folderpath, only='folders')['folders']
+            folder_names = [name[name.rfind('/') + 1:] for name in folders]
         if text != '' and delim_pos != len(text) - 1:
             folder_names += ['.', '..']
         prefix = text[:delim_pos + 1]
@@ -140,18 +146,30 @@ def get_data_matches(text, delim_pos, dxproj, folderpath, classname=None,
             visibility = "visible"
 
     try:
-        results = list(dxpy.find_data_objects(project=dxproj.get_id(),
-                                              folder=folderpath,
-                                              name=unescaped_text + "*",
-                                              name_mode="glob",
-                                              recurse=False,
-                                              visibility=visibility,
-                                              classname=classname,
-                                              limit=100,
-                                              describe=dict(fields=dict(name=True)),
-                                              typename=typespec))
+        # The cached listing can only be filtered by a single type
+        listing = None
+        if typespec is None or isinstance(typespec, basestring):
+            listing = get_folder_listing(dxproj.get_id(), folderpath)
+        if listing is not None and listing['objects'] is not None:
+            names = [obj['name'] for obj in listing['objects']
+                     if obj['name'].startswith(unescaped_text) and
+                     (classname is None or obj['class'] == classname) and
+                     (typespec is None or typespec in (obj['types'] or [])) and
+                     (visibility == "either" or obj['hidden'] == (visibility == "hidden"))][:100]
+        else:
+            results = dxpy.find_data_objects(project=dxproj.get_id(),
+                                             folder=folderpath,
+                                             name=unescaped_text + "*",
+                                             name_mode="glob",
+                                             recurse=False,
+                                             visibility=visibility,
+                                             classname=classname,
+                                             limit=100,
+                                             describe=dict(fields=dict(name=True)),
+                                             typename=typespec)
+            names = [result['describe']['name'] for result in results]
         prefix = '' if text == '' else text[:delim_pos + 1]
-        return [prefix + escape_name(result['describe']['name']) for result in results]
+        return [prefix + escape_name(name) for name in names]
     except:
         return []
 
@@ -286,6 +304,20 @@ class DXAppCompleter():
         self.installed = installed
 
     def _populate_matches(self, prefix):
+        try:
+            apps = get_app_list()
+        except:
+            apps = None
+        if apps is not None:
+            appnames = [app['name'] for app in apps if self.installed is None or (self.installed == app['installed'])]
+        else:
+            appnames = self._find_appnames(prefix)
+        self.matches = [name for name in appnames if name.startswith(prefix)]
+        if prefix != '' and prefix.startswith('app-'[:len(prefix)]):
+            appnames_with_prefix = [('app-' + name) for name in appnames]
+            self.matches += [name for name in appnames_with_prefix if name.startswith(prefix)]
+
+    def _find_appnames(self, prefix):
         try:
             name_query = None
             if len(prefix) > 0:
@@ -297,10 +329,7 @@ class DXAppCompleter():
         except:
             # This is for (temporary) backwards-compatibility
             appnames = [result['describe']['name'] for result in dxpy.find_apps(describe=True) if self.installed is None or (self.installed == result['describe']['installed'])]
-        self.matches = [name for name in appnames if name.startswith(prefix)]
-        if prefix != '' and prefix.startswith('app-'[:len(prefix)]):
-            appnames_with_prefix = [('app-' + name) for name in appnames]
-            self.matches += [name for name in appnames_with_prefix if name.startswith(prefix)]
+        return appnames
 
     def get_matches(self, line, point, prefix, suffix):
         # This implementation is reliant on bash behavior that ':' is
@@ -0,0 +1,305 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+On-disk cache for tab completion.
+
+Tab completion runs in a new ``dx`` process for every key press, so the
+contents of folders and the list of apps are kept in the session
+configuration directory (see
+:meth:`~dxpy.utils.config.DXConfig.get_session_conf_dir`), one small JSON
+file per folder and one for the apps. Entries younger than
+``DX_COMPLETION_CACHE_TTL`` seconds (60 by default) are used as is; older
+entries (up to a day old) are still used, while a detached process
+refreshes them in the background. Folders that are not cached yet are
+also fetched in the background, while completion falls back to a bounded
+prefix query. The cache is cleared once the commands that create, move or
+remove objects and folders, or install apps, have run (see
+:func:`invalidates_completion_cache`). Setting ``DX_COMPLETION_CACHE_TTL``
+to 0 disables the cache.
+
+The background refresh is run as::
+
+    python -m dxpy.utils.completion_cache refresh folder <project ID> <folder>
+    python -m dxpy.utils.completion_cache refresh apps
+
+The refreshing process is detached from the shell, so it cannot find the
+session configuration directory itself: the cache directory, the API
+server and the security context are given to it in the environment
+(``DX_COMPLETION_CACHE_DIR``, ``DX_APISERVER_*`` and
+``DX_SECURITY_CONTEXT``).
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os, sys, json, time, hashlib, subprocess, functools
+
+import dxpy
+
+DEFAULT_TTL = 60
+MAX_AGE = 24 * 60 * 60
+MAX_ENTRIES = 500
+# Folders with more objects than this only have their subfolders cached
+MAX_CACHED_OBJECTS = 10000
+# Minimum number of seconds between two background refreshes of an entry
+REFRESH_INTERVAL = 30
+CACHE_DIRNAME = "completion_cache"
+
+# Environment variable giving the cache directory to the background refresh
+CACHE_DIR_ENV_VAR = "DX_COMPLETION_CACHE_DIR"
+
+_OBJECT_FIELDS = {"name": True, "class": True, "types": True, "hidden": True}
+
+
+def _get_ttl():
+    try:
+        return max(float(os.environ.get("DX_COMPLETION_CACHE_TTL", DEFAULT_TTL)), 0)
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def _get_context():
+    # Entries are only valid for the API server and user they were fetched with
+    context = json.dumps([getattr(dxpy, "APISERVER", None), dxpy.SECURITY_CONTEXT], sort_keys=True)
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+
+def fetch_folder_listing(project, folder):
+    '''
+    :returns: The names of the subfolders of the folder, and the name, class, types and visibility of the objects in it (None if there are more than MAX_CACHED_OBJECTS objects)
+    :rtype: dict
+    '''
+    resp = dxpy.api.project_list_folder(project, {"folder": folder,
+                                                  "describe": {"fields": _OBJECT_FIELDS},
+                                                  "only": "all",
+                                                  "includeHidden": True})
+    objects = [{field: obj["describe"].get(field) for field in _OBJECT_FIELDS} for obj in resp["objects"]]
+    return {"folders": [path[path.rfind('/') + 1:] for path in resp["folders"]],
+            "objects": objects if len(objects) <= MAX_CACHED_OBJECTS else None}
+
+
+def fetch_app_list():
+    '''
+    :returns: The name of each app the user can access, and whether it is installed
+    :rtype: list of dicts
+    '''
+    return [{"name": result["describe"]["name"], "installed": result["describe"]["installed"]}
+            for result in dxpy.find_apps(describe={"fields": {"name": True, "installed": True}})]
+
+
+class DXCompletionCache(object):
+    '''
+    :param path: Directory holding the cache files
+    :type path: string
+    :param ttl: Number of seconds after which entries are refreshed in the background
+    :type ttl: float
+
+    Stale-while-revalidate cache of folder listings and of the app list.
+    '''
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._context = _get_context()
+
+    def _get_filename(self, key):
+        return os.path.join(self.path, hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest() + ".json")
+
+    def _read(self, key):
+        try:
+            with open(self._get_filename(key)) as fd:
+                entry = json.load(fd)
+        except Exception:
+            return None
+        if entry.get("context") != self._context or entry.get("key") != key:
+            return None
+        return entry
+
+    def _write(self, key, entry):
+        filename = self._get_filename(key)
+        tmp_filename = "{}.{}".format(filename, os.getpid())
+        entry.update(context=self._context, key=key)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0o700)
+            with os.fdopen(os.open(tmp_filename, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), "w") as fd:
+                json.dump(entry, fd)
+            os.rename(tmp_filename, filename)
+            self._evict()
+        except (IOError, OSError):
+            # The cache is only an optimization
+            pass
+
+    def _evict(self):
+        filenames = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".json")]
+        if len(filenames) > MAX_ENTRIES:
+            filenames.sort(key=os.path.getmtime)
+            for filename in filenames[:len(filenames) - MAX_ENTRIES]:
+                os.remove(filename)
+
+    def _start_refresh(self, key, entry):
+        if entry.get("refreshing", 0) + REFRESH_INTERVAL > time.time():
+            return
+        entry["refreshing"] = time.time()
+        self._write(key, entry)
+        try:
+            env = dict(os.environ, **self._get_refresh_env())
+            with open(os.devnull, "r+") as devnull:
+                subprocess.Popen([sys.executable, "-m", __name__, "refresh"] + key,
+                                 stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+                                 start_new_session=True, env=env)
+        except Exception:
+            pass
+
+    def _get_refresh_env(self):
+        # Once the completing process exits, the refresh is reparented and
+        # can no longer find the session configuration directory (nor the
+        # session's API server and token) from its parent processes
+        return {CACHE_DIR_ENV_VAR: self.path,
+                "DX_COMPLETION_CACHE_TTL": str(self.ttl),
+                "DX_APISERVER_PROTOCOL": str(dxpy.APISERVER_PROTOCOL),
+                "DX_APISERVER_HOST": str(dxpy.APISERVER_HOST),
+                "DX_APISERVER_PORT": str(dxpy.APISERVER_PORT),
+                "DX_SECURITY_CONTEXT": json.dumps(dxpy.SECURITY_CONTEXT)}
+
+    def get(self, key, fetch, fetch_in_background=False):
+        '''
+        :param key: Identifies the entry, e.g. ["folder", project, folder] or ["apps"]
+        :type key: list of strings
+        :param fetch: Function returning the value of the entry
+        :type fetch: function
+        :param fetch_in_background: Whether a missing entry is fetched in the background instead
+        :type fetch_in_background: boolean
+        :returns: The value of the entry (None if it is being fetched in the background)
+
+        Returns the cached value if there is one that is less than a day
+        old (refreshing it in the background if it is older than the
+        time to live); otherwise calls *fetch* and caches its result.
+        '''
+        entry = self._read(key)
+        if entry is not None:
+            age = time.time() - entry["time"]
+            if age < MAX_AGE:
+                if age >= self.ttl:
+                    self._start_refresh(key, entry)
+                return entry["value"]
+        if fetch_in_background:
+            # The placeholder entry lets the refresh keep its result
+            self._start_refresh(key, entry or {"time": 0, "value": None})
+            return None
+        return self.refresh(key, fetch)
+
+    def refresh(self, key, fetch, only_if_cached=False):
+        '''
+        Calls *fetch* and caches its result. If *only_if_cached* is True,
+        the result is dropped if the entry was removed in the meantime
+        (i.e. the cache was invalidated while the value was fetched).
+        '''
+        value = fetch()
+        if not only_if_cached or os.path.exists(self._get_filename(key)):
+            self._write(key, {"time": time.time(), "value": value})
+        return value
+
+
+def get_completion_cache():
+    '''
+    :returns: The completion cache of the current session, or None if it
+              is disabled or there is no session configuration directory
+    :rtype: :class:`DXCompletionCache` or None
+    '''
+    ttl = _get_ttl()
+    if ttl == 0 or dxpy.JOB_ID is not None:
+        return None
+    session_dir = dxpy.config.get_session_conf_dir()
+    if not os.path.isdir(session_dir):
+        return None
+    return DXCompletionCache(os.path.join(session_dir, CACHE_DIRNAME), ttl=ttl)
+
+
+def get_folder_listing(project, folder):
+    '''
+    :returns: The cached contents of the folder (see :func:`fetch_folder_listing`), or None if the cache is disabled or the folder is not cached yet
+    :rtype: dict
+
+    Listing a large folder with descriptions is slower than the prefix
+    query completion otherwise makes, so folders that are not cached yet
+    are fetched in the background, for the next key press.
+    '''
+    cache = get_completion_cache()
+    if cache is None:
+        return None
+    return cache.get(["folder", project, folder], lambda: fetch_folder_listing(project, folder),
+                     fetch_in_background=True)
+
+
+def get_app_list():
+    '''
+    :returns: The cached list of apps (see :func:`fetch_app_list`), or None if the cache is disabled
+    :rtype: list of dicts
+    '''
+    cache = get_completion_cache()
+    if cache is None:
+        return None
+    return cache.get(["apps"], fetch_app_list)
+
+
+def invalidate_completion_cache():
+    '''
+    Removes all entries from the completion cache of the current session.
+    '''
+    try:
+        path = os.path.join(dxpy.config.get_session_conf_dir(), CACHE_DIRNAME)
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+    except Exception:
+        pass
+
+
+def invalidates_completion_cache(func):
+    '''
+    Decorator for the commands that change the contents of folders or the
+    installed apps. The completion cache is cleared once the command has
+    run, whether it succeeded or not, so that a refresh started while it
+    ran cannot cache the contents from before the change.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            invalidate_completion_cache()
+    return wrapper
+
+
+def main(argv):
+    '''
+    Runs the background refresh of an entry (see :meth:`DXCompletionCache._start_refresh`),
+    in the cache directory given in the environment.
+    '''
+    if len(argv) >= 1 and argv[0] == "refresh":
+        refresh_cache = None
+        if os.environ.get(CACHE_DIR_ENV_VAR) and _get_ttl() > 0:
+            refresh_cache = DXCompletionCache(os.environ[CACHE_DIR_ENV_VAR], ttl=_get_ttl())
+        refresh_key = argv[1:]
+        if refresh_cache is not None and refresh_key == ["apps"]:
+            refresh_cache.refresh(refresh_key, fetch_app_list, only_if_cached=True)
+        elif refresh_cache is not None and len(refresh_key) == 3 and refresh_key[0] == "folder":
+            refresh_cache.refresh(refresh_key, lambda: fetch_folder_listing(refresh_key[1], refresh_key[2]),
+                                  only_if_cached=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Local cache of parsed dataset descriptors.
+
+The descriptor of a Dataset record is a gzipped JSON file that can be tens
+of MB large, and ``dx extract_dataset``, ``dx extract_assay`` and ``dx
+create_cohort`` all need it. Files are immutable once closed, so parsed
+descriptors are kept, keyed by the ID of the descriptor file, in memory
+for the lifetime of the process and as pickles in the user configuration
+directory (see :meth:`~dxpy.utils.config.DXConfig.get_user_conf_dir`),
+which load much faster than downloading and parsing the JSON again.
+
+The total size of the cached descriptors, in MB, can be set with the
+environment variable ``DX_DESCRIPTOR_CACHE_SIZE`` (1024 by default);
+setting it to 0 disables the on-disk cache. The gene-to-bin indexes used by
+the gene filters of ``dx extract_assay`` are cached the same way (see
+:mod:`dxpy.dx_extract_utils.retrieve_bins`), in a directory of their own.
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os, gzip, json, pickle, collections
+
+import dxpy
+
+DEFAULT_MAX_SIZE_MB = 1024
+CACHE_DIRNAME = "dataset_descriptors"
+# Number of descriptors kept in memory
+MAX_MEMOIZED = 4
+
+_memoized = collections.OrderedDict()
+
+
+def _get_max_bytes():
+    try:
+        return max(float(os.environ.get("DX_DESCRIPTOR_CACHE_SIZE", DEFAULT_MAX_SIZE_MB)), 0) * 1024 * 1024
+    except ValueError:
+        return DEFAULT_MAX_SIZE_MB * 1024 * 1024
+
+
+def get_cache_dir(cache_dirname=CACHE_DIRNAME):
+    return os.path.join(dxpy.config.get_user_conf_dir(), cache_dirname)
+
+
+def parse_descriptor(content):
+    '''
+    :param content: Contents of a descriptor file
+    :type content: bytes
+    :returns: The parsed descriptor, with objects as OrderedDicts
+    :rtype: collections.OrderedDict
+    '''
+    return json.loads(gzip.decompress(content).decode("utf-8"), object_pairs_hook=collections.OrderedDict)
+
+
+class DXDescriptorCache(object):
+    '''
+    :param path: Directory holding the cached descriptors
+    :type path: string
+    :param max_bytes: Maximum total size of the cached descriptors; the least recently used ones are removed beyond it
+    :type max_bytes: int
+
+    On-disk cache of parsed descriptors, one pickle per descriptor file.
+    '''
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _get_filename(self, file_id):
+        return os.path.join(self.path, file_id + ".pickle")
+
+    def get(self, file_id):
+        '''
+        :returns: The cached descriptor, or None if it is not cached
+        '''
+        filename = self._get_filename(file_id)
+        try:
+            with open(filename, "rb") as fd:
+                entry = pickle.load(fd)
+            if entry.get("apiserver") != getattr(dxpy, "APISERVER", None):
+                return None
+            # The modification time is used to find the least recently used entries
+            os.utime(filename, None)
+            return entry["descriptor"]
+        except Exception:
+            return None
+
+    def put(self, file_id, descriptor):
+        filename = self._get_filename(file_id)
+        tmp_filename = "{}.{}".format(filename, os.getpid())
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0o700)
+            with os.fdopen(os.open(tmp_filename, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), "wb") as fd:
+                pickle.dump({"apiserver": getattr(dxpy, "APISERVER", None), "descriptor": descriptor}, fd,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_filename, filename)
+            self._evict()
+        except (IOError, OSError):
+            # The cache is only an optimization
+            pass
+
+    def _evict(self):
+        filenames = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".pickle")]
+        filenames.sort(key=os.path.getmtime, reverse=True)
+        total_bytes = 0
+        for filename in filenames:
+            total_bytes += os.path.getsize(filename)
+            # Always keep the most recent entry, even if it is larger than the limit
+            if total_bytes > self.max_bytes and filename != filenames[0]:
+                os.remove(filename)
+
+
+def get_descriptor_cache(cache_dirname=CACHE_DIRNAME):
+    '''
+    :param cache_dirname: Name of the directory of the cache in the user configuration directory
+    :type cache_dirname: string
+    :returns: The on-disk descriptor cache, or None if it is disabled
+    :rtype: :class:`DXDescriptorCache` or None
+    '''
+    max_bytes = _get_max_bytes()
+    if max_bytes == 0 or dxpy.JOB_ID is not None:
+        return None
+    return DXDescriptorCache(get_cache_dir(cache_dirname), max_bytes=max_bytes)
+
+
+def get_dataset_descriptor(file_id, project=None):
+    '''
+    :param file_id: ID of the (gzipped JSON) descriptor file
+    :type file_id: string
+    :param project: Project in which to look for the file
+    :type project: string
+    :returns: The parsed descriptor, with objects as OrderedDicts; it is shared with the other callers in the process, so it must not be modified
+    :rtype: collections.OrderedDict
+
+    Returns the descriptor from memory or from the on-disk cache if
+    possible, and otherwise downloads, parses and caches it.
+    '''
+    if file_id in _memoized:
+        _memoized.move_to_end(file_id)
+        return _memoized[file_id]
+
+    cache = get_descriptor_cache()
+    descriptor = cache.get(file_id) if cache is not None else None
+    if descriptor is None:
+        descriptor = parse_descriptor(dxpy.DXFile(file_id, mode="rb", project=project).read())
+        if cache is not None:
+            cache.put(file_id, descriptor)
+
+    _memoized[file_id] = descriptor
+    while len(_memoized) > MAX_MEMOIZED:
+        _memoized.popitem(last=False)
+    return descriptor
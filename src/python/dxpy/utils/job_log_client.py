@@ -17,38 +17,254 @@
 """
 Utilities for client-side usage of the streaming log API
 (https://documentation.dnanexus.com/developer/api/running-analyses/applets-and-entry-points#api-method-job-xxxx-getlog).
+
+For large job trees, :class:`DXJobLogStreamClient` can filter the messages
+on the client side (:class:`LogMessageFilter`), write them in batches
+(:class:`BufferedLogWriter`, optionally to size-bounded, compressed files
+with :class:`RotatingLogFile`) and describe the jobs it sees in bulk in a
+background thread. :func:`dump_execution_logs` downloads the logs of all the
+jobs of an execution tree concurrently, into one file per job.
 """
 
 from __future__ import print_function, unicode_literals, division, absolute_import
 
+import datetime
+import gzip
+import io
 import json
 import logging
 import os
+import queue
+import re
 import signal
 import ssl
 import sys
 import textwrap
 import time
 
-from threading import Thread
+from threading import Event, Lock, Thread
 from websocket import WebSocketApp
 
 import dxpy
+from . import get_futures_threadpool, wait_for_all_futures
 from .describe import get_find_executions_string
 from ..exceptions import err_exit
 
 logger = logging.getLogger('websocket')
 logger.setLevel(logging.WARN)
 
+# Number of buffered bytes and seconds after which BufferedLogWriter writes out its lines
+LOG_BUFFER_SIZE = 64 * 1024
+LOG_FLUSH_INTERVAL = 0.5
+# Seconds to wait for more new jobs before describing them in bulk
+DESCRIBE_BATCH_DELAY = 0.2
+DUMP_MAX_WORKERS = 8
+DUMP_MSG_FORMAT = "{timestamp} {level} {msg}"
+
 
 class DXJobLogStreamingException(Exception):
     pass
 
 
+class LogMessageFilter(object):
+    '''
+    :param levels: If given, only messages with one of these levels are kept
+    :type levels: list of strings
+    :param pattern: If given, only messages whose text matches this regular expression are kept
+    :type pattern: string
+    :param exclude_pattern: If given, messages whose text matches this regular expression are dropped
+    :type exclude_pattern: string
+    :raises: :exc:`re.error` if a regular expression is invalid
+
+    Client-side filter of job log messages, called with the message dict.
+    The regular expressions are compiled once, when the filter is created.
+    '''
+
+    def __init__(self, levels=None, pattern=None, exclude_pattern=None):
+        self.levels = frozenset(levels) if levels else None
+        self._search = re.compile(pattern).search if pattern else None
+        self._exclude_search = re.compile(exclude_pattern).search if exclude_pattern else None
+
+    def __call__(self, message):
+        if self.levels is not None and message.get('level') not in self.levels:
+            return False
+        msg = message.get('msg', '')
+        if self._search is not None and self._search(msg) is None:
+            return False
+        if self._exclude_search is not None and self._exclude_search(msg) is not None:
+            return False
+        return True
+
+
+class RotatingLogFile(object):
+    '''
+    :param path: Path of the first file; the files are gzip-compressed if it ends with ".gz"
+    :type path: string
+    :param max_bytes: If given, a new file is started once about this many (uncompressed) bytes were written to the current one
+    :type max_bytes: int
+
+    File-like object writing text to *path*, then to <name>.1<ext>,
+    <name>.2<ext>... (e.g. "job.log.gz", "job.1.log.gz") as the files
+    reach *max_bytes*. Writes are never split, so a file can exceed
+    *max_bytes* by the size of one write.
+    '''
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress = path.endswith('.gz')
+        self.paths = []
+        self._file = None
+        self._bytes = 0
+
+    def _get_path(self, index):
+        if index == 0:
+            return self.path
+        name, ext = (self.path[:-len('.gz')], '.gz') if self.compress else (self.path, '')
+        name, name_ext = os.path.splitext(name)
+        return "{}.{}{}{}".format(name, index, name_ext, ext)
+
+    def _open_next(self):
+        if self._file is not None:
+            self._file.close()
+        path = self._get_path(len(self.paths))
+        self.paths.append(path)
+        if self.compress:
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self._file = io.open(path, 'w', encoding='utf-8')
+        self._bytes = 0
+
+    def write(self, data):
+        if self._file is None or (self.max_bytes and self._bytes >= self.max_bytes):
+            self._open_next()
+        self._file.write(data)
+        self._bytes += len(data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            # Always leave a (possibly empty) file behind
+            self._open_next()
+        self._file.close()
+
+
+class BufferedLogWriter(object):
+    '''
+    :param stream: File-like object to which the lines are written, e.g. sys.stdout or a :class:`RotatingLogFile`
+    :param buffer_size: Number of buffered bytes after which the lines are written out
+    :type buffer_size: int
+    :param flush_interval: If given, buffered lines are also written out every this many seconds by a background thread
+    :type flush_interval: float
+    :param close_stream: Whether :meth:`close` also closes *stream*
+    :type close_stream: bool
+
+    Collects lines and writes them to *stream* in batches, with one write
+    and one flush per batch instead of one per line. Thread-safe.
+    '''
+
+    def __init__(self, stream, buffer_size=LOG_BUFFER_SIZE, flush_interval=LOG_FLUSH_INTERVAL, close_stream=False):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.close_stream = close_stream
+        self._lines = []
+        self._size = 0
+        self._lock = Lock()
+        self._closed = Event()
+        if flush_interval:
+            flusher = Thread(target=self._flush_periodically, args=(flush_interval,))
+            flusher.daemon = True
+            flusher.start()
+
+    def _flush_periodically(self, interval):
+        while not self._closed.wait(interval):
+            self.flush()
+
+    def _write_lines(self):
+        if self._lines:
+            self._lines.append('')
+            self.stream.write('\n'.join(self._lines))
+            self.stream.flush()
+            self._lines, self._size = [], 0
+
+    def write_line(self, line):
+        with self._lock:
+            self._lines.append(line)
+            self._size += len(line) + 1
+            if self._size >= self.buffer_size:
+                self._write_lines()
+
+    def flush(self):
+        with self._lock:
+            self._write_lines()
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+
+
+class _BulkJobDescriber(object):
+    '''
+    Describes the jobs passed to :meth:`request` in a background thread,
+    with one /system/describeExecutions call for all the jobs requested
+    within DESCRIBE_BATCH_DELAY seconds of each other. The (job ID,
+    description) pairs are put in the :attr:`results` queue; the
+    description is None if the jobs could not be described.
+    '''
+
+    def __init__(self, delay=DESCRIBE_BATCH_DELAY):
+        self.delay = delay
+        self.results = queue.Queue()
+        self._requests = queue.Queue()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request(self, job_id):
+        self._requests.put(job_id)
+
+    def _run(self):
+        done = False
+        while not done:
+            job_id = self._requests.get()
+            if job_id is None:
+                return
+            time.sleep(self.delay)
+            batch = [job_id]
+            while True:
+                try:
+                    job_id = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if job_id is None:
+                    done = True
+                    break
+                batch.append(job_id)
+            try:
+                descriptions = dxpy.describe_executions(batch)
+            except Exception:
+                descriptions = [None] * len(batch)
+            for job_id, desc in zip(batch, descriptions):
+                self.results.put((job_id, desc))
+
+    def close(self):
+        '''
+        Waits for the pending requests to be described and stops the thread.
+        '''
+        self._requests.put(None)
+        self._thread.join()
+
+
 class DXJobLogStreamClient:
     def __init__(
         self, job_id, job_try=None, input_params=None, msg_output_format="{job} {level} {msg}",
-        msg_callback=None, print_job_info=True, exit_on_failed=True
+        msg_callback=None, print_job_info=True, exit_on_failed=True, message_filter=None,
+        output=None, async_describe=False
     ):
         """Initialize job log client.
 
@@ -76,6 +292,16 @@ class DXJobLogStreamClient:
         :param exit_on_failed: if True, will raise SystemExit with code of 3 if encountering a
         failed job (this is the default behavior)
         :type exit_on_failed: bool
+        :param message_filter: single argument function that accepts the message JSON blob and
+        returns whether it should be passed on, e.g. a :class:`LogMessageFilter`
+        :type message_filter: callable
+        :param output: if given, messages formatted with ``msg_output_format`` and job info are
+        written to it instead of being printed
+        :type output: :class:`BufferedLogWriter`
+        :param async_describe: if True, jobs seen for the first time are described in bulk in a
+        background thread instead of one at a time before their first message is handled, so job
+        info may be printed after the first messages of the job (ignored if ``job_try`` is given)
+        :type async_describe: bool
         """
         # TODO: add unit tests; note it is a public class
 
@@ -92,6 +318,11 @@ class DXJobLogStreamClient:
         self.closed_code = None
         self.closed_reason = None
         self.exit_on_failed = exit_on_failed
+        self.message_filter = message_filter
+        self.output = output
+        self.async_describe = async_describe and not self.job_has_try
+        self._describer = None
+        self._requested_jobs = {}
         self.url = "{protocol}://{host}:{port}/{job_id}/getLog/websocket".format(
             protocol='wss' if dxpy.APISERVER_PROTOCOL == 'https' else 'ws',
             host=dxpy.APISERVER_HOST,
@@ -179,21 +410,33 @@ class DXJobLogStreamClient:
                     )
                 )
         elif self.print_job_info:
+            if self._describer is not None:
+                self._describer.close()
+                self._add_described_jobs()
+                self._describer = None
             if self.job_id not in self.seen_jobs:
                 self.seen_jobs[self.job_id] = {}
-            for job_id in self.seen_jobs.keys():
-                self.seen_jobs[job_id] = self._describe_job(job_id)
-                print(
+            # Including the jobs that could not be described in the background
+            job_ids = list(self.seen_jobs.keys()) + [job_id for job_id in self._requested_jobs
+                                                     if job_id not in self.seen_jobs]
+            for job_id, desc in zip(job_ids, self._describe_jobs(job_ids)):
+                if desc is None:
+                    continue
+                self.seen_jobs[job_id] = desc
+                self._write(
                     get_find_executions_string(
-                        self.seen_jobs[job_id],
+                        desc,
                         has_children=False,
                         show_outputs=True,
                         show_try=self.job_has_try
                     )
                 )
-        else:
+        elif self.exit_on_failed:
             self.seen_jobs[self.job_id] = self._describe_job(self.job_id)
 
+        if self.output is not None:
+            self.output.flush()
+
         if (self.exit_on_failed
                 and self.seen_jobs[self.job_id].get('state') in {'failed', 'terminated'}):
             err_exit(code=3)
@@ -201,34 +444,80 @@ class DXJobLogStreamClient:
     def received_message(self, message):
         message_dict = json.loads(message)
 
+        if self._describer is not None:
+            self._add_described_jobs()
+
         if (
             self.print_job_info and
             'job' in message_dict and
             message_dict['job'] not in self.seen_jobs
         ):
-            self.seen_jobs[message_dict['job']] = self._describe_job(message_dict['job'])
-            print(
-                get_find_executions_string(
-                    self.seen_jobs[message_dict['job']],
-                    has_children=False,
-                    show_outputs=False,
-                    show_try=self.job_has_try
+            if self.async_describe:
+                if message_dict['job'] not in self._requested_jobs:
+                    self._requested_jobs[message_dict['job']] = True
+                    if self._describer is None:
+                        self._describer = _BulkJobDescriber()
+                    self._describer.request(message_dict['job'])
+            else:
+                self.seen_jobs[message_dict['job']] = self._describe_job(message_dict['job'])
+                self._write(
+                    get_find_executions_string(
+                        self.seen_jobs[message_dict['job']],
+                        has_children=False,
+                        show_outputs=False,
+                        show_try=self.job_has_try
+                    )
                 )
-            )
 
         if (
             message_dict.get('source') == 'SYSTEM' and
             message_dict.get('msg') == 'END_LOG'
         ):
             self._app.keep_running = False
+        elif self.message_filter is not None and not self.message_filter(message_dict):
+            pass
         elif self.msg_callback:
             self.msg_callback(message_dict)
         else:
-            print(self.msg_output_format.format(**message_dict))
+            self._write(self.msg_output_format.format(**message_dict))
+
+    def _add_described_jobs(self):
+        # Job info is printed from the thread handling the messages only
+        while True:
+            try:
+                job_id, desc = self._describer.results.get_nowait()
+            except queue.Empty:
+                return
+            if desc is not None:
+                self.seen_jobs[job_id] = desc
+                self._write(get_find_executions_string(desc, has_children=False, show_outputs=False))
+
+    def _write(self, line):
+        if self.output is not None:
+            self.output.write_line(line)
+        else:
+            print(line)
 
     def _describe_job(self, job_id):
         return dxpy.api.job_describe(job_id, {'try': self.job_try} if self.job_has_try else {})
 
+    def _describe_jobs(self, job_ids):
+        # The description is None for the jobs that could not be described
+        if not self.job_has_try:
+            try:
+                return dxpy.describe_executions(job_ids)
+            except Exception:
+                # A single job that cannot be described fails the whole
+                # request, so the jobs are then described one at a time
+                pass
+        descriptions = []
+        for job_id in job_ids:
+            try:
+                descriptions.append(self._describe_job(job_id))
+            except Exception:
+                descriptions.append(None)
+        return descriptions
+
 
 class CursesDXJobLogStreamClient(DXJobLogStreamClient):
 
@@ -238,6 +527,98 @@ class CursesDXJobLogStreamClient(DXJobLogStreamClient):
         os.kill(os.getpid(), signal.SIGINT)
 
 
+def get_execution_tree_job_ids(execution_id):
+    '''
+    :param execution_id: ID of a job or an analysis
+    :type execution_id: string
+    :returns: The IDs of the jobs in the execution tree of *execution_id*, i.e. the execution itself if it is a job and all the jobs it launched, directly or indirectly
+    :rtype: list of strings
+    '''
+    describe_method = dxpy.api.job_describe if execution_id.startswith('job-') else dxpy.api.analysis_describe
+    root_execution = describe_method(execution_id, {"fields": {"rootExecution": True}})["rootExecution"]
+    parent_fields = {"parentJob": True, "parentAnalysis": True}
+    parents = {}
+    for result in dxpy.find_executions(root_execution=root_execution, describe={"fields": parent_fields}):
+        parents[result["id"]] = result["describe"].get("parentJob") or result["describe"].get("parentAnalysis")
+
+    def in_tree(other_id):
+        while other_id is not None:
+            if other_id == execution_id:
+                return True
+            other_id = parents.get(other_id)
+        return False
+
+    job_ids = [other_id for other_id in parents if other_id.startswith('job-') and in_tree(other_id)]
+    if execution_id.startswith('job-') and execution_id not in job_ids:
+        job_ids.insert(0, execution_id)
+    return job_ids
+
+
+def dump_execution_logs(execution_id, output_dir, input_params=None, message_filter=None,
+                        msg_output_format=DUMP_MSG_FORMAT, compress=False, max_workers=DUMP_MAX_WORKERS):
+    '''
+    :param execution_id: ID of a job or an analysis
+    :type execution_id: string
+    :param output_dir: Directory in which to write the logs (created if needed)
+    :type output_dir: string
+    :param input_params: Additional connection parameters, e.g. ``levels``
+    :type input_params: dict
+    :param message_filter: If given, only the messages for which it returns True are written
+    :type message_filter: callable
+    :param msg_output_format: Format of the lines; available fields are timestamp (as a date), job, level and msg
+    :type msg_output_format: string
+    :param compress: Whether to gzip the files
+    :type compress: bool
+    :param max_workers: Maximum number of jobs whose logs are downloaded concurrently
+    :type max_workers: int
+    :returns: The path of the log file of each job, and the exception raised for each job whose logs could not be downloaded
+    :rtype: tuple of two dicts, keyed by job ID
+
+    Writes the full logs of every job in the execution tree to
+    <output_dir>/<job ID>.log (or .log.gz), streaming the logs of up to
+    *max_workers* jobs at a time. Waits for running jobs to finish.
+    '''
+    job_ids = get_execution_tree_job_ids(execution_id)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    params = {"numRecentMessages": 1024 * 256, "tail": True}
+    params.update(input_params or {})
+    params["recurseJobs"] = False
+
+    def dump_job_logs(job_id):
+        path = os.path.join(output_dir, job_id + (".log.gz" if compress else ".log"))
+        writer = BufferedLogWriter(RotatingLogFile(path), flush_interval=None, close_stream=True)
+
+        def write_message(message):
+            message['timestamp'] = str(datetime.datetime.fromtimestamp(message.get('timestamp', 0) // 1000))
+            writer.write_line(msg_output_format.format(**message))
+
+        try:
+            client = DXJobLogStreamClient(job_id, input_params=params, msg_callback=write_message,
+                                          print_job_info=False, exit_on_failed=False, message_filter=message_filter)
+            client.connect()
+            if client.closed_code != 1000:
+                raise DXJobLogStreamingException("Error while streaming job logs: {code}: {reason}".format(
+                    code=client.closed_code, reason=client.closed_reason))
+        finally:
+            writer.close()
+        return path
+
+    paths, failures = {}, {}
+    if not job_ids:
+        return paths, failures
+    pool = get_futures_threadpool(max_workers=min(max_workers, len(job_ids)))
+    futures = {job_id: pool.submit(dump_job_logs, job_id) for job_id in job_ids}
+    wait_for_all_futures(futures.values())
+    pool.shutdown()
+    for job_id, future in futures.items():
+        if future.exception() is not None:
+            failures[job_id] = future.exception()
+        else:
+            paths[job_id] = future.result()
+    return paths, failures
+
+
 def metrics_top(args, input_params, enrich_msg):
     try:
         import curses
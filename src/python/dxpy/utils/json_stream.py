@@ -0,0 +1,184 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Incremental parsing of large JSON responses.
+
+:class:`JSONArrayStream` reads a JSON object such as ``{"results": [...]}``
+chunk by chunk (e.g. from an HTTP response body) and yields the items of
+one of its array members as soon as they are decoded, so that results can
+be processed and written out while they are received, in constant memory.
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import codecs, json, re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JSONArrayStream(object):
+    '''
+    :param chunks: Chunks (bytes, UTF-8 encoded, or strings) forming a JSON object
+    :type chunks: iterable
+    :param key: Name of the member of the object whose items are yielded; it must be an array
+    :type key: string
+    :param on_close: Function called once the chunks are no longer needed (e.g. to release an HTTP connection)
+    :type on_close: function
+
+    Iterating over the stream yields the items of the array *key* of the
+    object one at a time. The other members of the object are decoded
+    whole and stored in :attr:`members` as they are reached; call
+    :meth:`start` to read the members that precede the array (e.g. an
+    "error" member) before iterating. :attr:`found` tells whether the
+    object had the member *key*.
+
+    Example::
+
+        stream = JSONArrayStream(response.stream(), key="results")
+        for row in stream:
+            writer.writerow(row)
+    '''
+
+    def __init__(self, chunks, key="results", on_close=None):
+        self.key = key
+        self.members = {}
+        self.found = False
+        self._chunks = iter(chunks)
+        self._utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._exhausted = False
+        self._on_close = on_close
+        self._started = False
+        self._in_array = False
+        self._done = False
+
+    def _fill(self, min_chars=1):
+        # Appends at least min_chars characters to the buffer, unless the
+        # chunks run out first; returns whether anything was appended
+        if self._exhausted:
+            return False
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        added = 0
+        while added < min_chars:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                chunk = None
+            if chunk is None:
+                text = self._utf8_decoder.decode(b"", final=True)
+                self._exhausted = True
+            elif isinstance(chunk, bytes):
+                text = self._utf8_decoder.decode(chunk)
+            else:
+                text = chunk
+            self._buffer += text
+            added += len(text)
+            if self._exhausted:
+                break
+        if self._exhausted:
+            self.close()
+        return added > 0
+
+    def _peek(self):
+        # Returns the next non-whitespace character without consuming it (None at the end)
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char is None or char not in chars:
+            raise ValueError("Invalid JSON: expected {} at {!r}".format(
+                " or ".join(repr(c) for c in chars), self._buffer[self._pos:self._pos + 20]))
+        self._pos += 1
+        return char
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+                # A value that ends with the buffer may be truncated (e.g. a number)
+                if end < len(self._buffer) or self._exhausted:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._exhausted:
+                    raise
+            # Read at least as much again as is buffered, so that large
+            # values are not parsed again for every chunk
+            self._fill(min_chars=max(len(self._buffer) - self._pos, 1))
+
+    def start(self):
+        '''
+        Reads the members of the object up to the beginning of the array
+        (or to the end of the object if there is no array *key*).
+        '''
+        if self._started:
+            return
+        self._started = True
+        self._expect("{")
+        while True:
+            char = self._peek()
+            if char == "}":
+                self._pos += 1
+                self._done = True
+                self.close()
+                return
+            if self.members:
+                self._expect(",")
+            name = self._decode_value()
+            self._expect(":")
+            if name == self.key and self._peek() == "[":
+                self._pos += 1
+                self.found = True
+                self._in_array = True
+                return
+            self.members[name] = self._decode_value()
+
+    def __iter__(self):
+        self.start()
+        first = True
+        while self._in_array:
+            if self._peek() == "]":
+                self._pos += 1
+                self._in_array = False
+                break
+            if not first:
+                self._expect(",")
+            first = False
+            yield self._decode_value()
+        # Members after the array
+        while not self._done:
+            if self._expect(",}") == "}":
+                self._done = True
+                break
+            name = self._decode_value()
+            self._expect(":")
+            self.members[name] = self._decode_value()
+        self.close()
+
+    def close(self):
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
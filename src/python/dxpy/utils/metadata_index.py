@@ -0,0 +1,467 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Local SQLite index of the metadata of the data objects in a project.
+
+The index is opt-in (see the ``--cached`` flag of ``dx ls``, ``dx tree``
+and ``dx find data``). It is populated with a single paginated
+findDataObjects query and then refreshed incrementally using the
+"modified" timestamps of the objects, so that interactive listings of
+large projects can be answered locally. Objects that were removed from
+the project or moved to another folder keep their timestamp, so each
+incremental sync also lists the IDs and folders of all the objects in
+the project and reconciles the index with them.
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os, re, json, time, sqlite3
+
+import dxpy
+from .resolver import clean_folder_path, ResolutionError
+from ..exceptions import DXError
+
+# Changes that do not update the "modified" timestamp of an object (other
+# than removals and moves) are only picked up by a full sync, which is
+# performed when the last one is older than this.
+FULL_SYNC_INTERVAL = 24 * 60 * 60 * 1000
+
+INDEX_DESCRIBE_FIELDS = {
+    'id': True,
+    'class': True,
+    'name': True,
+    'folder': True,
+    'size': True,
+    'length': True,
+    'state': True,
+    'hidden': True,
+    'created': True,
+    'modified': True,
+    'types': True,
+    'tags': True,
+    'properties': True
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS objects (
+    id TEXT PRIMARY KEY,
+    class TEXT,
+    name TEXT,
+    folder TEXT,
+    size INTEGER,
+    length INTEGER,
+    state TEXT,
+    hidden INTEGER,
+    created INTEGER,
+    modified INTEGER,
+    types TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_folder ON objects (folder, name);
+CREATE INDEX IF NOT EXISTS objects_name ON objects (name);
+CREATE TABLE IF NOT EXISTS tags (id TEXT, tag TEXT);
+CREATE INDEX IF NOT EXISTS tags_id ON tags (id);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE TABLE IF NOT EXISTS properties (id TEXT, key TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS properties_id ON properties (id);
+CREATE INDEX IF NOT EXISTS properties_key ON properties (key, value);
+'''
+
+_OBJECT_COLUMNS = ('id', 'class', 'name', 'folder', 'size', 'length', 'state', 'hidden', 'created', 'modified', 'types')
+
+
+def get_index_dir():
+    return os.path.join(dxpy.config.get_user_conf_dir(), "metadata_index")
+
+
+def get_index_path(project):
+    return os.path.join(get_index_dir(), project + ".sqlite")
+
+
+def _regexp(pattern, value):
+    return value is not None and re.search(pattern, value) is not None
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+class DXMetadataIndex(object):
+    '''
+    :param project: ID of the project to index
+    :type project: string
+    :param path: Location of the SQLite database; defaults to a file
+        named after the project in ~/.dnanexus_config/metadata_index
+    :type path: string
+
+    Local index of folders and data objects (with their names, classes,
+    sizes, tags and properties) of a single project. Call :meth:`sync`
+    to populate or refresh it, and :meth:`list_folder` or :meth:`find`
+    to query it. Query results have the same shape as the results of
+    :meth:`dxpy.DXProject.list_folder` and
+    :func:`dxpy.bindings.search.find_data_objects`, with the describe
+    fields in :data:`INDEX_DESCRIBE_FIELDS`.
+    '''
+
+    def __init__(self, project, path=None):
+        self.project = project
+        self.path = path or get_index_path(project)
+        if self.path != ':memory:' and not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path), 0o700)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.create_function("REGEXP", 2, _regexp)
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def last_synced(self):
+        '''
+        Client timestamp (in milliseconds) of the last successful sync, or
+        None if the index has never been populated.
+        '''
+        return self._get_meta('last_synced')
+
+    @property
+    def project_name(self):
+        return self._get_meta('project_name')
+
+    def get_staleness(self):
+        '''
+        :returns: Number of seconds since the last sync, or None if the index has never been populated
+        :rtype: float
+        '''
+        last_synced = self.last_synced
+        if last_synced is None:
+            return None
+        return max(0, _now() - last_synced) / 1000.0
+
+    def sync(self, full=None):
+        '''
+        :param full: If True, rebuild the index from scratch; if False,
+            only fetch objects modified since the last sync; if None,
+            rebuild only if the index is empty or the last full sync is
+            older than :data:`FULL_SYNC_INTERVAL`
+        :type full: boolean
+        :returns: Number of object records fetched from the platform
+        :rtype: int
+
+        Brings the index up to date with the project.
+        '''
+        sync_started = _now()
+        max_modified = self._get_meta('max_modified')
+        last_full_sync = self._get_meta('last_full_sync')
+        if full is None:
+            full = max_modified is None or last_full_sync is None or \
+                sync_started - last_full_sync > FULL_SYNC_INTERVAL
+
+        project_desc = dxpy.api.project_describe(self.project, {"fields": {"name": True, "folders": True}})
+
+        # Objects with the same "modified" timestamp as the newest indexed
+        # object may not have been returned yet; records are upserted, so
+        # fetching them again is harmless.
+        results = dxpy.find_data_objects(project=self.project,
+                                         visibility='either',
+                                         modified_after=(None if full else max_modified),
+                                         describe={"fields": INDEX_DESCRIBE_FIELDS})
+        num_fetched = 0
+        with self._conn:
+            if full:
+                for table in ('objects', 'tags', 'properties'):
+                    self._conn.execute("DELETE FROM " + table)
+            self._conn.execute("DELETE FROM folders")
+            self._conn.executemany("INSERT INTO folders (path) VALUES (?)",
+                                   ((folder,) for folder in project_desc['folders']))
+            for result in results:
+                self.add(result['describe'])
+                num_fetched += 1
+                max_modified = max(max_modified or 0, result['describe'].get('modified', 0))
+            if not full:
+                self._reconcile()
+            self._set_meta('project', self.project)
+            self._set_meta('project_name', project_desc['name'])
+            self._set_meta('max_modified', max_modified)
+            self._set_meta('last_synced', sync_started)
+            if full:
+                self._set_meta('last_full_sync', sync_started)
+        return num_fetched
+
+    def add(self, desc):
+        '''
+        :param desc: Describe hash of a data object, containing at least the "id" field
+        :type desc: dict
+
+        Inserts or replaces the record of a single data object. The caller
+        is responsible for committing the transaction.
+        '''
+        obj_id = desc['id']
+        self._conn.execute("INSERT OR REPLACE INTO objects (" + ", ".join(_OBJECT_COLUMNS) + ") VALUES (" +
+                           ", ".join("?" * len(_OBJECT_COLUMNS)) + ")",
+                           (obj_id, desc.get('class'), desc.get('name'), desc.get('folder'), desc.get('size'),
+                            desc.get('length'), desc.get('state'), int(bool(desc.get('hidden'))), desc.get('created'),
+                            desc.get('modified'), json.dumps(desc.get('types', []))))
+        self._conn.execute("DELETE FROM tags WHERE id = ?", (obj_id,))
+        self._conn.executemany("INSERT INTO tags (id, tag) VALUES (?, ?)",
+                               ((obj_id, tag) for tag in desc.get('tags', [])))
+        self._conn.execute("DELETE FROM properties WHERE id = ?", (obj_id,))
+        self._conn.executemany("INSERT INTO properties (id, key, value) VALUES (?, ?, ?)",
+                               ((obj_id, key, value) for key, value in desc.get('properties', {}).items()))
+
+    def remove(self, object_ids):
+        '''
+        :param object_ids: IDs of data objects that no longer exist in the project
+        :type object_ids: list of strings
+
+        Drops the records of the given objects from the index. The caller
+        is responsible for committing the transaction.
+        '''
+        for table in ('objects', 'tags', 'properties'):
+            self._conn.executemany("DELETE FROM " + table + " WHERE id = ?", ((obj_id,) for obj_id in object_ids))
+
+    def _reconcile(self):
+        '''
+        Lists the IDs and folders of all the objects in the project, drops
+        the records of objects that are no longer there and updates the
+        folder of objects that were moved. The listing is kept in a
+        temporary table rather than in memory.
+        '''
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS current_objects (id TEXT PRIMARY KEY, folder TEXT)")
+        self._conn.execute("DELETE FROM current_objects")
+        results = dxpy.find_data_objects(project=self.project,
+                                         visibility='either',
+                                         describe={"fields": {"id": True, "folder": True}})
+        self._conn.executemany("INSERT OR REPLACE INTO current_objects (id, folder) VALUES (?, ?)",
+                               ((result['id'], result['describe']['folder']) for result in results))
+        self.remove([obj_id for (obj_id,) in
+                     self._conn.execute("SELECT id FROM objects WHERE id NOT IN (SELECT id FROM current_objects)")
+                     .fetchall()])
+        self._conn.execute("UPDATE objects SET folder = (SELECT folder FROM current_objects WHERE id = objects.id) "
+                           "WHERE EXISTS (SELECT 1 FROM current_objects "
+                           "WHERE id = objects.id AND folder != objects.folder)")
+        self._conn.execute("DELETE FROM current_objects")
+
+    def _describe_rows(self, rows):
+        rows = list(rows)
+        ids = [row[0] for row in rows]
+        tags, properties = {}, {}
+        # SQLite limits the number of host parameters in a single statement
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ", ".join("?" * len(batch))
+            for obj_id, tag in self._conn.execute("SELECT id, tag FROM tags WHERE id IN (" + placeholders + ")", batch):
+                tags.setdefault(obj_id, []).append(tag)
+            for obj_id, key, value in self._conn.execute("SELECT id, key, value FROM properties WHERE id IN (" +
+                                                         placeholders + ")", batch):
+                properties.setdefault(obj_id, {})[key] = value
+        for row in rows:
+            desc = {column: value for column, value in zip(_OBJECT_COLUMNS, row) if value is not None}
+            desc['hidden'] = bool(desc.get('hidden'))
+            desc['types'] = json.loads(desc.get('types', '[]'))
+            desc['tags'] = tags.get(desc['id'], [])
+            desc['properties'] = properties.get(desc['id'], {})
+            desc['project'] = self.project
+            yield {"project": self.project, "id": desc['id'], "describe": desc}
+
+    def list_folder(self, folder="/", only="all", include_hidden=False):
+        '''
+        :param folder: Full path to the folder to list
+        :type folder: string
+        :param only: Indicates whether to return "objects", "folders", or "all"
+        :type only: string
+        :param include_hidden: Whether to include hidden objects
+        :type include_hidden: boolean
+        :returns: Dictionary with keys "folders" and "objects", as returned by /project-xxxx/listFolder
+        :rtype: dict
+        :raises: :class:`~dxpy.exceptions.DXError` if the folder is not in the index
+        '''
+        if not self.folder_exists(folder):
+            raise DXError('Folder ' + folder + ' was not found in the metadata index of ' + self.project)
+        resp = {"folders": [], "objects": []}
+        if only in ("folders", "all"):
+            prefix = folder.rstrip('/') + '/'
+            resp["folders"] = [path for (path,) in
+                               self._conn.execute("SELECT path FROM folders WHERE path LIKE ? ESCAPE '\\' ORDER BY path",
+                                                  (_escape_like(prefix) + '_%',))
+                               if '/' not in path[len(prefix):]]
+        if only in ("objects", "all"):
+            query = "SELECT " + ", ".join(_OBJECT_COLUMNS) + " FROM objects WHERE folder = ?"
+            if not include_hidden:
+                query += " AND hidden = 0"
+            resp["objects"] = list(self._describe_rows(self._conn.execute(query, (folder,))))
+        return resp
+
+    def folder_exists(self, folder):
+        return self._conn.execute("SELECT 1 FROM folders WHERE path = ?", (folder,)).fetchone() is not None
+
+    def resolve_existing_path(self, folderpath, entity_name):
+        '''
+        :param folderpath: Folder path, or None if *entity_name* is an object ID
+        :type folderpath: string
+        :param entity_name: Object name (possibly a glob pattern), object ID, or None
+        :type entity_name: string
+        :returns: A tuple of the folder path and the list of matching objects,
+            exactly one of which is None
+        :rtype: tuple
+        :raises: :exc:`~dxpy.utils.resolver.ResolutionError` if nothing in the index matches
+
+        Resolves the output of :func:`~dxpy.utils.resolver.resolve_path`
+        against the index, preferring data objects over folders in the same
+        way as :func:`~dxpy.utils.resolver.resolve_existing_path`.
+        '''
+        query = "SELECT " + ", ".join(_OBJECT_COLUMNS) + " FROM objects"
+        if folderpath is None:
+            results = list(self._describe_rows(self._conn.execute(query + " WHERE id = ?", (entity_name,))))
+            if len(results) == 0:
+                raise ResolutionError('Object ' + entity_name + ' was not found in the metadata index of ' +
+                                      self.project)
+            return None, results
+        if entity_name is None:
+            if not self.folder_exists(folderpath):
+                raise ResolutionError('Folder ' + folderpath + ' was not found in the metadata index of ' +
+                                      self.project)
+            return folderpath, None
+        results = list(self._describe_rows(self._conn.execute(query + " WHERE folder = ? AND name GLOB ? ORDER BY name",
+                                                              (folderpath, entity_name))))
+        if len(results) > 0:
+            return None, results
+        folder, _skip = clean_folder_path(folderpath + '/' + entity_name, 'folder')
+        if '/' in entity_name or not self.folder_exists(folder):
+            raise ResolutionError('Unable to resolve "' + entity_name + '" to a data object or folder name in \'' +
+                                  folderpath + "' of the metadata index of " + self.project)
+        return folder, None
+
+    def get_folders(self):
+        '''
+        :returns: All folder paths in the project, sorted
+        :rtype: list of strings
+        '''
+        return [path for (path,) in self._conn.execute("SELECT path FROM folders ORDER BY path")]
+
+    def find(self, classname=None, state=None, visibility='visible', name=None, name_mode='exact',
+             properties=None, typename=None, tags=None, folder=None, recurse=True,
+             modified_after=None, modified_before=None, created_after=None, created_before=None):
+        '''
+        :returns: Results in the same format as :func:`dxpy.bindings.search.find_data_objects`
+        :rtype: generator
+
+        Searches the index. The arguments have the same meaning as the
+        ones of :func:`dxpy.bindings.search.find_data_objects`, except that
+        *typename* may only be a single type name.
+        '''
+        clauses, params = [], []
+        if classname is not None:
+            clauses.append("class = ?")
+            params.append(classname)
+        if state is not None and state != 'any':
+            clauses.append("state = ?")
+            params.append(state)
+        if visibility in (None, 'visible'):
+            clauses.append("hidden = 0")
+        elif visibility == 'hidden':
+            clauses.append("hidden = 1")
+        if name is not None:
+            if name_mode == 'exact':
+                clauses.append("name = ?")
+            elif name_mode == 'glob':
+                clauses.append("name GLOB ?")
+            elif name_mode == 'regexp':
+                clauses.append("name REGEXP ?")
+            else:
+                raise DXError('find: Unexpected value found for argument name_mode')
+            params.append(name)
+        if folder is not None:
+            if recurse:
+                clauses.append("(folder = ? OR folder LIKE ? ESCAPE '\\')")
+                params.extend([folder, _escape_like(folder.rstrip('/') + '/') + '%'])
+            else:
+                clauses.append("folder = ?")
+                params.append(folder)
+        for key, value in (properties or {}).items():
+            if value is True:
+                clauses.append("id IN (SELECT id FROM properties WHERE key = ?)")
+                params.append(key)
+            else:
+                clauses.append("id IN (SELECT id FROM properties WHERE key = ? AND value = ?)")
+                params.extend([key, value])
+        for tag in (tags or []):
+            clauses.append("id IN (SELECT id FROM tags WHERE tag = ?)")
+            params.append(tag)
+        for column, after, before in (('modified', modified_after, modified_before),
+                                      ('created', created_after, created_before)):
+            if after is not None:
+                clauses.append(column + " >= ?")
+                params.append(dxpy.utils.normalize_time_input(after))
+            if before is not None:
+                clauses.append(column + " <= ?")
+                params.append(dxpy.utils.normalize_time_input(before))
+        query = "SELECT " + ", ".join(_OBJECT_COLUMNS) + " FROM objects"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY folder, name"
+        for result in self._describe_rows(self._conn.execute(query, params)):
+            if typename is not None and typename not in result['describe']['types']:
+                continue
+            yield result
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def format_staleness(seconds):
+    '''
+    Returns a short human-readable description of the age of an index.
+    '''
+    if seconds is None:
+        return "never synced"
+    for unit, length in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return "last synced {n} {unit}{s} ago".format(n=count, unit=unit, s='' if count == 1 else 's')
+    return "last synced {n} seconds ago".format(n=int(seconds))
+
+
+def open_metadata_index(project, refresh=False):
+    '''
+    :param project: ID of the project
+    :type project: string
+    :param refresh: If True, bring the index up to date before returning it
+    :type refresh: boolean
+    :rtype: :class:`DXMetadataIndex`
+
+    Opens the local metadata index of *project*, populating it first if it
+    has never been synced.
+    '''
+    index = DXMetadataIndex(project)
+    if refresh or index.last_synced is None:
+        index.sync()
+    return index
@@ -118,6 +118,40 @@ def format_tree(tree, root=None):
     _format(tree)
     return '\n'.join(formatted_tree)
 
+def iter_format_tree(tree, root=None):
+    ''' Lazy tree pretty printer, producing the same output as format_tree one line at a time.
+    Expects trees to be given as lists of (node, children) pairs, where children is None for leaves and
+    otherwise a function returning the list of pairs of the children of the node. The function is only
+    called when the node is printed, so large trees can be printed while they are being traversed.
+
+    Example:
+
+        for line in iter_format_tree([('foo', None), ('bar', lambda: [('xyz', None)])]):
+            print(line)
+
+    '''
+    if root is not None:
+        yield root
+    def _format(nodes, prefix='    '):
+        for i, (node, children) in enumerate(nodes):
+            if i == len(nodes)-1 and len(prefix) > 1:
+                my_prefix = prefix[:-4] + '└── '
+                my_multiline_prefix = prefix[:-4] + '    '
+            else:
+                my_prefix = prefix[:-4] + '├── '
+                my_multiline_prefix = prefix[:-4] + '│   '
+            for n, line in enumerate(node.splitlines()):
+                yield (my_prefix if n == 0 else my_multiline_prefix) + line
+
+            if children is not None:
+                subprefix = prefix
+                if i < len(nodes)-1 and len(prefix) > 1 and prefix[-4:] == '    ':
+                    subprefix = prefix[:-4] + '│   '
+                for line in _format(children(), subprefix + '    '):
+                    yield line
+    for line in _format(tree):
+        yield line
+
 def format_table(table, column_names=None, column_specs=None, max_col_width=32,
                  report_dimensions=False):
     ''' Table pretty printer.
@@ -25,6 +25,7 @@ from ..compat import sys_encoding
 from ..exceptions import DXCLIError
 import contextlib
 import io
+from threading import Event, Lock, Thread
 
 if sys.stdout.isatty():
     try:
@@ -187,6 +188,97 @@ def refill_paragraphs(string, ignored_prefix='    '):
     return '\n\n'.join(refilled_paragraphs).strip('\n')
 
 
+class JSONResultWriter(object):
+    '''
+    :param stream_format: None to print all results as one JSON array once
+        :meth:`close` is called (the output of ``--json``), "array" to print
+        the same JSON array incrementally as results are written (the output
+        of ``--json-stream``), or "lines" to print each result as a JSON
+        object on its own line (the output of ``--json-lines``)
+    :type stream_format: string
+    :param indent: Indentation used for the JSON array
+    :type indent: int or None
+    :param flush_interval: Maximum number of seconds a written result may stay buffered in a streaming format
+    :type flush_interval: float
+
+    Prints the results of ``dx find ...`` commands as JSON. The streaming
+    formats print each result as soon as it is written, so memory use
+    stays flat and downstream consumers (e.g. ``jq``) can start processing
+    before the last page of results arrives. Written results are flushed
+    by a background thread, so they are not held back while the next page
+    of results is being fetched.
+    '''
+    def __init__(self, stream_format=None, indent=4, file=None, flush_interval=1.0):
+        if stream_format not in (None, "array", "lines"):
+            raise ValueError("Unexpected JSON stream format: " + str(stream_format))
+        self.stream_format = stream_format
+        self.indent = indent
+        self.file = file
+        self.flush_interval = flush_interval
+        self._results = []
+        self._num_written = 0
+        self._unflushed = False
+        self._lock = Lock()
+        self._closed = Event()
+        self._flusher = None
+
+    def _out(self):
+        return self.file if self.file is not None else sys.stdout
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._unflushed:
+                    self._out().flush()
+                    self._unflushed = False
+
+    def write(self, result):
+        if self.stream_format is None:
+            self._results.append(result)
+            return
+        if self._flusher is None and self.flush_interval:
+            self._flusher = Thread(target=self._flush_periodically)
+            self._flusher.daemon = True
+            self._flusher.start()
+        with self._lock:
+            self._write(result)
+            self._unflushed = True
+
+    def _write(self, result):
+        out = self._out()
+        if self.stream_format == "lines":
+            out.write(json.dumps(result) + "\n")
+        else:
+            # Produces exactly the output of json.dumps(results, indent=indent)
+            if self._num_written == 0:
+                out.write("[\n" if self.indent is not None else "[")
+            else:
+                out.write(",\n" if self.indent is not None else ", ")
+            item = json.dumps(result, indent=self.indent)
+            if self.indent is not None:
+                item = textwrap.indent(item, " " * self.indent)
+            out.write(item)
+        self._num_written += 1
+
+    def close(self):
+        self._closed.set()
+        out = self._out()
+        with self._lock:
+            if self.stream_format is None:
+                out.write(json.dumps(self._results, indent=self.indent) + "\n")
+            elif self.stream_format == "array":
+                if self._num_written == 0:
+                    out.write("[]\n")
+                else:
+                    out.write(("\n" if self.indent is not None else "") + "]\n")
+            out.flush()
+            self._unflushed = False
+
+    def write_all(self, results):
+        for result in results:
+            self.write(result)
+        self.close()
+
 def _format_find_projects_results(results):
     for result in results:
         print(result["id"] + DELIMITER(" : ") + result['describe']['name'] +
@@ -220,7 +312,7 @@ def format_find_results(args, results):
     and ``dx find org_members``
     """
     if args.json:
-        print(json.dumps(list(results), indent=4))
+        JSONResultWriter(args.json_stream).write_all(results)
     elif args.brief:
         for result in results:
             print(result['id'])
@@ -0,0 +1,209 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Session-scoped cache of path resolutions.
+
+Each ``dx`` invocation is a new process, so the in-process caches of the
+resolver do not help shell scripts that refer to the same
+``project:folder/name`` many times. Resolved project names and object
+paths are therefore also kept for a short time in a JSON file in the
+session configuration directory (see
+:meth:`~dxpy.utils.config.DXConfig.get_session_conf_dir`). The cache is
+only used if that directory already exists (i.e. after ``dx login`` or
+``dx select``), and it is cleared once the commands that move, remove,
+rename or create projects, objects or folders have run (see
+:func:`invalidates_resolution_cache`).
+
+New entries are kept in memory and the file is written once, when the
+command exits (see :meth:`DXResolutionCache.flush`).
+
+The time to live of the entries, in seconds, can be set with the
+environment variable ``DX_RESOLUTION_CACHE_TTL``; setting it to 0
+disables the cache.
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os, json, time, hashlib, functools, atexit
+
+import dxpy
+
+DEFAULT_TTL = 30
+MAX_ENTRIES = 1000
+CACHE_FILENAME = "resolution_cache.json"
+
+_cache = None
+
+
+def _get_ttl():
+    try:
+        return max(float(os.environ.get("DX_RESOLUTION_CACHE_TTL", DEFAULT_TTL)), 0)
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def _get_context():
+    # Resolutions are only valid for the API server and user they were made with
+    context = json.dumps([getattr(dxpy, "APISERVER", None), dxpy.SECURITY_CONTEXT], sort_keys=True)
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+
+def _make_key(project, folder, name, *extra):
+    return json.dumps([project, folder, name] + list(extra))
+
+
+class DXResolutionCache(object):
+    '''
+    :param path: Path of the cache file
+    :type path: string
+    :param ttl: Time to live of the entries, in seconds
+    :type ttl: float
+
+    Mapping from (project, folder, name) keys to resolution results,
+    persisted to a JSON file by :meth:`flush`. Expired entries are ignored
+    on lookup and dropped when the file is written.
+    '''
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._context = _get_context()
+        self._entries = None
+        self._changed = False
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as fd:
+                    contents = json.load(fd)
+                self._entries = contents["entries"] if contents.get("context") == self._context else {}
+            except Exception:
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        now = time.time()
+        entries = {key: entry for key, entry in self._entries.items() if entry[0] + self.ttl > now}
+        if len(entries) > MAX_ENTRIES:
+            entries = dict(sorted(entries.items(), key=lambda item: item[1][0])[-MAX_ENTRIES:])
+        self._entries = entries
+        tmp_path = "{}.{}".format(self.path, os.getpid())
+        try:
+            with os.fdopen(os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), "w") as fd:
+                json.dump({"context": self._context, "entries": entries}, fd)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            # The cache is only an optimization
+            pass
+
+    def get(self, project, folder, name, *extra):
+        '''
+        :returns: The cached value, or None if there is no unexpired entry for the key
+        '''
+        entry = self._load().get(_make_key(project, folder, name, *extra))
+        if entry is None or entry[0] + self.ttl <= time.time():
+            return None
+        return entry[1]
+
+    def set(self, project, folder, name, value, *extra):
+        self._load()[_make_key(project, folder, name, *extra)] = [time.time(), value]
+        self._changed = True
+
+    def discard(self, project, folder, name, *extra):
+        if self._load().pop(_make_key(project, folder, name, *extra), None) is not None:
+            self._changed = True
+
+    def flush(self):
+        '''
+        Writes the entries to the cache file if any were set or discarded
+        since the last write.
+        '''
+        if self._changed:
+            self._save()
+            self._changed = False
+
+    def clear(self):
+        self._entries = {}
+        self._changed = False
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def get_resolution_cache():
+    '''
+    :returns: The resolution cache of the current session, or None if it
+              is disabled or there is no session configuration directory
+    :rtype: :class:`DXResolutionCache` or None
+    '''
+    global _cache
+    ttl = _get_ttl()
+    if ttl == 0 or dxpy.JOB_ID is not None:
+        return None
+    if _cache is None or _cache._context != _get_context():
+        flush_resolution_cache()
+        session_dir = dxpy.config.get_session_conf_dir()
+        if not os.path.isdir(session_dir):
+            return None
+        _cache = DXResolutionCache(os.path.join(session_dir, CACHE_FILENAME), ttl=ttl)
+    return _cache
+
+
+def flush_resolution_cache():
+    '''
+    Writes the new entries of the resolution cache of the current session
+    to its file. Called when the process exits.
+    '''
+    if _cache is not None:
+        _cache.flush()
+
+atexit.register(flush_resolution_cache)
+
+
+def invalidate_resolution_cache():
+    '''
+    Removes all entries from the resolution cache of the current session.
+    Called by the commands that change the paths of objects.
+    '''
+    global _cache
+    try:
+        session_dir = dxpy.config.get_session_conf_dir()
+    except Exception:
+        return
+    try:
+        os.remove(os.path.join(session_dir, CACHE_FILENAME))
+    except OSError:
+        pass
+    _cache = None
+
+
+def invalidates_resolution_cache(func):
+    '''
+    Decorator for the commands that change the contents of folders. The
+    resolution cache is cleared once the command has run, whether it
+    succeeded or not (some objects may have been changed before an
+    error), so that the resolutions made by the command itself are not
+    kept either.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            invalidate_resolution_cache()
+    return wrapper
@@ -25,10 +25,11 @@ For more details, see external documentation [TODO: Put link here].
 
 from __future__ import print_function, unicode_literals, division, absolute_import
 
-import os, sys, json, re
+import os, sys, json, re, collections
 
 import dxpy
 from .describe import get_ls_l_desc
+from .resolution_cache import get_resolution_cache
 from ..compat import basestring
 from ..cli import try_call, INTERACTIVE_CLI
 from ..exceptions import DXCLIError, DXError
@@ -384,6 +385,13 @@ def resolve_container_id_or_name(raw_string, is_error=False, multi=False):
     if string in cached_project_names:
         return ([cached_project_names[string]] if multi else cached_project_names[string])
 
+    session_cache = get_resolution_cache()
+    if session_cache is not None:
+        project_id = session_cache.get(string, None, None)
+        if project_id is not None:
+            cached_project_names[string] = project_id
+            return ([project_id] if multi else project_id)
+
     try:
         results = list(dxpy.find_projects(name=string, describe=True, level='VIEW'))
     except Exception as details:
@@ -391,6 +399,8 @@ def resolve_container_id_or_name(raw_string, is_error=False, multi=False):
 
     if len(results) == 1:
         cached_project_names[string] = results[0]['id']
+        if session_cache is not None:
+            session_cache.set(string, None, None, results[0]['id'])
         return ([results[0]['id']] if multi else results[0]['id'])
     elif len(results) == 0:
         if is_error:
@@ -893,6 +903,51 @@ def _resolve_global_entity(project_or_job_id, folderpath, entity_name, describe=
             raise ResolutionError(str(details))
 
 
+def _resolve_cached_entity(project, folderpath, entity_name, describe=True, visibility="either"):
+    """
+    :returns: The results of resolving the entity, in the format returned
+              by _resolve_global_entity, or None if the resolution is not
+              in the session cache
+    :rtype: list or None
+
+    Looks up the path in the session resolution cache. If a describe
+    mapping is requested, the cached object is described (as if its ID had
+    been given), and the entry is discarded if the object no longer has
+    the expected name and folder.
+    """
+    session_cache = get_resolution_cache()
+    if session_cache is None or is_job_id(project) or is_glob_pattern(entity_name):
+        return None
+    cached = session_cache.get(project, folderpath, entity_name, visibility)
+    if cached is None:
+        return None
+    if not describe:
+        return [cached]
+    describe_input = dict(describe) if isinstance(describe, dict) else {}
+    describe_input['project'] = cached['project']
+    try:
+        desc = dxpy.DXHTTPRequest('/' + cached['id'] + '/describe', describe_input)
+    except Exception:
+        desc = None
+    if desc is None or desc.get('name', entity_name) != entity_name or desc.get('folder', folderpath) != folderpath:
+        session_cache.discard(project, folderpath, entity_name, visibility)
+        return None
+    return [dict(cached, describe=desc)]
+
+
+def _cache_resolution(project, folderpath, entity_name, results, visibility="either"):
+    """
+    Stores a unique resolution of a path to a data object in the session
+    cache.
+    """
+    if len(results) != 1 or is_job_id(project) or is_glob_pattern(entity_name):
+        return
+    session_cache = get_resolution_cache()
+    if session_cache is not None:
+        session_cache.set(project, folderpath, entity_name,
+                          {"project": results[0]["project"], "id": results[0]["id"]}, visibility)
+
+
 def _format_resolution_output(path, project, folderpath, entity_name, result):
     """
     :param path: Path to the object that required resolution; propagated from
@@ -938,6 +993,69 @@ def _format_resolution_output(path, project, folderpath, entity_name, result):
         return {"project": None, "folder": None, "name": None}
 
 
+# Maximum number of concurrent API calls made by resolve_multiple_existing_paths
+RESOLUTION_MAX_WORKERS = 8
+# Maximum number of objects per /system/describeDataObjects and
+# /system/resolveDataObjects call
+RESOLUTION_BATCH_SIZE = 1000
+
+def _glob_to_regexp(pattern):
+    """
+    :param pattern: A name glob pattern, in which "*" and "?" are wildcards
+    :type pattern: string
+    :returns: An (unanchored) regular expression matching the same names
+    :rtype: string
+    """
+    return "".join(".*" if char == "*" else "." if char == "?" else re.escape(char) for char in pattern)
+
+
+def _resolve_glob_group(project, folderpath, patterns):
+    """
+    :param project: The project ID (or job ID) in which to resolve the patterns
+    :type project: string
+    :param folderpath: The folder in which to resolve the patterns
+    :type folderpath: string
+    :param patterns: List of (path, entity_name) tuples, where each entity_name is a glob pattern
+    :type patterns: list
+    :returns: A dictionary mapping each path to its resolved object, in the
+              format returned by resolve_multiple_existing_paths
+    :rtype: dict
+
+    Resolves all glob patterns that target the same project and folder. If
+    there is more than one pattern, a single findDataObjects call is made
+    with a regular expression matching any of them, and the results are
+    assigned to the individual patterns client-side.
+    """
+    results = {}
+    if len(patterns) == 1 or is_job_id(project):
+        for path, entity_name in patterns:
+            try:
+                find_results = _resolve_global_entity(project, folderpath, entity_name)
+                results[path] = _format_resolution_output(path, project, folderpath, entity_name, find_results)
+            except ResolutionError:
+                results[path] = {"project": None, "folder": None, "name": None}
+        return results
+
+    regexps = [re.compile("^" + _glob_to_regexp(entity_name) + "$", re.DOTALL) for _, entity_name in patterns]
+    combined = "^(?:" + "|".join(regexp.pattern[1:-1] for regexp in regexps) + ")$"
+    try:
+        find_results = list(dxpy.find_data_objects(project=project,
+                                                   folder=folderpath,
+                                                   name=combined,
+                                                   name_mode='regexp',
+                                                   recurse=False,
+                                                   describe=True,
+                                                   visibility="either"))
+    except Exception:
+        for path, _ in patterns:
+            results[path] = {"project": None, "folder": None, "name": None}
+        return results
+    for (path, entity_name), regexp in zip(patterns, regexps):
+        matches = [result for result in find_results if regexp.match(result["describe"]["name"])]
+        results[path] = _format_resolution_output(path, project, folderpath, entity_name, matches)
+    return results
+
+
 def resolve_multiple_existing_paths(paths):
     """
     :param paths: A list of paths to items that need to be resolved
@@ -982,8 +1100,11 @@ def resolve_multiple_existing_paths(paths):
     done_objects = {}  # Return value
     to_resolve_in_batch_paths = []  # Paths to resolve
     to_resolve_in_batch_inputs = []  # Project, folderpath, and entity name
-    for path in paths:
-        project, folderpath, entity_name = resolve_path(path, expected='entity')
+    glob_groups = collections.OrderedDict()  # (project, folderpath) -> [(path, entity_name), ...]
+    cached_paths = []  # Paths found in the session resolution cache
+    session_cache = get_resolution_cache()
+
+    def classify_path(path, project, folderpath, entity_name):
         try:
             must_resolve, project, folderpath, entity_name = _check_resolution_needed(
                 path, project, folderpath, entity_name)
@@ -992,28 +1113,143 @@ def resolve_multiple_existing_paths(paths):
 
         if must_resolve:
             if is_glob_pattern(entity_name):
-                # TODO: Must call findDataObjects because resolveDataObjects does not support glob patterns
-                try:
-                    find_results = _resolve_global_entity(project, folderpath, entity_name)
-                    done_objects[path] = _format_resolution_output(path, project, folderpath, entity_name,
-                                                                   find_results)
-                except ResolutionError:
-                    # Catches any ResolutionError thrown by _resolve_global_entity
-                    done_objects[path] = {"project": None, "folder": None, "name": None}
+                # resolveDataObjects does not support glob patterns; these
+                # are resolved below with findDataObjects
+                glob_groups.setdefault((project, folderpath), []).append((path, entity_name))
             else:
-                # Prepare batch call for resolveDataObjects
-                to_resolve_in_batch_paths.append(path)
-                to_resolve_in_batch_inputs.append({"project": project, "folder": folderpath, "name": entity_name})
+                cached = None
+                if session_cache is not None and not is_job_id(project):
+                    cached = session_cache.get(project, folderpath, entity_name, "either")
+                if cached is not None:
+                    # Checked below before it is used
+                    cached_paths.append((path, project, folderpath, entity_name, cached))
+                else:
+                    # Prepare batch call for resolveDataObjects
+                    to_resolve_in_batch_paths.append(path)
+                    to_resolve_in_batch_inputs.append({"project": project, "folder": folderpath,
+                                                       "name": entity_name})
         else:
             # No need to resolve
             done_objects[path] = {"project": project, "folder": folderpath, "name": entity_name}
 
-    # Call resolveDataObjects
-    resolution_results = dxpy.resolve_data_objects(to_resolve_in_batch_inputs)
-    for path, inputs, result in zip(to_resolve_in_batch_paths, to_resolve_in_batch_inputs,
-                                    resolution_results):
-        done_objects[path] = _format_resolution_output(path, inputs["project"], inputs["folder"], inputs["name"],
-                                                       result)
+    resolved_paths = collections.OrderedDict((path, resolve_path(path, expected='entity'))
+                                             for path in collections.OrderedDict.fromkeys(paths))
+    data_object_paths = collections.OrderedDict(
+        (path, resolved) for path, resolved in resolved_paths.items()
+        if resolved[2] is not None and is_data_obj_id(resolved[2]) and not is_job_id(resolved[0] or ''))
+
+    # Data objects given by ID are described in bulk, while the other paths
+    # are resolved: glob patterns with one findDataObjects call per project
+    # and folder, and names with batched resolveDataObjects calls, all
+    # concurrently
+    pool = dxpy.utils.get_futures_threadpool(max_workers=RESOLUTION_MAX_WORKERS)
+    try:
+        describe_futures = [pool.submit(_describe_data_objects_in_bulk, batch)
+                            for batch in _split_into_batches(list(data_object_paths.items()))]
+
+        for path, (project, folderpath, entity_name) in resolved_paths.items():
+            if path not in data_object_paths:
+                classify_path(path, project, folderpath, entity_name)
+
+        # Cached resolutions whose object was renamed, moved or removed are
+        # resolved again
+        valid_cached_paths = _validate_cached_resolutions(cached_paths)
+        for path, project, folderpath, entity_name, cached in cached_paths:
+            if path in valid_cached_paths:
+                done_objects[path] = _format_resolution_output(path, project, folderpath, entity_name, [cached])
+            else:
+                to_resolve_in_batch_paths.append(path)
+                to_resolve_in_batch_inputs.append({"project": project, "folder": folderpath, "name": entity_name})
+
+        glob_futures = [pool.submit(_resolve_glob_group, project, folderpath, patterns)
+                        for (project, folderpath), patterns in glob_groups.items()]
+        batches = _split_into_batches(list(zip(to_resolve_in_batch_paths, to_resolve_in_batch_inputs)))
+        resolve_futures = [pool.submit(dxpy.resolve_data_objects, [inputs for _path, inputs in batch])
+                           for batch in batches]
+
+        for future in describe_futures:
+            done_objects.update(future.result())
+        # Objects that could not be described in bulk are described
+        # individually (with and then without the project hint)
+        for path, (project, folderpath, entity_name) in data_object_paths.items():
+            if path not in done_objects:
+                classify_path(path, project, folderpath, entity_name)
+
+        for future in glob_futures:
+            done_objects.update(future.result())
+        for batch, future in zip(batches, resolve_futures):
+            for (path, inputs), result in zip(batch, future.result()):
+                done_objects[path] = _format_resolution_output(path, inputs["project"], inputs["folder"],
+                                                               inputs["name"], result)
+                _cache_resolution(inputs["project"], inputs["folder"], inputs["name"], result)
+    finally:
+        pool.shutdown(wait=False)
+    return done_objects
+
+
+def _split_into_batches(items, batch_size=RESOLUTION_BATCH_SIZE):
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def _validate_cached_resolutions(cached_paths):
+    """
+    :param cached_paths: (path, project, folderpath, entity_name, cached
+                         resolution) tuples
+    :type cached_paths: list
+    :returns: The paths whose cached object still has the expected name and
+              folder
+    :rtype: set
+
+    Makes the same check as _resolve_cached_entity, with one
+    /system/describeDataObjects call per batch of paths. The entries of the
+    other paths are discarded from the session cache.
+    """
+    valid_paths = set()
+    for batch in _split_into_batches(cached_paths):
+        objects = [{"id": cached["id"], "project": cached["project"],
+                    "describe": {"fields": {"name": True, "folder": True}}}
+                   for _path, _project, _folderpath, _entity_name, cached in batch]
+        try:
+            results = dxpy.api.system_describe_data_objects({"objects": objects})["results"]
+        except Exception:
+            results = [{}] * len(batch)
+        for (path, project, folderpath, entity_name, _cached), result in zip(batch, results):
+            desc = result.get("describe")
+            if desc is not None and desc.get("name") == entity_name and desc.get("folder") == folderpath:
+                valid_paths.add(path)
+            else:
+                get_resolution_cache().discard(project, folderpath, entity_name, "either")
+    return valid_paths
+
+
+def _describe_data_objects_in_bulk(paths):
+    """
+    :param paths: (path, (project, folderpath, object ID)) tuples
+    :type paths: list
+    :returns: A dictionary mapping each path whose object could be described
+              to its resolution output (as returned by
+              resolve_multiple_existing_paths)
+    :rtype: dict
+
+    Describes the objects with a single /system/describeDataObjects call,
+    using the project of each path (or the current project) as a hint.
+    """
+    objects = []
+    for _path, (project, _folderpath, entity_name) in paths:
+        describe_input = {"id": entity_name, "describe": True}
+        if (project or dxpy.WORKSPACE_ID) is not None:
+            describe_input["project"] = project or dxpy.WORKSPACE_ID
+        objects.append(describe_input)
+    try:
+        results = dxpy.api.system_describe_data_objects({"objects": objects})["results"]
+    except Exception:
+        return {}
+    done_objects = {}
+    for (path, (project, folderpath, entity_name)), result in zip(paths, results):
+        if result.get("describe"):
+            desc = dxpy.append_underlying_workflow_describe(result["describe"])
+            done_objects[path] = {"project": project, "folder": folderpath,
+                                  "name": {"id": entity_name, "describe": desc}}
     return done_objects
 
 
@@ -1071,7 +1307,11 @@ def resolve_existing_path(path, expected=None, ask_to_resolve=True, expected_cla
                                                                                                allow_mult))
 
     if must_resolve:
-        results = _resolve_global_entity(project, folderpath, entity_name, describe=describe, visibility=visibility)
+        results = _resolve_cached_entity(project, folderpath, entity_name, describe=describe, visibility=visibility)
+        if results is None:
+            results = _resolve_global_entity(project, folderpath, entity_name, describe=describe,
+                                             visibility=visibility)
+            _cache_resolution(project, folderpath, entity_name, results, visibility)
         if len(results) == 0:
             # Could not resolve entity, so it is probably a folder
             folder = _resolve_folder(project, folderpath, entity_name)
@@ -0,0 +1,232 @@
+# Copyright (C) 2013-2016 DNAnexus, Inc.
+#
+# This file is part of dx-toolkit (DNAnexus platform client libraries).
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may not
+#   use this file except in compliance with the License. You may obtain a copy
+#   of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+
+'''
+Opt-in local cache of vizserver query results.
+
+``dx extract_dataset``, ``dx extract_assay`` and cohort extractions are
+often run again and again with the same fields and filters, and so send
+the same queries to vizserver. When ``DX_RESULT_CACHE_TTL`` is set to a
+number of seconds, the response bodies of the queries (see
+:func:`dxpy.bindings.apollo.vizclient.stream_results`) are kept, gzipped,
+in the user configuration directory (see
+:meth:`~dxpy.utils.config.DXConfig.get_user_conf_dir`), and identical
+queries made within that time are answered from the cache.
+
+Entries are keyed on a hash of the API server, the security context, the
+URL of the query (which holds the ID of the dataset record), the descriptor
+of the dataset and the payload, so that the results of a query are only
+reused for the same user and version of the dataset. Responses with an
+error are not cached. The total size of the cache, in MB, can be set with
+``DX_RESULT_CACHE_SIZE`` (1024 by default); the oldest entries are removed
+beyond it.
+'''
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os, re, gzip, json, time, hashlib, threading
+
+import dxpy
+
+DEFAULT_TTL = 0
+DEFAULT_MAX_SIZE_MB = 1024
+CACHE_DIRNAME = "vizserver_results"
+# Size of the chunks in which cached responses are read
+READ_CHUNK_SIZE = 1024 * 1024
+
+_RECORD_ID = re.compile(r"/(record-[0-9A-Za-z]{24})/")
+
+# Descriptors of the dataset records, by record ID, for the lifetime of the process
+_descriptors = {}
+_lock = threading.Lock()
+
+
+def _get_ttl():
+    try:
+        return max(float(os.environ.get("DX_RESULT_CACHE_TTL", DEFAULT_TTL)), 0)
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def _get_max_bytes():
+    try:
+        return max(float(os.environ.get("DX_RESULT_CACHE_SIZE", DEFAULT_MAX_SIZE_MB)), 0) * 1024 * 1024
+    except ValueError:
+        return DEFAULT_MAX_SIZE_MB * 1024 * 1024
+
+
+def get_dataset_version(record_id):
+    '''
+    :param record_id: ID of a Dataset record
+    :type record_id: string
+    :returns: The link to the descriptor file of the dataset, or None if the record cannot be described
+    :rtype: dict
+
+    Datasets are immutable once closed, and a new version of a dataset has
+    a new descriptor file.
+    '''
+    with _lock:
+        if record_id not in _descriptors:
+            try:
+                details = dxpy.api.record_describe(record_id, {"fields": {"details": True}})["details"]
+                _descriptors[record_id] = details["descriptor"]
+            except Exception:
+                _descriptors[record_id] = None
+        return _descriptors[record_id]
+
+
+class DXResultCache(object):
+    '''
+    :param path: Directory holding the cached responses
+    :type path: string
+    :param ttl: Number of seconds for which responses are used
+    :type ttl: float
+    :param max_bytes: Maximum total size of the cached responses; the oldest ones are removed beyond it
+    :type max_bytes: int
+
+    On-disk cache of vizserver responses, one gzipped file per query.
+    '''
+
+    def __init__(self, path, ttl, max_bytes=DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _get_filename(self, key):
+        return os.path.join(self.path, key + ".json.gz")
+
+    def get_key(self, resource_url, payload):
+        '''
+        :returns: The key of the query, or None if its results cannot be cached (the URL does not refer to a dataset record that can be described)
+        :rtype: string
+        '''
+        match = _RECORD_ID.search(resource_url)
+        version = get_dataset_version(match.group(1)) if match else None
+        if version is None:
+            return None
+        key = json.dumps([getattr(dxpy, "APISERVER", None), dxpy.SECURITY_CONTEXT, resource_url, version, payload],
+                         sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        '''
+        :returns: The chunks of the cached response body, or None if it is not cached or has expired
+        :rtype: iterator of bytes
+        '''
+        filename = self._get_filename(key)
+        try:
+            if time.time() - os.path.getmtime(filename) >= self.ttl:
+                os.remove(filename)
+                return None
+            fd = gzip.open(filename, "rb")
+        except (IOError, OSError):
+            return None
+        return self._read(fd)
+
+    def _read(self, fd):
+        with fd:
+            while True:
+                chunk = fd.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def tee(self, key, chunks):
+        '''
+        :param chunks: The chunks of a response body
+        :type chunks: iterable of bytes
+        :returns: The same chunks; the response is cached once they have all been read
+        :rtype: iterator of bytes
+        '''
+        filename = self._get_filename(key)
+        tmp_filename = "{}.{}.{}".format(filename, os.getpid(), threading.current_thread().ident)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0o700)
+            fd = gzip.GzipFile(tmp_filename, mode="wb")
+            os.chmod(tmp_filename, 0o600)
+        except (IOError, OSError):
+            # The cache is only an optimization
+            fd = None
+        complete = False
+        try:
+            for chunk in chunks:
+                if fd is not None:
+                    try:
+                        fd.write(chunk)
+                    except (IOError, OSError):
+                        fd = self._discard(fd, tmp_filename)
+                yield chunk
+            complete = True
+        finally:
+            if fd is not None and complete:
+                try:
+                    fd.close()
+                    os.rename(tmp_filename, filename)
+                    self._evict()
+                except (IOError, OSError):
+                    self._discard(fd, tmp_filename)
+            elif fd is not None:
+                # The response was not read to the end
+                self._discard(fd, tmp_filename)
+
+    def _discard(self, fd, tmp_filename):
+        try:
+            fd.close()
+            os.remove(tmp_filename)
+        except (IOError, OSError):
+            pass
+        return None
+
+    def remove(self, key):
+        try:
+            os.remove(self._get_filename(key))
+        except (IOError, OSError):
+            pass
+
+    def _evict(self):
+        filenames = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json.gz"):
+                filename = os.path.join(self.path, name)
+                try:
+                    filenames.append((os.path.getmtime(filename), os.path.getsize(filename), filename))
+                except OSError:
+                    # Removed by another process or thread
+                    pass
+        filenames.sort(reverse=True)
+        total_bytes = 0
+        for i, (mtime, size, filename) in enumerate(filenames):
+            if time.time() - mtime < self.ttl:
+                total_bytes += size
+                # Always keep the most recent entry, even if it is larger than the limit
+                if total_bytes <= self.max_bytes or i == 0:
+                    continue
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def get_result_cache():
+    '''
+    :returns: The result cache, or None if it is disabled (i.e. DX_RESULT_CACHE_TTL is not set)
+    :rtype: :class:`DXResultCache` or None
+    '''
+    ttl = _get_ttl()
+    if ttl == 0:
+        return None
+    return DXResultCache(os.path.join(dxpy.config.get_user_conf_dir(), CACHE_DIRNAME), ttl, max_bytes=_get_max_bytes())
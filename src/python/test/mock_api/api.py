@@ -3,15 +3,23 @@
 
 from __future__ import print_function, unicode_literals
 
-import os, sys, random, hashlib, argparse, io, struct
+import os, sys, re, fnmatch, random, hashlib, argparse, io, struct, time
 from flask import Flask, request, jsonify
 
 parser = argparse.ArgumentParser(description=__doc__)
 parser.add_argument("--host", help="Hostname to serve on", default=os.environ.get("DX_APISERVER_HOST", "localhost"))
 parser.add_argument("--port", help="TCP port to serve on", type=int, default=os.environ.get("DX_APISERVER_PORT", 5000))
+parser.add_argument("--latency", help="Seconds to wait before answering each request", type=float, default=0)
 args = parser.parse_args()
 
 app = Flask(__name__)
+app.request_count = 0
+
+@app.before_request
+def simulate_latency():
+    app.request_count += 1
+    if args.latency:
+        time.sleep(args.latency)
 
 #random.seed(1)
 
@@ -39,14 +47,69 @@ def set_payload():
     file_desc["size"] = len(app.payload)
     return jsonify(dict())
 
+# Names of the objects in each folder, used to answer glob and regexp name queries
+folder_contents = {"/data": ["sample_{}.fastq".format(i) for i in range(1, 1001)] +
+                            ["glob_{}_R1.fastq".format(i) for i in range(1, 1001)]}
+
 @app.route("/system/findDataObjects", methods=["POST"])
 def find_data_objects():
     results=[]
-    results.append(dict(project=request.json["scope"]["project"],
-                        id=file_desc["id"],
-                        describe=dict(file_desc, project=request.json["scope"]["project"])))
+    project = request.json["scope"]["project"]
+    name = request.json.get("name")
+    if isinstance(name, dict):
+        folder = request.json["scope"].get("folder", "/")
+        if "glob" in name:
+            matches = fnmatch.filter(folder_contents.get(folder, []), name["glob"])
+        else:
+            matches = [n for n in folder_contents.get(folder, []) if re.search(name["regexp"], n)]
+        for match in matches:
+            results.append(dict(project=project, id=object_id(folder + "/" + match),
+                                describe=dict(file_desc, id=object_id(folder + "/" + match), name=match,
+                                              folder=folder, project=project)))
+    else:
+        results.append(dict(project=project,
+                            id=file_desc["id"],
+                            describe=dict(file_desc, project=project)))
     return jsonify(dict(results=results, next=None))
 
+def object_id(name):
+    # Stable ID for each object name
+    return "file-" + hashlib.md5(name.encode("utf-8")).hexdigest()[:24]
+
+@app.route("/system/resolveDataObjects", methods=["POST"])
+def resolve_data_objects():
+    project = request.json.get("project")
+    results = []
+    for obj in request.json["objects"]:
+        obj_project = obj.get("project", project)
+        results.append([dict(project=obj_project, id=object_id(obj.get("folder", "/") + "/" + obj["name"]))])
+    return jsonify(dict(results=results))
+
+@app.route("/system/describeDataObjects", methods=["POST"])
+def describe_data_objects():
+    results = [dict(describe=dict(file_desc, id=obj["id"], project=obj.get("project", "project-0123456789ABCDEF01234567")))
+               for obj in request.json["objects"]]
+    return jsonify(dict(results=results))
+
+@app.route("/system/requestCount", methods=["POST"])
+def request_count():
+    return jsonify(dict(count=app.request_count))
+
+applet_desc = {
+    "id": "applet-0123456789ABCDEF01234567",
+    "class": "applet",
+    "name": "mock_applet",
+    "project": "project-0123456789ABCDEF01234567",
+    "folder": "/",
+    "inputSpec": [{"name": "reads", "class": "array:file"}],
+    "outputSpec": [],
+    "runSpec": {"interpreter": "bash", "distribution": "Ubuntu", "release": "20.04"}
+}
+
+@app.route("/applet-<id>/run", methods=["POST"])
+def run_applet(id):
+    return jsonify(dict(id="job-0123456789ABCDEF01234567"))
+
 @app.route("/<resource>/listFolder", methods=["POST"])
 def list_folder(resource):
     folders=[]
@@ -59,6 +122,8 @@ def describe(resource):
         return jsonify(dict(name="¶", folders=["/"]))
     elif resource.startswith("file-"):
         return jsonify(dict(file_desc, project="project-0123456789ABCDEF01234567"))
+    elif resource.startswith("applet-"):
+        return jsonify(dict(applet_desc, id=resource))
     elif resource.startswith("job-"):
         return jsonify(dict(app="app-0123456789ABCDEF01234567"))
     else:
@@ -19,7 +19,7 @@
 
 from __future__ import print_function, unicode_literals, division, absolute_import
 
-import os, unittest, tempfile, filecmp, time, json, sys, random
+import os, unittest, tempfile, filecmp, time, json, sys, random, collections
 import shutil
 import string
 import subprocess
@@ -2491,6 +2491,17 @@ class TestPrettyPrint(unittest.TestCase):
         self.assertEqual(pretty_print.format_timedelta(365 * 24 * 60 * 60 + 8 * 60 * 60 + 1 * 60 + 3, in_seconds=True), "1 years, 8 hours, 1 minutes, 3 seconds")
         self.assertEqual(pretty_print.format_timedelta(365 * 24 * 60 * 60 + 8 * 60 * 60 + 1 * 60 + 3, in_seconds=True, auto_singulars=True), "1 year, 8 hours, 1 minute, 3 seconds")
 
+    def test_iter_format_tree(self):
+        tree = collections.OrderedDict([("a", collections.OrderedDict([("b", collections.OrderedDict([("c", None)])), ("d\ne", None)])),
+                            ("f", None),
+                            ("g", collections.OrderedDict([("h", None)]))])
+        def to_pairs(subtree):
+            return [(node, (lambda children=children: to_pairs(children)) if children is not None else None)
+                    for node, children in subtree.items()]
+        lines = pretty_print.iter_format_tree(to_pairs(tree), root="root")
+        self.assertEqual(next(lines), "root")
+        self.assertEqual("\n".join(["root"] + list(lines)), pretty_print.format_tree(tree, root="root"))
+
 class TestWarn(unittest.TestCase):
     def test_warn(self):
         warn("testing, one two three...")
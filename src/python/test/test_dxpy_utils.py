@@ -19,14 +19,31 @@
 
 from __future__ import print_function, unicode_literals, division, absolute_import
 
-import unittest, time, json, re, os
+import unittest, time, datetime, json, re, os, io, sys, tempfile, shutil, subprocess, threading, collections, argparse
+import requests
+from http.server import BaseHTTPRequestHandler, HTTPServer
 import dateutil.parser
+from mock import patch, Mock
 import dxpy
 from dxpy import AppError, AppInternalError, DXError, DXFile, DXRecord
-from dxpy.utils import (exec_utils, genomic_utils, response_iterator, get_futures_threadpool, DXJSONEncoder,
+from dxpy.exceptions import DXJobFailureError
+from dxpy.utils import (exec_utils, resolver, batch_utils, bulk_operations, genomic_utils, response_iterator, get_futures_threadpool, DXJSONEncoder,
                         normalize_timedelta, normalize_time_input, config, Nonce)
 from dxpy.utils.exec_utils import DXExecDependencyInstaller
+from dxpy.utils.metadata_index import DXMetadataIndex
+from dxpy.utils.compact_results import CompactResultSet
+from dxpy.utils.resolution_cache import DXResolutionCache, flush_resolution_cache
+from dxpy.utils.completion_cache import DXCompletionCache
+from dxpy.utils import job_log_client
+from dxpy.utils import descriptor_cache, result_cache
+from dxpy.utils.json_stream import JSONArrayStream
+from dxpy.bindings.apollo import query_sharding, json_validation_by_schema, vizserver_filters_from_json_parser
+from dxpy.bindings.apollo.schemas.assay_filtering_json_schemas import EXTRACT_ASSAY_EXPRESSION_JSON_SCHEMA
+from dxpy.bindings.apollo.schemas.assay_filtering_conditions import EXTRACT_ASSAY_EXPRESSION_FILTERING_CONDITIONS_1_0
+from dxpy.dx_extract_utils import retrieve_bins, filter_to_payload
+from dxpy.utils import completer, completion_cache
 from dxpy.utils.pretty_print import flatten_json_array
+from dxpy.utils.printing import JSONResultWriter
 import dxpy_testutil as testutil
 from dxpy.system_requirements import SystemRequirementsDict
 
@@ -338,6 +355,175 @@ class TestDXConfig(unittest.TestCase):
             os.environ.update(environ_backup)
             dxpy.config.__init__(suppress_warning=True)
 
+class TestMetadataIndex(unittest.TestCase):
+    project = "project-" + "0" * 24
+
+    def _desc(self, obj_id, name, folder, modified, **kwargs):
+        desc = {"id": obj_id, "class": "file", "name": name, "folder": folder, "project": self.project,
+                "state": "closed", "hidden": False, "size": 10, "created": 1, "modified": modified,
+                "types": [], "tags": [], "properties": {}}
+        desc.update(kwargs)
+        return {"project": self.project, "id": obj_id, "describe": desc}
+
+    def _sync(self, index, objects, folders, full=None, current=()):
+        # An incremental sync also lists the IDs and folders of all the objects in the project
+        listings = [iter(objects), iter({"project": self.project, "id": obj_id, "describe": {"folder": folder}}
+                                        for obj_id, folder in current)]
+        with patch("dxpy.api.project_describe", return_value={"name": "proj", "folders": folders}), \
+             patch("dxpy.find_data_objects", side_effect=listings) as find_mock:
+            index.sync(full=full)
+        self.assertEqual(find_mock.call_count, 1 if index._get_meta('last_full_sync') == index.last_synced else 2)
+        return find_mock.call_args_list[0][1]
+
+    def test_sync_and_query(self):
+        index = DXMetadataIndex(self.project, path=":memory:")
+        self.assertIsNone(index.get_staleness())
+        query = self._sync(index,
+                           [self._desc("file-" + "1" * 24, "a.txt", "/", 100, tags=["t1"]),
+                            self._desc("file-" + "2" * 24, "b.vcf", "/data", 200, properties={"k": "v"}),
+                            self._desc("file-" + "3" * 24, "c.txt", "/data/sub", 300, hidden=True)],
+                           ["/", "/data", "/data/sub"])
+        self.assertIsNone(query["modified_after"])
+        self.assertEqual(index.project_name, "proj")
+        self.assertLess(index.get_staleness(), 60)
+
+        resp = index.list_folder("/")
+        self.assertEqual(resp["folders"], ["/data"])
+        self.assertEqual([o["describe"]["name"] for o in resp["objects"]], ["a.txt"])
+        self.assertEqual(index.list_folder("/data/sub")["objects"], [])
+        self.assertEqual(len(index.list_folder("/data/sub", include_hidden=True)["objects"]), 1)
+        with self.assertRaises(DXError):
+            index.list_folder("/missing")
+
+        self.assertEqual([r["id"] for r in index.find(name="*.txt", name_mode="glob", visibility="either")],
+                         ["file-" + "1" * 24, "file-" + "3" * 24])
+        self.assertEqual([r["id"] for r in index.find(name=r"\.vcf$", name_mode="regexp")], ["file-" + "2" * 24])
+        self.assertEqual([r["id"] for r in index.find(tags=["t1"])], ["file-" + "1" * 24])
+        self.assertEqual([r["id"] for r in index.find(properties={"k": True})], ["file-" + "2" * 24])
+        self.assertEqual(list(index.find(properties={"k": "other"})), [])
+        self.assertEqual([r["id"] for r in index.find(folder="/data", recurse=False)], ["file-" + "2" * 24])
+        self.assertEqual(len(list(index.find(folder="/data", visibility="either"))), 2)
+
+        self.assertEqual(index.resolve_existing_path("/", "data"), ("/data", None))
+        folder, results = index.resolve_existing_path("/", "a.*")
+        self.assertIsNone(folder)
+        self.assertEqual(results[0]["describe"]["tags"], ["t1"])
+
+        # Incremental sync only asks for objects modified since the newest indexed object
+        query = self._sync(index, [self._desc("file-" + "1" * 24, "renamed.txt", "/", 400)], ["/", "/data"],
+                           full=False, current=[("file-" + "1" * 24, "/"), ("file-" + "2" * 24, "/data"),
+                                                ("file-" + "3" * 24, "/data/sub")])
+        self.assertEqual(query["modified_after"], 300)
+        self.assertEqual(index.list_folder("/")["objects"][0]["describe"]["name"], "renamed.txt")
+        self.assertEqual(index.list_folder("/data")["folders"], [])
+        self.assertEqual(len(list(index.find(visibility="either"))), 3)
+
+        # Removed and moved objects keep their timestamp, but are reconciled by an incremental sync too
+        self._sync(index, [], ["/", "/data"], full=False,
+                   current=[("file-" + "1" * 24, "/"), ("file-" + "2" * 24, "/")])
+        self.assertEqual([(r["describe"]["folder"], r["id"]) for r in index.find(visibility="either")],
+                         [("/", "file-" + "2" * 24), ("/", "file-" + "1" * 24)])
+        self.assertEqual(index.list_folder("/data")["objects"], [])
+        self.assertEqual(list(index.find(properties={"k": True}))[0]["describe"]["properties"], {"k": "v"})
+
+        # A full sync rebuilds the index from a single listing
+        self._sync(index, [self._desc("file-" + "2" * 24, "b.vcf", "/data", 200)], ["/", "/data"], full=True)
+        self.assertEqual([r["id"] for r in index.find(visibility="either")], ["file-" + "2" * 24])
+        index.close()
+
+    def test_find_data_cached_rejects_verbose(self):
+        from dxpy.scripts import dx
+        args = dx.parser.parse_args(["find", "data", "--cached", "--verbose"])
+        with patch("dxpy.WORKSPACE_ID", self.project), \
+             patch("dxpy.scripts.dx.get_metadata_index") as index_mock, \
+             patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            with self.assertRaises(SystemExit) as cm:
+                args.func(args)
+        self.assertEqual(cm.exception.code, 3)
+        self.assertIn("--verbose is not supported with --cached", stderr.getvalue())
+        index_mock.assert_not_called()
+
+class TestCompactResultSet(unittest.TestCase):
+    def test_columns_and_rows(self):
+        results = CompactResultSet(["name", "folder", "size", "tags"])
+        results.append({"id": "file-1", "project": "project-1",
+                        "describe": {"name": "a", "folder": "/x", "size": 3, "tags": ["t"], "ignored": 1}})
+        results.append({"id": "file-2", "project": "project-1", "describe": {"name": "b", "folder": "/x"}})
+        results.extend([{"id": "file-3", "describe": {"name": "c", "folder": "/y", "size": "big"}}])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0].to_dict(), {"id": "file-1", "project": "project-1",
+                                                "describe": {"name": "a", "folder": "/x", "size": 3, "tags": ["t"]}})
+        self.assertEqual(results[-1].id, "file-3")
+        self.assertIsNone(results[2].project)
+        self.assertIsNone(results[1]["size"])
+        self.assertEqual(results[1].get("tags", []), [])
+        self.assertEqual(results.column("size"), [3, None, "big"])
+        self.assertEqual(results.column("folder"), ["/x", "/x", "/y"])
+        with self.assertRaises(KeyError):
+            results[0]["ignored"]
+        with self.assertRaises(IndexError):
+            results[3]
+
+        out = io.StringIO()
+        results.to_jsonl(out)
+        self.assertEqual([json.loads(line)["id"] for line in out.getvalue().splitlines()],
+                         ["file-1", "file-2", "file-3"])
+        out = io.StringIO()
+        results.to_csv(out)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ["id,project,name,folder,size,tags", 'file-1,project-1,a,/x,3,"[""t""]"',
+                          "file-2,project-1,b,/x,,", "file-3,,c,/y,big,"])
+
+    def test_to_pandas(self):
+        try:
+            import pandas
+        except ImportError:
+            self.skipTest("pandas is not installed")
+        results = CompactResultSet(["folder", "size"])
+        results.extend([{"id": "file-1", "describe": {"folder": "/x", "size": 1}},
+                        {"id": "file-2", "describe": {"size": 2}}])
+        frame = results.to_pandas()
+        self.assertEqual(list(frame.columns), ["id", "project", "folder", "size"])
+        self.assertEqual(frame["folder"].tolist()[0], "/x")
+        self.assertTrue(pandas.isna(frame["folder"].tolist()[1]))
+        self.assertEqual(frame["size"].tolist(), [1, 2])
+
+    def test_find_into_result_set(self):
+        pages = [{"results": [{"id": "file-%d" % i, "project": "project-1", "describe": {"name": str(i)}}
+                              for i in range(start, start + 3)],
+                  "next": ({"id": "file-%d" % (start + 3)} if start == 0 else None)}
+                 for start in (0, 3)]
+        with patch("dxpy.api.system_find_data_objects", side_effect=pages) as find_mock:
+            results = dxpy.find_data_objects(project="project-1", describe={"fields": {"name": True}},
+                                             result_set=CompactResultSet(["name"]), limit=5)
+        self.assertEqual(find_mock.call_count, 2)
+        self.assertEqual(results.column("name"), ["0", "1", "2", "3", "4"])
+        with self.assertRaises(DXError):
+            dxpy.find_data_objects(result_set=CompactResultSet(), return_handler=True)
+
+    def test_find_executions_into_result_set(self):
+        root, child1, child2 = ("job-" + c * 24 for c in "123")
+        def pages():
+            return [{"results": [{"id": child1, "describe": {"name": "a"}}],
+                     "byParent": {root: [child1]}, "describe": {root: {"name": "root", "input": {"x": 1}}},
+                     "next": {"id": child2}},
+                    {"results": [{"id": child2, "describe": {"name": "b"}}],
+                     "byParent": {root: [child1, child2]}, "describe": {child1: {"name": "a"}},
+                     "next": None}]
+        with patch("dxpy.api.system_find_executions", side_effect=pages()) as find_mock:
+            listed = list(dxpy.find_executions(root_execution=root, describe={"fields": {"name": True}}))
+        list_query = find_mock.call_args_list[0][0][0]
+        with patch("dxpy.api.system_find_executions", side_effect=pages()) as find_mock:
+            results = dxpy.find_executions(root_execution=root, describe={"fields": {"name": True}},
+                                           result_set=CompactResultSet(["name"]))
+        self.assertEqual(find_mock.call_args_list[0][0][0], list_query)
+        self.assertEqual(results.column("name"), ["a", "b"])
+        self.assertEqual(results.by_parent, {root: [child1, child2]})
+        self.assertEqual(results.descriptions, {root: {"name": "root"}, child1: {"name": "a"}})
+        self.assertEqual(listed[-1][1], results.by_parent)
+        # Only the fields needed to print the tree are kept
+        self.assertEqual(listed[0][2][root]["input"], {"x": 1})
+
 class TestPrettyPrint(unittest.TestCase):
     def test_flatten_json_array(self):
         json_string = (
@@ -370,6 +556,1582 @@ class TestPrettyPrint(unittest.TestCase):
         self.assertEqual(flattened_json_string_ref, flatten_json_array(json_string, "arr"))
 
 
+class TestJSONResultWriter(unittest.TestCase):
+    def test_stream_formats(self):
+        results = [{"id": "file-1", "tags": ["a", "b"]}, {"id": "file-2", "details": {"x": None}}]
+        for stream_format in (None, "array"):
+            for indent in (4, None):
+                for subset in (results, results[:1], []):
+                    out = io.StringIO()
+                    JSONResultWriter(stream_format, indent=indent, file=out).write_all(iter(subset))
+                    self.assertEqual(out.getvalue(), json.dumps(subset, indent=indent) + "\n")
+        out = io.StringIO()
+        writer = JSONResultWriter("lines", file=out)
+        writer.write(results[0])
+        # Streaming formats write each result as soon as it is received
+        self.assertEqual(out.getvalue(), json.dumps(results[0]) + "\n")
+        writer.write(results[1])
+        writer.close()
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], results)
+        with self.assertRaises(ValueError):
+            JSONResultWriter("xml")
+
+    def test_flushed_while_waiting_for_results(self):
+        class Output(io.StringIO):
+            flushed = ""
+            def flush(self):
+                self.flushed = self.getvalue()
+        out = Output()
+        writer = JSONResultWriter("lines", file=out, flush_interval=0.01)
+        writer.write({"id": "file-1"})
+        # No further write is needed for the result to be flushed
+        deadline = time.time() + 5
+        while not out.flushed and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(out.flushed, '{"id": "file-1"}\n')
+        writer.close()
+
+    def test_stream_options_only_on_streaming_commands(self):
+        from dxpy.scripts import dx
+        args = dx.parser.parse_args(["find", "data", "--json-lines"])
+        self.assertTrue(args.json)
+        self.assertEqual(args.json_stream, "lines")
+        self.assertIsNone(dx.parser.parse_args(["find", "jobs", "--json"]).json_stream)
+        for command in (["describe", "file-xxxx"], ["find", "apps"]):
+            with patch("sys.stderr", new_callable=io.StringIO), self.assertRaises(SystemExit):
+                dx.parser.parse_args(command + ["--json-stream"])
+
+class TestResolveMultipleGlobs(unittest.TestCase):
+    project = "project-" + "0" * 24
+    names = ["a.txt", "b.txt", "a.bam", "c[1].txt", "notes"]
+
+    def fake_find(self, **kwargs):
+        self.find_calls.append(kwargs)
+        time.sleep(self.latency)
+        if kwargs["name_mode"] == "glob":
+            regexp = re.compile("^" + resolver._glob_to_regexp(kwargs["name"]) + "$")
+        else:
+            regexp = re.compile(kwargs["name"])
+        return iter([{"project": self.project, "id": "file-%024d" % i,
+                      "describe": {"name": name, "folder": kwargs["folder"]}}
+                     for i, name in enumerate(self.names) if regexp.match(name)])
+
+    def resolve(self, paths):
+        self.find_calls = []
+        with patch("dxpy.find_data_objects", side_effect=self.fake_find), \
+             patch("dxpy.resolve_data_objects", return_value=[]), \
+             patch("dxpy.utils.resolver._resolve_folder", side_effect=resolver.ResolutionError("not a folder")):
+            return resolver.resolve_multiple_existing_paths(paths)
+
+    def setUp(self):
+        self.latency = 0
+
+    def test_glob_to_regexp(self):
+        for pattern, name, matches in [("*.txt", "a.txt", True), ("*.txt", "a.bam", False),
+                                       ("?.txt", "ab.txt", False), ("c[1].*", "c[1].txt", True),
+                                       ("c[1].*", "c1.txt", False), ("a+b*", "a+b", True)]:
+            self.assertEqual(bool(re.match("^" + resolver._glob_to_regexp(pattern) + "$", name)), matches)
+
+    def test_merged_patterns(self):
+        paths = [self.project + ":/d/*.txt", self.project + ":/d/*.bam", self.project + ":/d/c[1]*"]
+        results = self.resolve(paths)
+        # One findDataObjects call for the folder, with a regexp name filter
+        self.assertEqual(len(self.find_calls), 1)
+        self.assertEqual(self.find_calls[0]["name_mode"], "regexp")
+        self.assertEqual(self.find_calls[0]["folder"], "/d")
+        # Ambiguous patterns are not resolved
+        self.assertEqual(results[paths[0]], {"project": None, "folder": None, "name": None})
+        self.assertEqual(results[paths[1]]["name"]["id"], "file-%024d" % 2)
+        self.assertEqual(results[paths[2]]["name"]["id"], "file-%024d" % 3)
+
+    def test_patterns_in_different_folders(self):
+        paths = [self.project + ":/d/*.txt", self.project + ":/e/*.bam"]
+        results = self.resolve(paths)
+        self.assertEqual(sorted(call["folder"] for call in self.find_calls), ["/d", "/e"])
+        self.assertTrue(all(call["name_mode"] == "glob" for call in self.find_calls))
+        self.assertEqual(results[paths[1]]["name"]["id"], "file-%024d" % 2)
+
+    @unittest.skipUnless(testutil.TEST_BENCHMARKS, 'skipping benchmark')
+    def test_benchmark_many_patterns(self):
+        # 200 patterns in 20 folders, with 50 ms of simulated API latency
+        self.latency = 0.05
+        paths = ["{}:/f{}/{}*{}".format(self.project, i % 20, "abcn"[i % 4], "?" * (i // 20)) for i in range(200)]
+        start = time.time()
+        results = self.resolve(paths)
+        elapsed = time.time() - start
+        print("Resolved {} glob patterns with {} findDataObjects calls in {:.2f}s".format(
+            len(paths), len(self.find_calls), elapsed))
+        self.assertEqual(len(results), len(paths))
+        self.assertEqual(len(self.find_calls), 20)
+        self.assertLess(elapsed, 20 * self.latency)
+
+
+class TestResolveMultipleInputs(unittest.TestCase):
+    project = "project-" + "0" * 24
+
+    def test_ids_described_in_bulk(self):
+        file_ids = ["file-%024d" % i for i in range(3)]
+        paths = file_ids + [self.project + ":/d/x.txt", file_ids[0]]
+
+        def describe_data_objects(input_params):
+            self.assertEqual([obj["id"] for obj in input_params["objects"]], file_ids)
+            self.assertTrue(all(obj["project"] == self.project for obj in input_params["objects"][1:]))
+            # The first object cannot be described with the project hint
+            return {"results": [{"error": "ResourceNotFound"}] +
+                               [{"describe": {"id": obj["id"], "class": "file"}} for obj in input_params["objects"][1:]]}
+
+        with patch("dxpy.WORKSPACE_ID", self.project), \
+             patch("dxpy.utils.resolver.get_resolution_cache", return_value=None), \
+             patch("dxpy.api.system_describe_data_objects", side_effect=describe_data_objects) as bulk_describe, \
+             patch("dxpy.DXHTTPRequest", return_value={"id": file_ids[0], "class": "file"}) as describe, \
+             patch("dxpy.resolve_data_objects", return_value=[[{"project": self.project, "id": "file-" + "9" * 24}]]):
+            results = resolver.resolve_multiple_existing_paths(paths)
+        self.assertEqual(bulk_describe.call_count, 1)
+        self.assertEqual(describe.call_count, 1)
+        self.assertEqual(describe.call_args[0][0], "/" + file_ids[0] + "/describe")
+        for file_id in file_ids:
+            self.assertEqual(results[file_id]["name"], {"id": file_id, "describe": {"id": file_id, "class": "file"}})
+        self.assertEqual(results[paths[3]]["name"], {"project": self.project, "id": "file-" + "9" * 24})
+
+    @unittest.skipUnless(testutil.TEST_BENCHMARKS, 'skipping benchmark')
+    def test_benchmark_dx_run_500_inputs(self):
+        # dx run with 500 file inputs (250 IDs, 200 names and 50 glob patterns)
+        # against the mock API server, with 50 ms of latency per request
+        try:
+            import flask
+        except ImportError:
+            self.skipTest("the mock API server requires flask")
+        port = 5000 + os.getpid() % 1000
+        mock_api_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_api")
+        server = subprocess.Popen([sys.executable, "api.py", "--port", str(port), "--latency", "0.05"],
+                                  cwd=mock_api_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        conf_dir = tempfile.mkdtemp()
+        try:
+            env = dict(os.environ, DX_APISERVER_HOST="localhost", DX_APISERVER_PORT=str(port),
+                       DX_APISERVER_PROTOCOL="http", DX_PROJECT_CONTEXT_ID="project-0123456789ABCDEF01234567",
+                       DX_CLI_WD="/", DX_USER_CONF_DIR=conf_dir,
+                       DX_SECURITY_CONTEXT=json.dumps({"auth_token": "x", "auth_token_type": "Bearer"}))
+            env.pop("DX_JOB_ID", None)
+            inputs = (["-ireads=file-%024d" % i for i in range(250)] +
+                      ["-ireads=/data/sample_%d.fastq" % i for i in range(1, 201)] +
+                      ["-ireads=/data/glob_%d_*.fastq" % i for i in range(1, 51)])
+            server_url = "http://localhost:%d" % port
+            for _ in range(50):
+                try:
+                    count_before = requests.post(server_url + "/system/requestCount", json={}).json()["count"]
+                    break
+                except requests.exceptions.ConnectionError:
+                    time.sleep(0.1)
+            start = time.time()
+            output = subprocess.check_output([sys.executable, "-m", "dxpy.scripts.dx", "run",
+                                              "applet-0123456789ABCDEF01234567", "--yes", "--brief"] + inputs,
+                                             env=env)
+            elapsed = time.time() - start
+            num_requests = requests.post(server_url + "/system/requestCount", json={}).json()["count"] - count_before - 1
+            print("dx run with {} inputs: {} API requests in {:.2f}s".format(len(inputs), num_requests, elapsed))
+            self.assertEqual(output.strip(), b"job-0123456789ABCDEF01234567")
+            self.assertLess(num_requests, 20)
+        finally:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(conf_dir)
+
+
+class TestResolutionCache(unittest.TestCase):
+    project = "project-" + "0" * 24
+    file_id = "file-" + "1" * 24
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = DXResolutionCache(os.path.join(self.tempdir, "resolution_cache.json"), ttl=30)
+        resolver.cached_project_names.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        resolver.cached_project_names.clear()
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get(self.project, "/a", "x.txt"))
+        self.cache.set(self.project, "/a", "x.txt", {"project": self.project, "id": self.file_id})
+        # Entries are only written to the file when the cache is flushed
+        self.assertFalse(os.path.exists(self.cache.path))
+        self.cache.flush()
+        # A new instance reads the entries back from the file
+        cache = DXResolutionCache(self.cache.path, ttl=30)
+        self.assertEqual(cache.get(self.project, "/a", "x.txt"), {"project": self.project, "id": self.file_id})
+        self.assertIsNone(cache.get(self.project, "/b", "x.txt"))
+        cache.discard(self.project, "/a", "x.txt")
+        cache.flush()
+        self.assertIsNone(DXResolutionCache(self.cache.path).get(self.project, "/a", "x.txt"))
+
+    def test_written_once_per_command(self):
+        inputs = [self.project + ":/a/x%d.txt" % i for i in range(50)]
+        results = [[{"project": self.project, "id": "file-%024d" % i}] for i in range(50)]
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=self.cache), \
+             patch("dxpy.utils.resolution_cache._cache", self.cache), \
+             patch("dxpy.resolve_data_objects", return_value=results), \
+             patch.object(self.cache, "_save", wraps=self.cache._save) as save:
+            resolver.resolve_multiple_existing_paths(inputs)
+            self.assertEqual(save.call_count, 0)
+            flush_resolution_cache()
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(DXResolutionCache(self.cache.path).get(self.project, "/a", "x7.txt", "either"),
+                         {"project": self.project, "id": "file-%024d" % 7})
+
+    def test_multiple_paths_check_cached_objects(self):
+        for name in ("x.txt", "y.txt"):
+            self.cache.set(self.project, "/a", name, {"project": self.project, "id": self.file_id}, "either")
+        described = {"results": [{"describe": {"id": self.file_id, "name": "x.txt", "folder": "/a"}}] * 2}
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=self.cache), \
+             patch("dxpy.api.system_describe_data_objects", return_value=described) as describe, \
+             patch("dxpy.resolve_data_objects", return_value=[[]]) as resolve_data_objects, \
+             patch("dxpy.utils.resolver._resolve_folder", side_effect=resolver.ResolutionError("not found")):
+            resolved = resolver.resolve_multiple_existing_paths([self.project + ":/a/x.txt", self.project + ":/a/y.txt"])
+        # Both cached objects are checked with a single call
+        self.assertEqual(describe.call_count, 1)
+        self.assertEqual(resolved[self.project + ":/a/x.txt"]["name"], {"project": self.project, "id": self.file_id})
+        # The object cached for y.txt is now named x.txt, so y.txt is resolved again
+        self.assertEqual(resolve_data_objects.call_args[0][0], [{"project": self.project, "folder": "/a",
+                                                                 "name": "y.txt"}])
+        self.assertIsNone(resolved[self.project + ":/a/y.txt"]["name"])
+        self.assertIsNone(self.cache.get(self.project, "/a", "y.txt", "either"))
+
+    def test_expiry_and_context(self):
+        self.cache.set("proj", None, None, self.project)
+        self.cache.flush()
+        with patch("time.time", return_value=time.time() + 31):
+            self.assertIsNone(self.cache.get("proj", None, None))
+        with patch("dxpy.SECURITY_CONTEXT", {"auth_token": "other", "auth_token_type": "Bearer"}):
+            self.assertIsNone(DXResolutionCache(self.cache.path).get("proj", None, None))
+
+    def test_resolver_uses_cache(self):
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=self.cache), \
+             patch("dxpy.find_projects", return_value=iter([{"id": self.project}])) as find_projects:
+            self.assertEqual(resolver.resolve_container_id_or_name("proj"), self.project)
+            resolver.cached_project_names.clear()
+            self.assertEqual(resolver.resolve_container_id_or_name("proj"), self.project)
+        self.assertEqual(find_projects.call_count, 1)
+
+        found = [{"project": self.project, "id": self.file_id}]
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=self.cache), \
+             patch("dxpy.find_data_objects", return_value=iter(found)) as find_data_objects:
+            for _ in range(2):
+                self.assertEqual(resolver.resolve_existing_path(self.project + ":/a/x.txt", describe=False),
+                                 (self.project, None, found[0]))
+        self.assertEqual(find_data_objects.call_count, 1)
+
+        # A cached object that has been renamed is resolved again
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=self.cache), \
+             patch("dxpy.DXHTTPRequest", return_value={"name": "y.txt", "folder": "/a"}), \
+             patch("dxpy.find_data_objects", return_value=iter([])), \
+             patch("dxpy.utils.resolver._resolve_folder", return_value="/a/x.txt"):
+            self.assertEqual(resolver.resolve_existing_path(self.project + ":/a/x.txt"),
+                             (self.project, "/a/x.txt", None))
+        self.assertIsNone(self.cache.get(self.project, "/a", "x.txt", "either"))
+
+    def test_invalidated_after_rename(self):
+        from dxpy.scripts import dx
+        found = [{"project": self.project, "id": self.file_id,
+                  "describe": {"id": self.file_id, "project": self.project, "class": "file", "name": "old.txt",
+                               "folder": "/a"}}]
+        args = argparse.Namespace(path=self.project + ":/a/old.txt", all=False, name="new.txt")
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=self.cache), \
+             patch("dxpy.config.get_session_conf_dir", return_value=self.tempdir), \
+             patch("dxpy.find_data_objects", return_value=iter(found)), \
+             patch("dxpy.DXHTTPRequest", return_value={}) as request:
+            dx.rename(args)
+        self.assertEqual(request.call_args[0], ("/" + self.file_id + "/rename", {"project": self.project, "name": "new.txt"}))
+
+        # The resolution made by the command itself is not kept for the next command
+        cache = DXResolutionCache(self.cache.path, ttl=30)
+        with patch("dxpy.utils.resolver.get_resolution_cache", return_value=cache), \
+             patch("dxpy.resolve_data_objects", return_value=[[]]) as resolve_data_objects, \
+             patch("dxpy.utils.resolver._resolve_folder", side_effect=resolver.ResolutionError("not found")):
+            resolved = resolver.resolve_multiple_existing_paths([self.project + ":/a/old.txt"])
+        self.assertEqual(resolve_data_objects.call_count, 1)
+        self.assertIsNone(resolved[self.project + ":/a/old.txt"]["name"])
+
+
+class TestCompletionCache(unittest.TestCase):
+    project = "project-" + "0" * 24
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = DXCompletionCache(os.path.join(self.tempdir, "completion_cache"), ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_stale_while_revalidate(self):
+        fetch = lambda: ["a"]
+        with patch("subprocess.Popen") as popen:
+            self.assertEqual(self.cache.get(["apps"], fetch), ["a"])
+            # Fresh entries are returned without fetching
+            self.assertEqual(self.cache.get(["apps"], lambda: self.fail("fetched")), ["a"])
+            self.assertEqual(popen.call_count, 0)
+            # Stale entries are returned and refreshed in the background, once
+            with patch("time.time", return_value=time.time() + 61):
+                self.assertEqual(self.cache.get(["apps"], lambda: self.fail("fetched")), ["a"])
+                self.assertEqual(self.cache.get(["apps"], lambda: self.fail("fetched")), ["a"])
+            self.assertEqual(popen.call_count, 1)
+            self.assertEqual(popen.call_args[0][0][-2:], ["refresh", "apps"])
+            # Entries older than a day are fetched again
+            with patch("time.time", return_value=time.time() + 2 * 24 * 60 * 60):
+                self.assertEqual(self.cache.get(["apps"], lambda: ["b"]), ["b"])
+
+    def test_refresh_after_invalidation(self):
+        self.cache.refresh(["apps"], lambda: ["a"], only_if_cached=True)
+        self.assertEqual(self.cache.get(["apps"], lambda: ["b"]), ["b"])
+        self.cache.refresh(["apps"], lambda: ["c"], only_if_cached=True)
+        self.assertEqual(self.cache.get(["apps"], lambda: ["d"]), ["c"])
+
+    def test_detached_refresh(self):
+        # The refresh runs in a new session with no session configuration
+        # directory, against a local API server
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                body = json.dumps({"results": [{"id": "app-" + "1" * 24, "describe": {"name": "bwa", "installed": True}}],
+                                   "next": None}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            self.cache.refresh(["apps"], lambda: [])
+            with patch("dxpy.APISERVER_PROTOCOL", "http"), patch("dxpy.APISERVER_HOST", "127.0.0.1"), \
+                 patch("dxpy.APISERVER_PORT", server.server_address[1]), \
+                 patch("dxpy.APISERVER", "http://127.0.0.1:%d" % server.server_address[1]), \
+                 patch("dxpy.SECURITY_CONTEXT", {"auth_token": "token", "auth_token_type": "Bearer"}):
+                env = dict(os.environ, DX_USER_CONF_DIR=os.path.join(self.tempdir, "conf"), **self.cache._get_refresh_env())
+                cache = DXCompletionCache(self.cache.path, ttl=60)
+            subprocess.check_call([sys.executable, "-m", "dxpy.utils.completion_cache", "refresh", "apps"], env=env,
+                                  start_new_session=True, timeout=60)
+        finally:
+            server.shutdown()
+            thread.join()
+        self.assertEqual(cache._read(["apps"])["value"], [{"name": "bwa", "installed": True}])
+
+    def test_completer_uses_cache(self):
+        listing = {"folders": ["/data/raw", "/data/results"],
+                   "objects": [{"describe": {"name": "reads.fastq", "class": "file", "types": [], "hidden": False}},
+                               {"describe": {"name": "reads.idx", "class": "file", "types": ["Index"], "hidden": True}},
+                               {"describe": {"name": "reads_app", "class": "applet", "types": [], "hidden": False}}]}
+        dxproj = dxpy.DXProject(self.project)
+        with patch("dxpy.utils.completion_cache.get_completion_cache", return_value=self.cache), \
+             patch("dxpy.api.project_list_folder", return_value={"folders": ["/data/raw"]}) as list_folder, \
+             patch("dxpy.find_data_objects", return_value=iter([{"describe": {"name": "reads.fastq"}}])) as find, \
+             patch("subprocess.Popen") as popen:
+            # A folder that is not cached yet is completed with the bounded
+            # queries, and fetched in the background once
+            self.assertEqual(completer.get_folder_matches("data/r", 4, dxproj, "/data"), ["data/raw/"])
+            self.assertEqual(completer.get_data_matches("data/rea", 4, dxproj, "/data"), ["data/reads.fastq"])
+        self.assertEqual(list_folder.call_count, 1)
+        self.assertEqual(list_folder.call_args[0][1]["only"], "folders")
+        self.assertEqual(find.call_args[1]["limit"], 100)
+        self.assertEqual(popen.call_count, 1)
+        self.assertEqual(popen.call_args[0][0][-4:], ["refresh", "folder", self.project, "/data"])
+
+        with patch("dxpy.api.project_list_folder", return_value=listing), \
+             patch.dict(os.environ, {"DX_COMPLETION_CACHE_DIR": self.cache.path}):
+            completion_cache.main(["refresh", "folder", self.project, "/data"])
+        with patch("dxpy.utils.completion_cache.get_completion_cache", return_value=self.cache), \
+             patch("dxpy.api.project_list_folder", side_effect=AssertionError) as list_folder, \
+             patch("dxpy.find_data_objects", side_effect=AssertionError):
+            self.assertEqual(completer.get_folder_matches("data/r", 4, dxproj, "/data"), ["data/raw/", "data/results/"])
+            self.assertEqual(completer.get_data_matches("data/rea", 4, dxproj, "/data"),
+                             ["data/reads.fastq", "data/reads.idx", "data/reads_app"])
+            self.assertEqual(completer.get_data_matches("data/rea", 4, dxproj, "/data", classname="file",
+                                                        visibility="visible"), ["data/reads.fastq"])
+            self.assertEqual(completer.get_data_matches("data/", 4, dxproj, "/data", typespec="Index"), [])
+
+    def test_invalidated_once_the_command_has_run(self):
+        from dxpy.scripts import dx
+        self.cache.refresh(["apps"], lambda: ["a"])
+        with patch("dxpy.config.get_session_conf_dir", return_value=self.tempdir), \
+             patch("dxpy.api.project_new_folder",
+                   side_effect=lambda *args, **kwargs: self.cache.refresh(["apps"], lambda: ["b"])):
+            code, _stdout, _stderr = run_dx("mkdir", self.project + ":/a")
+        self.assertEqual(code, 0)
+        # The entry cached while the command ran is dropped too
+        self.assertIsNone(self.cache._read(["apps"]))
+
+
+class TestJobLogStreamClient(unittest.TestCase):
+    job_ids = ["job-%024d" % i for i in range(3)]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def get_message(self, job_id, msg, level="STDOUT"):
+        return json.dumps({"timestamp": 1575465039481, "source": "APP", "level": level, "job": job_id, "line": 1,
+                           "msg": msg})
+
+    def test_log_message_filter(self):
+        message_filter = job_log_client.LogMessageFilter(levels=["STDOUT"], pattern="^keep", exclude_pattern="not")
+        self.assertTrue(message_filter({"level": "STDOUT", "msg": "keep this"}))
+        self.assertFalse(message_filter({"level": "STDERR", "msg": "keep this"}))
+        self.assertFalse(message_filter({"level": "STDOUT", "msg": "drop this"}))
+        self.assertFalse(message_filter({"level": "STDOUT", "msg": "keep, or not"}))
+
+    def test_async_describe_and_buffered_output(self):
+        stream = io.StringIO()
+        writer = job_log_client.BufferedLogWriter(stream, flush_interval=None)
+        client = job_log_client.DXJobLogStreamClient(
+            self.job_ids[0], msg_output_format="{job} {msg}", output=writer, async_describe=True,
+            message_filter=job_log_client.LogMessageFilter(pattern="keep"))
+        client._app = Mock()
+        describe_executions = lambda job_ids: [{"id": job_id} for job_id in job_ids]
+        with patch("dxpy.describe_executions", side_effect=describe_executions) as describe, \
+             patch("dxpy.api.job_describe") as job_describe, \
+             patch.object(job_log_client, "get_find_executions_string",
+                          side_effect=lambda desc, **kwargs: "info " + desc["id"]):
+            client.received_message(self.get_message(self.job_ids[0], "keep 1"))
+            client.received_message(self.get_message(self.job_ids[1], "drop 2"))
+            client.received_message(self.get_message(self.job_ids[1], "keep 3"))
+            # Nothing is written until the buffer is full or flushed
+            self.assertEqual(stream.getvalue(), "")
+            client._describer.close()
+            client.received_message(self.get_message(self.job_ids[0], "keep 4"))
+            client.received_message(json.dumps({"source": "SYSTEM", "msg": "END_LOG", "job": self.job_ids[0]}))
+            client.closed()
+            self.assertFalse(client._app.keep_running)
+            self.assertEqual(job_describe.call_count, 0)
+            # One call for the new jobs, and one for the final status of all the jobs
+            self.assertEqual([call[0][0] for call in describe.call_args_list], [self.job_ids[:2], self.job_ids[:2]])
+        self.assertEqual(stream.getvalue().splitlines(),
+                         [self.job_ids[0] + " keep 1", self.job_ids[1] + " keep 3",
+                          "info " + self.job_ids[0], "info " + self.job_ids[1], self.job_ids[0] + " keep 4",
+                          "info " + self.job_ids[0], "info " + self.job_ids[1]])
+
+    def test_final_status_skips_jobs_that_cannot_be_described(self):
+        stream = io.StringIO()
+        client = job_log_client.DXJobLogStreamClient(
+            self.job_ids[0], output=job_log_client.BufferedLogWriter(stream, flush_interval=None))
+        client._app = Mock()
+        client.seen_jobs = {job_id: {} for job_id in self.job_ids}
+
+        def job_describe(job_id, input_params):
+            if job_id == self.job_ids[1]:
+                raise dxpy.exceptions.ResourceNotFound({"error": {"type": "ResourceNotFound", "message": "m"}}, 404)
+            return {"id": job_id, "state": "done"}
+
+        with patch("dxpy.describe_executions", side_effect=dxpy.exceptions.DXError("cannot describe")), \
+             patch("dxpy.api.job_describe", side_effect=job_describe), \
+             patch.object(job_log_client, "get_find_executions_string",
+                          side_effect=lambda desc, **kwargs: "info " + desc["id"]):
+            client.closed()
+        client.output.flush()
+        self.assertEqual(stream.getvalue().splitlines(), ["info " + self.job_ids[0], "info " + self.job_ids[2]])
+
+    def watch(self, *argv):
+        clients = []
+
+        def connect(client):
+            clients.append(client)
+            client._app = Mock()
+            client.received_message(self.get_message(client.job_id, "hello"))
+            client.closed()
+
+        with patch("dxpy.describe", return_value={"state": "done"}), \
+             patch("dxpy.api.job_describe", return_value={"state": "done"}), \
+             patch.object(job_log_client.DXJobLogStreamClient, "connect", connect):
+            code, stdout, stderr = run_dx("watch", "-q", "--no-job-info", self.job_ids[0], *argv)
+        return code, stdout, stderr, clients
+
+    def test_watch_fast_and_output(self):
+        code, stdout, stderr, clients = self.watch("--fast", "--format", "{job} {msg}")
+        self.assertEqual(code, 0, stderr)
+        self.assertTrue(clients[0].async_describe)
+        # The buffered output is flushed once the stream is closed
+        self.assertEqual(stdout, self.job_ids[0] + " hello\n")
+
+        path = os.path.join(self.tempdir, "job.log.gz")
+        code, stdout, _stderr, clients = self.watch("--output", path, "--output-max-size", "1", "--format", "{msg}")
+        self.assertEqual(code, 0)
+        self.assertFalse(clients[0].async_describe)
+        self.assertEqual(stdout, "")
+        import gzip
+        with gzip.open(path, "rt") as fd:
+            self.assertEqual(fd.read(), "hello\n")
+
+        code, _stdout, stderr = run_dx("watch", self.job_ids[0], "--metrics", "top", "--fast")
+        self.assertEqual(code, 3)
+        self.assertIn("Can not specify both '--metrics top' and '--fast'", stderr)
+
+    def test_watch_dump_dir(self):
+        dump_dir = os.path.join(self.tempdir, "logs")
+        with patch("dxpy.describe", return_value={"state": "done"}), \
+             patch.object(job_log_client, "dump_execution_logs",
+                          return_value=({self.job_ids[0]: "p"}, {self.job_ids[1]: "ResourceNotFound"})) as dump:
+            code, _stdout, stderr = run_dx("watch", self.job_ids[0], "--dump-dir", dump_dir, "--levels", "STDERR")
+        self.assertEqual(code, 3)
+        self.assertEqual(dump.call_args[0], (self.job_ids[0], dump_dir))
+        self.assertEqual(dump.call_args[1]["input_params"], {"levels": ["STDERR"], "metricsFormat": "text"})
+        self.assertIn("Saved the logs of 1 job(s)", stderr)
+        self.assertIn("Could not save the logs of %s: ResourceNotFound" % self.job_ids[1], stderr)
+
+        code, _stdout, stderr = run_dx("watch", self.job_ids[0], "--dump-dir", dump_dir, "--no-wait")
+        self.assertEqual(code, 3)
+        self.assertIn("Can not specify both '--dump-dir' and '--no-wait'", stderr)
+
+    def test_rotating_log_file(self):
+        import gzip
+        path = os.path.join(self.tempdir, "job.log.gz")
+        log_file = job_log_client.RotatingLogFile(path, max_bytes=10)
+        writer = job_log_client.BufferedLogWriter(log_file, buffer_size=1, flush_interval=None, close_stream=True)
+        for line in ["first line", "second line", "third"]:
+            writer.write_line(line)
+        writer.close()
+        self.assertEqual(log_file.paths, [path, os.path.join(self.tempdir, "job.1.log.gz"),
+                                          os.path.join(self.tempdir, "job.2.log.gz")])
+        with gzip.open(log_file.paths[1], "rt") as fd:
+            self.assertEqual(fd.read(), "second line\n")
+
+    def test_dump_execution_logs(self):
+        def connect(client):
+            client._app = Mock()
+            client.received_message(self.get_message(client.job_id, "hello from " + client.job_id))
+            client.received_message(self.get_message(client.job_id, "debug", level="DEBUG"))
+            client.closed()
+
+        with patch.object(job_log_client, "get_execution_tree_job_ids", return_value=self.job_ids), \
+             patch.object(job_log_client.DXJobLogStreamClient, "connect", connect):
+            paths, failures = job_log_client.dump_execution_logs(
+                self.job_ids[0], os.path.join(self.tempdir, "logs"), msg_output_format="{level} {msg}",
+                message_filter=job_log_client.LogMessageFilter(levels=["STDOUT"]))
+        self.assertEqual(failures, {})
+        self.assertEqual(sorted(paths), self.job_ids)
+        for job_id in self.job_ids:
+            with open(paths[job_id]) as fd:
+                self.assertEqual(fd.read(), "STDOUT hello from %s\n" % job_id)
+
+    def test_get_execution_tree_job_ids(self):
+        root, child, grandchild, other = ["job-%024d" % i for i in range(4)]
+        analysis = "analysis-" + "0" * 24
+        results = [{"id": child, "describe": {"parentJob": root}},
+                   {"id": grandchild, "describe": {"parentJob": None, "parentAnalysis": analysis}},
+                   {"id": analysis, "describe": {"parentJob": child}},
+                   {"id": other, "describe": {"parentJob": None}},
+                   {"id": root, "describe": {"parentJob": None}}]
+        with patch("dxpy.api.job_describe", return_value={"rootExecution": other}), \
+             patch("dxpy.find_executions", return_value=results):
+            self.assertEqual(job_log_client.get_execution_tree_job_ids(child), [child, grandchild])
+            self.assertEqual(sorted(job_log_client.get_execution_tree_job_ids(root)), [root, child, grandchild])
+
+
+class TestDescriptorCache(unittest.TestCase):
+    file_ids = ["file-%024d" % i for i in range(3)]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = descriptor_cache.DXDescriptorCache(os.path.join(self.tempdir, "descriptors"))
+        descriptor_cache._memoized.clear()
+
+    def tearDown(self):
+        descriptor_cache._memoized.clear()
+        shutil.rmtree(self.tempdir)
+
+    def get_content(self, name):
+        import gzip
+        return gzip.compress(json.dumps({"name": name, "assays": [], "model": {"entities": {}}}).encode("utf-8"))
+
+    def test_get_dataset_descriptor(self):
+        with patch.object(descriptor_cache, "get_descriptor_cache", return_value=self.cache), \
+             patch("dxpy.DXFile") as dxfile:
+            dxfile.return_value.read.return_value = self.get_content("ds")
+            descriptor = descriptor_cache.get_dataset_descriptor(self.file_ids[0], project="project-" + "0" * 24)
+            self.assertEqual(list(descriptor.keys()), ["name", "assays", "model"])
+            self.assertIsInstance(descriptor["model"], collections.OrderedDict)
+            # Memoized within the process
+            self.assertIs(descriptor_cache.get_dataset_descriptor(self.file_ids[0]), descriptor)
+            # Loaded from disk in a new process
+            descriptor_cache._memoized.clear()
+            self.assertEqual(descriptor_cache.get_dataset_descriptor(self.file_ids[0]), descriptor)
+            self.assertEqual(dxfile.call_count, 1)
+
+    def test_eviction(self):
+        with patch("dxpy.DXFile") as dxfile:
+            for i, file_id in enumerate(self.file_ids):
+                dxfile.return_value.read.return_value = self.get_content("ds%d" % i)
+                self.cache.put(file_id, descriptor_cache.parse_descriptor(dxfile.return_value.read()))
+                os.utime(self.cache._get_filename(file_id), (i, i))
+        self.assertEqual(self.cache.get(self.file_ids[0])["name"], "ds0")
+        entry_size = os.path.getsize(self.cache._get_filename(self.file_ids[0]))
+        # The least recently used entry (ds1) is removed first
+        self.cache.max_bytes = 2 * entry_size
+        self.cache._evict()
+        self.assertIsNone(self.cache.get(self.file_ids[1]))
+        self.assertEqual(self.cache.get(self.file_ids[2])["name"], "ds2")
+
+
+class TestResultCache(unittest.TestCase):
+    record_id = "record-" + "0" * 24
+    resource_url = "https://vizserver/data/3.0/{}/raw".format(record_id)
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = result_cache.DXResultCache(os.path.join(self.tempdir, "results"), ttl=60)
+        result_cache._descriptors.clear()
+        result_cache._descriptors[self.record_id] = {"$dnanexus_link": "file-" + "0" * 24}
+
+    def tearDown(self):
+        result_cache._descriptors.clear()
+        shutil.rmtree(self.tempdir)
+
+    def stream_results(self, payload, body):
+        from dxpy.bindings.apollo.vizclient import stream_results
+        response = Mock()
+        response.stream.return_value = iter([body[i:i + 5] for i in range(0, len(body), 5)])
+        with patch("dxpy.bindings.apollo.vizclient.get_result_cache", return_value=self.cache), \
+             patch("dxpy.DXHTTPRequest", return_value=response) as request:
+            stream = stream_results(self.resource_url, payload)
+            return list(stream), stream.members, request.call_count
+
+    def test_stream_results(self):
+        body = b'{"results": [{"a": 1}, {"a": 2.5}]}'
+        self.assertEqual(self.stream_results({"fields": ["a"]}, body), ([{"a": 1}, {"a": 2.5}], {}, 1))
+        # Answered from the cache, also when the keys of the payload are in a different order
+        self.assertEqual(self.stream_results({"fields": ["a"]}, b'{"results": []}'), ([{"a": 1}, {"a": 2.5}], {}, 0))
+        self.assertEqual(self.stream_results({"fields": ["b"]}, b'{"results": []}'), ([], {}, 1))
+        # A new version of the dataset
+        result_cache._descriptors[self.record_id] = {"$dnanexus_link": "file-" + "1" * 24}
+        self.assertEqual(self.stream_results({"fields": ["a"]}, b'{"results": []}'), ([], {}, 1))
+
+    def test_errors_are_not_cached(self):
+        error = {"type": "QueryTimeOut", "message": "m"}
+        self.assertEqual(self.stream_results({}, json.dumps({"error": error}).encode()), ([], {"error": error}, 1))
+        self.assertEqual(os.listdir(self.cache.path), [])
+        self.assertEqual(self.stream_results({}, b'{"results": [1]}'), ([1], {}, 1))
+
+    def test_partial_responses_are_not_cached(self):
+        from dxpy.bindings.apollo.vizclient import stream_results
+        response = Mock()
+        response.stream.return_value = iter([b'{"results": [1, ', b'2, 3]}'])
+        with patch("dxpy.bindings.apollo.vizclient.get_result_cache", return_value=self.cache), \
+             patch("dxpy.DXHTTPRequest", return_value=response):
+            stream = stream_results(self.resource_url, {})
+            self.assertEqual(next(iter(stream)), 1)
+            del stream
+        self.assertEqual(os.listdir(self.cache.path), [])
+
+    def test_expiry_and_eviction(self):
+        keys = [self.cache.get_key(self.resource_url, {"i": i}) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.assertEqual(list(self.cache.tee(key, [b"x" * 100])), [b"x" * 100])
+            os.utime(self.cache._get_filename(key), (time.time() - 30 + i, time.time() - 30 + i))
+        self.assertEqual(b"".join(self.cache.get(keys[0])), b"x" * 100)
+        # The oldest entries are removed first
+        self.cache.max_bytes = 2 * os.path.getsize(self.cache._get_filename(keys[0]))
+        self.cache._evict()
+        self.assertIsNone(self.cache.get(keys[0]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+        self.cache.ttl = 10
+        self.assertIsNone(self.cache.get(keys[2]))
+        self.assertFalse(os.path.exists(self.cache._get_filename(keys[2])))
+
+    def test_disabled(self):
+        with patch.dict(os.environ, {"DX_RESULT_CACHE_TTL": "0"}):
+            self.assertIsNone(result_cache.get_result_cache())
+        with patch.dict(os.environ, {"DX_RESULT_CACHE_TTL": "600"}):
+            self.assertEqual(result_cache.get_result_cache().ttl, 600)
+        # Queries that do not refer to a dataset record are not cached
+        self.assertIsNone(self.cache.get_key("https://vizserver/data/3.0/record-x/raw", {}))
+        with patch("dxpy.api.record_describe", side_effect=dxpy.exceptions.ResourceNotFound({"error": {"type": "ResourceNotFound", "message": ""}}, 404)):
+            self.assertIsNone(self.cache.get_key(self.resource_url.replace("0", "2"), {}))
+
+
+def make_dataset_descriptor(num_entities, num_fields, num_codes, num_codings):
+    # Synthetic descriptor: even codings are flat, odd codings are two-level
+    # hierarchies, and every fourth field is coded
+    codings = collections.OrderedDict()
+    for k in range(num_codings):
+        codes = ["c{}_{}".format(k, i) for i in range(num_codes // num_codings)]
+        display = list(reversed(codes)) if k % 2 == 0 else [{codes[i]: codes[i + 1:i + 10]} for i in range(0, len(codes), 10)]
+        codings["coding_{}".format(k)] = {"display": display,
+                                          "codes_to_meanings": collections.OrderedDict((c, "m" + c) for c in codes),
+                                          "codes_to_concepts": {}}
+    entities = collections.OrderedDict()
+    for e in range(num_entities):
+        entity_name = "entity_{}".format(e)
+        fields = collections.OrderedDict()
+        for f in range(num_fields // num_entities):
+            coding = (e + f // 4) % num_codings if f % 4 == 0 else None
+            name = "field_{}".format(f)
+            fields[name] = {"name": name, "type": "integer", "coding_name": "coding_{}".format(coding) if coding is not None else None,
+                            "is_hierarchical": coding is not None and coding % 2 == 1, "concept": None, "description": None,
+                            "folder_path": ["Folder"], "is_multi_select": False, "is_sparse_coding": False, "linkout": None,
+                            "longitudinal_axis_type": None, "title": name.title(), "units": None,
+                            "mapping": {"database_name": "db", "table": entity_name, "column": name,
+                                        "database_unique_name": None, "database_id": None}}
+        entities[entity_name] = {"name": entity_name, "fields": fields, "primary_key": "field_0", "entity_title": entity_name.title()}
+    join_info = [{"joins": [{"to": "db$entity_{}$field_1".format(e), "from": "db$entity_0$field_0"}], "relationship": "many_to_one"}
+                 for e in range(1, num_entities)]
+    model = {"entities": entities, "codings": codings, "global_primary_key": {"entity": "entity_0", "field": "field_0"}}
+    descriptor = Mock(model=model, join_info=join_info)
+    return descriptor
+
+
+class TestDatasetDictionary(unittest.TestCase):
+    def setUp(self):
+        try:
+            import pandas
+        except ImportError:
+            self.skipTest("the dataset dictionary requires pandas")
+        from dxpy.cli import dataset_utilities
+        self.dataset_utilities = dataset_utilities
+        dataset_utilities.pd = pandas
+
+    def write(self, descriptor):
+        outputs = [io.StringIO() for _ in range(3)]
+        self.dataset_utilities.DXDatasetDictionary(descriptor).write(*outputs)
+        return [output.getvalue().splitlines() for output in outputs]
+
+    def test_write(self):
+        data, entities, codings = self.write(make_dataset_descriptor(2, 8, 40, 2))
+        self.assertEqual(data[0], "entity,name,type,primary_key_type,coding_name,concept,description,folder_path,"
+                                  "is_multi_select,is_sparse_coding,linkout,longitudinal_axis_type,"
+                                  "referenced_entity_field,relationship,title,units")
+        self.assertEqual(data[1], "entity_0,field_0,integer,global,coding_0,,,Folder,,,,,,,Field_0,")
+        self.assertEqual(data[6], "entity_1,field_1,integer,,,,,Folder,,,,,entity_0:field_0,many_to_one,Field_1,")
+        self.assertEqual(entities, ["entity,entity_title,entity_description,entity_label_plural,entity_label_singular",
+                                    "entity_0,Entity_0,,,", "entity_1,Entity_1,,,"])
+        self.assertEqual(codings[0], "coding_name,code,meaning,concept,display_order,parent_code")
+        # Flat codings are in the order of the codes, with their position in the display
+        self.assertEqual(codings[1:3], ["coding_0,c0_0,mc0_0,,20,", "coding_0,c0_1,mc0_1,,19,"])
+        # Hierarchies are in depth-first order
+        self.assertEqual(codings[21:24], ["coding_1,c1_0,mc1_0,,1,", "coding_1,c1_1,mc1_1,,2,c1_0",
+                                          "coding_1,c1_2,mc1_2,,3,c1_0"])
+        self.assertEqual(codings[31], "coding_1,c1_10,mc1_10,,11,")
+
+    def test_dataframes(self):
+        dictionary = self.dataset_utilities.DXDatasetDictionary(make_dataset_descriptor(2, 8, 40, 2))
+        self.assertEqual(list(dictionary.data_dictionary), ["entity_0", "entity_1"])
+        self.assertEqual(list(dictionary.coding_dictionary["coding_1"]["parent_code"][:2]), ["", "c1_0"])
+
+    @unittest.skipUnless(testutil.TEST_BENCHMARKS, 'skipping benchmark')
+    def test_benchmark_large_dictionary(self):
+        # 50 entities, 20k fields and 100k codes, including a flat coding with 50k codes
+        descriptor = make_dataset_descriptor(50, 20000, 50000, 50)
+        large_codes = ["L{}".format(i) for i in range(50000)]
+        descriptor.model["codings"]["coding_0"] = {"display": large_codes[::-1], "codes_to_concepts": {},
+                                                   "codes_to_meanings": collections.OrderedDict((c, c) for c in large_codes)}
+        start = time.time()
+        data, _, codings = self.write(descriptor)
+        elapsed = time.time() - start
+        print("Wrote the dictionary of {} fields and {} codes in {:.2f}s".format(len(data) - 1, len(codings) - 1, elapsed))
+        self.assertEqual(len(data), 20001)
+        self.assertLess(elapsed, 10)
+
+
+class TestJSONArrayStream(unittest.TestCase):
+    def get_chunks(self, doc, size, indent=None):
+        text = json.dumps(doc, indent=indent, ensure_ascii=False).encode("utf-8")
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def test_stream(self):
+        results = [{"sample_id": "s{}".format(i), "expression": i * 1.5, "gene": "\u00e9\u00e8" * i, "n": 10 ** i}
+                   for i in range(20)]
+        doc = {"meta": {"a": [1, 2]}, "results": results, "after": 12345}
+        for size in (1, 3, 7, 64, 100000):
+            for indent in (None, 2):
+                closed = []
+                stream = JSONArrayStream(self.get_chunks(doc, size, indent), on_close=lambda: closed.append(True))
+                stream.start()
+                self.assertEqual(stream.members, {"meta": {"a": [1, 2]}})
+                self.assertEqual(list(stream), results)
+                self.assertEqual(stream.members, {"meta": {"a": [1, 2]}, "after": 12345})
+                self.assertTrue(stream.found)
+                self.assertEqual(closed, [True])
+
+    def test_without_results(self):
+        stream = JSONArrayStream(self.get_chunks({"error": {"type": "QueryTimeOut"}}, 5))
+        stream.start()
+        self.assertEqual(stream.members, {"error": {"type": "QueryTimeOut"}})
+        self.assertFalse(stream.found)
+        self.assertEqual(list(stream), [])
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(JSONArrayStream([b'{"results": [{"a": 1}, {"a": ']))
+
+    def test_vizclient_stream(self):
+        from dxpy.bindings.apollo.vizclient import VizClient
+        from dxpy.cli.output_handling import write_expression_output
+        response = Mock()
+        response.stream.return_value = iter(self.get_chunks({"results": [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]}, 4))
+        errors = []
+        with patch("dxpy.DXHTTPRequest", return_value=response) as request:
+            results = VizClient("https://vizserver", "project-x", errors.append).get_data_stream({}, "record-x")
+        self.assertTrue(request.call_args[1]["want_full_response"])
+        self.assertFalse(request.call_args[1]["preload_content"])
+        output_file = os.path.join(tempfile.mkdtemp(), "out.csv")
+        try:
+            write_expression_output(output_file, ",", False, iter(results), error_handler=errors.append)
+            with open(output_file) as fd:
+                self.assertEqual(fd.read().splitlines(), ["a,b", "1,x", "2,y"])
+        finally:
+            shutil.rmtree(os.path.dirname(output_file))
+        self.assertEqual(errors, [])
+        self.assertEqual(response.release_conn.call_count, 1)
+
+        response.stream.return_value = iter([b'{"error": {"type": "DataTooLarge", "message": "m"}}'])
+        with patch("dxpy.DXHTTPRequest", return_value=response):
+            VizClient("https://vizserver", "project-x", errors.append).get_data_stream({}, "record-x")
+        self.assertEqual(len(errors), 1)
+        self.assertIn("--sql", errors[0])
+
+
+class TestStreamedOutput(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_truncated_stream(self):
+        from dxpy.cli.dataset_utilities import csv_from_json
+        from dxpy.cli.output_handling import write_typed_output
+        truncated = [b'{"results": [{"a": 1, "b": "x"}, ', b'{"a": 2, "b": "y"}, {"a": 3']
+        out_file_name = os.path.join(self.tempdir, "out.csv")
+        with self.assertRaises(ValueError):
+            csv_from_json(out_file_name=out_file_name, raw_results=JSONArrayStream(iter(truncated)),
+                          column_names=["a", "b"])
+        self.assertFalse(os.path.exists(out_file_name))
+        with self.assertRaises(ValueError):
+            write_typed_output(JSONArrayStream(iter(truncated)), ["a", "b"], "jsonl", output_file_name=out_file_name)
+        self.assertFalse(os.path.exists(out_file_name))
+
+        csv_from_json(out_file_name=out_file_name, raw_results=JSONArrayStream(iter(truncated[:1] + [b'{"a": 2}]}'])),
+                      column_names=["a", "b"])
+        with open(out_file_name) as fd:
+            self.assertEqual(fd.read(), "a,b\n1,x\n2,\n")
+
+
+class TestTypedOutput(unittest.TestCase):
+    def setUp(self):
+        try:
+            import pyarrow.ipc, pyarrow.parquet
+        except ImportError:
+            self.skipTest("the typed output formats require pyarrow")
+        self.pa = pyarrow
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def read(self, path, output_format):
+        if output_format == "parquet":
+            return self.pa.parquet.read_table(path)
+        with self.pa.ipc.open_file(path) as reader:
+            return reader.read_all()
+
+    def test_given_types(self):
+        from dxpy.cli.dataset_utilities import DXDatasetDictionary, csv_from_json
+        model = {"entities": {"patient": {"fields": {
+            "id": {"type": "integer"}, "dob": {"type": "date"}, "visit": {"type": "datetime"},
+            "tags": {"type": "string", "is_multi_select": True}, "score": {"type": "double"}}}}}
+        fields = ["patient.id", "patient.dob", "patient.visit", "patient.tags", "patient.score"]
+        column_types = DXDatasetDictionary.get_field_types(model, fields)
+        self.assertEqual(column_types["patient.tags"], "list<string>")
+        rows = [{"patient.id": 1, "patient.dob": "2001-02-03", "patient.visit": "2024-05-06T07:08:09",
+                 "patient.tags": ["a", "b"], "patient.score": 1},
+                {"patient.id": 2, "patient.dob": "2001-02-03T00:00:00", "patient.visit": "2024-05-06T07:08:09+02:00",
+                 "patient.tags": "c", "patient.score": None}]
+        for output_format in ("parquet", "arrow"):
+            path = os.path.join(self.tempdir, "out." + output_format)
+            csv_from_json(out_file_name=path, raw_results=iter(rows), column_names=fields,
+                          output_format=output_format, column_types=column_types)
+            table = self.read(path, output_format)
+            types = [field.type for field in table.schema]
+            self.assertEqual(types[:3] + types[4:], [self.pa.int64(), self.pa.date32(), self.pa.timestamp("us"),
+                                                     self.pa.float64()])
+            self.assertTrue(self.pa.types.is_list(types[3]) and types[3].value_type == self.pa.string())
+            self.assertEqual(table.column("patient.dob").to_pylist(), [datetime.date(2001, 2, 3)] * 2)
+            # Times with a UTC offset are converted to UTC
+            self.assertEqual(table.column("patient.visit").to_pylist(),
+                             [datetime.datetime(2024, 5, 6, 7, 8, 9), datetime.datetime(2024, 5, 6, 5, 8, 9)])
+            # Single values of list columns become lists of one value
+            self.assertEqual(table.column("patient.tags").to_pylist(), [["a", "b"], ["c"]])
+
+    def test_inferred_types_are_widened(self):
+        from dxpy.cli.output_handling import write_typed_output
+        # The first row group has only nulls and integers in columns that have floats and strings later
+        rows = [{"pos": i, "freq": None, "score": 1, "rsid": 7} for i in range(4)]
+        rows += [{"pos": 4, "freq": 0.5, "score": 2.5, "rsid": "rs1"}]
+        path = os.path.join(self.tempdir, "out.parquet")
+        write_typed_output(iter(rows), ["pos", "freq", "score", "rsid"], "parquet", output_file_name=path,
+                           row_group_size=2)
+        table = self.pa.parquet.read_table(path)
+        self.assertEqual([str(field.type) for field in table.schema], ["int64", "double", "double", "string"])
+        self.assertEqual(table.column("freq").to_pylist(), [None] * 4 + [0.5])
+        self.assertEqual(table.column("score").to_pylist(), [1.0] * 4 + [2.5])
+        self.assertEqual(table.column("rsid").to_pylist(), ["7"] * 4 + ["rs1"])
+        self.assertEqual(self.pa.parquet.ParquetFile(path).metadata.num_row_groups, 3)
+
+    def test_germline_output(self):
+        from dxpy.cli.dataset_utilities import csv_from_json
+        # More rows than fit in the first row group, with a column that only has values after it
+        rows = ({"allele_id": "1_%d_A_T" % i, "starting_position": i,
+                 "gnomad_alt_freq": 0.25 if i >= 65536 else None} for i in range(65540))
+        path = os.path.join(self.tempdir, "out.arrow")
+        csv_from_json(out_file_name=path, raw_results=rows, output_format="arrow",
+                      column_names=["allele_id", "starting_position", "gnomad_alt_freq"])
+        table = self.read(path, "arrow")
+        self.assertEqual([str(field.type) for field in table.schema], ["string", "int64", "double"])
+        self.assertEqual(table.num_rows, 65540)
+        self.assertEqual(table.column("gnomad_alt_freq").to_pylist()[65535:], [None, 0.25, 0.25, 0.25, 0.25])
+
+
+class TestQuerySharding(unittest.TestCase):
+    def test_split_filters(self):
+        keys = [("location",), ("annotation", "feature_id"), ("sample_id",)]
+        location = {"chromosome": "1", "starting_position": "1001", "ending_position": "9000"}
+        shards = query_sharding.split_filters({"location": [location], "sample_id": ["a", "b"]}, keys)
+        self.assertEqual([shard["location"][0]["starting_position"] for shard in shards],
+                         ["1001", "3001", "5001", "7001"])
+        self.assertEqual([shard["location"][0]["ending_position"] for shard in shards],
+                         ["3000", "5000", "7000", "9000"])
+        self.assertTrue(all(shard["sample_id"] == ["a", "b"] for shard in shards))
+        self.assertEqual(location["starting_position"], "1001")
+
+        shards = query_sharding.split_filters({"location": [location] * 5}, keys)
+        self.assertEqual([len(shard["location"]) for shard in shards], [2, 2, 1])
+
+        filters = {"annotation": {"feature_id": ["f%d" % i for i in range(10)], "feature_name": ["x"]},
+                   "sample_id": ["a", "b"]}
+        shards = query_sharding.split_filters(filters, keys)
+        self.assertEqual([shard["annotation"]["feature_id"] for shard in shards],
+                         [["f0", "f1", "f2"], ["f3", "f4", "f5"], ["f6", "f7", "f8"], ["f9"]])
+        self.assertEqual(len(filters["annotation"]["feature_id"]), 10)
+
+        small_location = {"chromosome": "1", "starting_position": "1", "ending_position": "1500"}
+        self.assertIsNone(query_sharding.split_filters({"location": [small_location], "sample_id": ["a"]}, keys))
+
+    def test_merge_results(self):
+        shards = [[{"pos": 1, "id": "a"}, {"pos": 5, "id": "b"}, {"pos": 7, "id": None}],
+                  [{"pos": 2, "id": "c"}, {"pos": 5, "id": "b"}, {"pos": 5, "id": "d"}]]
+        # Identical results are kept (results in common are skipped by run_sharded_query)
+        self.assertEqual([r["id"] for r in query_sharding.merge_results(shards, [{"pos": "asc"}])],
+                         ["a", "c", "b", "b", "d", None])
+        self.assertEqual([r["id"] for r in query_sharding.merge_results(shards)],
+                         ["a", "b", None, "c", "b", "d"])
+
+    def test_run_sharded_query(self):
+        rows = [{"pos": pos, "sample_id": sample} for pos in range(1, 100001, 500) for sample in ("s1", "s2")]
+        requests = []
+
+        def stream_results(resource_url, payload):
+            requests.append(payload)
+            location = payload["filters"]["location"][0]
+            start, end = int(location["starting_position"]), int(location["ending_position"])
+            if end - start >= 10000:
+                response = {"error": {"type": "QueryTimeOut", "message": "timed out"}}
+            else:
+                response = {"results": [row for row in rows if start <= row["pos"] <= end]}
+            stream = JSONArrayStream([json.dumps(response).encode()])
+            stream.start()
+            return stream
+
+        def build_payload(filters):
+            return {"filters": filters, "order_by": [{"pos": "asc"}, {"sample_id": "asc"}]}
+
+        filters = {"location": [{"chromosome": "1", "starting_position": "1", "ending_position": "100000"}]}
+        with patch("dxpy.bindings.apollo.query_sharding.stream_results", side_effect=stream_results):
+            results = list(query_sharding.run_sharded_query("https://vizserver", filters, build_payload,
+                                                            [("location",)]))
+            self.assertEqual(results, rows)
+            # 1 failed query, then 4 windows of 25 kbp that fail, then 16 windows that succeed, and the
+            # queries on the last position of the windows before each window
+            self.assertEqual(len(requests), 36)
+
+            with self.assertRaises(query_sharding.VizserverError):
+                query_sharding.run_sharded_query("https://vizserver", filters, build_payload, [("location",)],
+                                                 max_depth=1)
+
+    def test_results_in_common(self):
+        # Features overlapping several windows or ranges, and an identical feature in two rows
+        rows = [{"start": 1, "end": 10, "id": "a"}, {"start": 2000, "end": 5000, "id": "b"},
+                {"start": 2000, "end": 5000, "id": "b"}, {"start": 6000, "end": 6500, "id": "c"},
+                {"start": 6400, "end": 9000, "id": "d"}]
+
+        def stream_results(resource_url, payload):
+            locations = payload["filters"]["location"]
+            if len(locations) > 2 or int(locations[0]["ending_position"]) - int(locations[0]["starting_position"]) > 3000:
+                response = {"error": {"type": "DataTooLarge", "message": "too large"}}
+            else:
+                response = {"results": [row for row in rows if any(
+                    row["start"] <= int(location["ending_position"]) and row["end"] >= int(location["starting_position"])
+                    for location in locations)]}
+            stream = JSONArrayStream(iter([json.dumps(response).encode()]))
+            stream.start()
+            return stream
+
+        def build_payload(filters):
+            return {"filters": filters}
+
+        def location(start, end):
+            return {"chromosome": "1", "starting_position": start, "ending_position": end}
+
+        with patch("dxpy.bindings.apollo.query_sharding.stream_results", side_effect=stream_results):
+            results = query_sharding.run_sharded_query("https://vizserver", {"location": [location(1, 10000)]},
+                                                       build_payload, [("location",)])
+            self.assertEqual([row["id"] for row in results], ["a", "b", "b", "c", "d"])
+
+            ranges = [location(6450, 6500), location(1, 5), location(3000, 3100), location(5000, 6100),
+                      location(6000, 6100), location(8000, 8100), location(100, 200)]
+            results = query_sharding.run_sharded_query("https://vizserver", {"location": ranges},
+                                                       build_payload, [("location",)])
+            self.assertEqual(sorted(row["id"] for row in results), ["a", "b", "b", "c", "d"])
+
+
+class TestRetrieveBins(unittest.TestCase):
+    project = "project-" + "0" * 24
+    map_file_id = "file-" + "1" * 24
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = descriptor_cache.DXDescriptorCache(os.path.join(self.tempdir, "geno_bins"))
+        with open(os.path.join(self.tempdir, "manifest.json"), "w") as fd:
+            json.dump({"GRCh38.92": {"aws:us-east-1": self.map_file_id}}, fd)
+        for memo in (retrieve_bins._indexes, retrieve_bins._manifests, retrieve_bins._map_file_ids,
+                     retrieve_bins._project_regions):
+            memo.clear()
+        self.gene_map = {"ENSG%011d" % i: {"chr": str(i % 22 + 1), "start": str(i * 100), "end": str(i * 100 + 50),
+                                           "strand": "+"}
+                         for i in range(60000)}
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        for memo in (retrieve_bins._indexes, retrieve_bins._manifests, retrieve_bins._map_file_ids,
+                     retrieve_bins._project_regions):
+            memo.clear()
+
+    def retrieve(self, genes):
+        return retrieve_bins.retrieve_bins(genes, self.project, "GRCh38.92", self.tempdir, "manifest.json",
+                                           "manifest.json", "Following gene names or IDs are invalid")
+
+    def test_retrieve_bins(self):
+        genes = ["ENSG%011d" % i for i in range(0, 60000, 12)]
+        with patch.object(retrieve_bins, "get_descriptor_cache", return_value=self.cache), \
+             patch("dxpy.describe", return_value={"region": "aws:us-east-1"}) as describe, \
+             patch("dxpy.DXFile") as dxfile:
+            dxfile.return_value.read.return_value = json.dumps(self.gene_map).encode("utf-8")
+            self.assertEqual(self.retrieve(["ENSG00000000007", "ENSG00000000003"]),
+                             [{"chr": "8", "start": "700", "end": "750"}, {"chr": "4", "start": "300", "end": "350"}])
+            dxfile.assert_called_once_with(self.map_file_id, mode="rb")
+            # The index is kept in memory, so further lookups do not make any API call
+            start = time.time()
+            bins = self.retrieve(genes)
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(len(bins), 5000)
+            self.assertEqual(bins[-1], {"chr": "17", "start": "5998800", "end": "5998850"})
+            self.assertEqual(describe.call_count, 2)
+
+            with self.assertRaises(SystemExit):
+                self.retrieve(["ENSG00000000001", "unknown"])
+
+            # In a new process, the index is loaded from the on-disk cache
+            retrieve_bins._indexes.clear()
+            self.assertEqual(self.retrieve(genes), bins)
+            self.assertEqual(dxfile.call_count, 1)
+
+
+class TestFilterValidation(unittest.TestCase):
+    locations = [{"chromosome": str(i % 22 + 1), "starting_position": str(i * 100), "ending_position": str(i * 100 + 50)}
+                 for i in range(100000)]
+
+    def error_handler(self, message):
+        raise ValueError(message)
+
+    def validate(self, input_json):
+        validator = json_validation_by_schema.JSONValidator(EXTRACT_ASSAY_EXPRESSION_JSON_SCHEMA,
+                                                            error_handler=self.error_handler)
+        validator.validate(input_json)
+
+    def test_json_validator(self):
+        compiled = json_validation_by_schema.compile_schema(EXTRACT_ASSAY_EXPRESSION_JSON_SCHEMA)
+        self.assertIs(json_validation_by_schema.compile_schema(EXTRACT_ASSAY_EXPRESSION_JSON_SCHEMA), compiled)
+        self.assertEqual(set(compiled.types), {"annotation", "expression", "location", "sample_id"})
+
+        start = time.time()
+        self.validate({"location": self.locations, "sample_id": ["sample_%d" % i for i in range(100000)]})
+        self.assertLess(time.time() - start, 1)
+
+        locations = self.locations[:10] + [{"chromosome": "1", "starting_position": "1"}]
+        with self.assertRaisesRegex(ValueError, "Required key 'ending_position' was not found"):
+            self.validate({"location": locations})
+        locations[-1].update(starting_position=1, ending_position="2")
+        with self.assertRaisesRegex(ValueError, "Key 'starting_position' has an invalid type"):
+            self.validate({"location": locations})
+        with self.assertRaisesRegex(ValueError, "Expected list items to be of type string for sample_id"):
+            self.validate({"location": self.locations[:1], "sample_id": ["a", 1]})
+        with self.assertRaisesRegex(ValueError, r"Found following invalid filters: \['conflicting_keys'\]"):
+            self.validate({"location": self.locations[:1], "conflicting_keys": []})
+        with self.assertRaisesRegex(ValueError, "For annotation, exactly one of feature_name or feature_id"):
+            self.validate({"annotation": {"feature_name": ["a"], "feature_id": ["b"]}})
+        with self.assertRaisesRegex(ValueError, "When sample_id is present, one of the following keys"):
+            self.validate({"sample_id": ["a"]})
+
+    def test_json_filters_validator(self):
+        schema = EXTRACT_ASSAY_EXPRESSION_FILTERING_CONDITIONS_1_0
+        properties = schema["filtering_conditions"]["location"]["properties"]
+        item_filters = vizserver_filters_from_json_parser.compile_list_properties(properties)
+        self.assertIs(vizserver_filters_from_json_parser.compile_list_properties(properties), item_filters)
+        self.assertEqual([(key, condition) for key, _, condition, _ in item_filters],
+                         [("chromosome", "is"), (None, "genobin_partial_overlap")])
+
+        parser = vizserver_filters_from_json_parser.JSONFiltersValidator(
+            {"location": self.locations}, schema, error_handler=self.error_handler)
+        filters = parser.parse_list_v1(schema["filtering_conditions"]["location"], self.locations, properties)
+        self.assertEqual(len(filters["compound"]), 100000)
+        self.assertEqual(filters["compound"][1], {
+            "logic": "and",
+            "compound": [
+                {"filters": {"expr_annotation$chr": [{"condition": "is", "values": "2"}]}},
+                parser.build_partial_overlap_genobin_filters(properties[1], self.locations[1])
+            ]
+        })
+
+    def test_load_filter_schema(self):
+        filter_to_payload._filter_schemas.clear()
+        try:
+            with patch.object(filter_to_payload, "open", create=True, side_effect=open) as open_schema:
+                for _ in range(3):
+                    filter_to_payload.validate_JSON({"rsid": ["rs1"]}, "allele")
+                    filter_to_payload.validate_JSON({"allele_id": ["1_1_A_T"]}, "genotype")
+            self.assertEqual(open_schema.call_count, 2)
+            with self.assertRaises(SystemExit):
+                filter_to_payload.validate_JSON({"rsid": ["rs1"], "location": []}, "allele")
+        finally:
+            filter_to_payload._filter_schemas.clear()
+
+
+class TestWaitForExecutions(unittest.TestCase):
+    def make_describe(self, timelines):
+        # timelines: execution ID -> list of states, one per poll (the last one repeats)
+        self.polls = []
+
+        def describe_executions(input_params, **kwargs):
+            ids = [execution["id"] for execution in input_params["executions"]]
+            self.polls.append(ids)
+            results = []
+            for execution_id in ids:
+                timeline = timelines[execution_id]
+                state = timeline[min(len(self.polls) - 1, len(timeline) - 1)]
+                results.append({"describe": {"id": execution_id, "state": state, "failureReason": "AppError",
+                                             "failureMessage": "boom", "failureFrom": None}})
+            return {"results": results}
+        return describe_executions
+
+    def wait(self, timelines, **kwargs):
+        with patch("dxpy.api.system_describe_executions", side_effect=self.make_describe(timelines)), \
+             patch("time.sleep") as sleep:
+            try:
+                return dxpy.wait_for_executions(sorted(timelines), **kwargs)
+            finally:
+                self.sleeps = [call[0][0] for call in sleep.call_args_list]
+
+    def test_batched_polling_and_backoff(self):
+        timelines = {"job-" + str(i) * 24: ["running"] * (i + 2) + ["done"] for i in range(3)}
+        self.assertEqual(self.wait(timelines), {job_id: "done" for job_id in timelines})
+        # All pending executions are described in a single call per poll
+        self.assertEqual([len(poll) for poll in self.polls], [3, 3, 3, 2, 1])
+        # The interval grows while nothing changes and is reset when a state changes
+        self.assertEqual(self.sleeps, [2, 3.0, 2, 2])
+
+    def test_failures(self):
+        timelines = {"job-" + "1" * 24: ["running", "failed"],
+                     "job-" + "2" * 24: ["running", "running", "running", "done"]}
+        with self.assertRaisesRegex(DXJobFailureError, "job-1+ has failed because of AppError: boom"):
+            self.wait(timelines, fail_fast=True)
+        self.assertEqual(len(self.polls), 2)
+        with self.assertRaisesRegex(DXJobFailureError, "has failed"):
+            self.wait(timelines)
+        self.assertEqual(len(self.polls), 4)
+
+    def test_timeout(self):
+        with self.assertRaisesRegex(DXError, "Reached timeout") as cm:
+            self.wait({"job-" + "1" * 24: ["running"]}, timeout=0)
+        self.assertNotIsInstance(cm.exception, DXJobFailureError)
+
+
+class TestBatchRunParallel(unittest.TestCase):
+    class FakeExecutable(object):
+        def __init__(self, fail=None):
+            self.calls = []
+            self.launched = {}  # nonce -> job ID
+            self.fail = fail or {}  # batch ID -> list of errors to raise
+            self.lock = threading.Lock()
+
+        def describe(self):
+            return {"name": "exe"}
+
+        def run(self, input_json, **kwargs):
+            nonce = kwargs["extra_args"]["nonce"]
+            batch_id = kwargs["properties"]["batch-id"]
+            with self.lock:
+                self.calls.append((batch_id, nonce, kwargs["name"], kwargs.get("folder")))
+                if self.fail.get(batch_id):
+                    raise self.fail[batch_id].pop(0)
+                job_id = self.launched.setdefault(nonce, "job-%024d" % len(self.launched))
+            return dxpy.DXJob(job_id)
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tempdir, "batch.tsv.manifest.jsonl")
+        self.b_args = {"launch_args": [{"x": i} for i in range(20)], "batch_ids": ["b%d" % i for i in range(20)]}
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    @staticmethod
+    def api_error(code, error_type):
+        return dxpy.exceptions.DXAPIError({"error": {"type": error_type, "message": "error"}}, code)
+
+    def test_parallel_launch_with_retries(self):
+        executable = self.FakeExecutable(fail={"b3": [self.api_error(503, "ServiceUnavailable")],
+                                               "b5": [self.api_error(422, "InvalidInput")]})
+        with patch("time.sleep"):
+            exec_ids, failures = batch_utils.batch_run_parallel(executable, self.b_args, {"folder": "/out"},
+                                                                set_batch_folders=True, launch_jobs=4,
+                                                                manifest=self.manifest)
+        self.assertEqual(failures, [("b5", "InvalidInput: error, code 422. Request Time=, Request ID=")])
+        self.assertIsNone(exec_ids[5])
+        self.assertEqual(len(set(exec_ids)), 20)
+        # The retried row is sent again with the same nonce
+        b3_calls = [call for call in executable.calls if call[0] == "b3"]
+        self.assertEqual(len(b3_calls), 2)
+        self.assertEqual(b3_calls[0][1], b3_calls[1][1])
+        self.assertEqual(b3_calls[0][2:], ("exe-b3", "/out/b3"))
+
+        # Resuming only launches the failed row, with its recorded nonce
+        nonce = [call for call in executable.calls if call[0] == "b5"][0][1]
+        executable.calls = []
+        exec_ids2, failures = batch_utils.batch_run_parallel(executable, self.b_args, {}, launch_jobs=4,
+                                                             manifest=self.manifest)
+        self.assertEqual(failures, [])
+        self.assertEqual([call[:2] for call in executable.calls], [("b5", nonce)])
+        self.assertEqual(exec_ids2[:5], exec_ids[:5])
+        self.assertIsNotNone(exec_ids2[5])
+
+    def test_retry_budget(self):
+        executable = self.FakeExecutable(fail={"b0": [self.api_error(500, "InternalError")] * 5})
+        with patch("time.sleep"):
+            exec_ids, failures = batch_utils.batch_run_parallel(executable, self.b_args, {}, launch_jobs=2,
+                                                                retry_budget=2)
+        self.assertEqual([failure[0] for failure in failures], ["b0"])
+        self.assertEqual(len([call for call in executable.calls if call[0] == "b0"]), 3)
+
+    def test_mismatched_manifest(self):
+        with open(self.manifest, "w") as fd:
+            fd.write(json.dumps({"row": 0, "batch_id": "other", "nonce": "n"}) + "\n")
+        with self.assertRaisesRegex(DXError, "does not match"):
+            batch_utils.batch_run_parallel(self.FakeExecutable(), self.b_args, {}, manifest=self.manifest)
+
+
+class TestBulkOperations(unittest.TestCase):
+    project = "project-" + "0" * 24
+
+    def test_make_chunks(self):
+        ids = ["file-%024d" % i for i in range(25)]
+        self.assertEqual([len(chunk) for chunk in bulk_operations.make_chunks(ids, max_items=10)], [10, 10, 5])
+        # Each ID takes 32 bytes when JSON-encoded (plus a separator)
+        self.assertEqual([len(chunk) for chunk in bulk_operations.make_chunks(ids, max_bytes=100)], [3] * 8 + [1])
+        self.assertEqual(bulk_operations.make_chunks([]), [])
+
+    def test_run_in_chunks(self):
+        attempts = {}
+        unavailable = dxpy.exceptions.DXAPIError({"error": {"type": "ServiceUnavailable", "message": "m"}}, 503)
+        invalid = dxpy.exceptions.DXAPIError({"error": {"type": "InvalidInput", "message": "m"}}, 422)
+
+        def operation(chunk):
+            attempts[chunk[0]] = attempts.get(chunk[0], 0) + 1
+            if chunk[0] == 2 and attempts[chunk[0]] == 1:
+                raise unavailable
+            if chunk[0] == 4:
+                raise invalid
+            return sum(chunk)
+
+        progress = []
+        with patch("time.sleep"):
+            results, failures = bulk_operations.run_in_chunks(operation, list(range(6)), max_items=2,
+                                                              on_progress=lambda *args: progress.append(args))
+        self.assertEqual(results, [1, 5, None])
+        self.assertEqual(failures, [([4, 5], invalid)])
+        self.assertEqual(attempts, {0: 1, 2: 2, 4: 1})
+        self.assertEqual(progress, [(2, 6, 0), (4, 6, 0), (6, 6, 2)])
+
+    def test_resolve_paths(self):
+        file_id = "file-" + "1" * 24
+        paths = [self.project + ":/a/x.txt", self.project + ":" + file_id, self.project + ":/a/*.txt",
+                 self.project + ":/a/folder", self.project + ":/a/dup"]
+
+        def resolve_existing_path(path, **kwargs):
+            if path.endswith("*.txt"):
+                return self.project, None, [{"id": "file-" + "2" * 24}, {"id": "file-" + "3" * 24}]
+            if path.endswith("folder"):
+                return self.project, "/a/folder", None
+            raise resolver.ResolutionError("ambiguous")
+
+        resolved_objects = [[{"project": self.project, "id": file_id}], [],
+                            [{"project": self.project, "id": "file-" + "4" * 24},
+                             {"project": self.project, "id": "file-" + "5" * 24}]]
+        described_objects = {"results": [{"describe": {"id": file_id}}]}
+        with patch("dxpy.resolve_data_objects", return_value=resolved_objects) as resolve_data_objects, \
+             patch("dxpy.api.system_describe_data_objects", return_value=described_objects) as describe_data_objects, \
+             patch("dxpy.utils.bulk_operations.resolve_existing_path", side_effect=resolve_existing_path):
+            resolved = bulk_operations.resolve_paths(paths)
+        # The names are resolved in a batch, and the ID is checked in another
+        self.assertEqual([query["name"] for query in resolve_data_objects.call_args[0][0]], ["x.txt", "folder", "dup"])
+        self.assertEqual([query["id"] for query in describe_data_objects.call_args[0][0]["objects"]], [file_id])
+        self.assertEqual(resolved[:4], [(self.project, None, [file_id]),
+                                        (self.project, None, [file_id]),
+                                        (self.project, None, ["file-" + "2" * 24, "file-" + "3" * 24]),
+                                        (self.project, "/a/folder", None)])
+        self.assertIsInstance(resolved[4], resolver.ResolutionError)
+        with patch("dxpy.resolve_data_objects", return_value=resolved_objects), \
+             patch("dxpy.api.system_describe_data_objects", return_value=described_objects), \
+             patch("dxpy.utils.bulk_operations.resolve_existing_path", side_effect=resolve_existing_path):
+            self.assertEqual(bulk_operations.resolve_paths(paths, all_mult=True)[4],
+                             (self.project, None, ["file-" + "4" * 24, "file-" + "5" * 24]))
+            with self.assertRaisesRegex(resolver.ResolutionError, "ambiguous"):
+                bulk_operations.resolve_paths(paths, raise_errors=True)
+
+    def test_resolve_paths_nonexistent_id(self):
+        file_ids = ["file-" + "1" * 24, "file-" + "9" * 24]
+        paths = [self.project + ":" + file_id for file_id in file_ids]
+        not_found = {"error": {"type": "ResourceNotFound", "message": '"file-999999999999999999999999" is not a recognized ID'}}
+
+        def describe(path, *args, **kwargs):
+            raise dxpy.exceptions.DXAPIError(not_found, 404)
+
+        described_objects = {"results": [{"describe": {"id": file_ids[0]}},
+                                         {"statusCode": 404, "error": not_found["error"]}]}
+        with patch("dxpy.api.system_describe_data_objects", return_value=described_objects), \
+             patch("dxpy.DXHTTPRequest", side_effect=describe) as request:
+            resolved = bulk_operations.resolve_paths(paths)
+            self.assertEqual(resolved[0], (self.project, None, [file_ids[0]]))
+            # The object that was not found is resolved on its own, which reports the error
+            self.assertIsInstance(resolved[1], resolver.ResolutionError)
+            self.assertIn("is not a recognized ID", str(resolved[1]))
+            self.assertTrue(all(call[0][0] == "/" + file_ids[1] + "/describe" for call in request.call_args_list))
+            with self.assertRaises(resolver.ResolutionError):
+                bulk_operations.resolve_paths(paths, raise_errors=True)
+
+    def test_mv_is_a_single_request(self):
+        from dxpy.scripts import dx
+        file_ids = ["file-%024d" % i for i in range(2500)]
+        args = argparse.Namespace(sources=["/a", "/b/*"], destination=self.project + ":/dest", all=True,
+                                  target_file_relocation=False)
+        with patch("dxpy.scripts.dx.resolve_paths", return_value=[(self.project, "/a", None),
+                                                                   (self.project, None, file_ids)]), \
+             patch("dxpy.DXProject.list_folder", return_value={"folders": []}), \
+             patch("dxpy.api.project_move") as move:
+            dx.mv(args)
+        move.assert_called_once_with(self.project, {"objects": file_ids, "folders": ["/a"], "destination": "/dest",
+                                                    "targetFileRelocation": False})
+
+
+def run_dx(*argv):
+    """
+    Runs a dx command in-process and returns its exit code, stdout and stderr.
+    """
+    from dxpy.scripts import dx
+    args = dx.parser.parse_args(list(argv))
+    with patch("sys.stdout", new_callable=io.StringIO) as stdout, \
+         patch("sys.stderr", new_callable=io.StringIO) as stderr:
+        try:
+            args.func(args)
+        except SystemExit as e:
+            return e.code, stdout.getvalue(), stderr.getvalue()
+    return 0, stdout.getvalue(), stderr.getvalue()
+
+
+class TestArchive(unittest.TestCase):
+    project = "project-" + "0" * 24
+    file_ids = ["file-%024d" % i for i in range(2500)]
+
+    def test_chunks(self):
+        with patch("dxpy.api.project_archive", side_effect=lambda project, request: {"count": len(request["files"])}) \
+                as archive:
+            code, stdout, _stderr = run_dx("archive", "--all-copies",
+                                                *[self.project + ":" + file_id for file_id in self.file_ids])
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(len(call[0][1]["files"]) for call in archive.call_args_list), [500, 1000, 1000])
+        self.assertEqual(sorted(sum((call[0][1]["files"] for call in archive.call_args_list), [])), self.file_ids)
+        self.assertTrue(all(call[0][0] == self.project and call[0][1]["allCopies"] for call in archive.call_args_list))
+        self.assertIn("Tagged 2500 file(s) for archival in " + self.project, stdout)
+
+        with patch("dxpy.api.project_unarchive",
+                   side_effect=lambda project, request: {"files": len(request["files"]), "size": 2, "cost": 500}):
+            code, stdout, _stderr = run_dx("unarchive", *[self.project + ":" + file_id
+                                                               for file_id in self.file_ids])
+        self.assertIn("Tagged 2500 file(s) for unarchival, totalling 6 GB, costing $1.5", stdout)
+
+    def test_partial_failure_is_not_retried(self):
+        unavailable = dxpy.exceptions.DXAPIError({"error": {"type": "ServiceUnavailable", "message": "m"}}, 503)
+
+        def archive(project, request):
+            if self.file_ids[0] in request["files"]:
+                raise unavailable
+            return {"count": len(request["files"])}
+
+        with patch("dxpy.api.project_archive", side_effect=archive) as archive_mock, patch("time.sleep"):
+            code, _stdout, stderr = run_dx("archive", "-q",
+                                                *[self.project + ":" + file_id for file_id in self.file_ids])
+        self.assertEqual(code, 3)
+        # The failed chunk may have been applied in part, so it is not sent again
+        self.assertEqual(archive_mock.call_count, 3)
+        self.assertIn("1 of 3 request(s) failed", stderr)
+        self.assertIn("ServiceUnavailable", stderr)
+
+    def test_file_paths_are_resolved_relative_to_their_own_path(self):
+        resolutions = [[{"project": self.project, "id": self.file_ids[0]}],
+                       [{"project": self.project, "id": self.file_ids[1]}]]
+        with patch("dxpy.resolve_data_objects", return_value=resolutions) as resolve, \
+             patch("dxpy.api.project_archive", return_value={"count": 2}) as archive:
+            code, _stdout, _stderr = run_dx("archive", "-q", self.project + ":d1/a.txt", self.project + ":/x.txt")
+        self.assertEqual(code, 0)
+        # Each name is parsed from its own path, not from the last path given
+        self.assertEqual(resolve.call_args[0][0], [{"folder": "/", "name": "x.txt"}, {"folder": "/d1", "name": "a.txt"}])
+        self.assertEqual(sorted(archive.call_args[0][1]["files"]), self.file_ids[:2])
+
+
+class TestDescribe(unittest.TestCase):
+    project = "project-" + "0" * 24
+    file_ids = ["file-" + "1" * 24, "file-" + "2" * 24]
+    job_id = "job-" + "3" * 24
+    analysis_ids = ["analysis-" + "4" * 24, "analysis-" + "5" * 24]
+
+    def setUp(self):
+        patcher = patch.multiple("dxpy", WORKSPACE_ID=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("dxpy.utils.resolver.get_resolution_cache", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def describe_results(self, key):
+        def describe(request):
+            return {"results": [{"describe": {"id": item["id"], "class": item["id"].split("-")[0]}}
+                                for item in request[key]]}
+        return describe
+
+    def test_mixed_ids_and_paths(self):
+        found = [{"project": self.project, "id": self.file_ids[1],
+                  "describe": {"id": self.file_ids[1], "class": "file", "name": "x.txt"}}]
+        with patch("dxpy.api.system_describe_data_objects",
+                   side_effect=self.describe_results("objects")) as describe_data_objects, \
+             patch("dxpy.api.system_describe_executions",
+                   side_effect=self.describe_results("executions")) as describe_executions, \
+             patch("dxpy.api.system_describe_projects",
+                   side_effect=self.describe_results("projects")) as describe_projects, \
+             patch("dxpy.find_data_objects", return_value=iter(found)), \
+             patch("dxpy.DXHTTPRequest") as request:
+            code, stdout, _stderr = run_dx("describe", "--json", self.file_ids[0], self.project + ":/a/x.txt",
+                                           self.job_id, self.project)
+        self.assertEqual(code, 0)
+        # The IDs are described in bulk, with one call per kind of entity
+        self.assertEqual(describe_data_objects.call_count, 1)
+        self.assertEqual(describe_executions.call_count, 1)
+        self.assertEqual(describe_projects.call_count, 1)
+        request.assert_not_called()
+        # The results are in the order of the paths
+        self.assertEqual([desc["id"] for desc in json.loads(stdout)],
+                         [self.file_ids[0], self.file_ids[1], self.job_id, self.project])
+
+    def test_verbose_analyses(self):
+        def describe_executions(request):
+            default = all(item["describe"] == {} for item in request["executions"])
+            return {"results": [{"describe": {"id": item["id"], "class": "analysis",
+                                              ("stages" if default else "spotCostSavings"): 1}}
+                                for item in request["executions"]]}
+
+        with patch("dxpy.api.system_describe_executions", side_effect=describe_executions) as describe, \
+             patch("dxpy.api.analysis_describe") as analysis_describe:
+            code, stdout, _stderr = run_dx("describe", "--json", "--verbose", *self.analysis_ids)
+        self.assertEqual(code, 0)
+        # The verbose and the default descriptions are both fetched in bulk
+        self.assertEqual(describe.call_count, 2)
+        analysis_describe.assert_not_called()
+        self.assertEqual(json.loads(stdout), [{"id": analysis_id, "class": "analysis", "spotCostSavings": 1,
+                                               "stages": 1} for analysis_id in self.analysis_ids])
+
+
+class TestFindExecutionTrees(unittest.TestCase):
+    analysis_ids = ["analysis-" + "1" * 24, "analysis-" + "2" * 24]
+    job_ids = ["job-%024d" % i for i in range(5)]
+
+    def setUp(self):
+        patcher = patch.multiple("dxpy", WORKSPACE_ID=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execution_desc(self, execution_id, created, parent=None, root=None, **desc):
+        desc.update(id=execution_id, created=created, name="app", executableName="app",
+                    function="main", state="done", launchedBy="user-alice", parentJob=parent,
+                    originJob=root or execution_id, rootExecution=root or execution_id,
+                    **{"class": execution_id.split("-")[0]})
+        return desc
+
+    def run_find(self, trees, *argv):
+        def find_executions(**kwargs):
+            roots = kwargs.get("origin_job") or kwargs.get("root_execution")
+            if roots is None:
+                return iter(result for tree in trees.values() for result in tree)
+            return iter(trees[roots[0]])
+
+        with patch("dxpy.find_executions", side_effect=find_executions), \
+             patch("dxpy.describe_executions", side_effect=dxpy.exceptions.DXError("cannot describe")):
+            return run_dx(*argv)
+
+    def test_cached_stage_from_an_older_analysis(self):
+        older, newer = self.analysis_ids
+        stage = self.execution_desc(self.job_ids[0], 1001, root=older, parentAnalysis=older)
+        trees = {
+            newer: [{"id": newer, "describe": self.execution_desc(newer, 2000, stages=[{"execution": stage}])}],
+            older: [{"id": older, "describe": self.execution_desc(older, 1000, stages=[{"execution": stage}])},
+                    {"id": stage["id"], "describe": stage}],
+        }
+        code, stdout, stderr = self.run_find(trees, "find", "executions", "--all-projects")
+        self.assertEqual(code, 0, stderr)
+        # The newest tree is printed first, and the cached stage is shown in both trees
+        self.assertLess(stdout.index(newer), stdout.index(older))
+        self.assertEqual(stdout.count(stage["id"]), 2)
+
+    def test_tree_width_and_depth(self):
+        origin = self.job_ids[0]
+        children = [self.execution_desc(job_id, 1000 + i, parent=origin, root=origin)
+                    for i, job_id in enumerate(self.job_ids[1:4])]
+        grandchild = self.execution_desc(self.job_ids[4], 2000, parent=children[0]["id"], root=origin)
+        trees = {origin: [{"id": desc["id"], "describe": desc}
+                          for desc in [self.execution_desc(origin, 1000)] + children + [grandchild]]}
+
+        code, stdout, stderr = self.run_find(trees, "find", "jobs", "--all-projects", "--tree-width", "2")
+        self.assertEqual(code, 0, stderr)
+        self.assertIn("... and 1 more", stdout)
+        self.assertNotIn(children[2]["id"], stdout)
+        self.assertIn(grandchild["id"], stdout)
+
+        code, stdout, stderr = self.run_find(trees, "find", "jobs", "--all-projects", "--tree-depth", "1")
+        self.assertEqual(code, 0, stderr)
+        self.assertIn("... 1 child execution(s) not shown", stdout)
+        self.assertNotIn(grandchild["id"], stdout)
+        self.assertTrue(all(child["id"] in stdout for child in children))
+
+
 class TestNonceGeneration(unittest.TestCase):
     def test_nonce_generator(self):
         nonce_list = []
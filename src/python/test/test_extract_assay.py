@@ -21,6 +21,7 @@
 # Run manually with python2 and python3 src/python/test/test_extract_assay.py
 
 import unittest
+import heapq
 import dxpy
 import os
 import subprocess
@@ -44,7 +45,10 @@ from dxpy.dx_extract_utils.filter_to_payload import (
 from dxpy.dx_extract_utils.germline_utils import (
     filter_results,
     _produce_loci_dict,
-    infer_genotype_type
+    infer_genotype_type,
+    iter_inferred_genotypes,
+    iter_filtered_results,
+    sort_germline_variant,
 )
 from dxpy.cli.dataset_utilities import (
     DXDataset,
@@ -674,6 +678,7 @@ class TestDXExtractAssay(unittest.TestCase):
 
         output = infer_genotype_type(samples, loci, result_entries, type_to_infer)
         self.assertEqual(output, result_entries + expected_output)
+
     ##########
     # Normal Command Lines
     ##########
@@ -806,5 +811,64 @@ class TestDXExtractAssay(unittest.TestCase):
         self.assertTrue(expected_error_message in process.communicate()[1])
 
 
+class TestGermlineOutput(unittest.TestCase):
+    """Tests of the germline output helpers, which do not need the platform"""
+
+    def test_iter_inferred_genotypes_sorted(self):
+        samples = ["SAMPLE_3", "SAMPLE_1", "SAMPLE_2"]
+        loci = [
+            {"locus_id": "2_1042_G_CC", "chromosome": "2", "starting_position": 1042, "ref": "G"},
+            {"locus_id": "1_1076145_A_T", "chromosome": "1", "starting_position": 1076145, "ref": "A"},
+            {"locus_id": "1_1076145_AC_T", "chromosome": "1", "starting_position": 1076145, "ref": "AC"},
+        ]
+        result_entries = [
+            {
+                "sample_id": "SAMPLE_2",
+                "allele_id": "1_1076145_A_AT",
+                "locus_id": "1_1076145_A_T",
+                "chromosome": "1",
+                "starting_position": 1076145,
+                "ref": "A",
+                "alt": "AT",
+                "genotype_type": "het-alt",
+            },
+            {
+                "sample_id": "SAMPLE_1",
+                "allele_id": "2_1042_G_CC",
+                "locus_id": "2_1042_G_CC",
+                "chromosome": "2",
+                "starting_position": 1042,
+                "ref": "G",
+                "alt": "CC",
+                "genotype_type": "hom",
+            },
+        ]
+        inferred = list(iter_inferred_genotypes(samples, loci, result_entries, "ref", sort=True))
+        self.assertEqual(
+            [(entry["locus_id"], entry["sample_id"]) for entry in inferred],
+            [
+                ("1_1076145_A_T", "SAMPLE_1"),
+                ("1_1076145_AC_T", "SAMPLE_1"),
+                ("1_1076145_AC_T", "SAMPLE_2"),
+                ("1_1076145_A_T", "SAMPLE_3"),
+                ("1_1076145_AC_T", "SAMPLE_3"),
+                ("2_1042_G_CC", "SAMPLE_2"),
+                ("2_1042_G_CC", "SAMPLE_3"),
+            ],
+        )
+        self.assertTrue(all(entry["genotype_type"] == "ref" and entry["allele_id"] is None for entry in inferred))
+
+        # Merging the sorted results with the inferred entries gives the same output as sorting everything
+        expected_output = sorted(infer_genotype_type(samples, loci, result_entries, "ref"), key=sort_germline_variant)
+        merged = heapq.merge(
+            sorted(result_entries, key=sort_germline_variant), iter(inferred), key=sort_germline_variant
+        )
+        self.assertEqual(list(merged), expected_output)
+        self.assertEqual(
+            list(iter_filtered_results(expected_output, "genotype_type", ["ref"])),
+            filter_results(expected_output, "genotype_type", ["ref"]),
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -36,7 +36,7 @@ from collections import OrderedDict
 import dxpy
 import pandas as pd
 from dxpy.bindings.apollo.cmd_line_options_validator import ArgsValidator
-from dxpy.bindings.apollo.data_transformations import transform_to_expression_matrix
+from dxpy.bindings.apollo.data_transformations import transform_to_expression_matrix, ExpressionMatrix
 from dxpy.bindings.apollo.dataset import Dataset
 from dxpy.bindings.apollo.json_validation_by_schema import JSONValidator
 from dxpy.bindings.apollo.schemas.assay_filtering_conditions import (
@@ -160,6 +160,7 @@ class TestDXExtractExpression(unittest.TestCase):
             "expression_matrix": False,
             "delim": None,
             "output": None,
+            "output_format": None,
         }
 
         cls.vizserver_data_mock_response = {
@@ -635,6 +636,40 @@ class TestDXExtractExpression(unittest.TestCase):
         }
         self.common_input_args_test(input_dict, expected_error_message)
 
+    # --output-format cannot be used with --sql
+    def test_output_format_sql(self):
+        expected_error_message = '"--output-format" cannot be passed with the flag, "--sql".'
+        input_dict = {
+            "path": self.expression_dataset,
+            "retrieve_expression": True,
+            "filter_json": r'{"annotation": {"feature_name": ["BRCA2"]}}',
+            "output_format": "parquet",
+            "sql": True,
+        }
+        self.common_input_args_test(input_dict, expected_error_message)
+
+    # --output-format mtx can only be used with --expression-matrix
+    def test_output_format_mtx_without_exp_matrix(self):
+        expected_error_message = '"--output-format mtx" can only be used with "--expression-matrix".'
+        command = [
+            "dx",
+            "extract_assay",
+            "expression",
+            self.expression_dataset,
+            "--retrieve-expression",
+            "--filter-json",
+            r'{"annotation": {"feature_name": ["BRCA2"]}}',
+            "--output-format",
+            "mtx",
+        ]
+
+        process = subprocess.Popen(
+            command, stderr=subprocess.PIPE, universal_newlines=True
+        )
+        actual_err_msg = process.communicate()[1]
+
+        self.assertIn(expected_error_message, actual_err_msg)
+
     # Malformed input json tests
     # EM-18, EM-19, EM-20
     #
@@ -1450,6 +1485,110 @@ class TestDXExtractExpression(unittest.TestCase):
         assert merged_compound_block == expected_merged_compound_block
 
 
+class TestExpressionOutput(unittest.TestCase):
+    """Tests of the expression output formats, which do not need the platform"""
+
+    def setUp(self):
+        self.general_output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.general_output_dir)
+
+    def test_exp_matrix_output_formats(self):
+        vizserver_results = [
+            {"feature_id": "ENST00000450305", "sample_id": "sample_2", "expression": 50},
+            {"feature_id": "ENST00000450305", "sample_id": "sample_1", "expression": 77},
+            {"feature_id": "ENST00000456328", "sample_id": "sample_1", "expression": 90},
+            {"feature_id": "ENST00000488147", "sample_id": "sample_2", "expression": 20},
+            {"feature_id": "ENST00000456328", "sample_id": "sample_3", "expression": None},
+        ]
+        matrix = ExpressionMatrix(iter(vizserver_results))
+        self.assertEqual(matrix.sample_ids, ["sample_2", "sample_1", "sample_3"])
+        self.assertEqual(
+            list(matrix.iter_rows()),
+            [
+                ["sample_2", 50, None, 20],
+                ["sample_1", 77, 90, None],
+                ["sample_3", None, None, None],
+            ],
+        )
+
+        output_path = os.path.join(self.general_output_dir, "exp_matrix_rows.tsv")
+        write_expression_output(output_path, "\t", False, matrix)
+        with open(output_path, "r") as infile:
+            self.assertEqual(
+                infile.read().splitlines(),
+                [
+                    "sample_id\tENST00000450305\tENST00000456328\tENST00000488147",
+                    "sample_2\t50\t\t20",
+                    "sample_1\t77\t90\t",
+                    "sample_3\t\t\t",
+                ],
+            )
+
+        output_path = os.path.join(self.general_output_dir, "exp_matrix.mtx")
+        write_expression_output(output_path, None, False, matrix, output_format="mtx")
+        with open(output_path, "r") as infile:
+            self.assertEqual(
+                infile.read().splitlines(),
+                [
+                    "%%MatrixMarket matrix coordinate real general",
+                    "3 3 4",
+                    "1 1 50",
+                    "1 3 20",
+                    "2 1 77",
+                    "2 2 90",
+                ],
+            )
+        with open(output_path[:-4] + ".samples.tsv", "r") as infile:
+            self.assertEqual(infile.read().splitlines(), matrix.sample_ids)
+        with open(output_path[:-4] + ".features.tsv", "r") as infile:
+            self.assertEqual(infile.read().splitlines(), matrix.feature_ids)
+
+    def test_typed_output_formats(self):
+        vizserver_results = [
+            {"feature_id": "ENST00000450305", "sample_id": "sample_2", "expression": 50},
+            {"feature_id": "ENST00000456328", "sample_id": "sample_1", "expression": 90.5},
+        ]
+        output_path = os.path.join(self.general_output_dir, "exp_typed.jsonl")
+        write_expression_output(
+            output_path, None, False, iter(vizserver_results), output_format="jsonl"
+        )
+        with open(output_path, "r") as infile:
+            self.assertEqual(
+                [json.loads(line) for line in infile], vizserver_results
+            )
+
+    def test_typed_matrix_output(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("the parquet output requires pyarrow")
+        vizserver_results = [
+            {"feature_id": "ENST00000450305", "sample_id": "sample_2", "expression": 50},
+            {"feature_id": "ENST00000456328", "sample_id": "sample_1", "expression": 90.5},
+        ]
+        output_path = os.path.join(self.general_output_dir, "exp_matrix_typed.parquet")
+        write_expression_output(
+            output_path,
+            None,
+            False,
+            ExpressionMatrix(vizserver_results),
+            output_format="parquet",
+        )
+        table = pyarrow.parquet.read_table(output_path)
+        self.assertEqual(
+            [str(field.type) for field in table.schema], ["string", "double", "double"]
+        )
+        self.assertEqual(
+            table.to_pylist(),
+            [
+                {"sample_id": "sample_2", "ENST00000450305": 50.0, "ENST00000456328": None},
+                {"sample_id": "sample_1", "ENST00000450305": None, "ENST00000456328": 90.5},
+            ],
+        )
+
+
 # Start the test
 if __name__ == "__main__":
     unittest.main()